@@ -0,0 +1,265 @@
+'''
+Episode index for the CoSTAR block stacking dataset.
+
+Sampling a batch with CostarBlockStackingSequence used to open every example
+h5f file just to read the goal indices, labels and poses, and
+inference_mode_gen opened every file of a split to count its frames. The
+index stores all of the small per-frame data of a split in one npz file, so
+the only thing still read from the example files is the image bytes a batch
+actually uses, and every (file, frame) pair can be enumerated without opening
+any h5f file.
+
+The index of a split file such as
+costar_block_stacking_v0.4_success_only_train_files.txt is written next to it
+as costar_block_stacking_v0.4_success_only_train_files_index.npz:
+
+    python costar_hyper/block_stacking_index.py \
+        --split ~/.keras/datasets/costar_block_stacking_dataset_v0.4/costar_block_stacking_v0.4_success_only_train_files.txt
+
+Contents, for the n episodes of the split and the total number of frames:
+
+    names           (n,)  basename of each example file
+    frame_counts    (n,)  number of frames of each example
+    offsets         (n,)  position of each example's first frame in the
+                          per frame arrays
+    success         (n,)  True for examples with 'success' in the name
+    gripper_action_goal_idx  (frames,)
+    gripper_action_label     (frames,)
+    pose, pose_gripper_center ... (frames, 7), the pose keys that were
+                          present in every file
+'''
+import argparse
+import os
+
+import h5py
+import numpy as np
+
+# Progress bars using https://github.com/tqdm/tqdm
+# Import tqdm without enforcing it as a dependency
+try:
+    from tqdm import tqdm
+except ImportError:
+    def tqdm(*args, **kwargs):
+        if args:
+            return args[0]
+        return kwargs.get('iterable', None)
+
+
+INDEX_SUFFIX = '_index.npz'
+FRAME_KEYS = ['gripper_action_goal_idx', 'gripper_action_label']
+POSE_KEYS = ['pose', 'pose_gripper_center']
+
+
+def index_filename_for_split(split_filename):
+    """ Get the name of the index of a split txt file.
+    """
+    base, _ = os.path.splitext(split_filename)
+    return base + INDEX_SUFFIX
+
+
+def build_block_stacking_index(filenames, index_filename, pose_keys=None, verbose=0):
+    """ Read the per frame data of every example and write the index.
+
+    Files that cannot be read or that were not preprocessed with
+    view_convert_dataset.py --preprocess_inplace gripper_action are skipped
+    with a warning; CostarBlockStackingSequence still reads them directly.
+
+    # Arguments
+
+    filenames: list of paths to example h5f files.
+    index_filename: the npz file to write.
+    pose_keys: the pose keys to store, defaults to POSE_KEYS.
+        Keys missing from any of the files are left out.
+
+    # Returns
+
+    The number of examples in the index.
+    """
+    if pose_keys is None:
+        pose_keys = POSE_KEYS
+    names = []
+    frame_counts = []
+    columns = dict((key, []) for key in FRAME_KEYS + list(pose_keys))
+    for filename in tqdm(filenames):
+        filename = os.path.expanduser(filename)
+        try:
+            with h5py.File(filename, 'r') as data:
+                if any(key not in data for key in FRAME_KEYS):
+                    print('block_stacking_index.py: skipping file without preprocessed '
+                          'gripper actions: ' + filename)
+                    continue
+                count = len(data['gripper_action_goal_idx'])
+                # read everything before adding any of it to the columns, so
+                # a file that fails halfway does not leave them misaligned
+                values = dict((key, np.array(data[key])) for key in columns
+                              if key in data and len(data[key]) == count)
+        except (IOError, OSError) as ex:
+            print('block_stacking_index.py: skipping file due to IO error: ' +
+                  filename + ': ' + str(ex))
+            continue
+        for key in list(columns.keys()):
+            if key not in values:
+                if verbose > 0:
+                    print('block_stacking_index.py: ' + key + ' not in ' + filename +
+                          ', leaving it out of the index')
+                del columns[key]
+                continue
+            columns[key].append(values[key])
+        names.append(os.path.basename(filename))
+        frame_counts.append(count)
+
+    frame_counts = np.array(frame_counts, dtype=np.int64)
+    offsets = np.zeros(len(frame_counts), dtype=np.int64)
+    offsets[1:] = np.cumsum(frame_counts)[:-1]
+    arrays = dict((key, np.concatenate(values) if values else np.zeros((0,)))
+                  for key, values in columns.items())
+    arrays['names'] = np.array(names).astype(bytes)
+    arrays['frame_counts'] = frame_counts
+    arrays['offsets'] = offsets
+    arrays['success'] = np.array(['success' in name for name in names], dtype=bool)
+    # write to a temporary file first so readers never see a partial index
+    tmp = index_filename + '.tmp.npz'
+    np.savez(tmp, **arrays)
+    os.rename(tmp, index_filename)
+    return len(names)
+
+
+class BlockStackingIndex(object):
+    """ The episode index of a split, loaded in memory.
+
+    Examples are looked up by the basename of their file, so the index
+    stays valid when the dataset is moved.
+    """
+
+    def __init__(self, index_filename):
+        with np.load(os.path.expanduser(index_filename)) as index:
+            arrays = dict((key, index[key]) for key in index.files)
+        names = arrays.pop('names').astype(str)
+        order = np.argsort(names)
+        self.names = names[order]
+        self.frame_counts = arrays.pop('frame_counts')[order]
+        self.offsets = arrays.pop('offsets')[order]
+        self.success = arrays.pop('success')[order]
+        # per frame arrays
+        self.frames = arrays
+
+    def __len__(self):
+        return len(self.names)
+
+    def find(self, filename):
+        """ Position of an example in the index, or None if it is not in it.
+        """
+        name = os.path.basename(filename)
+        i = np.searchsorted(self.names, name)
+        if i < len(self.names) and self.names[i] == name:
+            return i
+        return None
+
+    def frame_count(self, filename):
+        return int(self.frame_counts[self.find(filename)])
+
+    def get(self, i, key):
+        """ Per frame data of the example at position i.
+        """
+        start = self.offsets[i]
+        return self.frames[key][start:start + self.frame_counts[i]]
+
+    def time_steps(self, filenames, first=1, last=1):
+        """ Enumerate every (file, frame) pair of a list of files.
+
+        By default the first and last frames of every example are left out,
+        like CostarBlockStackingSequence does when it samples frames.
+
+        # Arguments
+
+        filenames: the example files, all of which must be in the index.
+        first: number of frames to skip at the start of every example.
+        last: number of frames to skip at the end of every example.
+
+        # Returns
+
+        Two arrays: the position of each frame's file in filenames, and
+        the frame number within that file.
+        """
+        positions = [self.find(filename) for filename in filenames]
+        if None in positions:
+            raise ValueError('BlockStackingIndex: file not in the index: ' +
+                             str(filenames[positions.index(None)]))
+        counts = np.maximum(self.frame_counts[positions] - first - last, 0)
+        file_ids = np.repeat(np.arange(len(filenames)), counts)
+        # frame numbers restart at `first` for every file
+        starts = np.zeros(len(counts), dtype=np.int64)
+        starts[1:] = np.cumsum(counts)[:-1]
+        frames = np.arange(np.sum(counts)) - np.repeat(starts, counts) + first
+        return file_ids, frames
+
+    def open(self, filename):
+        """ Get a read-only view of an example that serves the indexed keys from
+        the index, and opens the h5f file only when other keys (e.g. images)
+        are read. Use it like h5py.File, in a with statement.
+        """
+        i = self.find(filename)
+        if i is None:
+            return h5py.File(filename, 'r')
+        return IndexedExample(self, i, filename)
+
+
+class IndexedExample(object):
+    """ An example h5f file, with the indexed keys read from the index.
+    """
+
+    def __init__(self, index, i, filename):
+        self.index = index
+        self.i = i
+        self.filename = filename
+        self.file = None
+
+    def __contains__(self, key):
+        return key in self.index.frames or key in self._file()
+
+    def __getitem__(self, key):
+        if key in self.index.frames:
+            return self.index.get(self.i, key)
+        return self._file()[key]
+
+    def _file(self):
+        if self.file is None:
+            self.file = h5py.File(self.filename, 'r')
+        return self.file
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description='Write the episode index of block stacking dataset split files, '
+                    'see block_stacking_index.py for details.')
+    parser.add_argument('--split', type=str, nargs='+', required=True,
+                        help='split txt files listing one example h5f file per line, '
+                             'the index is written next to each one.')
+    parser.add_argument('--verbose', type=int, default=0)
+    return parser.parse_args()
+
+
+def main(args):
+    for split in args.split:
+        split = os.path.expanduser(split)
+        filenames = np.genfromtxt(split, dtype='str', delimiter=', ')
+        filenames = list(np.atleast_1d(filenames))
+        index_filename = index_filename_for_split(split)
+        count = build_block_stacking_index(filenames, index_filename, verbose=args.verbose)
+        print('wrote ' + str(count) + ' of ' + str(len(filenames)) +
+              ' examples to ' + index_filename)
+
+
+if __name__ == '__main__':
+    main(_parse_args())
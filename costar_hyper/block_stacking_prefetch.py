@@ -0,0 +1,504 @@
+"""Multiprocess prefetching for the CoSTAR block stacking dataset.
+
+CostarBlockStackingSequence builds a batch one example at a time: it opens the
+example file, decodes two images, resizes each of them and appends them to
+python lists, all in the process running Keras. Threads do not help much with
+that, and OrderedEnqueuer(use_multiprocessing=True) pickles every batch back to
+the trainer.
+
+PrefetchingBlockStackingSequence is a drop in replacement which assembles
+whole batches at a time, in worker processes writing into a ring of shared
+memory slots, so batches only need to be copied out of shared memory:
+
+  - all the images of a batch are decoded in one call and resized in one
+    skimage call (see resize_images_np);
+  - action labels, poses and the image preprocessing are computed on the
+    whole batch;
+  - workers get the next batches in advance, up to max_queue_size of them.
+
+The frame of every example is drawn in the trainer process from the same
+random_state, in the same order, as CostarBlockStackingSequence does when its
+batches are read in order, so for a given seed both visit the same
+(file, frame) pairs and, without random augmentation, give exactly the same
+batches. Random augmentation uses the global numpy random state reseeded for
+every batch from (seed, epoch, batch), so augmented batches do not depend on
+the number of workers or on which worker made them.
+
+Use it with Keras threads, not with use_multiprocessing=True, e.g.
+model.fit_generator(sequence, workers=1, use_multiprocessing=False).
+Call close() to stop the workers.
+
+Benchmark batches per second for a number of workers:
+
+    python costar_hyper/block_stacking_prefetch.py --workers 1 2 4 \
+        --split ~/.keras/datasets/costar_block_stacking_dataset_v0.4/costar_block_stacking_v0.4_success_only_train_files.txt
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from multiprocessing.sharedctypes import RawArray
+
+import h5py
+import numpy as np
+from skimage.transform import resize
+import keras_applications
+import keras_preprocessing
+
+from block_stacking_reader import CostarBlockStackingSequence
+from block_stacking_reader import DecodeImages
+from block_stacking_reader import blend_image_sequence
+from block_stacking_reader import encode_action_and_images
+from block_stacking_reader import encode_label
+from block_stacking_reader import get_past_goal_indices
+from block_stacking_reader import random_eraser
+from block_stacking_index import index_filename_for_split
+
+# the workers need to be forked to share the slots and this sequence with the trainer
+if hasattr(multiprocessing, 'get_context'):
+    _multiprocessing = multiprocessing.get_context('fork')
+else:
+    _multiprocessing = multiprocessing
+
+
+def resize_images_np(images, output_shape):
+    """ Resize a batch of NHWC images with a single call to skimage resize.
+
+    The images are stacked along the channel axis, which skimage resizes
+    independently, so the result is the same as resizing every image with
+    resize(image, output_shape, mode='constant', preserve_range=True, order=1).
+
+    # Arguments
+
+    images: NHWC array of images with the same size.
+    output_shape: the (height, width, channels) of the resized images.
+
+    # Returns
+
+    The NHWC float array of resized images.
+    """
+    images = np.asarray(images)
+    n, h, w, c = images.shape
+    stacked = np.transpose(images, [1, 2, 0, 3]).reshape([h, w, n * c])
+    resized = resize(stacked, (output_shape[0], output_shape[1], n * c),
+                     mode='constant', preserve_range=True, order=1)
+    resized = resized.reshape([output_shape[0], output_shape[1], n, c])
+    return np.transpose(resized, [2, 0, 1, 3])
+
+
+class PrefetchingBlockStackingSequence(CostarBlockStackingSequence):
+    """ CostarBlockStackingSequence with batches made ahead of time in worker processes.
+
+    See the top of block_stacking_prefetch.py for details.
+    """
+    def __init__(self, list_example_filenames, workers=2, max_queue_size=4, **kwargs):
+        """ Initialization
+
+        # Arguments
+
+        list_example_filenames: a list of file paths to be read
+        workers: number of worker processes making batches.
+        max_queue_size: number of shared memory slots, which is the number of
+            batches that can be made ahead of the ones Keras asked for.
+        kwargs: the arguments of CostarBlockStackingSequence.
+            inference_mode and the 'stacking_reward' label are not supported,
+            and a seed is required.
+        """
+        super(PrefetchingBlockStackingSequence, self).__init__(list_example_filenames, **kwargs)
+        if self.seed is None:
+            raise ValueError('PrefetchingBlockStackingSequence: a seed is required')
+        if self.inference_mode:
+            raise ValueError('PrefetchingBlockStackingSequence: inference_mode is not supported, '
+                             'use CostarBlockStackingSequence')
+        if (self.label_features_to_extract is not None and
+                'stacking_reward' in self.label_features_to_extract):
+            raise ValueError('PrefetchingBlockStackingSequence: the stacking_reward label is not supported, '
+                             'use CostarBlockStackingSequence')
+        if workers < 1:
+            raise ValueError('PrefetchingBlockStackingSequence: at least one worker is needed')
+        if max_queue_size < 1:
+            raise ValueError('PrefetchingBlockStackingSequence: max_queue_size must be at least 1')
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.frame_counts = [self._count_frames(filename) for filename in self.list_example_filenames]
+        self.epoch = 0
+        self._draw_frames()
+        # the worker processes and ring buffer, started by the first __getitem__
+        self._processes = []
+        self._slots = None
+        self._x_is_list = False
+        self._cond = threading.Condition()
+        self._free = []
+        self._pending = {}
+        self._ready = {}
+        self._errors = {}
+        self._waiting = []
+
+    def _count_frames(self, example_filename):
+        """ Number of frames of an example, or None if it cannot be read.
+        """
+        if self.index is not None and self.index.find(example_filename) is not None:
+            return self.index.frame_count(example_filename)
+        try:
+            with h5py.File(os.path.expanduser(example_filename), 'r') as data:
+                return len(data['gripper_action_goal_idx'])
+        except IOError as ex:
+            print('PrefetchingBlockStackingSequence: Skipping file due to IO error when opening ' +
+                  example_filename + ': ' + str(ex))
+            return None
+
+    def _draw_frames(self):
+        """ Draw the frame of every example visited this epoch.
+
+        random_state is used in the same order as CostarBlockStackingSequence
+        uses it when its batches are read in order, after on_epoch_end().
+        Files which cannot be read get frame -1 and do not use random_state.
+        """
+        count = len(self) * self.batch_size
+        frames = np.zeros(count, dtype=np.int64)
+        for k, i in enumerate(self.indexes[:count]):
+            if self.frame_counts[i] is None:
+                frames[k] = -1
+                continue
+            rand_max = self.frame_counts[i] - 1
+            if rand_max <= 1:
+                raise ValueError('PrefetchingBlockStackingSequence: not enough goal ids: ' +
+                                 str(self.frame_counts[i]) + ' file: ' + str(self.list_example_filenames[i]))
+            frames[k] = self.random_state.randint(1, rand_max, 1)[0]
+        self.frames = frames
+
+    def on_epoch_end(self):
+        """ Updates indexes and draws the frames of the next epoch
+        """
+        super(PrefetchingBlockStackingSequence, self).on_epoch_end()
+        if not hasattr(self, 'frame_counts'):
+            # called by CostarBlockStackingSequence.__init__()
+            return
+        with self._cond:
+            self.epoch += 1
+            self._draw_frames()
+            # batches made in advance for the last epoch are not needed any more,
+            # those still being made are dropped when they are done
+            for slot in self._ready.values():
+                self._free.append(slot)
+            self._ready = {}
+            self._errors = {}
+            self._cond.notify_all()
+
+    def batch_plan(self, index):
+        """ The example files and frames of a batch of the current epoch.
+        """
+        start = index * self.batch_size
+        files = [self.list_example_filenames[k] for k in self.indexes[start:start + self.batch_size]]
+        return files, self.frames[start:start + self.batch_size]
+
+    def generate_batch(self, epoch, index, list_Ids, frames):
+        """ Make a batch in the calling process.
+
+        # Arguments
+
+        epoch: the epoch the batch belongs to, for seeding augmentation.
+        index: the number of the batch in the epoch, for seeding augmentation.
+        list_Ids: a list of file paths to be read
+        frames: the frame to use from each file
+
+        # Returns
+
+        The batch (X, y).
+        """
+        # augmentation uses the global random state, which we seed for the batch
+        # and put back afterwards
+        random_state = np.random.get_state()
+        np.random.seed([self.seed, epoch, index])
+        try:
+            return self._generate_batch(list_Ids, frames)
+        finally:
+            np.random.set_state(random_state)
+
+    def _generate_batch(self, list_Ids, frames):
+        examples = []
+        for example_filename, frame in zip(list_Ids, frames):
+            example_filename = os.path.expanduser(example_filename)
+            if frame < 0:
+                continue
+            try:
+                with self._open_example(example_filename) as data:
+                    if 'gripper_action_goal_idx' not in data or 'gripper_action_label' not in data:
+                        raise ValueError('block_stacking_prefetch.py: You need to run preprocessing before this will work! \n' +
+                                         '    python2 ctp_integration/scripts/view_convert_dataset.py --path ~/.keras/datasets/costar_block_stacking_dataset_v0.4 --preprocess_inplace gripper_action --write'
+                                         '\n File with error: ' + str(example_filename))
+                    all_goal_ids = np.array(data['gripper_action_goal_idx'])
+                    if self.blend:
+                        img_indices = get_past_goal_indices(np.array([frame]), all_goal_ids, filename=example_filename)
+                    else:
+                        img_indices = [0, frame]
+                    examples.append((list(data['image'][img_indices]),
+                                     np.array(data[self.pose_name][frame]),
+                                     np.array(data[self.pose_name][all_goal_ids[frame]]),
+                                     data['gripper_action_label'][frame],
+                                     1 if 'success' in example_filename else 0))
+            except IOError as ex:
+                print('Error: Skipping file due to IO error when opening ' +
+                      example_filename + ': ' + str(ex) + ' using the last example twice for batch')
+        if not examples:
+            raise ValueError('PrefetchingBlockStackingSequence: none of the files in the batch could be read: ' +
+                             str(list_Ids))
+        # every batch has the same size so it fits in the shared memory slots
+        examples += [examples[-1]] * (len(list_Ids) - len(examples))
+        raw_images, poses, goal_poses, action_labels, action_successes = zip(*examples)
+
+        # decode every image of the batch at once, the workers are the parallelism
+        counts = [len(raw) for raw in raw_images]
+        images = DecodeImages([raw for raws in raw_images for raw in raws], num_threads=1)
+        if self.blend:
+            starts = np.cumsum([0] + counts)
+            images = np.array([[images[start], blend_image_sequence(list(images[start:end]))]
+                               for start, end in zip(starts[:-1], starts[1:])])
+        images = images.reshape((-1,) + images.shape[-3:])
+
+        if self.is_training and self.random_augmentation is not None and self.random_shift:
+            # random_shift returns floats, keep them instead of truncating into the uint8 images
+            images = images.astype(np.float64)
+            for k in range(len(images)):
+                if np.random.random() > self.random_augmentation:
+                    # apply random shift to the images before resizing
+                    images[k] = keras_preprocessing.image.random_shift(
+                        images[k],
+                        # height, width
+                        1./(48. * 2.), 1./(64. * 2.),
+                        row_axis=0, col_axis=1, channel_axis=2)
+        if self.output_shape is not None:
+            images = resize_images_np(images, self.output_shape)
+        if self.is_training and self.random_augmentation:
+            for k in range(len(images)):
+                # do some image augmentation with random erasing & cutout
+                images[k] = random_eraser(images[k])
+
+        images = keras_applications.imagenet_utils._preprocess_numpy_input(
+            np.array(images, dtype=np.float32),
+            data_format='channels_last', mode='tf')
+        init_images = images[0::2]
+        current_images = images[1::2]
+
+        # WARNING: IF YOU CHANGE THIS ACTION ENCODING CODE BELOW, ALSO CHANGE encode_action() in block_stacking_reader.py
+        action_labels = np.array(action_labels)
+        if (self.data_features_to_extract is not None and
+                ('image_0_image_n_vec_xyz_aaxyz_nsc_15' in self.data_features_to_extract or
+                 'image_0_image_n_vec_xyz_nxygrid_12' in self.data_features_to_extract or
+                 'image_0_image_n_vec_xyz_aaxyz_nsc_nxygrid_17' in self.data_features_to_extract or
+                 'image_0_image_n_vec_0_vec_n_xyz_aaxyz_nsc_nxygrid_25' in self.data_features_to_extract) and not self.one_hot_encoding):
+            # normalized floating point encoding of action vector
+            # from 0 to 1 in a single float which still becomes
+            # a 2d array of dimension batch_size x 1
+            action_labels = np.expand_dims(action_labels / self.total_actions_available, axis=-1).astype(float)
+        else:
+            # one hot encoding
+            one_hot = np.zeros((len(action_labels), self.total_actions_available))
+            one_hot[np.arange(len(action_labels)), action_labels] = 1
+            action_labels = one_hot
+
+        poses = np.array(poses)
+        goal_poses = np.array(goal_poses)
+        X = encode_action_and_images(
+            data_features_to_extract=self.data_features_to_extract,
+            poses=poses, action_labels=action_labels,
+            init_images=init_images, current_images=current_images,
+            y=goal_poses, random_augmentation=self.random_encoding_augmentation)
+        y = encode_label(self.label_features_to_extract, goal_poses, list(action_successes),
+                         self.random_augmentation, None)
+        return X, np.array(y)
+
+    def __getitem__(self, index):
+        """ Get one batch of data, made by the workers
+        """
+        with self._cond:
+            if self._slots is None:
+                # make the first batch here to find the size of the shared memory slots
+                files, frames = self.batch_plan(index)
+                batch = self.generate_batch(self.epoch, index, files, frames)
+                self._start(batch)
+                self._prefetch(index + 1)
+                return batch
+            key = (self.epoch, index)
+            self._waiting.append(key)
+            try:
+                slot = self._wait(key)
+                arrays = [np.array(buf[slot]) for buf in self._slots]
+                self._free.append(slot)
+                del self._ready[key]
+            finally:
+                self._waiting.remove(key)
+            self._prefetch(index + 1)
+            self._cond.notify_all()
+        if self._x_is_list:
+            return arrays[:-1], arrays[-1]
+        return arrays[0], arrays[-1]
+
+    def _wait(self, key):
+        """ Wait until a batch is in a slot and return the slot. Call with _cond held.
+        """
+        while key not in self._ready:
+            if key in self._errors:
+                raise RuntimeError('PrefetchingBlockStackingSequence: making batch ' + str(key[1]) +
+                                   ' failed in a worker:\n' + self._errors.pop(key))
+            if key not in self._pending:
+                if not self._free:
+                    # drop a batch made in advance that nobody is waiting for yet
+                    unwanted = [other for other in self._ready if other not in self._waiting]
+                    if unwanted:
+                        self._free.append(self._ready.pop(max(unwanted)))
+                if self._free:
+                    self._schedule(key)
+                    continue
+            self._cond.wait(1.0)
+            if not all(process.is_alive() for process in self._processes):
+                raise RuntimeError('PrefetchingBlockStackingSequence: a worker process died')
+        return self._ready[key]
+
+    def _schedule(self, key):
+        slot = self._free.pop()
+        self._pending[key] = slot
+        files, frames = self.batch_plan(key[1])
+        self._tasks.put((slot, key[0], key[1], files, frames))
+
+    def _prefetch(self, index):
+        """ Give batches after index to the workers while there are free slots.
+        """
+        while self._free and index < len(self):
+            key = (self.epoch, index)
+            if key not in self._pending and key not in self._ready:
+                self._schedule(key)
+            index += 1
+
+    def _start(self, batch):
+        """ Allocate the shared memory slots to fit batches like this one, and start the workers.
+        """
+        X, y = batch
+        self._x_is_list = isinstance(X, list)
+        arrays = (list(X) if self._x_is_list else [X]) + [y]
+        self._shapes = [(array.shape, array.dtype) for array in arrays]
+        self._slots = []
+        for array in arrays:
+            raw = RawArray('b', self.max_queue_size * array.nbytes)
+            self._slots.append(np.frombuffer(raw, dtype=array.dtype).reshape(
+                (self.max_queue_size,) + array.shape))
+        self._free = list(range(self.max_queue_size))
+        self._tasks = _multiprocessing.Queue()
+        self._done = _multiprocessing.Queue()
+        for _ in range(self.workers):
+            process = _multiprocessing.Process(target=self._work)
+            process.daemon = True
+            process.start()
+            self._processes.append(process)
+        self._collector = threading.Thread(target=self._collect)
+        self._collector.daemon = True
+        self._collector.start()
+
+    def _work(self):
+        """ Worker process loop: make batches and write them into their slot.
+        """
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            slot, epoch, index, files, frames = task
+            error = None
+            try:
+                X, y = self.generate_batch(epoch, index, files, frames)
+                arrays = (list(X) if self._x_is_list else [X]) + [y]
+                for buf, array, (shape, dtype) in zip(self._slots, arrays, self._shapes):
+                    if array.shape != shape:
+                        raise ValueError('batch array of shape ' + str(array.shape) +
+                                         ' does not fit in a slot of shape ' + str(shape))
+                    buf[slot] = array
+            except Exception:
+                error = traceback.format_exc()
+                print(error)
+            self._done.put((slot, epoch, index, error))
+
+    def _collect(self):
+        """ Thread in the trainer process marking batches done by the workers as ready.
+        """
+        while True:
+            message = self._done.get()
+            if message is None:
+                break
+            slot, epoch, index, error = message
+            key = (epoch, index)
+            with self._cond:
+                del self._pending[key]
+                if epoch != self.epoch:
+                    self._free.append(slot)
+                elif error is not None:
+                    self._errors[key] = error
+                    self._free.append(slot)
+                else:
+                    self._ready[key] = slot
+                self._cond.notify_all()
+
+    def close(self):
+        """ Stop the worker processes.
+        """
+        if not self._processes:
+            return
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join()
+        self._processes = []
+        self._done.put(None)
+        self._collector.join()
+        with self._cond:
+            self._slots = None
+            self._pending = {}
+            self._ready = {}
+            self._errors = {}
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description='Measure how many batches per second PrefetchingBlockStackingSequence makes.')
+    parser.add_argument('--split', type=str, default=None,
+                        help='split txt file listing the example files, its index is used if it exists.')
+    parser.add_argument('--glob', type=str,
+                        default='~/.keras/datasets/costar_block_stacking_dataset_v0.4/*success.h5f',
+                        help='example files to use when there is no --split.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--batches', type=int, default=50)
+    parser.add_argument('--max_queue_size', type=int, default=4)
+    return parser.parse_args()
+
+
+def main(args):
+    index = None
+    if args.split is not None:
+        split = os.path.expanduser(args.split)
+        filenames = list(np.atleast_1d(np.genfromtxt(split, dtype='str', delimiter=', ')))
+        if os.path.isfile(index_filename_for_split(split)):
+            index = index_filename_for_split(split)
+    else:
+        filenames = glob.glob(os.path.expanduser(args.glob))
+    for workers in args.workers:
+        sequence = PrefetchingBlockStackingSequence(
+            filenames, workers=workers, max_queue_size=args.max_queue_size,
+            batch_size=args.batch_size, output_shape=(224, 224, 3), shuffle=True,
+            label_features_to_extract='grasp_goal_xyz_aaxyz_nsc_8',
+            data_features_to_extract=['image_0_image_n_vec_xyz_aaxyz_nsc_nxygrid_17'],
+            index=index)
+        batches = min(args.batches, len(sequence))
+        # the first batch is made in this process and starts the workers
+        sequence[0]
+        start = time.time()
+        for i in range(1, batches):
+            sequence[i]
+        elapsed = time.time() - start
+        sequence.close()
+        print('workers: ' + str(workers) + ' batches per second: ' + str((batches - 1) / elapsed))
+
+
+if __name__ == '__main__':
+    main(_parse_args())
@@ -16,8 +16,12 @@ from keras.utils import Sequence
 from keras.utils import OrderedEnqueuer
 import tensorflow as tf
 import hypertree_pose_metrics
+from block_stacking_index import BlockStackingIndex
 import keras_applications
 import keras_preprocessing
+# batched decoding on a thread pool, shared with costar_models
+from costar_models.datasets.image import ConvertImageListToNumpy
+from costar_models.datasets.image import DecodeImages
 
 
 def random_eraser(input_img, p=0.5, s_l=0.02, s_h=0.4, r_1=0.3, r_2=1/0.3, v_l=0, v_h=255, pixel_level=True):
@@ -370,16 +374,22 @@ def encode_action_and_images(
     return X
 
 
-def inference_mode_gen(file_names):
+def inference_mode_gen(file_names, index=None):
     """ Generate data for all time steps in a single example.
+
+    index: optional BlockStackingIndex, frames are counted
+        without opening the files that are in it.
     """
     file_list_updated = []
     # print(len(file_names))
     for f_name in file_names:
-        with h5py.File(f_name, 'r') as data:
-            file_len = len(data['gripper_action_goal_idx']) - 1
-            # print(file_len)
-            list_id = [f_name] * file_len
+        if index is not None and index.find(f_name) is not None:
+            file_len = index.frame_count(f_name) - 1
+        else:
+            with h5py.File(f_name, 'r') as data:
+                file_len = len(data['gripper_action_goal_idx']) - 1
+        # print(file_len)
+        list_id = [f_name] * file_len
         file_list_updated = file_list_updated + list_id
     return file_list_updated
 
@@ -400,7 +410,8 @@ class CostarBlockStackingSequence(Sequence):
                  blend_previous_goal_images=False,
                  estimated_time_steps_per_example=250, verbose=0, inference_mode=False, one_hot_encoding=True,
                  pose_name='pose_gripper_center',
-                 force_random_training_pose_augmentation=None):
+                 force_random_training_pose_augmentation=None,
+                 index=None):
         '''Initialization
 
         # Arguments
@@ -424,6 +435,7 @@ class CostarBlockStackingSequence(Sequence):
             so we simply sample in proportion to an estimated number of images per example.
             Due to random sampling, there is no guarantee that every image will be visited once!
             However, the images can be visited in a fixed order, particularly when is_training=False.
+            None uses the exact average number of frames from the index.
         one_hot_encoding flag triggers one hot encoding and thus numbers at the end of labels might not correspond to the actual size.
         force_random_training_pose_augmentation: override random_augmenation when training for pose data only.
         pose_name: Which pose to use as the robot 3D position in space. Options include:
@@ -431,6 +443,9 @@ class CostarBlockStackingSequence(Sequence):
                 of the robot, which is the base of the gripper wrist.
             'pose_gripper_center' is a point in between the robotiq C type gripping plates when the gripper is open
                 with the same orientation as pose.
+        index: a BlockStackingIndex or the path to one, see block_stacking_index.py.
+            Goal indices, action labels and poses are then read from the index,
+            and only the images from the example files. Files missing from the index are read directly.
 
         # Explanation of abbreviations:
 
@@ -473,9 +488,16 @@ class CostarBlockStackingSequence(Sequence):
                 self.random_encoding_augmentation = force_random_training_pose_augmentation
 
         self.blend = blend_previous_goal_images
+        if isinstance(index, str):
+            index = BlockStackingIndex(index)
+        self.index = index
+        if estimated_time_steps_per_example is None:
+            if index is None:
+                raise ValueError('CostarBlockStackingSequence: exact time step counts need an index')
+            estimated_time_steps_per_example = self.get_time_steps_per_example()
         self.estimated_time_steps_per_example = estimated_time_steps_per_example
         if self.inference_mode is True:
-            self.list_example_filenames = inference_mode_gen(self.list_example_filenames)
+            self.list_example_filenames = inference_mode_gen(self.list_example_filenames, index)
         # if crop_shape is None:
         #     # height width 3
         #     crop_shape = (224, 224, 3)
@@ -508,6 +530,30 @@ class CostarBlockStackingSequence(Sequence):
         """
         return self.estimated_time_steps_per_example
 
+    def get_time_steps(self):
+        """ Get every (file, frame) pair the examples can be sampled at, from the index.
+
+        # Returns
+
+        Two arrays: the position of each file in the list of examples, and the frame number.
+        """
+        if self.index is None:
+            raise ValueError('CostarBlockStackingSequence: enumerating time steps needs an index')
+        return self.index.time_steps(self.list_example_filenames)
+
+    def get_time_steps_per_example(self):
+        """ Get the exact average number of frames the examples can be sampled at, from the index.
+        """
+        file_ids, _ = self.get_time_steps()
+        return int(np.ceil(len(file_ids) / float(max(1, len(self.list_example_filenames)))))
+
+    def _open_example(self, example_filename):
+        """ Open an example file, or a view of it that reads everything but images from the index.
+        """
+        if self.index is not None:
+            return self.index.open(example_filename)
+        return h5py.File(example_filename, 'r')
+
     def on_epoch_end(self):
         """ Updates indexes after each epoch
         """
@@ -527,34 +573,6 @@ class CostarBlockStackingSequence(Sequence):
         list_Ids: a list of file paths to be read
         """
 
-        def JpegToNumpy(jpeg):
-            stream = io.BytesIO(jpeg)
-            im = np.asarray(Image.open(stream))
-            try:
-                return im.astype(np.uint8)
-            except(TypeError) as exception:
-                print("Failed to convert PIL image type", exception)
-                print("type ", type(im), "len ", len(im))
-
-        def ConvertImageListToNumpy(data, format='numpy', data_format='NHWC'):
-            """ Convert a list of binary jpeg or png files to numpy format.
-
-            # Arguments
-
-            data: a list of binary jpeg images to convert
-            format: default 'numpy' returns a 4d numpy array,
-                'list' returns a list of 3d numpy arrays
-            """
-            length = len(data)
-            imgs = []
-            for raw in data:
-                img = JpegToNumpy(raw)
-                if data_format == 'NCHW':
-                    img = np.transpose(img, [2, 0, 1])
-                imgs.append(img)
-            if format == 'numpy':
-                imgs = np.array(imgs)
-            return imgs
         try:
             # Initialization
             if self.verbose > 0:
@@ -584,7 +602,7 @@ class CostarBlockStackingSequence(Sequence):
                 try:
                     if not os.path.isfile(example_filename):
                         raise ValueError('CostarBlockStackingSequence: Trying to open something which is not a file: ' + str(example_filename))
-                    with h5py.File(example_filename, 'r') as data:
+                    with self._open_example(example_filename) as data:
                         if 'gripper_action_goal_idx' not in data or 'gripper_action_label' not in data:
                             raise ValueError('block_stacking_reader.py: You need to run preprocessing before this will work! \n' +
                                              '    python2 ctp_integration/scripts/view_convert_dataset.py --path ~/.keras/datasets/costar_block_stacking_dataset_v0.4 --preprocess_inplace gripper_action --write'
@@ -18,6 +18,7 @@ import tensorflow as tf
 import traceback
 import keras
 import hypertree_utilities
+from hyperopt_store import history_objective
 
 # progress bars https://github.com/tqdm/tqdm
 # import tqdm without enforcing it as a dependency
@@ -179,37 +180,13 @@ class HyperparameterOptions(object):
             json.dump(data, fp)
 
 
-def optimize(
-        run_training_fn,
-        feature_combo_name,
-        seed=1,
-        verbose=1,
-        initial_num_samples=300,
-        maximum_hyperopt_steps=100,
-        num_cores=15,
-        baysean_batch_size=1,
-        problem_type=None,
-        log_dir='./',
-        run_name='',
-        param_to_optimize='val_acc',
-        maximize=None,
-        variable_trainability=False,
-        learning_rate_enabled=False,
-        min_top_block_filter_multiplier=6,
-        batch_size=2,
-        hyperoptions=None,
-        **kwargs):
-    """ Run hyperparameter optimization
+def choose_maximize(param_to_optimize, maximize=None):
+    """ Decide if param_to_optimize should be maximized or minimized.
 
-    hyperoptions: an instance of thee hyperopt.HyperparameterOptions class,
-        default of None will create one automatically
+    # Returns
 
-    kwargs: these are passed to the run_training_fn but *not* saved as hyperparameters.
-        The current example use case is to disable model checkpointing if it takes too much space
-        with the parameter checkpoint=False (assuming the run_training_fn accepts that parameter).
+    (maximize, optimize_loss)
     """
-    np.random.seed(seed)
-
     optimize_loss = False
     if maximize is None:
         if 'loss' in param_to_optimize:
@@ -225,7 +202,27 @@ def optimize(
                 'if the string "acc" is in param_to_optimize we will maximize by default, '
                 'alternately you can set the maximize flag to True or False and we '
                 'will go with your choice.')
+    return maximize, optimize_loss
+
 
+def hypertree_hyperoptions(
+        feature_combo_name,
+        problem_type=None,
+        variable_trainability=False,
+        learning_rate_enabled=False,
+        min_top_block_filter_multiplier=6,
+        batch_size=2,
+        optimize_loss=False,
+        hyperoptions=None):
+    """ Configure the hypertree model search space.
+
+    hyperoptions: an instance of thee hyperopt.HyperparameterOptions class,
+        default of None will create one automatically
+
+    # Returns
+
+    The HyperparameterOptions instance with every hypertree parameter added.
+    """
     if hyperoptions is None:
         hyperoptions = HyperparameterOptions()
     # Configuring hyperparameters
@@ -340,6 +337,63 @@ def optimize(
     # ['linear', 'relu', 'elu']
     hyperoptions.add_param('hidden_activation', ['relu', 'elu'],
                            default='relu', enable=True, required=True)
+    return hyperoptions
+
+
+def params_to_training_arguments(hyperoptions, x, learning_rate_enabled=False):
+    """ Convert one GPyOpt sample x to the hyperparams passed to the training function.
+    """
+    training_arguments = hyperoptions.params_to_args(x)
+
+    if learning_rate_enabled:
+        # Learning rates are exponential so we take a uniform random
+        # input and map it from 1 to 3e-5 on an exponential scale.
+        training_arguments['learning_rate'] = 0.9 ** training_arguments['learning_rate']
+    return training_arguments
+
+
+def optimize(
+        run_training_fn,
+        feature_combo_name,
+        seed=1,
+        verbose=1,
+        initial_num_samples=300,
+        maximum_hyperopt_steps=100,
+        num_cores=15,
+        baysean_batch_size=1,
+        problem_type=None,
+        log_dir='./',
+        run_name='',
+        param_to_optimize='val_acc',
+        maximize=None,
+        variable_trainability=False,
+        learning_rate_enabled=False,
+        min_top_block_filter_multiplier=6,
+        batch_size=2,
+        hyperoptions=None,
+        **kwargs):
+    """ Run hyperparameter optimization
+
+    hyperoptions: an instance of thee hyperopt.HyperparameterOptions class,
+        default of None will create one automatically
+
+    kwargs: these are passed to the run_training_fn but *not* saved as hyperparameters.
+        The current example use case is to disable model checkpointing if it takes too much space
+        with the parameter checkpoint=False (assuming the run_training_fn accepts that parameter).
+    """
+    np.random.seed(seed)
+
+    maximize, optimize_loss = choose_maximize(param_to_optimize, maximize)
+    hyperoptions = hypertree_hyperoptions(
+        feature_combo_name,
+        problem_type=problem_type,
+        variable_trainability=variable_trainability,
+        learning_rate_enabled=learning_rate_enabled,
+        min_top_block_filter_multiplier=min_top_block_filter_multiplier,
+        batch_size=batch_size,
+        optimize_loss=optimize_loss,
+        hyperoptions=hyperoptions)
+
     # deep learning algorithms don't give exact results
     algorithm_gives_exact_results = False
     # how many optimization steps to take after the initial sampling
@@ -352,12 +406,7 @@ def optimize(
 
     def train_callback(x):
         # x is a funky 2d numpy array, so we convert it back to normal parameters
-        training_arguments = hyperoptions.params_to_args(x)
-
-        if learning_rate_enabled:
-            # Learning rates are exponential so we take a uniform random
-            # input and map it from 1 to 3e-5 on an exponential scale.
-            training_arguments['learning_rate'] = 0.9 ** training_arguments['learning_rate']
+        training_arguments = params_to_training_arguments(hyperoptions, x, learning_rate_enabled)
 
         if verbose:
             # update counts by 1 each step
@@ -419,19 +468,7 @@ def optimize(
         if history is not None:
             # hyperopt seems to be done on val_loss
             # may try 1-val_acc sometime (since the hyperopt minimizes)
-            if param_to_optimize in history.history:
-                # Take the best performance regardless of the epoch
-                if maximize:
-                    loss = np.max(history.history[param_to_optimize])
-                else:
-                    loss = np.min(history.history[param_to_optimize])
-            else:
-                raise ValueError('A hyperopt step completed, but the parameter '
-                                 'being optimized over is %s and it '
-                                 'was missing from the history'
-                                 'so hyperopt must exit. Here are the contents '
-                                 'of the history.history dictionary:\n\n %s' %
-                                 (param_to_optimize, str(history.history)))
+            loss = history_objective(history.history, param_to_optimize, maximize)
             if verbose > 0:
                 if 'val_binary_accuracy' in history.history:
                     acc = np.max(history.history['val_binary_accuracy'])
@@ -13,6 +13,7 @@ from tensorflow.python.platform import gfile
 from tensorflow.python.platform import app
 import pandas
 import hypertree_utilities
+import hyperopt_store
 
 # progress bars https://github.com/tqdm/tqdm
 # import tqdm without enforcing it as a dependency
@@ -119,12 +120,53 @@ flags.DEFINE_string(
     'Only include rows where the basename contains the string you specify, useful for extracting a single specific model.'
 )
 
+flags.DEFINE_string(
+    'trial_store',
+    None,
+    'Rank the trials of a hyperopt_scheduler.py search in this store directory '
+    'instead of the csv files in log_dir.'
+)
+
 FLAGS = flags.FLAGS
 
 
+def filter_epochs(dataframe):
+    """ Apply the epoch filter flags to the rows of a dataframe.
+    """
+    if FLAGS.filter_epoch:
+        dataframe = dataframe.loc[dataframe['epoch'] == FLAGS.epoch]
+
+    if FLAGS.max_epoch is not None:
+        dataframe = dataframe.loc[dataframe['epoch'] <= FLAGS.max_epoch]
+
+    if FLAGS.min_epoch is not None:
+        dataframe = dataframe.loc[dataframe['epoch'] >= FLAGS.min_epoch]
+    return dataframe
+
+
+def read_trial_store(store_dir):
+    """ Load the epochs of every trial in a hyperopt_store.TrialStore as a list with one dataframe.
+
+    The basename and csv_filename columns hold the trial json file,
+    so --filter_unique keeps the best epoch of each trial.
+    """
+    store = hyperopt_store.TrialStore(store_dir)
+    dataframe = pandas.DataFrame(store.history_rows())
+    if dataframe.empty:
+        return []
+    dataframe['basename'] = dataframe['trial_filename'].apply(os.path.basename)
+    dataframe['csv_filename'] = dataframe['trial_filename']
+    dataframe['hyperparameters_filename'] = dataframe['trial_filename']
+    return [filter_epochs(dataframe)]
+
+
 def main(_):
-    csv_files = gfile.Glob(os.path.join(os.path.expanduser(FLAGS.log_dir), FLAGS.glob_csv))
-    dataframe_list = []
+    if FLAGS.trial_store is not None:
+        csv_files = []
+        dataframe_list = read_trial_store(FLAGS.trial_store)
+    else:
+        csv_files = gfile.Glob(os.path.join(os.path.expanduser(FLAGS.log_dir), FLAGS.glob_csv))
+        dataframe_list = []
     progress = tqdm(csv_files)
     for csv_file in progress:
         # progress.write('reading: ' + str(csv_file))
@@ -137,14 +179,7 @@ def main(_):
             hyperparam_filename = gfile.Glob(os.path.join(csv_dir, FLAGS.glob_hyperparams))
 
             # filter specific epochs
-            if FLAGS.filter_epoch:
-                dataframe = dataframe.loc[dataframe['epoch'] == FLAGS.epoch]
-
-            if FLAGS.max_epoch is not None:
-                dataframe = dataframe.loc[dataframe['epoch'] <= FLAGS.max_epoch]
-
-            if FLAGS.min_epoch is not None:
-                dataframe = dataframe.loc[dataframe['epoch'] >= FLAGS.min_epoch]
+            dataframe = filter_epochs(dataframe)
 
             # manage hyperparams
             if len(hyperparam_filename) > 1:
@@ -185,6 +220,8 @@ def main(_):
 
     if FLAGS.save_dir is None:
         FLAGS.save_dir = FLAGS.log_dir
+        if FLAGS.trial_store is not None:
+            FLAGS.save_dir = FLAGS.trial_store
     output_filename = os.path.join(FLAGS.save_dir, FLAGS.save_csv)
     results_df.to_csv(output_filename)
     print('Processing complete. Results saved to file: ' + str(output_filename))
@@ -0,0 +1,561 @@
+#!/usr/local/bin/python
+"""
+Run hyperparameter optimization trials in parallel worker processes.
+
+hyperopt.optimize() trains one model at a time inside the process that runs
+GPyOpt, so a crash ends the whole search and nothing but the GPyOpt report
+files is left behind. The scheduler here instead:
+
+ - keeps every trial in a hyperopt_store.TrialStore, so an interrupted search
+   resumes where it stopped when optimize() is called again with the same
+   store_dir,
+ - trains up to num_workers trials at once, each in its own python process
+   running this file with --worker, with optional memory, cpu time and wall
+   clock limits, and one GPU per worker slot,
+ - stops trials which lag their peers with asynchronous successive halving:
+   every trial is first trained for min_epochs, and a trial is trained again
+   with eta times more epochs only if it is in the top 1 / eta of the trials
+   that reached its rung. Training restarts from scratch with the larger
+   budget.
+
+New trials are sampled at random for the first initial_num_samples trials
+and are suggested by GPyOpt from the completed trials afterwards.
+
+Example, with hypertree_train.run_training as the training function:
+
+    hyperopt_scheduler.optimize(
+        'hypertree_train:run_training', 'image_preprocessed',
+        store_dir='hyperopt_logs/search', num_workers=2, gpus=['0', '1'],
+        min_epochs=1, max_epochs=9, worker_flags=['--batch_size=16'])
+
+Rank the trials with:
+
+    python hyperopt_rank.py --trial_store hyperopt_logs/search --nofilter_epoch
+
+Apache License 2.0 https://www.apache.org/licenses/LICENSE-2.0
+
+"""
+
+import os
+import sys
+import time
+import signal
+import importlib
+import subprocess
+import traceback
+import numpy as np
+
+import hyperopt_store
+from hyperopt_store import TrialStore
+from hyperopt_store import PENDING, RUNNING, COMPLETED, FAILED
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, resource limits will be disabled
+    resource = None
+
+
+def rung_epochs(rung, min_epochs, eta):
+    """ Epoch budget of a successive halving rung.
+    """
+    if min_epochs is None:
+        return None
+    return int(min_epochs * eta ** rung)
+
+
+def max_rung(min_epochs, max_epochs, eta):
+    """ Highest successive halving rung whose budget is at most max_epochs.
+    """
+    if min_epochs is None or max_epochs is None:
+        return 0
+    rung = 0
+    while rung_epochs(rung + 1, min_epochs, eta) <= max_epochs:
+        rung += 1
+    return rung
+
+
+def worst_objective(maximize):
+    if maximize:
+        return float('-inf')
+    return float('inf')
+
+
+class WorkerLimits(object):
+    """ Resource limits applied to each worker process before it starts.
+
+    max_memory_mb: address space limit of the worker in megabytes.
+        CUDA reserves a very large address space, so only use it for cpu training.
+    max_cpu_seconds: cpu time after which the worker is killed.
+    nice: niceness added to the worker so the scheduler stays responsive.
+    """
+
+    def __init__(self, max_memory_mb=None, max_cpu_seconds=None, nice=0):
+        self.max_memory_mb = max_memory_mb
+        self.max_cpu_seconds = max_cpu_seconds
+        self.nice = nice
+
+    def __call__(self):
+        if self.nice:
+            os.nice(self.nice)
+        if resource is None:
+            return
+        if self.max_memory_mb is not None:
+            limit = int(self.max_memory_mb) * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if self.max_cpu_seconds is not None:
+            limit = int(self.max_cpu_seconds)
+            resource.setrlimit(resource.RLIMIT_CPU, (limit, limit))
+
+
+class TrialScheduler(object):
+    """ Create, run and promote the trials of a search stored in a TrialStore.
+
+    # Arguments
+
+    store: the TrialStore of the search.
+    suggest_fn: function taking (trials, count, pending_x) and returning count
+        new samples in the GPyOpt domain.
+    to_hyperparams_fn: function converting one sample to the hyperparams of its trial.
+    max_trials: total number of trials to create.
+    maximize: True if larger objectives are better.
+    num_workers: number of trials trained at the same time.
+    min_epochs: epochs of the first successive halving rung,
+        None trains every trial once with the training function's default epochs.
+    max_epochs: the largest epoch budget of a trial.
+    eta: trials are promoted to the next rung if they are in the top 1 / eta of their rung,
+        and the next rung trains eta times more epochs.
+    gpus: list of CUDA_VISIBLE_DEVICES values, worker slot i uses gpus[i % len(gpus)].
+    limits: WorkerLimits for the worker processes.
+    timeout: wall clock seconds after which a worker is killed and its trial failed.
+    max_attempts: number of times a trial whose worker crashed is run before it fails.
+    worker_flags: extra command line arguments for the worker processes,
+        for example the flags of hypertree_train.py.
+    poll_interval: seconds between checks of the workers.
+    """
+
+    def __init__(self, store, suggest_fn, to_hyperparams_fn, max_trials, maximize,
+                 num_workers=1, min_epochs=None, max_epochs=None, eta=3,
+                 gpus=None, limits=None, timeout=None, max_attempts=2,
+                 worker_flags=None, poll_interval=1.0, verbose=1):
+        if num_workers < 1:
+            raise ValueError('TrialScheduler needs at least one worker, not ' + str(num_workers))
+        if eta < 2:
+            raise ValueError('TrialScheduler successive halving needs eta >= 2, not ' + str(eta))
+        self.store = store
+        self.suggest_fn = suggest_fn
+        self.to_hyperparams_fn = to_hyperparams_fn
+        self.max_trials = max_trials
+        self.maximize = maximize
+        self.num_workers = num_workers
+        self.min_epochs = min_epochs
+        self.eta = eta
+        self.max_rung = max_rung(min_epochs, max_epochs, eta)
+        self.gpus = gpus
+        self.limits = limits
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.worker_flags = worker_flags or []
+        self.poll_interval = poll_interval
+        self.verbose = verbose
+        # worker slot -> (trial, process, start time, log file)
+        self.workers = {}
+        self.trials = self.store.trials()
+        self._resume()
+
+    def _resume(self):
+        """ Queue the trials which were running when the previous scheduler stopped.
+        """
+        for trial in self.trials:
+            if trial['status'] == RUNNING:
+                trial['status'] = PENDING
+                self.store.save(trial)
+                self._log('resuming trial ' + str(trial['id']) + ' at rung ' + str(trial['rung']))
+
+    def _log(self, message):
+        if self.verbose > 0:
+            print('hyperopt_scheduler.py: ' + message)
+            sys.stdout.flush()
+
+    def run(self):
+        """ Run trials until max_trials were created and none can be promoted.
+
+        # Returns
+
+        The list of every trial record.
+        """
+        try:
+            while True:
+                self._poll()
+                for slot in range(self.num_workers):
+                    if slot in self.workers:
+                        continue
+                    trial = self._next_trial()
+                    if trial is None:
+                        break
+                    self._launch(slot, trial)
+                if not self.workers:
+                    break
+                time.sleep(self.poll_interval)
+        finally:
+            # the trials of killed workers stay RUNNING in the store and will be resumed
+            for trial, process, _, log in self.workers.values():
+                self._kill(process)
+                log.close()
+            self.workers = {}
+        return self.trials
+
+    def _next_trial(self):
+        """ The next trial to train: resumed trials first, then promotions, then new trials.
+        """
+        for trial in self.trials:
+            if trial['status'] == PENDING:
+                return trial
+        trial = self._promotable()
+        if trial is not None:
+            trial['rung'] += 1
+            self._log('promoting trial ' + str(trial['id']) + ' to rung ' + str(trial['rung']))
+            return trial
+        if len(self.trials) < self.max_trials:
+            pending_x = [trial['x'] for trial in self.trials if trial['status'] == RUNNING]
+            x = np.array(self.suggest_fn(self.trials, 1, pending_x))[0]
+            trial = self.store.create(x.tolist(), self.to_hyperparams_fn(x), len(self.trials))
+            self.trials.append(trial)
+            return trial
+        return None
+
+    def _promotable(self):
+        """ The best completed trial in the top 1 / eta of its rung, if any.
+        """
+        candidates = []
+        for rung in range(self.max_rung):
+            key = str(rung)
+            reached = [trial for trial in self.trials if key in trial['rung_objectives']]
+            if not reached:
+                continue
+            objectives = np.array([trial['rung_objectives'][key] for trial in reached])
+            if self.maximize:
+                objectives = -objectives
+            num_promoted = len(reached) // self.eta
+            top = np.argsort(objectives, kind='mergesort')[:num_promoted]
+            for i in top:
+                trial = reached[i]
+                if (trial['status'] == COMPLETED and trial['rung'] == rung and
+                        np.isfinite(objectives[i])):
+                    candidates.append((rung, objectives[i], trial))
+        if not candidates:
+            return None
+        # prefer the highest rung, then the best objective
+        candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+        return candidates[0][2]
+
+    def _launch(self, slot, trial):
+        trial['status'] = RUNNING
+        trial['epochs'] = rung_epochs(trial['rung'], self.min_epochs, self.eta)
+        trial['error'] = None
+        self.store.save(trial)
+        result_filename = self.store.result_filename(trial['id'])
+        if os.path.exists(result_filename):
+            os.remove(result_filename)
+
+        env = dict(os.environ)
+        if self.gpus:
+            env['CUDA_VISIBLE_DEVICES'] = str(self.gpus[slot % len(self.gpus)])
+        command = [sys.executable, os.path.abspath(__file__.replace('.pyc', '.py')),
+                   '--worker', self.store.trial_filename(trial['id'])] + list(self.worker_flags)
+        log = open(self.store.log_filename(trial['id']), 'a')
+        log.write('\n' + ' '.join(command) + '\n')
+        log.flush()
+        process = subprocess.Popen(
+            command, stdout=log, stderr=subprocess.STDOUT, env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            preexec_fn=self.limits)
+        self.workers[slot] = (trial, process, time.time(), log)
+        self._log('started trial ' + str(trial['id']) + ' with ' + str(trial['epochs']) +
+                  ' epochs on worker ' + str(slot) + ', pid ' + str(process.pid))
+
+    def _poll(self):
+        """ Collect the results of finished workers and kill workers past the timeout.
+        """
+        for slot, (trial, process, start, log) in list(self.workers.items()):
+            returncode = process.poll()
+            timed_out = False
+            if returncode is None:
+                if self.timeout is None or time.time() - start < self.timeout:
+                    continue
+                self._kill(process)
+                timed_out = True
+                returncode = process.returncode
+            log.close()
+            del self.workers[slot]
+            self._finish(trial, returncode, timed_out)
+
+    def _finish(self, trial, returncode, timed_out):
+        result_filename = self.store.result_filename(trial['id'])
+        result = None
+        if not timed_out and os.path.exists(result_filename):
+            result = hyperopt_store.load_json(result_filename)
+
+        if result is not None and result.get('error') is None:
+            objective = result['objective']
+            trial['status'] = COMPLETED
+            trial['history'] = result['history']
+            trial['rung_objectives'][str(trial['rung'])] = objective
+            trial['objective'] = objective
+            self._log('trial ' + str(trial['id']) + ' rung ' + str(trial['rung']) +
+                      ' objective: ' + str(objective))
+        elif result is not None or timed_out:
+            # the training function raised an exception or ran too long, running it again won't help
+            trial['status'] = FAILED
+            trial['error'] = result['error'] if result is not None else 'timeout after ' + str(self.timeout) + 's'
+            self._fail(trial)
+        else:
+            # the worker crashed, for example killed by a resource limit
+            trial['attempts'] += 1
+            trial['error'] = 'worker exited with code ' + str(returncode) + ' and no result'
+            if trial['attempts'] < self.max_attempts:
+                trial['status'] = PENDING
+                self._log('trial ' + str(trial['id']) + ' crashed, will retry: ' + trial['error'])
+            else:
+                trial['status'] = FAILED
+                self._fail(trial)
+        self.store.save(trial)
+
+    def _fail(self, trial):
+        # a failed promoted trial keeps the objective of the rungs it completed
+        if trial['rung'] == 0:
+            trial['objective'] = worst_objective(self.maximize)
+        else:
+            trial['rung'] -= 1
+        self._log('trial ' + str(trial['id']) + ' failed: ' + str(trial['error']).strip().split('\n')[-1])
+
+    def _kill(self, process):
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+
+def gpyopt_suggest_fn(domain, initial_num_samples, maximize):
+    """ Suggest new samples at random for the first initial_num_samples trials,
+    and with GPyOpt Bayesian optimization over the completed trials afterwards.
+    """
+    import GPyOpt
+
+    space = GPyOpt.Design_space(space=domain)
+
+    def suggest(trials, count, pending_x):
+        done = [trial for trial in trials
+                if trial['objective'] is not None and np.isfinite(trial['objective'])]
+        if len(trials) < initial_num_samples or len(done) < 2:
+            return GPyOpt.experiment_design.initial_design('random', space, count)
+        x = np.array([trial['x'] for trial in done])
+        y = np.array([[trial['objective']] for trial in done])
+        if maximize:
+            # GPyOpt minimizes
+            y = -y
+        pending_x = np.array(pending_x) if pending_x else None
+        bayesian_optimization = GPyOpt.methods.BayesianOptimization(
+            f=None,
+            domain=domain,
+            X=x,
+            Y=y,
+            model_type='sparseGP',
+            acquisition_type='EI',  # Expected Improvement
+            evaluator_type='predictive',
+            batch_size=count,
+            exact_feval=False)
+        return bayesian_optimization.suggest_next_locations(pending_X=pending_x)
+
+    return suggest
+
+
+def optimize(
+        run_training_fn,
+        feature_combo_name,
+        store_dir,
+        seed=1,
+        verbose=1,
+        initial_num_samples=300,
+        maximum_hyperopt_steps=100,
+        num_workers=1,
+        min_epochs=None,
+        max_epochs=None,
+        eta=3,
+        gpus=None,
+        max_memory_mb=None,
+        max_cpu_seconds=None,
+        timeout=None,
+        max_attempts=2,
+        worker_flags=None,
+        problem_type=None,
+        param_to_optimize='val_acc',
+        maximize=None,
+        variable_trainability=False,
+        learning_rate_enabled=False,
+        min_top_block_filter_multiplier=6,
+        batch_size=2,
+        hyperoptions=None,
+        **kwargs):
+    """ Run a resumable hyperparameter search with parallel worker processes.
+
+    The search space and objective are the same as hyperopt.optimize().
+    Calling optimize() again with the same store_dir resumes the search,
+    the search space must not change in between.
+
+    # Arguments
+
+    run_training_fn: 'module:function' name of the training function, which
+        each worker imports, for example 'hypertree_train:run_training'.
+        It is called with hyperparams=hyperparams, epochs=budget when
+        successive halving is enabled, the hyperparams and kwargs,
+        and must return a keras history.
+    store_dir: directory of the TrialStore holding the search.
+    num_workers: number of trials trained at the same time.
+    min_epochs, max_epochs, eta: successive halving settings, see TrialScheduler.
+        The default min_epochs=None disables successive halving.
+    gpus: list of CUDA_VISIBLE_DEVICES values, one per worker slot.
+    max_memory_mb, max_cpu_seconds: resource limits of each worker, see WorkerLimits.
+    timeout: wall clock seconds after which a trial is killed and fails.
+    worker_flags: command line flags parsed by the workers before training.
+    kwargs: these are passed to the run_training_fn but *not* saved as hyperparameters.
+
+    # Returns
+
+    The best hyperparams found.
+    """
+    # import here so workers and hyperopt_rank.py don't need GPyOpt
+    import hyperopt
+
+    if ':' not in run_training_fn:
+        raise ValueError('hyperopt_scheduler.optimize() run_training_fn must be a '
+                         '"module:function" string, not: ' + str(run_training_fn))
+    maximize, optimize_loss = hyperopt.choose_maximize(param_to_optimize, maximize)
+    hyperoptions = hyperopt.hypertree_hyperoptions(
+        feature_combo_name,
+        problem_type=problem_type,
+        variable_trainability=variable_trainability,
+        learning_rate_enabled=learning_rate_enabled,
+        min_top_block_filter_multiplier=min_top_block_filter_multiplier,
+        batch_size=batch_size,
+        optimize_loss=optimize_loss,
+        hyperoptions=hyperoptions)
+
+    store = TrialStore(store_dir)
+    search = {
+        'run_training_fn': run_training_fn,
+        'param_to_optimize': param_to_optimize,
+        'maximize': maximize,
+        'domain': hyperoptions.get_domain(),
+        'kwargs': kwargs}
+    previous = store.load_search()
+    if previous is not None:
+        if previous['domain'] != hyperopt_store.json_round_trip(search['domain']):
+            raise ValueError('hyperopt_scheduler.optimize() the search space changed since '
+                             'the search in ' + store.directory + ' was started, '
+                             'use a new store_dir.')
+        print('Resuming hyperopt search in ' + store.directory)
+    else:
+        print('Starting hyperopt search in ' + store.directory)
+    store.save_search(search)
+    hyperoptions.save(os.path.join(store.directory, 'hyperoptions.json'))
+
+    if seed is not None:
+        # continue the random sequence where the previous run of the search stopped
+        np.random.seed(seed + len(store.trials()))
+
+    scheduler = TrialScheduler(
+        store,
+        gpyopt_suggest_fn(hyperoptions.get_domain(), initial_num_samples, maximize),
+        lambda x: hyperopt.params_to_training_arguments(hyperoptions, x, learning_rate_enabled),
+        max_trials=initial_num_samples + maximum_hyperopt_steps,
+        maximize=maximize,
+        num_workers=num_workers,
+        min_epochs=min_epochs,
+        max_epochs=max_epochs,
+        eta=eta,
+        gpus=gpus,
+        limits=WorkerLimits(max_memory_mb, max_cpu_seconds, nice=0),
+        timeout=timeout,
+        max_attempts=max_attempts,
+        worker_flags=worker_flags,
+        verbose=verbose)
+    trials = scheduler.run()
+
+    best = best_trial(trials, maximize)
+    if best is None:
+        print('Hyperopt search in ' + store.directory + ' has no completed trials.')
+        return None
+    result_file = os.path.join(store.directory, 'optimized_hyperparams.json')
+    hyperopt_store.write_json_atomic(result_file, best['hyperparams'])
+    print('Hyperparameter Optimization final best result:\n' + str(best['hyperparams']))
+    print('Optimized ' + param_to_optimize + ': {0} at rung {1}'.format(best['objective'], best['rung']))
+    return best['hyperparams']
+
+
+def best_trial(trials, maximize):
+    """ The trial with the best objective at the highest rung reached by any trial.
+
+    Promoted trials which failed are included with the objective of the last rung they completed.
+    """
+    done = [trial for trial in trials
+            if trial['objective'] is not None and np.isfinite(trial['objective'])]
+    if not done:
+        return None
+    top_rung = max(trial['rung'] for trial in done)
+    done = [trial for trial in done if trial['rung'] == top_rung]
+    objectives = np.array([trial['objective'] for trial in done])
+    if maximize:
+        return done[int(np.argmax(objectives))]
+    return done[int(np.argmin(objectives))]
+
+
+def _parse_worker_flags(argv):
+    """ Parse the tensorflow flags defined by the training module, if there are any.
+    """
+    try:
+        from tensorflow.python.platform import flags
+    except ImportError:
+        return
+    flags.FLAGS(argv, known_only=True)
+
+
+def run_worker(trial_filename, argv):
+    """ Train the model of one trial and write its result file.
+
+    Exceptions of the training function are written to the result so the
+    trial fails, while a crash of the process leaves no result and the
+    scheduler retries the trial.
+    """
+    # the worker must not be killed by the ctrl + c meant for the scheduler
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    trial = hyperopt_store.load_json(trial_filename)
+    store = TrialStore(os.path.dirname(os.path.dirname(trial_filename)))
+    search = store.load_search()
+    module_name, function_name = search['run_training_fn'].split(':')
+    module = importlib.import_module(module_name)
+    _parse_worker_flags(argv)
+    run_training_fn = getattr(module, function_name)
+
+    training_arguments = dict(trial['hyperparams'])
+    training_arguments.update(search['kwargs'])
+    if trial['epochs'] is not None:
+        training_arguments['epochs'] = trial['epochs']
+    result = {'error': None}
+    try:
+        history = run_training_fn(hyperparams=trial['hyperparams'], **training_arguments)
+        result['history'] = dict((key, np.array(values).tolist())
+                                 for key, values in history.history.items())
+        result['objective'] = float(hyperopt_store.history_objective(
+            result['history'], search['param_to_optimize'], search['maximize']))
+    except Exception:
+        result['error'] = traceback.format_exc()
+        print(result['error'])
+    hyperopt_store.write_json_atomic(store.result_filename(trial['id']), result)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != '--worker':
+        print('usage: hyperopt_scheduler.py --worker <trial json> [training flags]\n'
+              'Workers are started by hyperopt_scheduler.optimize(), see hyperopt_scheduler.py.')
+        sys.exit(1)
+    run_worker(sys.argv[2], sys.argv[:1] + sys.argv[3:])
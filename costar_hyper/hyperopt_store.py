@@ -0,0 +1,180 @@
+"""
+On disk store of hyperparameter optimization trials.
+
+Every trial of a search is one json file in the store directory, written
+atomically so a crashed scheduler or worker never leaves a partial record:
+
+    <store>/search.json             configuration of the search
+    <store>/trials/trial_000012.json  state of trial 12
+    <store>/trials/trial_000012/     worker log and result of trial 12
+
+A trial record is a dictionary with:
+
+    id: integer trial number, in the order trials were created.
+    x: the GPyOpt sample the trial was created from.
+    hyperparams: the arguments passed to the training function.
+    status: one of TRIAL_STATUSES.
+    rung: successive halving rung of the last (or current) run.
+    epochs: epoch budget of the last (or current) run, None for the default.
+    objective: the value of the optimized metric at the highest rung reached.
+    rung_objectives: dictionary from rung (as a string) to objective.
+    history: the keras history dictionary of the last completed run.
+    attempts: number of runs that crashed without producing a result.
+    error: traceback or reason for the last failure.
+
+hyperopt_scheduler.py writes the store, hyperopt_rank.py --trial_store reads it.
+
+Apache License 2.0 https://www.apache.org/licenses/LICENSE-2.0
+
+"""
+import os
+import json
+import glob
+import six
+
+import numpy as np
+
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+TRIAL_STATUSES = [PENDING, RUNNING, COMPLETED, FAILED]
+
+
+def history_objective(history, param_to_optimize, maximize):
+    """ The best value of param_to_optimize over all epochs of a keras history dictionary.
+    """
+    if param_to_optimize not in history:
+        raise ValueError('A hyperopt step completed, but the parameter '
+                         'being optimized over is %s and it '
+                         'was missing from the history'
+                         'so hyperopt must exit. Here are the contents '
+                         'of the history.history dictionary:\n\n %s' %
+                         (param_to_optimize, str(history)))
+    # Take the best performance regardless of the epoch
+    if maximize:
+        return np.max(history[param_to_optimize])
+    return np.min(history[param_to_optimize])
+
+
+def write_json_atomic(filename, data):
+    """ Write data to a json file so readers only ever see a complete file.
+    """
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as fp:
+        json.dump(data, fp, indent=1, sort_keys=True, default=_to_json)
+    os.rename(tmp, filename)
+
+
+def load_json(filename):
+    with open(filename, 'r') as fp:
+        return json.load(fp)
+
+
+def json_round_trip(data):
+    """ data as it will be after it was written to a json file and loaded again.
+    """
+    return json.loads(json.dumps(data, default=_to_json))
+
+
+def _to_json(value):
+    """ Convert numpy values which json cannot serialize.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(repr(value) + ' is not JSON serializable')
+
+
+class TrialStore(object):
+    """ The trials of one hyperparameter search, stored in a directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.expanduser(directory)
+        self.trials_dir = os.path.join(self.directory, 'trials')
+        if not os.path.isdir(self.trials_dir):
+            os.makedirs(self.trials_dir)
+        self.search_filename = os.path.join(self.directory, 'search.json')
+
+    def load_search(self):
+        """ The search configuration, or None for a new store.
+        """
+        if not os.path.exists(self.search_filename):
+            return None
+        return load_json(self.search_filename)
+
+    def save_search(self, search):
+        write_json_atomic(self.search_filename, search)
+
+    def trial_filename(self, trial_id):
+        return os.path.join(self.trials_dir, 'trial_%06d.json' % trial_id)
+
+    def trial_dir(self, trial_id):
+        """ Directory for the worker log and result of a trial, created when needed.
+        """
+        trial_dir = os.path.join(self.trials_dir, 'trial_%06d' % trial_id)
+        if not os.path.isdir(trial_dir):
+            os.makedirs(trial_dir)
+        return trial_dir
+
+    def result_filename(self, trial_id):
+        return os.path.join(self.trial_dir(trial_id), 'result.json')
+
+    def log_filename(self, trial_id):
+        return os.path.join(self.trial_dir(trial_id), 'worker.log')
+
+    def trials(self):
+        """ Load every trial record, sorted by id.
+        """
+        filenames = sorted(glob.glob(os.path.join(self.trials_dir, 'trial_*.json')))
+        return [load_json(filename) for filename in filenames]
+
+    def create(self, x, hyperparams, trial_id):
+        """ Add a new pending trial at rung 0.
+        """
+        trial = {
+            'id': trial_id,
+            'x': x,
+            'hyperparams': hyperparams,
+            'status': PENDING,
+            'rung': 0,
+            'epochs': None,
+            'objective': None,
+            'rung_objectives': {},
+            'history': None,
+            'attempts': 0,
+            'error': None}
+        self.save(trial)
+        return trial
+
+    def save(self, trial):
+        write_json_atomic(self.trial_filename(trial['id']), trial)
+
+    def history_rows(self):
+        """ One row per trial and epoch of its last completed run, in the
+        layout of the csv files written by hypertree_train.py.
+
+        Every row holds the epoch, each metric of the history, the
+        hyperparams, and the trial's id, status, rung and objective.
+        """
+        rows = []
+        for trial in self.trials():
+            history = trial['history'] or {}
+            common = dict(trial['hyperparams'])
+            common.update({
+                'trial': trial['id'],
+                'status': trial['status'],
+                'rung': trial['rung'],
+                'objective': trial['objective'],
+                'trial_filename': self.trial_filename(trial['id'])})
+            epochs = max([len(values) for values in six.itervalues(history)] + [0])
+            for epoch in range(epochs):
+                row = dict(common)
+                row['epoch'] = epoch
+                for key, values in six.iteritems(history):
+                    if epoch < len(values):
+                        row[key] = values[epoch]
+                rows.append(row)
+        return rows
@@ -1,15 +1,45 @@
+import os
 import tensorflow as tf
 from keras import backend as K
 from tensorflow.python.platform import flags
 
 import hyperopt
+import hyperopt_scheduler
 import hypertree_train
 import cornell_grasp_dataset_reader
 import hypertree_utilities
 
+flags.DEFINE_integer(
+    'hyperopt_workers',
+    0,
+    'Number of models trained at the same time in separate worker processes by '
+    'hyperopt_scheduler.py, the default of 0 trains one model at a time in this process.'
+)
+
+flags.DEFINE_string(
+    'hyperopt_store',
+    None,
+    'Trial store directory of a hyperopt_scheduler.py search, an interrupted search '
+    'resumes when it is run again with the same directory. Defaults to log_dir/run_name.'
+)
+
+flags.DEFINE_integer(
+    'hyperopt_min_epochs',
+    None,
+    'Epochs of the first successive halving rung of hyperopt_scheduler.py, trials in the top third '
+    'are trained again with 3x the epochs up to --epochs. The default of None trains every model for --epochs.'
+)
+
 FLAGS = flags.FLAGS
 
 
+def modified_flags():
+    """ Command line arguments for every flag which is not at its default value,
+    so worker processes train with the flags set in main().
+    """
+    return [FLAGS[name].serialize() for name in FLAGS if not FLAGS[name].using_default_value]
+
+
 def cornell_hyperoptions(problem_type, param_to_optimize):
     """ Set some hyperparams based on the problem type and parameter to optimize
 
@@ -135,6 +165,29 @@ def main(_):
           ' fine_tuning_epochs: ' + str(FLAGS.fine_tuning_epochs) +
           ' problem_type:' + str(FLAGS.problem_type) +
           ' crop (height, width): ({}, {})'.format(FLAGS.crop_height, FLAGS.crop_width))
+    if FLAGS.hyperopt_workers > 0:
+        store_dir = FLAGS.hyperopt_store
+        if store_dir is None:
+            store_dir = os.path.join(log_dir, run_name)
+        best_hyperparams = hyperopt_scheduler.optimize(
+            run_training_fn='hypertree_train:run_training',
+            feature_combo_name=feature_combo_name,
+            store_dir=store_dir,
+            num_workers=FLAGS.hyperopt_workers,
+            min_epochs=FLAGS.hyperopt_min_epochs,
+            max_epochs=FLAGS.epochs,
+            worker_flags=modified_flags(),
+            problem_type=FLAGS.problem_type,
+            min_top_block_filter_multiplier=min_top_block_filter_multiplier,
+            batch_size=batch_size,
+            param_to_optimize=param_to_optimize,
+            initial_num_samples=initial_num_samples,
+            maximum_hyperopt_steps=maximum_hyperopt_steps,
+            learning_rate_enabled=learning_rate_enabled,
+            seed=seed,
+            checkpoint=checkpoint)
+        return
+
     best_hyperparams = hyperopt.optimize(
         run_training_fn=run_training_fn,
         feature_combo_name=feature_combo_name,
@@ -503,6 +503,137 @@ def shapely_intersection_over_union(rect0_points, rect1_points, verbose=0):
         return 0.0
 
 
+def batch_rectangle_vertices(h, w, cy, cx, theta):
+    """ Get the vertices of a batch of parameterized bounding boxes.
+
+    Vectorized version of rectangle_vertices(), all arguments are arrays of length n.
+
+    # Returns
+
+    An array of shape (n, 4, 2) with the 4 vertices of each rectangle in y, x order.
+    """
+    sin_theta, cos_theta = batch_normalize_sin_theta_cos_theta(np.sin(theta), np.cos(theta))
+    dx = w / 2.0
+    dy = h / 2.0
+    dxcos = dx * cos_theta
+    dxsin = dx * sin_theta
+    dycos = dy * cos_theta
+    dysin = dy * sin_theta
+    offsets = np.stack([
+        np.stack([-dxsin + -dycos, -dxcos - -dysin], axis=-1),
+        np.stack([ dxsin + -dycos,  dxcos - -dysin], axis=-1),
+        np.stack([ dxsin +  dycos,  dxcos -  dysin], axis=-1),
+        np.stack([-dxsin +  dycos, -dxcos -  dysin], axis=-1)
+    ], axis=1)
+    return np.stack([cy, cx], axis=-1)[:, np.newaxis, :] + offsets
+
+
+def batch_polygon_area(polygons, counts=None):
+    """ Signed area of a batch of polygons with the shoelace formula.
+
+    # Arguments
+
+        polygons: array of shape (n, k, 2) with the vertices of each polygon in order.
+        counts: optional number of vertices actually used by each polygon,
+            the rest are ignored. Defaults to k.
+
+    # Returns
+
+        An array of n signed areas, positive for counter clockwise polygons.
+    """
+    n, k = polygons.shape[:2]
+    if counts is None:
+        counts = np.full(n, k)
+    rows = np.arange(n)[:, np.newaxis]
+    following = (np.arange(k)[np.newaxis, :] + 1) % np.maximum(counts, 1)[:, np.newaxis]
+    p = polygons
+    q = polygons[rows, following]
+    cross = p[..., 0] * q[..., 1] - p[..., 1] * q[..., 0]
+    cross = np.where(np.arange(k)[np.newaxis, :] < counts[:, np.newaxis], cross, 0.0)
+    return 0.5 * np.sum(cross, axis=1)
+
+
+def batch_convex_polygon_intersection_area(subject, clip):
+    """ Area of the intersection of two batches of convex polygons.
+
+    Sutherland-Hodgman clipping of each subject polygon by each clip polygon,
+    done for the whole batch at once. Clipping by a half plane adds at most
+    one vertex to a convex polygon, so the polygons are kept in arrays with
+    room for k + m vertices, and a count of the vertices actually used.
+
+    # Arguments
+
+        subject: array of shape (n, k, 2) of convex polygons, vertices in order.
+        clip: array of shape (n, m, 2) of convex polygons, vertices in order.
+
+    # Returns
+
+        An array of n intersection areas.
+    """
+    subject = np.asarray(subject, dtype=np.float64)
+    clip = np.asarray(clip, dtype=np.float64)
+    n, k = subject.shape[:2]
+    m = clip.shape[1]
+    if n == 0:
+        return np.zeros(0)
+    rows = np.arange(n)[:, np.newaxis]
+    # make the clip polygons counter clockwise, so the inside is left of every edge
+    clip_area = batch_polygon_area(clip)
+    clip = np.where((clip_area < 0)[:, np.newaxis, np.newaxis], clip[:, ::-1], clip)
+    polygon = subject
+    counts = np.full(n, k)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for j in range(m):
+            edge_start = clip[:, j, np.newaxis, :]
+            edge = clip[:, (j + 1) % m, np.newaxis, :] - edge_start
+            size = polygon.shape[1]
+            index = np.arange(size)[np.newaxis, :]
+            used = index < counts[:, np.newaxis]
+            following = (index + 1) % np.maximum(counts, 1)[:, np.newaxis]
+            # cross product of the edge and the vertices, >= 0 is inside
+            side = (edge[..., 0] * (polygon[..., 1] - edge_start[..., 1]) -
+                    edge[..., 1] * (polygon[..., 0] - edge_start[..., 0]))
+            side_following = side[rows, following]
+            inside = side >= 0
+            # point where the polygon edge to the following vertex crosses the clip edge
+            t = side / (side - side_following)
+            crossing = polygon + t[..., np.newaxis] * (polygon[rows, following] - polygon)
+            # every vertex emits itself if it is inside, then the crossing if there is one
+            candidates = np.stack([polygon, crossing], axis=2).reshape(n, 2 * size, 2)
+            keep = np.stack([used & inside, used & (inside != (side_following >= 0))], axis=2).reshape(n, 2 * size)
+            # move the kept candidates to the front, in order
+            order = np.argsort(~keep, axis=1, kind='mergesort')[:, :min(2 * size, k + m)]
+            polygon = candidates[rows, order]
+            counts = np.minimum(np.sum(keep, axis=1), polygon.shape[1])
+        # unused entries may hold nan crossings, they are masked out of the area
+        area = np.abs(batch_polygon_area(polygon, counts))
+    # clipping by a degenerate polygon keeps everything, but nothing intersects it
+    area[clip_area == 0] = 0.0
+    return area
+
+
+def batch_intersection_over_union(rect0_points, rect1_points):
+    """ Vectorized shapely_intersection_over_union() for batches of rectangles.
+
+    # Arguments
+
+        rect0_points: array of shape (n, 4, 2) of rectangle vertices in order.
+        rect1_points: array of shape (n, 4, 2) of rectangle vertices in order.
+
+    # Returns
+
+        An array of n intersection over union values, 0 where the union is empty.
+    """
+    rect0_points = np.asarray(rect0_points, dtype=np.float64)
+    rect1_points = np.asarray(rect1_points, dtype=np.float64)
+    intersection_area = batch_convex_polygon_intersection_area(rect0_points, rect1_points)
+    union_area = (np.abs(batch_polygon_area(rect0_points)) +
+                  np.abs(batch_polygon_area(rect1_points)) - intersection_area)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = np.where(union_area > 0, intersection_area / union_area, 0.0)
+    return iou
+
+
 def normalize_sin_theta_cos_theta(sin_theta, cos_theta):
     """ Put sin(theta) cos(theta) on the unit circle.
 
@@ -515,6 +646,17 @@ def normalize_sin_theta_cos_theta(sin_theta, cos_theta):
     return sin_theta, cos_theta
 
 
+def batch_normalize_sin_theta_cos_theta(sin_theta, cos_theta):
+    """ Put arrays of sin(theta) cos(theta) on the unit circle.
+
+    Vectorized version of normalize_sin_theta_cos_theta(),
+    zero vectors are left unchanged like sklearn does.
+    """
+    norm = np.sqrt(np.square(sin_theta) + np.square(cos_theta))
+    norm = np.where(norm == 0.0, 1.0, norm)
+    return sin_theta / norm, cos_theta / norm
+
+
 def prediction_vector_has_grasp_success(y_pred):
     has_grasp_success = (y_pred.size == 7)
     return has_grasp_success
@@ -560,6 +702,41 @@ def decode_prediction_vector_theta_center_polygon(y_true):
     return theta, center, true_rp
 
 
+def batch_decode_prediction_vector(y_true):
+    """ Vectorized decode_prediction_vector() for a 2d array of prediction vectors.
+
+    Unlike decode_prediction_vector() the array is not modified.
+
+    # Returns
+
+    sin(2 * theta), cos(2 * theta), and an array of shape (n, 4, 2) with the rectangle vertices.
+    """
+    rect_index = get_prediction_vector_rectangle_start_index(y_true[0])
+    sin_cos = denorm_sin2_cos2(y_true[:, rect_index:rect_index + 2])
+    # decode_prediction_vector() passes the already denormalized angle
+    # to parse_rectangle_vertices(), which decodes it again, so we do the same
+    sin2, cos2 = batch_normalize_sin_theta_cos_theta(*denorm_sin2_cos2(sin_cos).T)
+    theta = np.arctan2(sin2, cos2) / 2.0
+    rect = y_true[:, rect_index + 2:]
+    true_rp = batch_rectangle_vertices(rect[:, 0], rect[:, 1], rect[:, 2], rect[:, 3], theta)
+    return sin_cos[:, 0], sin_cos[:, 1], true_rp
+
+
+def batch_angle_difference_less_than_threshold(
+        true_y_sin_theta, true_x_cos_theta,
+        pred_y_sin_theta, pred_x_cos_theta,
+        angle_threshold=np.radians(60.0)):
+    """ Vectorized angle_difference_less_than_threshold() for arrays of angles.
+    """
+    true_y_sin_theta, true_x_cos_theta = batch_normalize_sin_theta_cos_theta(true_y_sin_theta, true_x_cos_theta)
+    true_angle = np.arctan2(true_y_sin_theta, true_x_cos_theta)
+    pred_y_sin_theta, pred_x_cos_theta = batch_normalize_sin_theta_cos_theta(pred_y_sin_theta, pred_x_cos_theta)
+    pred_angle = np.arctan2(pred_y_sin_theta, pred_x_cos_theta)
+    true_pred_diff = true_angle - pred_angle
+    angle_difference = np.arctan2(np.sin(true_pred_diff), np.cos(true_pred_diff))
+    return np.abs(angle_difference) <= angle_threshold
+
+
 def angle_difference_less_than_threshold(
         true_y_sin_theta, true_x_cos_theta,
         pred_y_sin_theta, pred_x_cos_theta,
@@ -696,29 +873,54 @@ def jaccard_score(y_true, y_pred, angle_threshold=np.radians(60.0), iou_threshol
             return 0.0
 
 
-def grasp_jaccard_batch(y_true, y_pred, verbose=0):
-    # print('y_true.shape: ' + str(y_true.shape))
-    # print('y_pred.shape: ' + str(y_pred.shape))
-    scores = []
-    for i in range(y_true.shape[0]):
-        # print(' i: ' + str(i))
-        # TODO(ahundt) comment the next few lines when not debugging
-        verbose = 0
-        if np.random.randint(0, 10000) % 10000 == 0:
-            verbose = 1
-            print('')
-            print('')
-            print('hypertree_pose_metrics.py sample of ground_truth and prediction:')
-        this_true = y_true[i, :]
-        this_pred = y_pred[i, :]
-        score = jaccard_score(this_true, this_pred, verbose=verbose)
-        if verbose:
-            print('s2t_c2t_hw_cycx_true: ' + str(this_true))
-            print('s2t_c2t_hw_cycx_pred: ' + str(this_pred))
-            print('score:' + str(score))
-        scores += [score]
-    scores = np.array(scores, dtype=np.float32)
-    # print('scores.shape: ' + str(scores.shape))
+def grasp_jaccard_batch(y_true, y_pred, angle_threshold=np.radians(60.0), iou_threshold=0.25, verbose=0):
+    """ Vectorized jaccard_score() for a batch of ground truth and prediction vectors.
+
+    Gives the same scores as calling jaccard_score() on every row, but computes
+    the intersection over union of all the rectangles at once with
+    batch_intersection_over_union() instead of one shapely call per row.
+
+    # Arguments
+
+        y_true: a 2d numpy array of features, see jaccard_score() for formats.
+        y_pred: a 2d numpy array of features.
+
+    # Returns
+
+        A float32 array with a score of 0 or 1 for each row.
+    """
+    y_true = np.array(y_true, dtype=np.float64)
+    y_pred = np.array(y_pred, dtype=np.float64)
+    if y_true.shape[0] == 0:
+        return np.zeros(0, dtype=np.float32)
+    with np.errstate(invalid='ignore'):
+        true_y_sin_theta, true_x_cos_theta, true_rp = batch_decode_prediction_vector(y_true)
+        pred_y_sin_theta, pred_x_cos_theta, pred_rp = batch_decode_prediction_vector(y_pred)
+        is_within_angle_threshold = batch_angle_difference_less_than_threshold(
+            true_y_sin_theta, true_x_cos_theta,
+            pred_y_sin_theta, pred_x_cos_theta,
+            angle_threshold)
+        iou = batch_intersection_over_union(true_rp, pred_rp)
+        scores = (is_within_angle_threshold & (iou >= iou_threshold)).astype(np.float32)
+
+    if prediction_vector_has_grasp_success(y_pred[0]):
+        # round grasp success to 0 or 1
+        predicted_success = np.rint(y_pred[:, 0])
+        true_success = np.trunc(y_true[:, 0])
+        # grasp success prediction doesn't match, 0 score
+        scores[predicted_success != true_success] = 0.0
+        # true negatives get credit regardless of box contents
+        scores[(predicted_success == true_success) & (predicted_success == 0)] = 1.0
+
+    # TODO(ahundt) comment the next few lines when not debugging
+    for i in np.nonzero(np.random.randint(0, 10000, size=len(scores)) == 0)[0]:
+        print('')
+        print('')
+        print('hypertree_pose_metrics.py sample of ground_truth and prediction:')
+        print('s2t_c2t_hw_cycx_true: ' + str(y_true[i]))
+        print('s2t_c2t_hw_cycx_pred: ' + str(y_pred[i]))
+        print('iou: ' + str(iou[i]) + ' is_within_angle_threshold: ' + str(is_within_angle_threshold[i]))
+        print('score:' + str(scores[i]))
     return scores
 
 
@@ -808,6 +1010,57 @@ def normalize_axis(aaxyz, epsilon=1e-5, verbose=0):
     return aaxyz
 
 
+def batch_normalise_quaternions(q, tolerance=1e-14):
+    """ Normalise a batch of quaternions the way pyquaternion does.
+
+    Quaternions whose squared norm is within tolerance of 1
+    and zero quaternions are left unchanged.
+
+    q: n by 4 array of quaternion elements in pyquaternion order.
+    """
+    sum_of_squares = np.einsum('ij,ij->i', q, q)
+    norm = np.sqrt(sum_of_squares)
+    normalise = (np.abs(1.0 - sum_of_squares) >= tolerance) & (norm > 0)
+    return np.where(normalise[:, np.newaxis], q / np.where(normalise, norm, 1.0)[:, np.newaxis], q)
+
+
+def batch_rotation_to_xyz_theta(rotations):
+    """ Vectorized rotation_to_xyz_theta() for an n by 4 array of
+    quaternion elements, in the order pyquaternion takes them.
+
+    Follows the steps pyquaternion takes for Quaternion.angle and
+    Quaternion.axis, so the results are the same.
+
+    # Returns
+
+    An n by 4 array of the axis and signed angle.
+    """
+    # Quaternion.angle
+    q = batch_normalise_quaternions(np.asarray(rotations, dtype=np.float64))
+    vector_norm = np.sqrt(np.einsum('ij,ij->i', q[:, 1:], q[:, 1:]))
+    theta = ((2.0 * np.arctan2(vector_norm, q[:, 0]) + np.pi) % (2 * np.pi)) - np.pi
+    theta = np.where(theta == -np.pi, np.pi, theta)
+    # Quaternion.axis, which is the zero vector when it is undefined
+    q = batch_normalise_quaternions(q)
+    vector_norm = np.sqrt(np.einsum('ij,ij->i', q[:, 1:], q[:, 1:]))
+    defined = vector_norm >= 1e-17
+    axis = np.where(defined[:, np.newaxis], q[:, 1:] / np.where(defined, vector_norm, 1.0)[:, np.newaxis], 0.0)
+    theta = np.where(axis[:, 2] < 0, theta, -theta)
+    return np.concatenate([axis, theta[:, np.newaxis]], axis=-1)
+
+
+def batch_normalize_axis(aaxyz, epsilon=1e-5):
+    """ Vectorized normalize_axis() for an n by 3 array of axes.
+    """
+    aaxyz = np.array(aaxyz, dtype=np.float64)
+    # fix missing axes
+    aaxyz[~np.any(aaxyz, axis=-1), -1] += epsilon
+    # same steps as sklearn.preprocessing.normalize
+    norms = np.sqrt(np.einsum('ij,ij->i', aaxyz, aaxyz))
+    norms[norms == 0.0] = 1.0
+    return aaxyz / norms[:, np.newaxis]
+
+
 def encode_xyz_qxyzw_to_xyz_aaxyz_nsc(xyz_qxyzw, rescale_meters=4, rotation_weight=0.001, random_augmentation=None):
     """ Encode a translation + quaternion pose to an encoded xyz, axis, and an angle as sin(theta) cos(theta)
 
@@ -862,7 +1115,10 @@ def encode_xyz_qxyzw_to_xyz_aaxyz_nsc(xyz_qxyzw, rescale_meters=4, rotation_weig
 
 
 def batch_encode_xyz_qxyzw_to_xyz_aaxyz_nsc(batch_xyz_qxyzw, rescale_meters=4, rotation_weight=0.001, random_augmentation=None):
-    """ Expects n by 7 batch with xyz_qxyzw
+    """ Expects n by 7 batch with xyz_qxyzw, or n by 3 with xyz
+
+    Vectorized encode_xyz_qxyzw_to_xyz_aaxyz_nsc(), with the same results
+    and the same random numbers drawn in the same order for augmentation.
 
     rescale_meters: Divide the number of meters by this number so
         positions will be encoded between 0 and 1.
@@ -875,14 +1131,29 @@ def batch_encode_xyz_qxyzw_to_xyz_aaxyz_nsc(batch_xyz_qxyzw, rescale_meters=4, r
         of randomly modifying the data with a small translation and rotation.
         Enabling random_augmentation is not recommended.
     """
-    encoded_poses = []
-    for xyz_qxyzw in batch_xyz_qxyzw:
-        # print('xyz_qxyzw: ' + str(xyz_qxyzw))
-        xyz_aaxyz_nsc = encode_xyz_qxyzw_to_xyz_aaxyz_nsc(
-            xyz_qxyzw, rescale_meters=rescale_meters, rotation_weight=rotation_weight, random_augmentation=random_augmentation)
-        # print('xyz_aaxyz_nsc: ' + str(xyz_aaxyz_nsc))
-        encoded_poses.append(xyz_aaxyz_nsc)
-    return np.stack(encoded_poses, axis=0)
+    batch_xyz_qxyzw = np.asarray(batch_xyz_qxyzw)
+    length = batch_xyz_qxyzw.shape[-1]
+    if length != 7 and length != 3:
+        raise ValueError('batch_encode_xyz_qxyzw_to_xyz_aaxyz_nsc: unsupported input data length of ' + str(length))
+    xyz = (batch_xyz_qxyzw[:, :3] / rescale_meters) + 0.5
+    if random_augmentation is not None:
+        # whether each pose is modified depends on the previous draws,
+        # so draw pose by pose like encode_xyz_qxyzw_to_xyz_aaxyz_nsc()
+        xyz = xyz.copy()
+        for i in range(len(xyz)):
+            if np.random.random() > random_augmentation:
+                # random translation change of up to 0.5 cm
+                xyz[i] = xyz[i] + (np.random.random(3) - 0.5) / 10.
+    if length == 3:
+        return xyz
+    aaxyz_theta = batch_rotation_to_xyz_theta(batch_xyz_qxyzw[:, 3:])
+    # encode the unit axis vector into the [0,1] range
+    # rotation_weight makes it so mse applied to rotation values
+    # is on a similar scale to the translation values.
+    aaxyz = ((aaxyz_theta[:, :-1] / 2) * rotation_weight) + 0.5
+    theta = aaxyz_theta[:, -1]
+    nsc = encode_sin_cos(np.stack([np.sin(theta), np.cos(theta)], axis=-1))
+    return np.concatenate([xyz, aaxyz, nsc], axis=-1)
 
 
 def decode_xyz_aaxyz_nsc_to_xyz_qxyzw(xyz_aaxyz_nsc, rescale_meters=4, rotation_weight=0.001):
@@ -912,6 +1183,31 @@ def decode_xyz_aaxyz_nsc_to_xyz_qxyzw(xyz_aaxyz_nsc, rescale_meters=4, rotation_
     return xyz
 
 
+def batch_decode_xyz_aaxyz_nsc_to_xyz_qxyzw(batch_xyz_aaxyz_nsc, rescale_meters=4, rotation_weight=0.001):
+    """ Vectorized decode_xyz_aaxyz_nsc_to_xyz_qxyzw() for an n by 8 or n by 3 array.
+
+    The quaternion elements are in the same order as decode_xyz_aaxyz_nsc_to_xyz_qxyzw() returns them.
+    """
+    batch_xyz_aaxyz_nsc = np.asarray(batch_xyz_aaxyz_nsc, dtype=np.float64)
+    xyz = (batch_xyz_aaxyz_nsc[:, :3] - 0.5) * rescale_meters
+    length = batch_xyz_aaxyz_nsc.shape[-1]
+    if length == 3:
+        return xyz
+    elif length != 8:
+        raise ValueError('batch_decode_xyz_aaxyz_nsc_to_xyz_qxyzw: unsupported input data length of ' + str(length))
+    sin_theta, cos_theta = batch_normalize_sin_theta_cos_theta(*denorm_sin_cos(batch_xyz_aaxyz_nsc[:, -2:]).T)
+    theta = np.arctan2(sin_theta, cos_theta)
+    # decode ([0, 1] * rotation_weight) range to [-1, 1] range
+    aaxyz = ((batch_xyz_aaxyz_nsc[:, 3:-2] - 0.5) * 2) / rotation_weight
+    aaxyz = batch_normalize_axis(aaxyz)
+    # pyquaternion normalizes the axis again unless it is within 1e-12 of unit length
+    mag_sq = np.einsum('ij,ij->i', aaxyz, aaxyz)
+    aaxyz = np.where((np.abs(1.0 - mag_sq) > 1e-12)[:, np.newaxis], aaxyz / np.sqrt(mag_sq)[:, np.newaxis], aaxyz)
+    half_theta = theta / 2.0
+    q = np.concatenate([np.cos(half_theta)[:, np.newaxis], aaxyz * np.sin(half_theta)[:, np.newaxis]], axis=-1)
+    return np.concatenate([xyz, q], axis=-1)
+
+
 def grasp_acc(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc, max_translation=0.01, max_rotation=0.261799):
     """ Calculate 3D grasp accuracy for a single result with grasp_accuracy_xyz_aaxyz_nsc encoding.
 
@@ -1262,20 +1558,35 @@ def absolute_angle_distance_xyz_aaxyz_nsc_single(y_true_xyz_aaxyz_nsc, y_pred_xy
 
 def absolute_angle_distance_xyz_aaxyz_nsc_batch(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc):
     """ Calculate 3D grasp accuracy for a single result
-    Expects batch of data as an nx8 array. Eager execution / numpy version.
+    Expects batch of data as an nx8 or nx5 array. Eager execution / numpy version.
+
+    Vectorized absolute_angle_distance_xyz_aaxyz_nsc_single().
 
     max_translation defaults to 0.01 meters, or 1cm.
     max_rotation defaults to 15 degrees in radians.
     Input format is xyz_aaxyz_nsc.
     """
-    # print('type of y_true_xyz_aaxyz_nsc: ' + str(type(y_true_xyz_aaxyz_nsc)))
-    accuracies = []
-    for y_true, y_pred in zip(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc):
-        one_accuracy = absolute_angle_distance_xyz_aaxyz_nsc_single(y_true, y_pred)
-        # print('one grasp acc: ' + str(one_accuracy))
-        accuracies.append(one_accuracy)
-    accuracies = np.array(accuracies, np.float32)
-    return accuracies
+    return _batch_absolute_angle_distance(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc).astype(np.float32)
+
+
+def _batch_decode_quaternions(batch_xyz_aaxyz_nsc):
+    """ Decode the quaternions of an nx8 xyz_aaxyz_nsc or nx5 aaxyz_nsc array.
+    """
+    batch_xyz_aaxyz_nsc = np.asarray(batch_xyz_aaxyz_nsc)
+    if batch_xyz_aaxyz_nsc.shape[-1] == 5:
+        # rotation distance only, just use [0.5, 0.5, 0.5] for the translation component
+        fake_translation = np.full((len(batch_xyz_aaxyz_nsc), 3), 0.5)
+        batch_xyz_aaxyz_nsc = np.concatenate([fake_translation, batch_xyz_aaxyz_nsc], axis=-1)
+    return batch_decode_xyz_aaxyz_nsc_to_xyz_qxyzw(batch_xyz_aaxyz_nsc)[:, 3:]
+
+
+def _batch_absolute_angle_distance(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc):
+    y_true_q = _batch_decode_quaternions(y_true_xyz_aaxyz_nsc)
+    y_pred_q = _batch_decode_quaternions(y_pred_xyz_aaxyz_nsc)
+    # Quaternion.absolute_distance()
+    d_minus = np.sqrt(np.einsum('ij,ij->i', y_true_q - y_pred_q, y_true_q - y_pred_q))
+    d_plus = np.sqrt(np.einsum('ij,ij->i', y_true_q + y_pred_q, y_true_q + y_pred_q))
+    return np.where(d_minus < d_plus, d_minus, d_plus)
 
 
 def absolute_cart_distance_xyz_aaxyz_nsc_single(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc):
@@ -1294,17 +1605,20 @@ def absolute_cart_distance_xyz_aaxyz_nsc_batch(y_true_xyz_aaxyz_nsc, y_pred_xyz_
     """ Calculate 3D grasp accuracy for a single result
     Expects batch of data as an nx8 array. Eager execution / numpy version.
 
+    Vectorized absolute_cart_distance_xyz_aaxyz_nsc_single().
+
     max_translation defaults to 0.01 meters, or 1cm.
     max_rotation defaults to 15 degrees in radians.
     """
-    # print('type of y_true_xyz_aaxyz_nsc: ' + str(type(y_true_xyz_aaxyz_nsc)))
-    accuracies = []
-    for y_true, y_pred in zip(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc):
-        one_accuracy = absolute_cart_distance_xyz_aaxyz_nsc_single(y_true, y_pred)
-        # print('one grasp acc: ' + str(one_accuracy))
-        accuracies.append(one_accuracy)
-    accuracies = np.array(accuracies, np.float32)
-    return accuracies
+    return _batch_absolute_cart_distance(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc).astype(np.float32)
+
+
+def _batch_absolute_cart_distance(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc):
+    # only the translation is needed, which is decoded the same way for every length
+    y_true_xyz = batch_decode_xyz_aaxyz_nsc_to_xyz_qxyzw(np.asarray(y_true_xyz_aaxyz_nsc)[:, :3])
+    y_pred_xyz = batch_decode_xyz_aaxyz_nsc_to_xyz_qxyzw(np.asarray(y_pred_xyz_aaxyz_nsc)[:, :3])
+    difference = y_true_xyz - y_pred_xyz
+    return np.sqrt(np.einsum('ij,ij->i', difference, difference))
 
 
 def grasp_accuracy_xyz_aaxyz_nsc_single(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc, max_translation=0.01, max_rotation=0.261799):
@@ -1352,15 +1666,26 @@ def grasp_accuracy_xyz_aaxyz_nsc_batch(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_ns
     """ Calculate 3D grasp accuracy for a single result
     Expects batch of data as an nx8 array. Eager execution / numpy version.
 
+    Vectorized grasp_accuracy_xyz_aaxyz_nsc_single(), supporting
+    nx3, nx5 and nx8 arrays.
+
     max_translation defaults to 0.01 meters, or 1cm.
     max_rotation defaults to 15 degrees in radians.
     """
-    # print('type of y_true_xyz_aaxyz_nsc: ' + str(type(y_true_xyz_aaxyz_nsc)))
-    accuracies = []
-    for y_true, y_pred in zip(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc):
-        one_accuracy = grasp_accuracy_xyz_aaxyz_nsc_single(
-            y_true, y_pred, max_translation=max_translation, max_rotation=max_rotation)
-        # print('one grasp acc: ' + str(one_accuracy))
-        accuracies.append(one_accuracy)
-    accuracies = np.array(accuracies, np.float32)
-    return accuracies
+    y_true_xyz_aaxyz_nsc = np.asarray(y_true_xyz_aaxyz_nsc)
+    y_pred_xyz_aaxyz_nsc = np.asarray(y_pred_xyz_aaxyz_nsc)
+    length = y_true_xyz_aaxyz_nsc.shape[-1]
+    if length == 3:
+        # translation component only
+        accurate = _batch_absolute_cart_distance(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc) < max_translation
+    elif length == 8:
+        # translation and rotation
+        translation = _batch_absolute_cart_distance(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc)
+        angle_distance = _batch_absolute_angle_distance(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc)
+        accurate = (angle_distance < max_rotation) & (translation < max_translation)
+    elif length == 5:
+        # rotation distance only
+        accurate = _batch_absolute_angle_distance(y_true_xyz_aaxyz_nsc, y_pred_xyz_aaxyz_nsc) < max_rotation
+    else:
+        raise ValueError('grasp_accuracy_xyz_aaxyz_nsc_batch: unsupported label value format of length ' + str(length))
+    return accurate.astype(np.float32)
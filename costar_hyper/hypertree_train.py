@@ -30,6 +30,7 @@ import cornell_grasp_dataset_reader
 
 from block_stacking_reader import CostarBlockStackingSequence
 from block_stacking_reader import block_stacking_generator
+from block_stacking_index import index_filename_for_split
 
 import time
 from tensorflow.python.platform import flags
@@ -1272,6 +1273,8 @@ def load_dataset(
                 # val_filenames, batch_size=1, is_training=False,
                 # shuffle=False, steps=1,
     elif dataset_name == 'costar_block_stacking':
+        # episode indices of the splits, see block_stacking_index.py
+        train_index = validation_index = test_index = None
         if FLAGS.costar_filename_base is None or not FLAGS.costar_filename_base:
             # Generate a new train/test/val split
             if 'cornell' in FLAGS.data_dir:
@@ -1328,6 +1331,17 @@ def load_dataset(
             print('loading train data from: ' + str(train_data_filename))
             train_data = np.genfromtxt(train_data_filename, dtype='str', delimiter=', ')
 
+            # use the episode indices if they were written with block_stacking_index.py
+            split_indices = []
+            for split_filename in [train_data_filename, validation_data_filename, test_data_filename]:
+                index_filename = index_filename_for_split(split_filename)
+                if os.path.isfile(index_filename):
+                    print('loading episode index from: ' + str(index_filename))
+                else:
+                    index_filename = None
+                split_indices.append(index_filename)
+            train_index, validation_index, test_index = split_indices
+
         # We are multiplying by batch size as a hacky workaround because we want the sizing reduction
         # from steps_per_epoch to not be affected by the batch size.
         estimated_time_steps_per_example = 8 * batch_size
@@ -1345,15 +1359,15 @@ def load_dataset(
             train_data, batch_size=batch_size, is_training=True, shuffle=True, output_shape=output_shape,
             data_features_to_extract=data_features, label_features_to_extract=label_features,
             estimated_time_steps_per_example=estimated_time_steps_per_example,
-            random_augmentation=random_augmentation)
+            random_augmentation=random_augmentation, index=train_index)
         validation_data = CostarBlockStackingSequence(
             validation_data, batch_size=batch_size, is_training=False, output_shape=output_shape,
             data_features_to_extract=data_features, label_features_to_extract=label_features,
-            estimated_time_steps_per_example=estimated_time_steps_per_example)
+            estimated_time_steps_per_example=estimated_time_steps_per_example, index=validation_index)
         test_data = CostarBlockStackingSequence(
             test_data, batch_size=batch_size, is_training=False, output_shape=output_shape,
             data_features_to_extract=data_features, label_features_to_extract=label_features,
-            estimated_time_steps_per_example=estimated_time_steps_per_example)
+            estimated_time_steps_per_example=estimated_time_steps_per_example, index=test_index)
         train_size = len(train_data) * train_data.get_estimated_time_steps_per_example()
         val_size = len(validation_data) * validation_data.get_estimated_time_steps_per_example()
         test_size = len(test_data) * test_data.get_estimated_time_steps_per_example()
@@ -0,0 +1,101 @@
+import os
+
+import h5py
+import numpy as np
+
+import block_stacking_index
+from block_stacking_index import BlockStackingIndex
+from block_stacking_index import build_block_stacking_index
+
+
+def write_example(filename, frames, pose_keys=('pose', 'pose_gripper_center'),
+                  compression=None):
+    data = {'gripper_action_goal_idx': np.sort(np.random.randint(0, frames, frames)),
+            'gripper_action_label': np.random.randint(0, 40, frames)}
+    for key in pose_keys:
+        data[key] = np.random.randn(frames, 7)
+    with h5py.File(filename, 'w') as f:
+        for key, value in data.items():
+            f.create_dataset(key, data=value, compression=compression)
+        # the images make up most of a real file, and come last
+        f.create_dataset('image', data=np.random.randint(0, 255, (frames, 4096)))
+    return data
+
+
+def write_split(directory):
+    np.random.seed(0)
+    examples = {}
+    filenames = []
+    for i, frames in enumerate([5, 9, 3, 12]):
+        status = 'success' if i != 1 else 'failure'
+        filename = str(directory.join('2018-05-%02d.%s.h5f' % (i + 1, status)))
+        examples[os.path.basename(filename)] = write_example(filename, frames)
+        filenames.append(filename)
+    return examples, filenames
+
+
+def check_index(index, examples):
+    assert sorted(index.names) == sorted(examples.keys())
+    total = 0
+    for i, name in enumerate(index.names):
+        expected = examples[name]
+        assert index.frame_counts[i] == len(expected['gripper_action_label'])
+        assert index.success[i] == ('success' in name)
+        total += index.frame_counts[i]
+        for key in index.frames:
+            np.testing.assert_array_equal(index.get(i, key), expected[key])
+    for key in index.frames:
+        assert len(index.frames[key]) == total
+
+
+def test_index_round_trip(tmpdir):
+    examples, filenames = write_split(tmpdir)
+    index_filename = str(tmpdir.join('split_index.npz'))
+    assert build_block_stacking_index(filenames, index_filename) == len(filenames)
+    index = BlockStackingIndex(index_filename)
+    assert sorted(index.frames.keys()) == sorted(block_stacking_index.FRAME_KEYS +
+                                                 block_stacking_index.POSE_KEYS)
+    check_index(index, examples)
+
+
+def test_truncated_and_corrupt_files(tmpdir):
+    examples, filenames = write_split(tmpdir)
+
+    # a file whose last pose column is damaged: it opens and the other
+    # columns read fine, but reading that one fails partway through the file
+    damaged = str(tmpdir.join('2018-06-01.success.h5f'))
+    write_example(damaged, 20, compression='gzip')
+    with h5py.File(damaged, 'r') as f:
+        chunk = f['pose_gripper_center'].id.get_chunk_info(0)
+    with open(damaged, 'rb+') as f:
+        f.seek(chunk.byte_offset)
+        f.write(b'\xff' * chunk.size)
+    # a file cut off at half its size, which does not open
+    truncated = str(tmpdir.join('2018-06-02.success.h5f'))
+    write_example(truncated, 20)
+    with open(truncated, 'rb+') as f:
+        f.truncate(os.path.getsize(truncated) // 2)
+    # and a file that is not an h5f file at all
+    corrupt = str(tmpdir.join('2018-06-03.success.h5f'))
+    with open(corrupt, 'wb') as f:
+        f.write(b'not an hdf5 file' * 100)
+    # missing files are skipped too
+    missing = str(tmpdir.join('2018-06-04.success.h5f'))
+
+    filenames = filenames[:2] + [damaged, truncated, corrupt] + filenames[2:] + [missing]
+    index_filename = str(tmpdir.join('split_index.npz'))
+    assert build_block_stacking_index(filenames, index_filename) == len(examples)
+    index = BlockStackingIndex(index_filename)
+    check_index(index, examples)
+
+
+def test_missing_pose_key(tmpdir):
+    examples, filenames = write_split(tmpdir)
+    no_pose = str(tmpdir.join('2018-06-01.success.h5f'))
+    examples['2018-06-01.success.h5f'] = write_example(no_pose, 7, pose_keys=('pose',))
+    index_filename = str(tmpdir.join('split_index.npz'))
+    build_block_stacking_index(filenames + [no_pose], index_filename)
+    index = BlockStackingIndex(index_filename)
+    # keys missing from any file are left out, the rest stay aligned
+    assert 'pose_gripper_center' not in index.frames
+    check_index(index, examples)
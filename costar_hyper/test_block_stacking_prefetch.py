@@ -0,0 +1,86 @@
+import io
+
+import h5py
+import numpy as np
+from PIL import Image
+
+from block_stacking_reader import CostarBlockStackingSequence
+from block_stacking_prefetch import PrefetchingBlockStackingSequence
+
+
+def write_example(filename, frames, image_shape=(12, 16, 3)):
+    jpegs = []
+    for _ in range(frames):
+        image = np.random.randint(0, 255, image_shape).astype(np.uint8)
+        output = io.BytesIO()
+        Image.fromarray(image).save(output, format='JPEG')
+        jpegs.append(np.frombuffer(output.getvalue(), dtype=np.uint8))
+    with h5py.File(filename, 'w') as f:
+        f.create_dataset('gripper_action_goal_idx',
+                         data=np.sort(np.random.randint(0, frames, frames)))
+        f.create_dataset('gripper_action_label', data=np.random.randint(0, 41, frames))
+        f.create_dataset('pose_gripper_center', data=np.random.randn(frames, 7))
+        images = f.create_dataset('image', (frames,), dtype=h5py.special_dtype(vlen=np.uint8))
+        for i, jpeg in enumerate(jpegs):
+            images[i] = jpeg
+
+
+def write_split(directory, examples=8):
+    np.random.seed(0)
+    filenames = []
+    for i in range(examples):
+        status = 'success' if i % 3 else 'failure'
+        filename = str(directory.join('2018-05-%02d.%s.h5f' % (i + 1, status)))
+        write_example(filename, 6 + i)
+        filenames.append(filename)
+    return filenames
+
+
+def make_sequence(sequence_type, filenames, **kwargs):
+    return sequence_type(
+        filenames, batch_size=2, output_shape=(8, 8, 3), shuffle=True, seed=3,
+        label_features_to_extract='grasp_goal_xyz_aaxyz_nsc_8',
+        data_features_to_extract=['image_0_image_n_vec_xyz_aaxyz_nsc_nxygrid_17'],
+        **kwargs)
+
+
+def read_epoch(sequence):
+    return [sequence[i] for i in range(len(sequence))]
+
+
+def check_batches_equal(batches, expected):
+    assert len(batches) == len(expected)
+    for (X, y), (expected_X, expected_y) in zip(batches, expected):
+        np.testing.assert_allclose(np.asarray(X), np.asarray(expected_X), rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(y, expected_y, rtol=1e-5, atol=1e-5)
+
+
+def test_same_batches_as_sequence(tmpdir):
+    filenames = write_split(tmpdir)
+    reference = make_sequence(CostarBlockStackingSequence, filenames)
+    sequence = make_sequence(PrefetchingBlockStackingSequence, filenames, workers=2)
+    try:
+        for _ in range(2):
+            check_batches_equal(read_epoch(sequence), read_epoch(reference))
+            reference.on_epoch_end()
+            sequence.on_epoch_end()
+    finally:
+        sequence.close()
+
+
+def test_augmentation_does_not_depend_on_workers(tmpdir):
+    filenames = write_split(tmpdir)
+    epochs = {}
+    for workers in [1, 3]:
+        sequence = make_sequence(PrefetchingBlockStackingSequence, filenames, workers=workers,
+                                 random_augmentation=0.5, random_shift=True)
+        try:
+            epochs[workers] = [read_epoch(sequence)]
+            sequence.on_epoch_end()
+            epochs[workers].append(read_epoch(sequence))
+        finally:
+            sequence.close()
+    for batches, expected in zip(epochs[3], epochs[1]):
+        check_batches_equal(batches, expected)
+    # the next epoch draws new frames and augmentation
+    assert not np.allclose(epochs[1][0][0][0], epochs[1][1][0][0])
@@ -106,6 +106,70 @@ def test_rotation_encoding():
     test_add_sub_angles(180, 56)
     test_add_sub_angles(340, 56)
 
+
+def test_batch_intersection_over_union():
+    # two unit high rectangles overlapping by half their width
+    rect0 = np.array([[[0., 0.], [0., 2.], [1., 2.], [1., 0.]]])
+    rect1 = np.array([[[0., 1.], [0., 3.], [1., 3.], [1., 1.]]])
+    assert np.allclose(hypertree_pose_metrics.batch_intersection_over_union(rect0, rect1), 1. / 3.)
+    assert np.allclose(hypertree_pose_metrics.batch_intersection_over_union(rect0, rect0), 1.)
+
+    random_state = np.random.RandomState(0)
+    n = 200
+    rect0 = hypertree_pose_metrics.batch_rectangle_vertices(
+        random_state.rand(n), random_state.rand(n), random_state.rand(n), random_state.rand(n), random_state.rand(n) * 6)
+    rect1 = hypertree_pose_metrics.batch_rectangle_vertices(
+        random_state.rand(n), random_state.rand(n), random_state.rand(n), random_state.rand(n), random_state.rand(n) * 6)
+    iou = hypertree_pose_metrics.batch_intersection_over_union(rect0, rect1)
+    for i in range(n):
+        assert np.allclose(iou[i], hypertree_pose_metrics.shapely_intersection_over_union(list(rect0[i]), list(rect1[i])))
+
+
+def test_grasp_jaccard_batch():
+    random_state = np.random.RandomState(0)
+    for columns in [6, 7]:
+        n = 500
+        y_true = random_state.rand(n, columns)
+        y_pred = y_true + random_state.randn(n, columns) * 0.08
+        if columns == 7:
+            y_true[:, 0] = random_state.randint(0, 2, n)
+            y_pred[:, 0] = random_state.rand(n)
+        scores = hypertree_pose_metrics.grasp_jaccard_batch(y_true, y_pred)
+        # jaccard_score modifies its arguments, so give it copies
+        expected = [hypertree_pose_metrics.jaccard_score(y_true[i].copy(), y_pred[i].copy()) for i in range(n)]
+        assert np.array_equal(scores, np.array(expected, dtype=np.float32))
+
+
+def test_batch_pose_encoding():
+    random_state = np.random.RandomState(0)
+    n = 100
+    quaternions = random_state.randn(n, 4)
+    quaternions[:n // 2] /= np.linalg.norm(quaternions[:n // 2], axis=-1, keepdims=True)
+    poses = np.concatenate([random_state.randn(n, 3), quaternions], axis=-1)
+    encoded = hypertree_pose_metrics.batch_encode_xyz_qxyzw_to_xyz_aaxyz_nsc(poses)
+    expected = [hypertree_pose_metrics.encode_xyz_qxyzw_to_xyz_aaxyz_nsc(pose) for pose in poses]
+    assert np.allclose(encoded, expected, rtol=0, atol=1e-14)
+
+    # augmentation draws the same random numbers
+    np.random.seed(0)
+    expected = [hypertree_pose_metrics.encode_xyz_qxyzw_to_xyz_aaxyz_nsc(pose, random_augmentation=0.5) for pose in poses]
+    np.random.seed(0)
+    augmented = hypertree_pose_metrics.batch_encode_xyz_qxyzw_to_xyz_aaxyz_nsc(poses, random_augmentation=0.5)
+    assert np.allclose(augmented, expected, rtol=0, atol=1e-14)
+
+    predicted = encoded + random_state.randn(n, 8) * 0.01
+    decoded = hypertree_pose_metrics.batch_decode_xyz_aaxyz_nsc_to_xyz_qxyzw(predicted)
+    expected = [hypertree_pose_metrics.decode_xyz_aaxyz_nsc_to_xyz_qxyzw(pose.copy()) for pose in predicted]
+    assert np.allclose(decoded, expected, rtol=0, atol=1e-14)
+
+    for columns in [slice(0, 8), slice(0, 3), slice(3, 8)]:
+        accuracy = hypertree_pose_metrics.grasp_accuracy_xyz_aaxyz_nsc_batch(
+            encoded[:, columns], predicted[:, columns], max_translation=0.04, max_rotation=1.047196)
+        expected = [hypertree_pose_metrics.grasp_accuracy_xyz_aaxyz_nsc_single(
+                    y_true[columns].copy(), y_pred[columns].copy(), max_translation=0.04, max_rotation=1.047196)
+                    for y_true, y_pred in zip(encoded, predicted)]
+        assert np.array_equal(accuracy, np.array(expected, dtype=np.float32))
+
 if __name__ == '__main__':
     test_add_sub_angles(1, 28)
     pytest.main([__file__])
\ No newline at end of file
@@ -0,0 +1,157 @@
+import os
+import time
+
+import numpy as np
+
+import hyperopt_scheduler
+from hyperopt_scheduler import TrialScheduler
+from hyperopt_store import TrialStore
+from hyperopt_store import PENDING, RUNNING, COMPLETED, FAILED
+
+# what the fake training function does, selected by the second value of a sample
+MODES = ['train', 'raise', 'crash_once', 'crash', 'sleep']
+
+
+class FakeHistory(object):
+    def __init__(self, history):
+        self.history = history
+
+
+def fake_training(hyperparams=None, epochs=1, marker_dir=None, **kwargs):
+    """ Training function run by the workers, as 'test_hyperopt_scheduler:fake_training'.
+
+    val_loss improves with the epochs towards the score of the trial.
+    """
+    mode = hyperparams['mode']
+    marker = os.path.join(marker_dir, 'crashed_%g' % hyperparams['score'])
+    if mode == 'crash' or (mode == 'crash_once' and not os.path.exists(marker)):
+        open(marker, 'w').close()
+        os._exit(3)
+    if mode == 'sleep':
+        time.sleep(60)
+    if mode == 'raise':
+        raise ValueError('fake_training: bad hyperparams')
+    return FakeHistory({'val_loss': [hyperparams['score'] + 1. / (epoch + 1) for epoch in range(epochs)],
+                        'loss': [1.] * epochs})
+
+
+def to_hyperparams(x):
+    return {'score': float(x[0]), 'mode': MODES[int(x[1])]}
+
+
+def make_store(tmpdir):
+    store = TrialStore(str(tmpdir.join('search')))
+    store.save_search({
+        'run_training_fn': 'test_hyperopt_scheduler:fake_training',
+        'param_to_optimize': 'val_loss',
+        'maximize': False,
+        'domain': [],
+        'kwargs': {'marker_dir': str(tmpdir)}})
+    return store
+
+
+def make_scheduler(store, samples, max_trials, **kwargs):
+    """ A scheduler suggesting the samples in order.
+    """
+    suggested = []
+
+    def suggest(trials, count, pending_x):
+        x = samples[len(trials)]
+        suggested.append(x)
+        return [x]
+
+    scheduler = TrialScheduler(store, suggest, to_hyperparams, max_trials, maximize=False,
+                               poll_interval=0.05, verbose=0, **kwargs)
+    return scheduler, suggested
+
+
+def by_id(trials):
+    return dict((trial['id'], trial) for trial in trials)
+
+
+def test_rung_epochs():
+    assert [hyperopt_scheduler.rung_epochs(rung, 1, 3) for rung in range(3)] == [1, 3, 9]
+    assert hyperopt_scheduler.max_rung(1, 9, 3) == 2
+    assert hyperopt_scheduler.max_rung(1, 8, 3) == 1
+    assert hyperopt_scheduler.max_rung(None, 9, 3) == 0
+
+
+def test_promotion_across_rungs(tmpdir):
+    store = make_store(tmpdir)
+    # the best trial comes first, so with one worker every promotion is known in advance
+    samples = [[score, 0] for score in range(9)]
+    scheduler, _ = make_scheduler(store, samples, 9, min_epochs=1, max_epochs=9, eta=3)
+    trials = by_id(scheduler.run())
+
+    assert all(trial['status'] == COMPLETED for trial in trials.values())
+    expected_rungs = [2, 1, 1, 0, 0, 0, 0, 0, 0]
+    assert [trials[i]['rung'] for i in range(9)] == expected_rungs
+    for i, rung in enumerate(expected_rungs):
+        epochs = hyperopt_scheduler.rung_epochs(rung, 1, 3)
+        assert trials[i]['epochs'] == epochs
+        assert len(trials[i]['history']['val_loss']) == epochs
+        assert sorted(trials[i]['rung_objectives'].keys()) == [str(r) for r in range(rung + 1)]
+        np.testing.assert_allclose(trials[i]['objective'], i + 1. / epochs)
+    best = hyperopt_scheduler.best_trial(list(trials.values()), maximize=False)
+    assert best['id'] == 0
+    # the store holds the same records
+    assert by_id(store.trials()) == trials
+
+
+def test_crash_is_retried(tmpdir):
+    store = make_store(tmpdir)
+    samples = [[1, MODES.index('crash_once')], [2, MODES.index('crash')],
+               [3, MODES.index('raise')], [4, MODES.index('train')]]
+    scheduler, _ = make_scheduler(store, samples, 4, num_workers=2, max_attempts=2)
+    trials = by_id(scheduler.run())
+
+    # crashed once, then completed when it was run again
+    assert trials[0]['status'] == COMPLETED
+    assert trials[0]['attempts'] == 1
+    np.testing.assert_allclose(trials[0]['objective'], 2.)
+    # crashed every time
+    assert trials[1]['status'] == FAILED
+    assert trials[1]['attempts'] == 2
+    assert 'exited with code 3' in trials[1]['error']
+    assert trials[1]['objective'] == float('inf')
+    # the training function raised, which is not retried
+    assert trials[2]['status'] == FAILED
+    assert trials[2]['attempts'] == 0
+    assert 'bad hyperparams' in trials[2]['error']
+    assert trials[3]['status'] == COMPLETED
+
+
+def test_timeout_fails(tmpdir):
+    store = make_store(tmpdir)
+    scheduler, _ = make_scheduler(store, [[1, MODES.index('sleep')]], 1, timeout=2)
+    start = time.time()
+    trials = scheduler.run()
+    assert time.time() - start < 30
+    assert trials[0]['status'] == FAILED
+    assert trials[0]['attempts'] == 0
+    assert trials[0]['error'] == 'timeout after 2s'
+
+
+def test_resume(tmpdir):
+    store = make_store(tmpdir)
+    samples = [[score, 0] for score in [3, 1, 2, 0]]
+    scheduler, suggested = make_scheduler(store, samples, 2)
+    scheduler.run()
+    assert suggested == samples[:2]
+
+    # as if the scheduler was killed while training trial 1
+    trial = by_id(store.trials())[1]
+    trial['status'] = RUNNING
+    store.save(trial)
+
+    scheduler, suggested = make_scheduler(store, samples, 4)
+    assert by_id(scheduler.trials)[1]['status'] == PENDING
+    trials = by_id(scheduler.run())
+    # only the new trials were suggested, the first ones were kept
+    assert suggested == samples[2:]
+    assert sorted(trials.keys()) == [0, 1, 2, 3]
+    assert all(trial['status'] == COMPLETED for trial in trials.values())
+    for i, (score, _) in enumerate(samples):
+        assert trials[i]['hyperparams']['score'] == score
+        np.testing.assert_allclose(trials[i]['objective'], score + 1.)
+    assert hyperopt_scheduler.best_trial(list(trials.values()), maximize=False)['id'] == 3
@@ -14,6 +14,7 @@ import keras.backend as K
 import keras.optimizers as optimizers
 
 from .datasets.image import *
+from .datasets.prefetch import PrefetchGenerator
 from .plotting import *
 
 class AbstractAgentBasedModel(object):
@@ -104,6 +105,10 @@ class AbstractAgentBasedModel(object):
             model_directory="./",
             reqs_directory=None,
             max_img_size=224,
+            draft_decode=False,
+            num_workers=0,
+            prefetch=4,
+            seed=None,
             *args, **kwargs):
 
         if lr == 0 or lr < 1e-30:
@@ -173,6 +178,10 @@ class AbstractAgentBasedModel(object):
         self.option_num = option_num
         self.load_jpeg = False
         self.max_img_size = max_img_size
+        self.draft_decode = draft_decode
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        self.seed = seed
 
         if self.noise_dim < 1:
             self.use_noise = False
@@ -274,14 +283,30 @@ class AbstractAgentBasedModel(object):
         raise NotImplementedError('_getData() requires a dataset.')
 
     def trainGenerator(self, dataset):
-        return self._yieldLoop(dataset.sampleTrain)
+        return self._makeGenerator(dataset.sampleTrain, 0)
 
     def testGenerator(self, dataset):
         if self.validation_steps is None:
             # update the validation steps if we did not already set it --
             # something proportional to the amount of validation data we have
             self.validation_steps = len(dataset.test) + 1
-        return self._yieldLoop(dataset.sampleTest)
+        return self._makeGenerator(dataset.sampleTest, 1)
+
+    def _makeGenerator(self, sampleFn, stream):
+        '''
+        Read batches in the background with a pool of worker processes if
+        num_workers is set, otherwise on the calling thread. The train and
+        test generators get different streams of random numbers.
+        '''
+        if self.num_workers > 0:
+            seed = None
+            if self.seed is not None:
+                seed = 2 * self.seed + stream
+            return PrefetchGenerator(lambda: self._sampleBatch(sampleFn),
+                                     num_workers=self.num_workers,
+                                     prefetch=self.prefetch,
+                                     seed=seed)
+        return self._yieldLoop(sampleFn)
 
     def _genRandomIndexes(self, length, random_draw):
       ''' Common method to generate random indexes for getData '''
@@ -302,66 +327,77 @@ class AbstractAgentBasedModel(object):
       '''
       # Infinite loop for yielding (generator)
       while True:
-            drawn_samples = 0
-            features, targets = [], []
-            while drawn_samples < self.batch_size:
+            # Yield so it's a generator
+            yield self._sampleBatch(sampleFn)
 
-                # Sample one random file to read and its name
-                sampler, filename = sampleFn()
-                with sampler as filedata:
-                    if len(filedata.keys()) == 0:
-                        print("WARNING: ", filename, "has no keys")
-                        continue
+    def _sampleBatch(self, sampleFn):
+        '''
+        Build a single batch of batch_size examples by drawing random rows from
+        random files, and then perform any necessary preprocessing on it.
 
-                    # Randomly choose how many to draw from this file
-                    to_draw = np.random.randint(1, self.batch_size - drawn_samples + 1)
+        Parameters:
+        -----------
+        sampleFn: callable to receive a feature dict and file name
+        '''
+        drawn_samples = 0
+        features, targets = [], []
+        while drawn_samples < self.batch_size:
+
+            # Sample one random file to read and its name
+            sampler, filename = sampleFn()
+            with sampler as filedata:
+                if len(filedata.keys()) == 0:
+                    print("WARNING: ", filename, "has no keys")
+                    continue
 
-                    # Draw the random samples from the file
-                    ffeatures, ftargets = self._getDataRandom(random_draw=to_draw, **filedata)
+                # Randomly choose how many to draw from this file
+                to_draw = np.random.randint(1, self.batch_size - drawn_samples + 1)
 
-                if len(ffeatures) == 0 or len(ffeatures[0]) == 0:
-                    #print("WARNING: ", filename, "was empty after getData.")
-                    continue
+                # Draw the random samples from the file
+                ffeatures, ftargets = self._getDataRandom(random_draw=to_draw, **filedata)
 
-                actually_drawn = len(ffeatures[0])
-                drawn_samples += actually_drawn
+            if len(ffeatures) == 0 or len(ffeatures[0]) == 0:
+                #print("WARNING: ", filename, "was empty after getData.")
+                continue
 
-                # Concatenate
-                if features == []:
-                    features = [[x] for x in ffeatures]
-                else:
-                    for old, new in zip(features, ffeatures):
-                        old.append(new)
+            actually_drawn = len(ffeatures[0])
+            drawn_samples += actually_drawn
 
-                if targets == []:
-                    targets = [[x] for x in ftargets]
-                else:
-                    for old, new in zip(targets, ftargets):
-                        old.append(new)
+            # Concatenate
+            if features == []:
+                features = [[x] for x in ffeatures]
+            else:
+                for old, new in zip(features, ffeatures):
+                    old.append(new)
 
-            # Concatenate every feature/target with numpy
-            features = [np.concatenate(f) for f in features]
-            targets = [np.concatenate(t) for t in targets]
+            if targets == []:
+                targets = [[x] for x in ftargets]
+            else:
+                for old, new in zip(targets, ftargets):
+                    old.append(new)
 
-            # Sanity check
-            n_samples = features[0].shape[0]
-            for f in features:
-                if f.shape[0] != n_samples:
-                    print(f.shape, n_samples)
-                    raise ValueError("Feature lengths are not equal!")
+        # Concatenate every feature/target with numpy
+        features = [np.concatenate(f) for f in features]
+        targets = [np.concatenate(t) for t in targets]
 
-            #print("Collected ", n_samples, " samples") #debug
+        # Sanity check
+        n_samples = features[0].shape[0]
+        for f in features:
+            if f.shape[0] != n_samples:
+                print(f.shape, n_samples)
+                raise ValueError("Feature lengths are not equal!")
 
-            # Final conversion for some kinds of data
-            self._convert(features)
-            self._convert(targets)
+        #print("Collected ", n_samples, " samples") #debug
 
-            # Resize if necessary
-            self._resize(features)
-            self._resize(targets)
+        # Final conversion for some kinds of data
+        self._convert(features)
+        self._convert(targets)
 
-            # Yield so it's a generator
-            yield features, targets
+        # Resize if necessary
+        self._resize(features)
+        self._resize(targets)
+
+        return features, targets
 
     def _getDataRandom(self, random_draw, **kwargs):
         '''
@@ -379,8 +415,17 @@ class AbstractAgentBasedModel(object):
     def _convert(self, features):
         if self.load_jpeg:
             for i, f in enumerate(features):
-                if str(f.dtype)[:2] == "|S":
-                    features[i] = self._scale(ConvertImageListToNumpy(np.squeeze(f)))
+                if str(f.dtype)[:2] == "|S" or f.dtype == object:
+                    # fixed or variable length binary images; large jpegs
+                    # are decoded at reduced size only if asked to
+                    max_img_size = None
+                    if self.draft_decode:
+                        max_img_size = self.max_img_size
+                    features[i] = self._scale(ConvertImageListToNumpy(
+                        np.squeeze(f), max_img_size=max_img_size))
+                elif f.dtype == np.uint8 and len(f.shape) >= 3:
+                    # frames that were already decoded by the dataset cache
+                    features[i] = self._scale(f)
 
     def _resize(self, features):
         # Look for image features to make smaller if needed
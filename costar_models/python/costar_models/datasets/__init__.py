@@ -2,3 +2,6 @@ from .tfrecord import TFRecordConverter
 from .npz import NpzDataset
 from .h5f import H5fDataset
 from .npy_generator import NpzGeneratorDataset
+from .prefetch import PrefetchGenerator
+from .shards import ShardDataset, ShardGeneratorDataset
+from .pipeline import FramePipeline
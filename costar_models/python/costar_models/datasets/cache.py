@@ -0,0 +1,256 @@
+from __future__ import print_function
+
+import collections
+import os
+
+import h5py as h5f
+import numpy as np
+
+from .image import DecodeImages
+
+'''
+Caching for datasets made of many h5f files.
+
+Sampling a batch opens a few random files, reads some rows and decodes the
+images in them. DatasetCache keeps two bounded layers between the training
+code and the disk:
+  - open file handles, in an LRU limited to a number of files so that we stay
+    well below the limit on open file descriptors;
+  - decoded image frames, in an LRU limited to a number of bytes and keyed by
+    (file, key, index).
+
+One cache is shared by everything reading from a dataset, so the train and
+test generators both benefit from it. Handles are not shared between
+processes: after a fork the child closes what it inherited and opens its own,
+while decoded frames the parent already had stay available to the child.
+'''
+
+
+class LRUCache(object):
+    '''
+    Least-recently-used cache with a budget. Every entry has a cost (1 by
+    default, or e.g. its size in bytes); the oldest entries are evicted when
+    the total cost goes over capacity.
+
+    Parameters:
+    -----------
+    capacity: total cost of entries to keep; 0 disables the cache
+    evict: optional callback called with every evicted value
+    '''
+
+    def __init__(self, capacity, evict=None):
+        self.capacity = capacity
+        self.evict = evict
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def enabled(self):
+        return self.capacity > 0
+
+    def get(self, key, default=None):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.entries[key] = entry
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, cost=1):
+        '''
+        Add a value; if it costs more than the whole capacity it is not kept.
+        '''
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        if cost > self.capacity:
+            return
+        self.entries[key] = (value, cost)
+        self.size += cost
+        while self.size > self.capacity:
+            _, (evicted, evicted_cost) = self.entries.popitem(last=False)
+            self.size -= evicted_cost
+            self.evictions += 1
+            if self.evict is not None:
+                self.evict(evicted)
+
+    def clear(self, evict=True):
+        while len(self.entries) > 0:
+            _, (value, _) = self.entries.popitem(last=False)
+            if evict and self.evict is not None:
+                self.evict(value)
+        self.size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def stats(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "size": self.size,
+                "capacity": self.capacity}
+
+
+class DatasetCache(object):
+    '''
+    Open h5f files and decoded image frames for a dataset.
+
+    Parameters:
+    -----------
+    max_files: number of files to keep open
+    max_frame_bytes: memory budget for decoded frames; 0 turns off caching
+                     (and decoding) of frames
+    max_img_size: decode jpegs larger than this at reduced size, like the
+                  model does when it decodes them itself
+    '''
+
+    def __init__(self, max_files=64, max_frame_bytes=0, max_img_size=None):
+        if max_files < 1:
+            raise RuntimeError('the cache needs room for at least one file')
+        self.files = LRUCache(max_files, evict=_close)
+        self.frames = LRUCache(max_frame_bytes)
+        self.max_img_size = max_img_size
+        self.pid = os.getpid()
+
+    def open(self, filename):
+        '''
+        Get an open, read-only handle to a file. Do not close it; it belongs
+        to the cache.
+        '''
+        self._checkProcess()
+        handle = self.files.get(filename)
+        if handle is None:
+            handle = h5f.File(filename, 'r')
+            self.files.put(filename, handle)
+        return handle
+
+    def decode(self, filename, key, column, indexes):
+        '''
+        Read and decode the given rows of a column of encoded images, and
+        return them as one array. Only frames that are not in the cache yet
+        are read from the file.
+        '''
+        frames = [self.frames.get((filename, key, i)) for i in indexes]
+        missing = [i for i, frame in zip(indexes, frames) if frame is None]
+        if len(missing) > 0:
+            # h5py wants unique, sorted indices
+            rows = sorted(set(missing))
+            decoded = dict(zip(rows, DecodeImages(
+                column[rows], max_img_size=self.max_img_size)))
+            for i, frame in decoded.items():
+                self.frames.put((filename, key, i), frame, frame.nbytes)
+            frames = [decoded[i] if frame is None else frame
+                      for i, frame in zip(indexes, frames)]
+        return np.array(frames)
+
+    def close(self):
+        self.files.clear()
+
+    def _checkProcess(self):
+        if os.getpid() != self.pid:
+            self.files.clear()
+            self.pid = os.getpid()
+
+    def stats(self):
+        '''
+        Hit, miss and eviction counts and sizes of both layers.
+        '''
+        return {"files": self.files.stats(),
+                "frames": self.frames.stats()}
+
+
+class CachedFile(object):
+    '''
+    Read-only view of an h5f file from a DatasetCache. It behaves like the
+    file itself, except that columns of encoded images come out decoded, as
+    arrays of uint8 frames, when the frame cache is on.
+    '''
+
+    def __init__(self, cache, filename, image_keys):
+        self.cache = cache
+        self.filename = filename
+        self.file = cache.open(filename)
+        self.image_keys = image_keys
+
+    def keys(self):
+        return list(self.file.keys())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.file)
+
+    def __contains__(self, key):
+        return key in self.file
+
+    def __getitem__(self, key):
+        column = self.file[key]
+        if key in self.image_keys and self.cache.frames.enabled():
+            return CachedFrames(self.cache, self.filename, key, column)
+        return column
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def close(self):
+        # The handle belongs to the cache
+        pass
+
+
+class CachedFrames(object):
+    '''
+    Column of encoded images that decodes rows as they are indexed.
+    '''
+
+    def __init__(self, cache, filename, key, column):
+        self.cache = cache
+        self.filename = filename
+        self.key = key
+        self.column = column
+        self.shape = column.shape
+
+    def __len__(self):
+        return len(self.column)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            index = range(*index.indices(len(self)))
+        elif np.isscalar(index):
+            i = int(index)
+            if i < 0:
+                i += len(self)
+            return self.cache.decode(self.filename, self.key, self.column,
+                                     [i])[0]
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.nonzero(index)[0]
+        return self.cache.decode(self.filename, self.key, self.column,
+                                 [int(i) for i in index])
+
+    def __array__(self, dtype=None):
+        frames = self[:]
+        if dtype is not None:
+            frames = frames.astype(dtype)
+        return frames
+
+
+def _close(handle):
+    try:
+        handle.close()
+    except Exception:
+        pass
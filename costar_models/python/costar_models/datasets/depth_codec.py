@@ -0,0 +1,252 @@
+"""Fast encoding and decoding of depth images.
+
+Depth from the camera comes as 16 bit integers in millimeters. Up to now it
+has been stored as an RGB png with the high byte in red, the low byte in green
+and zero in blue, which is the same as the 24 bit fixed point encoding of
+depth_image_encoding.FloatArrayToRgbImage (1/256 mm precision) with the blue
+channel dropped.
+
+The kernels here produce exactly the same pixels as encode_depth_numpy and
+FloatArrayToRgbImage, and decode exactly the same values as ImageToFloatArray,
+but work by copying bytes between views of the arrays instead of dividing,
+and can write into preallocated output arrays so that nothing is allocated
+per frame.
+
+The png helpers can store depth either in that RGB format ("rgb") or directly
+as a single channel 16 bit png ("png16"), and take a compression level; low
+levels are much faster and still lossless. DecodeDepthPng reads both formats.
+
+Examples:
+
+  rgb = EncodeDepth16ToRgb(depth_mm, out=buf)
+  depth_mm = DecodeRgbToDepth16(rgb)
+
+  raw = EncodeDepthPng(depth_mm, mode="png16", compression=1)
+  depth_mm = DecodeDepthPng(raw)
+"""
+
+import io
+import sys
+
+import numpy as np
+from PIL import Image
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# 1/256 mm per unit for depth in meters
+DEFAULT_RGB_SCALE_FACTOR = 256000.0
+
+DEPTH_RGB = "rgb"
+DEPTH_PNG16 = "png16"
+
+# positions of the red and blue channels for each channel order
+_CHANNELS = {"rgb": (0, 2), "bgr": (2, 0)}
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def _channels(order):
+    if order not in _CHANNELS:
+        raise ValueError('unsupported channel order: ' + str(order))
+    return _CHANNELS[order]
+
+
+def _bytes(array, itemsize, writeable=False):
+    """View the bytes of a native integer array as a last axis, lowest byte
+    first.
+    """
+    if writeable and not array.flags.c_contiguous:
+        raise ValueError('output arrays must be contiguous')
+    array = np.ascontiguousarray(array)
+    view = array.view(np.uint8).reshape(array.shape + (itemsize,))
+    if not _LITTLE_ENDIAN:
+        view = view[..., ::-1]
+    return view
+
+
+def EncodeDepth16ToRgb(depth, out=None, order="rgb"):
+    """Encode 16 bit depth as RGB: high byte in red, low byte in green, zero
+    in blue. Same result as collector.encode_depth_numpy.
+
+    Args:
+      depth: HxW array of uint16 depth values.
+      out: optional HxWx3 uint8 array to write into.
+      order: "rgb", or "bgr" for images passed to opencv.
+
+    Returns:
+      The HxWx3 uint8 image.
+    """
+    depth = np.asarray(depth)
+    if depth.dtype != np.uint16:
+        depth = depth.astype(np.uint16)
+    if out is None:
+        out = np.empty(depth.shape + (3,), dtype=np.uint8)
+    r, b = _channels(order)
+    depth_bytes = _bytes(depth, 2)
+    out[..., r] = depth_bytes[..., 1]
+    out[..., 1] = depth_bytes[..., 0]
+    out[..., b] = 0
+    return out
+
+
+def DecodeRgbToDepth16(rgb, out=None, order="rgb"):
+    """Recover 16 bit depth from an image made by EncodeDepth16ToRgb.
+
+    Args:
+      rgb: HxWx3 uint8 image.
+      out: optional HxW uint16 array to write into.
+      order: channel order of the image.
+
+    Returns:
+      The HxW uint16 depth values.
+    """
+    r, _ = _channels(order)
+    if out is None:
+        out = np.empty(rgb.shape[:-1], dtype=np.uint16)
+    out_bytes = _bytes(out, 2, writeable=True)
+    out_bytes[..., 1] = rgb[..., r]
+    out_bytes[..., 0] = rgb[..., 1]
+    return out
+
+
+def EncodeFloatToRgb(float_array, scale_factor=DEFAULT_RGB_SCALE_FACTOR,
+                     drop_blue=False, out=None, work=None, int_work=None,
+                     order="rgb"):
+    """Encode floating point depth in meters as 24 bit fixed point RGB, like
+    depth_image_encoding.FloatArrayToRgbImage but returning the array.
+
+    Args:
+      float_array: HxW depth values in meters.
+      scale_factor: scale applied to the values before rounding.
+      drop_blue: zero the blue channel (1 mm precision).
+      out: optional HxWx3 uint8 array to write into.
+      work: optional HxW float array for intermediate values; to match
+        FloatArrayToRgbImage it should have the type of
+        float_array * scale_factor.
+      int_work: optional HxW uint32 array for intermediate values.
+      order: "rgb" or "bgr".
+
+    Returns:
+      The HxWx3 uint8 image.
+    """
+    float_array = np.squeeze(float_array)
+    if work is None:
+        dtype = np.multiply(float_array.flat[:1], scale_factor).dtype
+        work = np.empty(float_array.shape, dtype=dtype)
+    if int_work is None:
+        int_work = np.empty(float_array.shape, dtype=np.uint32)
+    np.multiply(float_array, scale_factor, out=work)
+    work += 0.5
+    np.floor(work, out=work)
+    np.clip(work, 0, 2**24 - 1, out=work)
+    int_work[...] = work
+    if out is None:
+        out = np.empty(float_array.shape + (3,), dtype=np.uint8)
+    r, b = _channels(order)
+    int_bytes = _bytes(int_work, 4)
+    out[..., r] = int_bytes[..., 2]
+    out[..., 1] = int_bytes[..., 1]
+    if drop_blue:
+        out[..., b] = 0
+    else:
+        out[..., b] = int_bytes[..., 0]
+    return out
+
+
+def DecodeRgbToFloat(rgb, scale_factor=DEFAULT_RGB_SCALE_FACTOR, out=None,
+                     int_work=None, order="rgb"):
+    """Recover floating point depth in meters from a 24 bit RGB image. Same
+    values as depth_image_encoding.ImageToFloatArray.
+
+    Args:
+      rgb: HxWx3 uint8 image.
+      scale_factor: the scale used when encoding.
+      out: optional HxW float64 array to write into.
+      int_work: optional HxW uint32 array for intermediate values.
+      order: channel order of the image.
+
+    Returns:
+      The HxW float64 depth values.
+    """
+    r, b = _channels(order)
+    if int_work is None:
+        int_work = np.empty(rgb.shape[:-1], dtype=np.uint32)
+    int_bytes = _bytes(int_work, 4, writeable=True)
+    int_bytes[..., 3] = 0
+    int_bytes[..., 2] = rgb[..., r]
+    int_bytes[..., 1] = rgb[..., 1]
+    int_bytes[..., 0] = rgb[..., b]
+    if out is None:
+        out = np.empty(rgb.shape[:-1], dtype=np.float64)
+    np.divide(int_work, scale_factor, out=out)
+    return out
+
+
+def EncodeDepthPng(depth, mode=DEPTH_RGB, compression=None, out=None):
+    """Encode 16 bit depth as a png.
+
+    Args:
+      depth: HxW uint16 depth in millimeters.
+      mode: DEPTH_RGB for the RGB format of EncodeDepth16ToRgb, or
+        DEPTH_PNG16 for a single channel 16 bit png.
+      compression: zlib level from 0 to 9; 1 is much faster than the
+        default and still lossless. None uses the library default.
+      out: optional HxWx3 uint8 buffer for the RGB format.
+
+    Returns:
+      The png as bytes.
+    """
+    if mode == DEPTH_PNG16:
+        image = np.ascontiguousarray(depth, dtype=np.uint16)
+    elif mode == DEPTH_RGB:
+        image = EncodeDepth16ToRgb(depth, out=out,
+                                   order="bgr" if cv2 is not None else "rgb")
+    else:
+        raise ValueError('unsupported depth png mode: ' + str(mode))
+
+    if cv2 is not None:
+        params = []
+        if compression is not None:
+            params = [cv2.IMWRITE_PNG_COMPRESSION, compression]
+        return cv2.imencode('.png', image, params)[1].tobytes()
+
+    if mode == DEPTH_PNG16:
+        pil_image = Image.frombuffer('I;16', (image.shape[1], image.shape[0]),
+                                     image.astype('<u2').tobytes(), 'raw',
+                                     'I;16', 0, 1)
+    else:
+        pil_image = Image.fromarray(image, mode='RGB')
+    output = io.BytesIO()
+    if compression is not None:
+        pil_image.save(output, format="PNG", compress_level=compression)
+    else:
+        pil_image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def DecodeDepthPng(raw, out=None):
+    """Decode a png made by EncodeDepthPng, in either mode, or by the
+    collector, into 16 bit depth in millimeters.
+
+    Args:
+      raw: png bytes.
+      out: optional HxW uint16 array to write into.
+
+    Returns:
+      The HxW uint16 depth values.
+    """
+    if cv2 is not None:
+        image = cv2.imdecode(np.frombuffer(raw, dtype=np.uint8),
+                             cv2.IMREAD_UNCHANGED)
+        order = "bgr"
+    else:
+        image = np.asarray(Image.open(io.BytesIO(raw)))
+        order = "rgb"
+    if len(image.shape) == 3:
+        return DecodeRgbToDepth16(image, out=out, order=order)
+    if out is None:
+        return image.astype(np.uint16)
+    out[...] = image
+    return out
@@ -39,6 +39,10 @@ PIL or standard image viewers.
 import numpy as np
 from PIL import Image
 
+from .depth_codec import DEFAULT_RGB_SCALE_FACTOR
+from .depth_codec import EncodeFloatToRgb
+from .depth_codec import DecodeRgbToFloat
+
 
 def ClipFloatValues(float_array, min_value, max_value):
     """Clips values to the range [min_value, max_value].
@@ -62,9 +66,6 @@ def ClipFloatValues(float_array, min_value, max_value):
     return float_array
 
 
-DEFAULT_RGB_SCALE_FACTOR = 256000.0
-
-
 def FloatArrayToRgbImage(float_array,
                          scale_factor=DEFAULT_RGB_SCALE_FACTOR,
                          drop_blue=False):
@@ -90,29 +91,11 @@ def FloatArrayToRgbImage(float_array,
     Returns:
       24-bit RGB PIL Image object representing depth values.
     """
-    float_array = np.squeeze(float_array)
-    # Scale the floating point array.
-    scaled_array = np.floor(float_array * scale_factor + 0.5)
-    # Convert the array to integer type and clip to representable range.
-    min_inttype = 0
-    max_inttype = 2**24 - 1
-    scaled_array = ClipFloatValues(scaled_array, min_inttype, max_inttype)
-    int_array = scaled_array.astype(np.uint32)
-    # Calculate:
+    # The bytes of the 24 bit integers go straight into the channels:
     #   r = (f / 256) / 256  high byte
     #   g = (f / 256) % 256  middle byte
     #   b = f % 256          low byte
-    rg = np.divide(int_array, 256)
-    r = np.divide(rg, 256)
-    g = np.mod(rg, 256)
-    image_shape = int_array.shape
-    rgb_array = np.zeros((image_shape[0], image_shape[1], 3), dtype=np.uint8)
-    rgb_array[..., 0] = r
-    rgb_array[..., 1] = g
-    if not drop_blue:
-        # Calculate the blue channel and add it to the array.
-        b = np.mod(int_array, 256)
-        rgb_array[..., 2] = b
+    rgb_array = EncodeFloatToRgb(float_array, scale_factor, drop_blue)
     image_mode = 'RGB'
     image = Image.fromarray(rgb_array, mode=image_mode)
     return image
@@ -202,9 +185,9 @@ def ImageToFloatArray(image, scale_factor=None):
     assert 2 <= len(image_shape) <= 3
     if channels == 3:
         # RGB image needs to be converted to 24 bit integer.
-        float_array = np.sum(image_array * [65536, 256, 1], axis=2)
         if scale_factor is None:
             scale_factor = DEFAULT_RGB_SCALE_FACTOR
+        return DecodeRgbToFloat(image_array, scale_factor)
     else:
         if scale_factor is None:
             scale_factor = DEFAULT_GRAY_SCALE_FACTOR[image_dtype.type]
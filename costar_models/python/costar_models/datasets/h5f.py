@@ -4,11 +4,21 @@ import h5py as h5f
 import numpy as np
 import os
 import datetime
+import six
+import tempfile
 
 class H5fDataset(object):
     '''
     Write out h5f datasets one file at a time, with information in filenames
     for easy access and data aggregation.
+
+    Examples can be written at once with write(), or streamed to disk a time
+    step at a time with open_episode():
+
+        episode = dataset.open_episode(image_types=[("image", "jpeg")])
+        for step in steps:
+            episode.append(step)
+        episode.close(extra_data, "example000001.success.h5f")
     '''
 
     def __init__(self, name, verbose=0):
@@ -40,6 +50,23 @@ class H5fDataset(object):
             f.create_dataset(key, data=value)
         f.close()
 
+    def open_episode(self, filename=None, image_types=[], chunk_rows=64):
+        '''
+        Start writing an example one time step at a time.
+
+        Parameters:
+        -----------
+        filename: name of the file in the dataset; can also be given when
+                  the episode is closed
+        image_types: (key, format) pairs as for write(); these keys hold
+                     encoded images and are stored as variable length bytes
+        chunk_rows: number of time steps per chunk of each column
+
+        Returns an H5fEpisode.
+        '''
+        return H5fEpisode(self.name, filename, image_types, chunk_rows,
+                          self.verbose)
+
     def load(self,success_only=False):
         '''
         Read a whole set of data files in. This part could definitely be
@@ -63,3 +90,114 @@ class H5fDataset(object):
         Create train/val/test splits
         '''
         raise RuntimeError('h5f does not yet support train/test splits')
+
+
+class H5fEpisode(object):
+    '''
+    An example being written one time step at a time. Every key becomes a
+    chunked column that grows along its first axis, with room added a chunk
+    or more at a time, so memory use does not grow with the length of the
+    example. Images (the keys in image_types) are stored as variable length
+    byte arrays, and other strings as variable length strings.
+
+    The file is written under a hidden temporary name and only moved to its
+    final name by close(), so readers never see a partial example.
+    '''
+
+    def __init__(self, directory, filename=None, image_types=[],
+                 chunk_rows=64, verbose=0):
+        self.directory = directory
+        self.filename = filename
+        self.image_types = image_types
+        self.image_keys = set(key for key, _ in image_types)
+        self.chunk_rows = chunk_rows
+        self.verbose = verbose
+        fd, self.tmp = tempfile.mkstemp(prefix=".episode", suffix=".partial",
+                                        dir=directory)
+        os.close(fd)
+        self.file = h5f.File(self.tmp, 'w')
+        self.columns = None
+        self.rows = 0
+        self.capacity = 0
+
+    def __len__(self):
+        return self.rows
+
+    def append(self, step):
+        '''
+        Add a time step: a dict with one value for every key. All steps must
+        have the same keys, and values of the same shape for each key.
+        '''
+        if self.columns is None:
+            self.columns = dict((key, self._create(key, value))
+                                for key, value in six.iteritems(step))
+        elif len(step) != len(self.columns) or \
+                any(key not in self.columns for key in step):
+            raise ValueError('time step has keys ' + str(sorted(step.keys()))
+                             + ', expected ' + str(sorted(self.columns.keys())))
+
+        if self.rows == self.capacity:
+            self.capacity += max(self.chunk_rows, self.capacity // 2)
+            for column in self.columns.values():
+                column.resize(self.capacity, axis=0)
+        for key, value in six.iteritems(step):
+            column = self.columns[key]
+            if key in self.image_keys:
+                value = np.frombuffer(value, dtype=np.uint8)
+            elif column.shape[1:] != np.shape(value):
+                raise ValueError('value of ' + key + ' has shape ' +
+                                 str(np.shape(value)) + ', expected ' +
+                                 str(column.shape[1:]))
+            column[self.rows] = value
+        self.rows += 1
+
+    def _create(self, key, value):
+        if self.verbose > 0:
+            print('H5fEpisode creating key: ' + str(key))
+        chunk_rows = self.chunk_rows
+        if key in self.image_keys:
+            dtype, shape = h5f.special_dtype(vlen=np.uint8), ()
+        else:
+            value = np.asarray(value)
+            dtype, shape = value.dtype, value.shape
+            if dtype.kind in "SUO":
+                dtype = h5f.special_dtype(vlen=six.text_type
+                                          if dtype.kind == "U" else bytes)
+            else:
+                # keep chunks of large arrays (e.g. raw images) around 1MB
+                chunk_rows = max(1, min(chunk_rows, 2**20 // max(1, value.nbytes)))
+        return self.file.create_dataset(key,
+                                        shape=(0,) + shape,
+                                        maxshape=(None,) + shape,
+                                        chunks=(chunk_rows,) + shape,
+                                        dtype=dtype)
+
+    def close(self, data={}, filename=None):
+        '''
+        Finish the example: trim the columns, write the values in data that
+        are not per time step (e.g. a log) and the image types, and move the
+        file to its final name. Returns the path of the file.
+        '''
+        if filename is None:
+            filename = self.filename
+        if filename is None:
+            raise RuntimeError('no filename given for the episode')
+        if self.columns is not None:
+            for column in self.columns.values():
+                column.resize(self.rows, axis=0)
+        for (img_type_str, img_format_str) in self.image_types:
+            self.file.create_dataset("type_" + img_type_str,
+                                     data=[img_format_str])
+        for key, value in six.iteritems(data):
+            self.file.create_dataset(key, data=value)
+        self.file.close()
+        filename = os.path.join(self.directory, filename)
+        os.rename(self.tmp, filename)
+        return filename
+
+    def discard(self):
+        '''
+        Throw away the example.
+        '''
+        self.file.close()
+        os.remove(self.tmp)
@@ -7,6 +7,7 @@ import os
 
 from .npy_generator import NpzGeneratorDataset
 from .image import *
+from .cache import CachedFile
 
 class H5fGeneratorDataset(NpzGeneratorDataset):
     '''
@@ -16,6 +17,9 @@ class H5fGeneratorDataset(NpzGeneratorDataset):
     The Npz generator version implements a generic version of this that just
     takes the load function so all we need to do is implement things so they'll
     load a particular class.
+
+    If the dataset has a DatasetCache, files are kept open between samples
+    and, if the cache has room for frames, images come out already decoded.
     '''
     def __init__(self, *args, **kwargs):
         super(H5fGeneratorDataset, self).__init__(*args, **kwargs)
@@ -38,8 +42,10 @@ class H5fGeneratorDataset(NpzGeneratorDataset):
             print('loading hf5 filename: ' + str(filename))
             debug_str = 'loading data:\n'
 
-        dataset = h5f.File(filename, 'r')
-        self.file = dataset
+        if self.cache is not None:
+            dataset = self.cache.open(filename)
+        else:
+            dataset = h5f.File(filename, 'r')
 
         # TODO: fix up this horrible code
         for k, v in six.iteritems(dataset):
@@ -51,10 +57,16 @@ class H5fGeneratorDataset(NpzGeneratorDataset):
                 continue
             if verbose > 0:
                 debug_str += ' added\n'
-            if k == "image":
+            if k == "image" and k not in self.load_jpeg:
                 self.load_jpeg.append(k)
-            elif k == "depth_image":
+            elif k == "depth_image" and k not in self.load_png:
                 self.load_png.append(k)
         if verbose > 0:
             print(debug_str)
+
+        if self.cache is not None:
+            self.file = CachedFile(self.cache, filename,
+                                   self.load_jpeg + self.load_png)
+        else:
+            self.file = dataset
         return self
@@ -27,6 +27,9 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import numpy as np
 import io
+import multiprocessing
+import os
+from multiprocessing.pool import ThreadPool
 from PIL import Image
 try:
     # don't require tensorflow for reading
@@ -69,7 +72,90 @@ def JpegToNumpy(jpeg):
     return np.asarray(image, dtype=np.uint8)
 
 
-def ConvertImageListToNumpy(data, format='numpy', data_format='NHWC', dtype=np.uint8):
+def OpenImage(raw, max_img_size=None):
+    '''
+    Open a binary jpeg or png image. If max_img_size is given, jpegs larger
+    than that are decoded at reduced size: the smallest of 1/2, 1/4 or 1/8
+    scale that is still at least max_img_size on each side.
+    '''
+    image = Image.open(io.BytesIO(raw))
+    if max_img_size is not None and image.format == "JPEG":
+        image.draft(image.mode, (max_img_size, max_img_size))
+    return image
+
+
+# Threads for decoding images. PIL releases the GIL while decoding, so
+# batches decode in parallel.
+# One pool for each number of threads asked for, in the process that made
+# them: a forked process (like a prefetch worker) inherits the pools but not
+# their threads, and would wait forever on them.
+_decode_pools = {}
+_decode_pid = None
+
+
+def _pool(num_threads):
+    global _decode_pools, _decode_pid
+    if _decode_pid != os.getpid():
+        _decode_pools = {}
+        _decode_pid = os.getpid()
+    if num_threads not in _decode_pools:
+        _decode_pools[num_threads] = ThreadPool(num_threads)
+    return _decode_pools[num_threads]
+
+
+def DefaultDecodeThreads():
+    return min(8, multiprocessing.cpu_count())
+
+
+def DecodeImages(data, out=None, max_img_size=None, num_threads=None,
+                 dtype=np.uint8):
+    """ Decode a list of binary jpeg or png images into one NHWC array.
+
+    The first image is decoded to find the shape of the output, and the rest
+    are decoded in parallel straight into it. All images must have the same
+    size.
+
+    # Arguments
+
+    data: a list of binary jpeg or png images
+    out: optional preallocated array to decode into
+    max_img_size: decode jpegs at reduced size when they are larger than
+        this, see OpenImage
+    num_threads: number of decoding threads, by default one per core (up
+        to 8)
+    dtype: type of the output
+    """
+    data = list(data)
+    if len(data) == 0:
+        return np.zeros((0,), dtype=dtype) if out is None else out
+    first = np.asarray(OpenImage(data[0], max_img_size))
+    if out is None:
+        out = np.empty((len(data),) + first.shape, dtype=dtype)
+    elif out.shape[1:] != first.shape:
+        raise ValueError('image of shape ' + str(first.shape) +
+                         ' does not fit in ' + str(out.shape))
+    out[0] = first
+
+    def decode(i):
+        image = np.asarray(OpenImage(data[i], max_img_size))
+        if image.shape != first.shape:
+            raise ValueError('image %d has shape %s, expected %s' %
+                             (i, str(image.shape), str(first.shape)))
+        out[i] = image
+
+    if num_threads is None:
+        num_threads = DefaultDecodeThreads()
+    if num_threads <= 1 or len(data) < 3:
+        for i in range(1, len(data)):
+            decode(i)
+    else:
+        _pool(num_threads).map(decode, range(1, len(data)))
+    return out
+
+
+def ConvertImageListToNumpy(data, format='numpy', data_format='NHWC',
+                            dtype=np.uint8, max_img_size=None,
+                            num_threads=None):
     """ Convert a list of binary jpeg or png files to numpy format.
 
     # Arguments
@@ -77,14 +163,26 @@ def ConvertImageListToNumpy(data, format='numpy', data_format='NHWC', dtype=np.u
     data: a list of binary jpeg images to convert
     format: default 'numpy' returns a 4d numpy array,
         'list' returns a list of 3d numpy arrays
+    max_img_size: decode jpegs at reduced size when they are larger than
+        this, see OpenImage
+    num_threads: number of decoding threads, see DecodeImages
     """
-    length = len(data)
-    images = []
-    for raw in data:
-        img = JpegToNumpy(raw)
-        if data_format == 'NCHW':
-            img = np.transpose(img, [2, 0, 1])
-        images.append(img)
-    if format == 'numpy':
-        images = np.array(images, dtype=dtype)
+    if format == 'list':
+        # images in a list may have different sizes
+        def decode(raw):
+            image = np.asarray(OpenImage(raw, max_img_size), dtype=dtype)
+            if data_format == 'NCHW':
+                image = np.transpose(image, [2, 0, 1])
+            return image
+        data = list(data)
+        if num_threads is None:
+            num_threads = DefaultDecodeThreads()
+        if num_threads <= 1 or len(data) < 3:
+            return [decode(raw) for raw in data]
+        return _pool(num_threads).map(decode, data)
+
+    images = DecodeImages(data, max_img_size=max_img_size,
+                          num_threads=num_threads, dtype=dtype)
+    if data_format == 'NCHW' and len(images.shape) == 4:
+        images = np.ascontiguousarray(np.transpose(images, [0, 3, 1, 2]))
     return images
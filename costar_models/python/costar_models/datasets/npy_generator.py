@@ -6,13 +6,14 @@ import glob
 import six
 
 from .image import *
+from .cache import CachedFrames
 
 class NpzGeneratorDataset(object):
     '''
     Get the list of objects from a folder full of NP arrays.
     '''
 
-    def __init__(self, name, split=0.1, preload=False):
+    def __init__(self, name, split=0.1, preload=False, cache=None):
         '''
         Set name of directory to load files from
 
@@ -21,6 +22,8 @@ class NpzGeneratorDataset(object):
         name: the directory
         split: portion of the data files reserved for testing/validation
         preload: load all files into memory when starting up
+        cache: optional DatasetCache of open files and decoded frames, for
+               datasets that support it
         '''
         self.name = name
         self.split = split
@@ -28,6 +31,7 @@ class NpzGeneratorDataset(object):
         self.test = []
         self.preload = preload
         self.preload_cache = {}
+        self.cache = cache
         # list of keys which contain lists of jpeg files
         self.load_jpeg = []
         # list of keys which contain lists of png files
@@ -68,31 +72,7 @@ class NpzGeneratorDataset(object):
                 # a good example to start with!
                 print('Extracting dataset structure from file: ' + str(filename))
                 with self._load(filename) as fsample:
-                    for key, value in six.iteritems(fsample):
-
-                        # Hack. shouldn't be duplicated here
-                        if key in self.load_jpeg or key in self.load_png:
-                            value = ConvertImageListToNumpy(value)
-
-                        # Hack. Resize for oversized data 
-                        shp = value.shape
-                        if len(shp) == 4 and shp[-1] == 3 and \
-                            (shp[1] > max_img_size or shp[2] > max_img_size):
-                                value = np.zeros((shp[0], 224, 224, 3), dtype=np.float32)
-
-
-                        if value.shape[0] == 0:
-                            print('key ' + str(key) + ' had 0 entries, skipping sample')
-                            # sample = {}
-                            continue
-
-                        if key not in sample:
-                            print('adding key to sample: ' + str(key))
-                            sample[key] = np.array(value)
-                        else:
-                            # Note: do not collect multiple samples anymore; this
-                            # hould never be reached
-                            sample[key] = np.concatenate([sample[key], value], axis=0)
+                    sample = self._structure(fsample, max_img_size)
             i += 1
             acceptable_files.append(filename)
         if verbose > 0:
@@ -123,6 +103,41 @@ class NpzGeneratorDataset(object):
 
         return sample # return numpy list
 
+    def _structure(self, fsample, max_img_size):
+        '''
+        Read the data of one example file into a dict of numpy arrays, to
+        show the structure of the data in the dataset.
+        '''
+        sample = {}
+        for key, value in six.iteritems(fsample):
+
+            # Hack. shouldn't be duplicated here
+            if isinstance(value, CachedFrames):
+                value = np.array(value)
+            elif key in self.load_jpeg or key in self.load_png:
+                value = ConvertImageListToNumpy(value)
+
+            # Hack. Resize for oversized data 
+            shp = value.shape
+            if len(shp) == 4 and shp[-1] == 3 and \
+                (shp[1] > max_img_size or shp[2] > max_img_size):
+                    value = np.zeros((shp[0], 224, 224, 3), dtype=np.float32)
+
+
+            if value.shape[0] == 0:
+                print('key ' + str(key) + ' had 0 entries, skipping sample')
+                # sample = {}
+                continue
+
+            if key not in sample:
+                print('adding key to sample: ' + str(key))
+                sample[key] = np.array(value)
+            else:
+                # Note: do not collect multiple samples anymore; this
+                # hould never be reached
+                sample[key] = np.concatenate([sample[key], value], axis=0)
+        return sample
+
     def sampleTrainFilename(self):
         return os.path.join(self.name,
                 self.train[np.random.randint(len(self.train))])
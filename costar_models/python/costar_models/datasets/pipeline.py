@@ -0,0 +1,279 @@
+from __future__ import print_function
+
+import io
+import os
+import threading
+import timeit
+import traceback
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import six
+from six.moves import queue
+from PIL import Image
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+from .depth_codec import DEPTH_RGB
+from .depth_codec import EncodeDepthPng
+
+'''
+Pipelined logging of camera streams.
+
+Encoding every camera frame as jpeg or png inside the ROS callbacks, and then
+writing a whole episode at once when it ends, keeps the callbacks slow and
+stalls the robot between episodes. FramePipeline splits the work in three
+stages:
+  - callbacks only drop raw frames into a slot holding the latest frame of
+    each stream, skipping all but one in every keep_every frames;
+  - for every logged time step, the latest frames are handed to a pool of
+    encoding threads (opencv and PIL release the GIL while encoding);
+  - a writer thread waits for the encoded frames in order and appends them
+    to the episode's file while the episode is still running.
+
+Nothing here depends on ROS, so the pipeline can be driven from synthetic
+frames, see costar_models/scripts/benchmark_frame_pipeline.py.
+'''
+
+
+class FramePipeline(object):
+    '''
+    Encode and write the frames of camera streams in the background.
+
+    Parameters:
+    -----------
+    encoders: dict from the name of each stream (the key its frames are
+              stored under, e.g. "image") to a function encoding one raw
+              frame as bytes
+    sink: function returning a new sink to append the encoded time steps of
+          an episode to, e.g. the H5fEpisode from H5fDataset.open_episode.
+          Sinks have append(step), close(data, filename) and discard().
+    keep_every: keep one frame in this many from each stream, by sequence
+                number; 1 keeps every frame
+    num_workers: number of encoding threads
+    max_pending: number of time steps that may be waiting to be encoded and
+                 written before append() blocks
+    '''
+
+    def __init__(self, encoders, sink, keep_every=3, num_workers=2,
+                 max_pending=64):
+        if keep_every < 1:
+            raise RuntimeError('keep_every must be at least 1')
+        if num_workers < 1:
+            raise RuntimeError('encoding needs at least one worker')
+        self.encoders = encoders
+        self.sink_factory = sink
+        self.keep_every = keep_every
+        self.pool = ThreadPool(num_workers)
+        self.steps = queue.Queue(max_pending)
+        self.mutex = threading.Lock()
+        self.frames = dict((stream, None) for stream in encoders)
+        self.sink = None
+        self.error = None
+        self.resetStats()
+
+        self.thread = threading.Thread(target=self._write)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def resetStats(self):
+        self.received = 0
+        self.skipped = 0
+        self.appended = 0
+        self.written = 0
+        self.wait_time = 0.
+        self.encode_time = 0.
+        self.write_time = 0.
+
+    def keep(self, seq):
+        '''
+        Whether to keep the frame with this sequence number. Callbacks should
+        check this before converting the message to an image.
+        '''
+        self.received += 1
+        if seq % self.keep_every == 0:
+            return True
+        self.skipped += 1
+        return False
+
+    def put(self, stream, frame):
+        '''
+        Make a raw frame the latest one of its stream. The frame must not be
+        modified afterwards.
+        '''
+        with self.mutex:
+            self.frames[stream] = frame
+
+    def latest(self):
+        '''
+        The latest frame of every stream, or None for streams that did not
+        receive any yet.
+        '''
+        with self.mutex:
+            return dict(self.frames)
+
+    def append(self, frames):
+        '''
+        Queue a time step for encoding and writing. Blocks while max_pending
+        steps are waiting.
+
+        Parameters:
+        -----------
+        frames: dict from stream to raw frame, as returned by latest()
+        '''
+        self._check()
+        step = dict((stream, self.pool.apply_async(
+                        _encode, (self.encoders[stream], frame)))
+                    for stream, frame in six.iteritems(frames))
+        start = timeit.default_timer()
+        self.steps.put(step)
+        self.wait_time += timeit.default_timer() - start
+        self.appended += 1
+
+    def finish(self, data, filename):
+        '''
+        Wait for every queued time step to be written, then complete the
+        episode with the rest of its data and store it under filename.
+        Returns the path of the file written.
+        '''
+        self.steps.join()
+        self._check()
+        sink, self.sink = self.sink, None
+        if sink is None:
+            sink = self.sink_factory()
+        return sink.close(data, filename)
+
+    def discard(self):
+        '''
+        Wait for queued time steps and throw away the current episode.
+        '''
+        self.steps.join()
+        sink, self.sink = self.sink, None
+        self.error = None
+        if sink is not None:
+            sink.discard()
+
+    def _check(self):
+        if self.error is not None:
+            error = self.error
+            self.discard()
+            raise RuntimeError('writing the episode failed:\n' + error)
+
+    def _write(self):
+        '''
+        Writer thread: append time steps to the sink in the order they were
+        queued. After an error, steps are dropped until the episode is
+        finished or discarded.
+        '''
+        while True:
+            step = self.steps.get()
+            try:
+                if self.error is None:
+                    row = {}
+                    for stream, result in six.iteritems(step):
+                        row[stream], encode_time = result.get()
+                        self.encode_time += encode_time
+                    start_write = timeit.default_timer()
+                    if self.sink is None:
+                        self.sink = self.sink_factory()
+                    self.sink.append(row)
+                    self.write_time += timeit.default_timer() - start_write
+                    self.written += 1
+            except Exception:
+                self.error = traceback.format_exc()
+            finally:
+                self.steps.task_done()
+
+    def stats(self):
+        '''
+        Counters: frames received and skipped by keep(), time steps appended,
+        written and still pending, the time append() spent blocked, and the
+        total time spent encoding and writing (in seconds).
+        '''
+        return {"received": self.received,
+                "skipped": self.skipped,
+                "appended": self.appended,
+                "written": self.written,
+                "pending": self.steps.qsize(),
+                "wait_time": self.wait_time,
+                "encode_time": self.encode_time,
+                "write_time": self.write_time}
+
+
+def _encode(encoder, frame):
+    start = timeit.default_timer()
+    if frame is None:
+        # nothing was received on this stream yet
+        raw = b''
+    else:
+        raw = encoder(frame)
+    return raw, timeit.default_timer() - start
+
+
+class WriterSink(object):
+    '''
+    Keep the encoded frames of an episode in memory and write the whole
+    episode with a dataset writer at the end, for formats that cannot be
+    appended to like npz.
+    '''
+
+    def __init__(self, writer, image_types=[]):
+        self.writer = writer
+        self.image_types = image_types
+        self.columns = {}
+
+    def append(self, row):
+        for key, value in six.iteritems(row):
+            self.columns.setdefault(key, []).append(value)
+
+    def close(self, data, filename):
+        data = dict(data)
+        for key, value in six.iteritems(self.columns):
+            data[key] = np.asarray(value)
+        self.writer.write(data, filename, image_types=self.image_types)
+        return os.path.join(self.writer.name, filename)
+
+    def discard(self):
+        self.columns = {}
+
+
+def EncodeJpeg(image, quality=None):
+    '''
+    Encode an RGB frame as jpeg bytes, with opencv if it is available.
+
+    quality: jpeg quality from 0 to 100; None uses the library default
+    '''
+    if cv2 is not None:
+        params = []
+        if quality is not None:
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        return cv2.imencode('.jpg', bgr, params)[1].tobytes()
+    output = io.BytesIO()
+    if quality is not None:
+        Image.fromarray(image).save(output, format="JPEG", quality=quality)
+    else:
+        Image.fromarray(image).save(output, format="JPEG")
+    return output.getvalue()
+
+
+class DepthPngEncoder(object):
+    '''
+    Encode 16 bit depth frames in millimeters as png bytes with
+    depth_codec.EncodeDepthPng, reusing one buffer per encoding thread.
+    '''
+
+    def __init__(self, mode=DEPTH_RGB, compression=None):
+        self.mode = mode
+        self.compression = compression
+        self.local = threading.local()
+
+    def __call__(self, depth):
+        shape = depth.shape + (3,)
+        buf = getattr(self.local, "buffer", None)
+        if buf is None or buf.shape != shape:
+            buf = self.local.buffer = np.empty(shape, dtype=np.uint8)
+        return EncodeDepthPng(depth, mode=self.mode,
+                              compression=self.compression, out=buf)
@@ -0,0 +1,286 @@
+from __future__ import print_function
+
+import ctypes
+import multiprocessing
+import pickle
+import timeit
+import traceback
+
+import numpy as np
+
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+'''
+Asynchronous prefetching of training batches.
+
+Building a batch means opening a few random files, slicing random rows out of
+them and decoding any jpeg images, which is slow enough to keep the GPU
+waiting. PrefetchGenerator moves that work into a pool of worker processes.
+
+Every worker owns a few slots of shared memory. It fills a free slot with the
+arrays of the next batch it is responsible for and tells the consumer about
+the layout of the slot; the consumer copies the arrays out and hands the slot
+back. The number of slots bounds how far the workers run ahead.
+
+Workers take turns: with n workers, each one builds every n-th batch. Batch k
+is built with the global numpy random state seeded from (seed, k), and the
+batches are handed out in order, so a given seed gives the same stream of
+batches for any number of workers.
+'''
+
+# Offsets of arrays inside a slot are rounded up to this many bytes
+_ALIGN = 64
+
+
+def _align(n):
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _nbytes(arrays):
+    return sum(_align(a.nbytes) for a in arrays)
+
+
+class PrefetchGenerator(object):
+    '''
+    Drop-in replacement for the generator returned by _yieldLoop(): iterating
+    over it yields (features, targets) tuples of lists of numpy arrays.
+
+    Parameters:
+    -----------
+    sampleBatch: callable that builds one (features, targets) batch using the
+                 global numpy random state, e.g.
+                 lambda: model._sampleBatch(dataset.sampleTrain)
+    num_workers: number of worker processes
+    prefetch: number of batches each worker may have ready at once
+    seed: base random seed; drawn at random if None
+    slot_bytes: size of each shared memory slot. By default one batch is built
+                up front and each slot gets room for its size plus headroom.
+                Batches that still do not fit are pickled instead.
+    headroom: extra space in each slot, as a fraction of the first batch
+    '''
+
+    def __init__(self, sampleBatch, num_workers=2, prefetch=4, seed=None,
+                 slot_bytes=None, headroom=0.5):
+        if num_workers < 1:
+            raise RuntimeError('prefetching needs at least one worker')
+        if prefetch < 1:
+            raise RuntimeError('prefetching needs at least one slot')
+        if seed is None:
+            seed = np.random.randint(2**31 - 1)
+        self.sampleBatch = sampleBatch
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        self.seed = seed
+        self.slot_bytes = slot_bytes
+        self.headroom = headroom
+        self.workers = []
+        self.next_batch = 0
+        self.first = None
+        self.offset = 0
+        self._resetStats()
+
+    def _resetStats(self):
+        self.batches = 0
+        self.samples = 0
+        self.bytes = 0
+        self.spilled = 0
+        self.wait_time = 0.
+        self.build_time = 0.
+        self.start_time = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.start_time is None:
+            self.start()
+        k = self.next_batch
+        self.next_batch += 1
+
+        if k == 0 and self.first is not None:
+            batch, self.first = self.first, None
+            self._count(batch, 0.)
+            return batch
+
+        start = timeit.default_timer()
+        worker = self.workers[(k - self.offset) % self.num_workers]
+        batch, build_time, spilled = worker.get()
+        self.wait_time += timeit.default_timer() - start
+        self.spilled += spilled
+        self._count(batch, build_time)
+        return batch
+
+    next = __next__
+
+    def start(self):
+        '''
+        Build the first batch here to size the shared memory, then start the
+        workers on the rest. Called on the first call to next().
+        '''
+        self._resetStats()
+        self.start_time = timeit.default_timer()
+        self.offset = 0
+        slot_bytes = self.slot_bytes
+        if slot_bytes is None:
+            state = np.random.get_state()
+            try:
+                start = timeit.default_timer()
+                _seed(self.seed, 0)
+                self.first = self.sampleBatch()
+                self.build_time += timeit.default_timer() - start
+            finally:
+                np.random.set_state(state)
+            features, targets = self.first
+            slot_bytes = _nbytes(features + targets)
+            slot_bytes = int(slot_bytes * (1. + self.headroom)) + _ALIGN
+            self.offset = 1
+        self.next_batch = 0
+        self.workers = [_Worker(self.sampleBatch, i, self.num_workers,
+                                self.offset, self.seed, self.prefetch, slot_bytes)
+                        for i in range(self.num_workers)]
+
+    def close(self):
+        '''
+        Stop all the worker processes.
+        '''
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+
+    def __del__(self):
+        self.close()
+
+    def _count(self, batch, build_time):
+        features, targets = batch
+        self.batches += 1
+        self.samples += len(features[0]) if len(features) > 0 else 0
+        self.bytes += _nbytes(features + targets)
+        self.build_time += build_time
+
+    def stats(self):
+        '''
+        Throughput counters: how many batches, samples and bytes were
+        delivered, how many did not fit in shared memory, the total time the
+        consumer spent waiting on the workers and the workers spent building
+        the delivered batches (both in seconds), and the resulting rates.
+        '''
+        elapsed = 0.
+        if self.start_time is not None:
+            elapsed = timeit.default_timer() - self.start_time
+        rate = lambda n: n / elapsed if elapsed > 0 else 0.
+        return {"batches": self.batches,
+                "samples": self.samples,
+                "bytes": self.bytes,
+                "spilled": self.spilled,
+                "wait_time": self.wait_time,
+                "build_time": self.build_time,
+                "elapsed": elapsed,
+                "batches_per_second": rate(self.batches),
+                "samples_per_second": rate(self.samples)}
+
+
+class _Worker(object):
+    '''
+    Consumer side of one worker process and its slots.
+    '''
+
+    def __init__(self, sampleBatch, index, num_workers, first, seed, prefetch,
+                 slot_bytes):
+        self.slot_bytes = slot_bytes
+        self.slots = [multiprocessing.RawArray(ctypes.c_uint8, slot_bytes)
+                      for _ in range(prefetch)]
+        self.free = multiprocessing.Queue()
+        self.ready = multiprocessing.Queue()
+        for i in range(prefetch):
+            self.free.put(i)
+        # batches handled by this worker: index + first, then every
+        # num_workers after that
+        self.process = multiprocessing.Process(
+                target=_work,
+                args=(sampleBatch, index + first, num_workers, seed,
+                      self.slots, self.free, self.ready))
+        self.process.daemon = True
+        self.process.start()
+
+    def get(self):
+        '''
+        Wait for this worker's next batch and copy it out of shared memory.
+        Returns the batch, the time the worker took to build it and whether
+        it had to be pickled.
+        '''
+        while True:
+            try:
+                msg = self.ready.get(timeout=1.)
+                break
+            except Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError('prefetch worker died with exit code '
+                                       + str(self.process.exitcode))
+        kind, slot, payload, build_time = msg
+        if kind == "error":
+            raise RuntimeError('prefetch worker failed:\n' + payload)
+        elif kind == "pickle":
+            # the slot stays checked out until now, so batches that do not
+            # fit are bounded by the number of slots too
+            self.free.put(slot)
+            return pickle.loads(payload), build_time, True
+
+        buf = np.ctypeslib.as_array(self.slots[slot])
+        features, targets = [], []
+        for dest, (dtype, shape, offset) in payload:
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            array = buf[offset:offset + size].view(dtype).reshape(shape)
+            (features if dest == 0 else targets).append(array.copy())
+        self.free.put(slot)
+        return (features, targets), build_time, False
+
+    def close(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+
+def _seed(seed, k):
+    np.random.seed([seed % 2**32, k % 2**32])
+
+
+def _work(sampleBatch, k, step, seed, slots, free, ready):
+    '''
+    Worker process: build batches k, k + step, k + 2 * step... and write each
+    one into the next free slot.
+    '''
+    buffers = [np.ctypeslib.as_array(slot) for slot in slots]
+    try:
+        while True:
+            slot = free.get()
+            start = timeit.default_timer()
+            _seed(seed, k)
+            features, targets = sampleBatch()
+            build_time = timeit.default_timer() - start
+            k += step
+
+            arrays = [(0, np.ascontiguousarray(f)) for f in features] + \
+                     [(1, np.ascontiguousarray(t)) for t in targets]
+            if any(a.dtype.hasobject for _, a in arrays) or \
+                    _nbytes([a for _, a in arrays]) > len(buffers[slot]):
+                ready.put(("pickle", slot,
+                           pickle.dumps((features, targets), protocol=2),
+                           build_time))
+                continue
+
+            layout = []
+            offset = 0
+            buf = buffers[slot]
+            for dest, array in arrays:
+                buf[offset:offset + array.nbytes] = \
+                        array.reshape(-1).view(np.uint8)
+                layout.append((dest, (array.dtype.str, array.shape, offset)))
+                offset += _align(array.nbytes)
+            ready.put(("shared", slot, layout, build_time))
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        ready.put(("error", None, traceback.format_exc(), 0.))
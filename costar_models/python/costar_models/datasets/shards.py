@@ -0,0 +1,381 @@
+from __future__ import print_function
+
+import glob
+import os
+
+import h5py as h5f
+import numpy as np
+import six
+
+from .cache import DatasetCache
+from .npy_generator import NpzGeneratorDataset
+
+'''
+Sharded, columnar storage for training data.
+
+Instead of one npz or h5f file per episode, episodes are appended to a few
+large h5f shards, where every key of an example is one chunked, compressed
+column with a row per time step. A small index next to the shards records the
+name of each episode (the file name it would have had), its shard, its first
+row and its length:
+
+    name/index.npz
+    name/shard00000.h5
+    name/shard00001.h5
+    ...
+
+Listing and splitting the dataset only reads the index, and reading an
+episode is one contiguous read per column from a shard that stays open.
+'''
+
+INDEX_FILENAME = "index.npz"
+
+
+def ShardFilename(shard):
+    return "shard%05d.h5" % shard
+
+
+class ShardDataset(object):
+    '''
+    Write episodes into shards. Drop-in replacement for H5fDataset.write; call
+    close() when done to write out the index.
+
+    Parameters:
+    -----------
+    name: directory to hold the shards and index
+    shard_rows: start a new shard once the current one has this many rows
+    chunk_rows: number of rows per chunk of each column
+    compression: h5py compression filter for the columns ("lzf", "gzip"...)
+    '''
+
+    def __init__(self, name, shard_rows=100000, chunk_rows=64,
+                 compression="lzf", verbose=0):
+        self.name = os.path.expanduser(name)
+        self.shard_rows = shard_rows
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        self.verbose = verbose
+        try:
+            os.mkdir(self.name)
+        except OSError:
+            pass
+
+        self.columns = None
+        self.shard = -1
+        self.file = None
+        self.rows = 0
+        self.names = []
+        self.shards = []
+        self.starts = []
+        self.lengths = []
+
+    def write(self, example, filename, image_types=[]):
+        '''
+        Append an episode. Every value that has one entry per time step
+        becomes a column; anything else (like the image type) is dropped,
+        with a warning if it is an array of some other length.
+        Image types are accepted for compatibility with H5fDataset.
+        '''
+        example = _rows(example, filename)
+        if example is None:
+            print('skipping empty example', filename)
+            return
+        if self.columns is None:
+            self.columns = dict((key, _columnType(value))
+                                for key, value in six.iteritems(example))
+        elif set(example.keys()) != set(self.columns.keys()):
+            print('skipping', filename, 'with keys', sorted(example.keys()),
+                  'instead of', sorted(self.columns.keys()))
+            return
+
+        if self.file is None or self.rows >= self.shard_rows:
+            self._nextShard()
+
+        length = len(six.next(six.itervalues(example)))
+        start = self.rows
+        for key, value in six.iteritems(example):
+            column = self.file[key]
+            column.resize(start + length, axis=0)
+            value = _encode(value)
+            if value.dtype == object:
+                # h5py takes an object array of byte arrays that all have
+                # the same length for a 2D array, so write them one by one
+                for i in np.ndindex(*value.shape):
+                    column[(start + i[0],) + i[1:]] = value[i]
+            else:
+                column[start:start + length] = value
+        self.rows += length
+
+        self.names.append(filename)
+        self.shards.append(self.shard)
+        self.starts.append(start)
+        self.lengths.append(length)
+        if self.verbose > 0:
+            print('ShardDataset wrote', filename, 'to shard', self.shard,
+                  'rows', start, 'to', start + length)
+
+    def _nextShard(self):
+        if self.file is not None:
+            self.file.close()
+        self.shard += 1
+        self.rows = 0
+        self.file = h5f.File(os.path.join(self.name,
+                                          ShardFilename(self.shard)), 'w')
+        for key, (dtype, shape) in six.iteritems(self.columns):
+            self.file.create_dataset(key,
+                                     shape=(0,) + shape,
+                                     maxshape=(None,) + shape,
+                                     chunks=(self.chunk_rows,) + shape,
+                                     dtype=dtype,
+                                     compression=self.compression)
+
+    def close(self):
+        '''
+        Close the last shard and write the index.
+        '''
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        WriteIndex(self.name, self.names, self.shards, self.starts,
+                   self.lengths)
+
+
+def WriteIndex(name, names, shards, starts, lengths):
+    '''
+    Write the episode index of a sharded dataset. It is written to a temporary
+    file first, so readers never see a partial index.
+    '''
+    names = np.array([str(n) for n in names])
+    success = np.array(['success' in n and 'error.failure' not in n
+                        for n in names], dtype=bool)
+    filename = os.path.join(name, INDEX_FILENAME)
+    tmp = filename + ".tmp.npz"
+    np.savez(tmp,
+             names=names.astype(bytes),
+             shards=np.array(shards, dtype=np.int32),
+             starts=np.array(starts, dtype=np.int64),
+             lengths=np.array(lengths, dtype=np.int64),
+             success=success)
+    os.rename(tmp, filename)
+
+
+def IsShardDataset(name):
+    return os.path.exists(os.path.join(os.path.expanduser(name),
+                                       INDEX_FILENAME))
+
+
+def ConvertToShards(files, name, verbose=0, **kwargs):
+    '''
+    Convert a set of per-episode npz or h5f files, e.g. a directory of
+    example%06d.success.h5f files, into a sharded dataset. Files that
+    ShardDataset cannot use are skipped with a warning.
+
+    Parameters:
+    -----------
+    files: glob pattern or list of files to convert
+    name: directory to write the shards to
+    kwargs: passed on to ShardDataset
+
+    Returns the number of episodes written.
+    '''
+    if isinstance(files, six.string_types):
+        files = glob.glob(os.path.expanduser(files))
+    files = sorted(files)
+    dataset = ShardDataset(name, verbose=verbose, **kwargs)
+    for i, filename in enumerate(files):
+        if verbose > 0:
+            print("%d/%d: %s" % (i + 1, len(files), filename))
+        basename = os.path.basename(filename)
+        if filename.endswith('.npz'):
+            data = np.load(filename)
+            example = dict((key, data[key]) for key in data.keys())
+            data.close()
+        else:
+            with h5f.File(filename, 'r') as data:
+                example = dict((key, data[key][()]) for key in data.keys())
+        dataset.write(example, basename)
+    dataset.close()
+    return len(dataset.names)
+
+
+class ShardGeneratorDataset(NpzGeneratorDataset):
+    '''
+    Sample episodes from a sharded dataset, like NpzGeneratorDataset does from
+    a folder of files. Episodes are named after the files they were converted
+    from, and split into train and test sets the same way.
+
+    Shards are kept open in a DatasetCache; preloading is not supported.
+    '''
+
+    def __init__(self, name, split=0.1, preload=False, cache=None):
+        if cache is None:
+            cache = DatasetCache(max_files=16)
+        super(ShardGeneratorDataset, self).__init__(
+                os.path.expanduser(name), split, preload=False, cache=cache)
+        self.file_extension = 'h5'
+        # the index, sorted by name
+        self.names = np.array([], dtype=str)
+        self.shards = None
+        self.starts = None
+        self.lengths = None
+
+    def load(self, success_only=False, verbose=0, max_img_size=224):
+        '''
+        Read the index, split the episodes into train and test sets and
+        return the data of the first one.
+        '''
+        index = np.load(os.path.join(self.name, INDEX_FILENAME))
+        names = index['names'].astype(str)
+        order = np.argsort(names)
+        self.names = names[order]
+        self.shards = index['shards'][order]
+        self.starts = index['starts'][order]
+        self.lengths = index['lengths'][order]
+        ok = self.lengths > 0
+        if success_only:
+            ok &= index['success'][order]
+        index.close()
+
+        # names are sorted, so the first files go to the test set as in
+        # NpzGeneratorDataset
+        acceptable = self.names[ok]
+        length = max(1, int(self.split * len(acceptable)))
+        print("---------------------------------------------")
+        print("Loaded data.")
+        print("# Total examples:", len(acceptable))
+        print("# Validation examples:", length)
+        print("---------------------------------------------")
+        test = acceptable[:length]
+        train = acceptable[length:]
+        self.test = test[np.random.permutation(len(test))].tolist()
+        self.train = train[np.random.permutation(len(train))].tolist()
+        if verbose > 0:
+            print('episodes that will be used in dataset: \n' +
+                  str(acceptable.tolist()))
+
+        if len(acceptable) == 0:
+            return {}
+        print('Extracting dataset structure from episode: ' + acceptable[0])
+        with self._load(acceptable[0]) as fsample:
+            for key in fsample.keys():
+                if key == "image" and key not in self.load_jpeg:
+                    self.load_jpeg.append(key)
+                elif key == "depth_image" and key not in self.load_png:
+                    self.load_png.append(key)
+            sample = self._structure(fsample, max_img_size)
+        return sample
+
+    def _load(self, filename):
+        name = os.path.basename(filename)
+        i = np.searchsorted(self.names, name)
+        if i >= len(self.names) or self.names[i] != name:
+            raise RuntimeError('no episode named ' + name + ' in ' + self.name)
+        shard = os.path.join(self.name, ShardFilename(self.shards[i]))
+        self.file = Episode(self.cache.open(shard), self.starts[i],
+                            self.lengths[i])
+        return self
+
+    # Interface for `with`
+    def __enter__(self):
+        return self.file
+
+    def __exit__(self, *args):
+        self.file = None
+
+
+class Episode(object):
+    '''
+    The rows of one episode in a shard, as a read-only dict of numpy arrays.
+    Each column is read the first time it is accessed.
+    '''
+
+    def __init__(self, shard, start, length):
+        self.shard = shard
+        self.start = start
+        self.length = length
+        self.data = {}
+
+    def keys(self):
+        return list(self.shard.keys())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.shard)
+
+    def __contains__(self, key):
+        return key in self.shard
+
+    def __getitem__(self, key):
+        if key not in self.data:
+            value = self.shard[key][self.start:self.start + self.length]
+            if value.dtype == object:
+                # variable length byte strings, e.g. jpeg images
+                value = np.array([v.tobytes() for v in value.reshape(-1)]) \
+                        .reshape(value.shape)
+            self.data[key] = value
+        return self.data[key]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+
+def _rows(example, filename):
+    '''
+    Keep only the values with one entry per time step: those with the most
+    common length. Scalars and the image formats that H5fDataset stores as
+    type_* keys are dropped; any other value with a different length is
+    dropped with a warning.
+    '''
+    lengths = {}
+    for key, value in six.iteritems(example):
+        shape = np.shape(value)
+        if _isMetadata(key, shape):
+            continue
+        if shape[0] > 0:
+            lengths[shape[0]] = lengths.get(shape[0], 0) + 1
+    if len(lengths) == 0:
+        return None
+    length = max(lengths, key=lambda n: (lengths[n], n))
+    rows = {}
+    for key, value in sorted(six.iteritems(example)):
+        shape = np.shape(value)
+        if _isMetadata(key, shape):
+            continue
+        if shape[0] == length:
+            rows[key] = value
+        else:
+            print('dropping', key, 'from', filename, 'with',
+                  shape[0], 'rows instead of', length)
+    return rows
+
+
+def _isMetadata(key, shape):
+    return len(shape) == 0 or key.startswith("type_")
+
+
+def _columnType(value):
+    '''
+    dtype and row shape of the column a value is stored in. Byte strings (like
+    jpeg images) have a different length in every file and can contain nulls,
+    so they are stored as variable length arrays of bytes.
+    '''
+    value = np.asarray(value)
+    if value.dtype.kind in "SO":
+        return h5f.special_dtype(vlen=np.uint8), value.shape[1:]
+    return value.dtype, value.shape[1:]
+
+
+def _encode(value):
+    value = np.asarray(value)
+    if value.dtype.kind in "SO":
+        encoded = np.empty(value.size, dtype=object)
+        encoded[:] = [v if isinstance(v, np.ndarray)
+                      else np.frombuffer(bytes(v), dtype=np.uint8)
+                      for v in value.reshape(-1)]
+        return encoded.reshape(value.shape)
+    return value
@@ -195,6 +195,26 @@ def GetModelParser():
     parser.add_argument("--preload",
                         help="preload all files into RAM", default=False,
                         action='store_true')
+    parser.add_argument("--cache_files",
+                        help="number of h5f files to keep open between" + \
+                             " samples; 0 (the default) opens them every time",
+                        type=int,
+                        default=0)
+    parser.add_argument("--cache_frames",
+                        help="MB of memory for caching decoded images from" + \
+                             " h5f files; needs --cache_files",
+                        type=int,
+                        default=0)
+    parser.add_argument("--num_workers",
+                        help="number of processes reading batches in the" + \
+                             " background; 0 reads them on the training thread",
+                        type=int,
+                        default=0)
+    parser.add_argument("--prefetch",
+                        help="number of batches each reader process may" + \
+                             " have ready at once",
+                        type=int,
+                        default=4)
     parser.add_argument("--wasserstein",
                         help="Use weisserstein gan loss. Sets clip_weights to 0.01",
                         default=False,
@@ -215,7 +235,14 @@ def GetModelParser():
                         action='store_true')
     parser.add_argument("--max_img_size",
                         help="Set max size for frames to be resized into",
+                        type=int,
                         default=224)
+    parser.add_argument("--draft_decode",
+                        help="decode jpegs larger than max_img_size at" + \
+                             " reduced scale, which is faster but gives" + \
+                             " different pixels than a full decode",
+                        default=False,
+                        action='store_true')
     return parser
 
 def GetSubmodelOptions():
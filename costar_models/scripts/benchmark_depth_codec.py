@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+'''
+Measure depth images per second through the old depth encoding code and
+through depth_codec: the raw kernels, and full png encode and decode in the
+RGB and 16 bit formats at different compression levels.
+'''
+
+import argparse
+import io
+import timeit
+
+import numpy as np
+from PIL import Image
+
+from costar_models.datasets.depth_codec import *
+from costar_models.datasets.depth_image_encoding import ImageToFloatArray
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(add_help=True)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--number", type=int, default=20)
+    parser.add_argument("--compression", type=int, nargs="+",
+                        default=[1, 3, 6])
+    return parser.parse_args()
+
+
+def encodeLoop(cv_image):
+    # the previous collector.encode_depth_numpy
+    r = np.array(np.divide(cv_image, 256), dtype=np.uint8)
+    g = np.array(np.mod(cv_image, 256), dtype=np.uint8)
+    b = np.zeros(cv_image.shape, dtype=np.uint8)
+    return np.stack([b, g, r], axis=-1)
+
+
+def floatDecodeLoop(rgb):
+    # the previous ImageToFloatArray
+    return np.sum(rgb * [65536, 256, 1], axis=2) / DEFAULT_RGB_SCALE_FACTOR
+
+
+def report(args, name, fn):
+    t = min(timeit.repeat(fn, number=args.number, repeat=3)) / args.number
+    print("%-40s %8.1f images/s" % (name, 1. / t))
+
+
+def main(args):
+    # smooth depth, in millimeters, like a table top seen from above
+    y, x = np.mgrid[0:args.height, 0:args.width]
+    depth = (800 + 0.3 * x + 0.2 * y +
+             np.random.randint(0, 3, size=x.shape)).astype(np.uint16)
+    rgb = EncodeDepth16ToRgb(depth)
+    out = np.empty_like(rgb)
+    out16 = np.empty_like(depth)
+    out_float = np.empty(depth.shape)
+    work = np.empty(depth.shape, dtype=np.uint32)
+
+    report(args, "encode, old", lambda: encodeLoop(depth))
+    report(args, "encode, EncodeDepth16ToRgb",
+           lambda: EncodeDepth16ToRgb(depth, out=out, order="bgr"))
+    report(args, "decode, DecodeRgbToDepth16",
+           lambda: DecodeRgbToDepth16(rgb, out=out16))
+    report(args, "decode to meters, old",
+           lambda: floatDecodeLoop(rgb))
+    report(args, "decode to meters, DecodeRgbToFloat",
+           lambda: DecodeRgbToFloat(rgb, out=out_float, int_work=work))
+
+    for mode in [DEPTH_RGB, DEPTH_PNG16]:
+        for compression in [None] + args.compression:
+            raw = EncodeDepthPng(depth, mode, compression)
+            report(args, "png %s, compression %s, encode" % (mode, compression),
+                   lambda: EncodeDepthPng(depth, mode, compression, out=out))
+            report(args, "png %s, compression %s, decode (%d kB)" %
+                   (mode, compression, len(raw) // 1024),
+                   lambda: DecodeDepthPng(raw, out=out16))
+
+if __name__ == '__main__':
+    main(getArgs())
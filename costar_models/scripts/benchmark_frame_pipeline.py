@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+'''
+Drive a FramePipeline with synthetic camera streams instead of ROS topics,
+the way DataCollector does: a camera thread publishes rgb and depth frames,
+the main loop logs the latest ones at a fixed rate, and every episode is
+finished into an h5f file. Prints how long logging a step and finishing an
+episode took, then reads the episodes back to check them.
+'''
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+import timeit
+
+import h5py as h5f
+import numpy as np
+
+from costar_models.datasets.image import DecodeImages
+from costar_models.datasets.depth_codec import DecodeDepthPng
+from costar_models.datasets.h5f import H5fDataset
+from costar_models.datasets.pipeline import *
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(add_help=True)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--camera_rate", type=float, default=30.,
+                        help="frames per second of the synthetic camera")
+    parser.add_argument("--rate", type=float, default=10.,
+                        help="time steps logged per second, 0 for no limit")
+    parser.add_argument("--keep_every", type=int, default=3)
+    parser.add_argument("--steps", type=int, default=50,
+                        help="time steps per episode")
+    parser.add_argument("--episodes", type=int, default=3)
+    parser.add_argument("--encode_threads", type=int, default=2)
+    parser.add_argument("--data_root", type=str, default=None,
+                        help="where to write, a temporary directory if unset")
+    return parser.parse_args()
+
+
+def camera(args, pipeline, stop):
+    y, x = np.mgrid[0:args.height, 0:args.width]
+    seq = 0
+    while not stop.is_set():
+        if pipeline.keep(seq):
+            rgb = np.random.randint(0, 255, size=(args.height, args.width, 3))
+            depth = 800 + 0.3 * x + 0.2 * y + (seq % 50)
+            pipeline.put("image", rgb.astype(np.uint8))
+            pipeline.put("depth_image", depth.astype(np.uint16))
+        seq += 1
+        time.sleep(1. / args.camera_rate)
+
+
+def main(args):
+    root = args.data_root
+    if root is None:
+        root = tempfile.mkdtemp()
+    writer = H5fDataset(root)
+    image_types = [("image", "jpeg"), ("depth_image", "png")]
+    pipeline = FramePipeline(
+            {"image": lambda image: EncodeJpeg(image, quality=99),
+             "depth_image": DepthPngEncoder()},
+            lambda: writer.open_episode(image_types=image_types),
+            keep_every=args.keep_every,
+            num_workers=args.encode_threads)
+
+    stop = threading.Event()
+    thread = threading.Thread(target=camera, args=(args, pipeline, stop))
+    thread.daemon = True
+    thread.start()
+    # wait for the first frames
+    while any(frame is None for frame in pipeline.latest().values()):
+        time.sleep(0.01)
+
+    step_times = []
+    finish_times = []
+    filenames = []
+    for episode in range(args.episodes):
+        for step in range(args.steps):
+            start = timeit.default_timer()
+            pipeline.append(pipeline.latest())
+            step_times.append(timeit.default_timer() - start)
+            if args.rate > 0:
+                time.sleep(max(0., 1. / args.rate - step_times[-1]))
+        data = {"label": np.zeros(args.steps, dtype=np.int64),
+                "log": np.asarray('')}
+        start = timeit.default_timer()
+        filenames.append(pipeline.finish(
+                data, "example%06d.success.h5f" % episode))
+        finish_times.append(timeit.default_timer() - start)
+    stop.set()
+    thread.join()
+
+    print("steps logged:      ", len(step_times))
+    print("log step, mean:    %.2f ms" % (1000 * np.mean(step_times)))
+    print("log step, max:     %.2f ms" % (1000 * np.max(step_times)))
+    print("finish, mean:      %.2f ms" % (1000 * np.mean(finish_times)))
+    for key, value in sorted(pipeline.stats().items()):
+        print("%-18s %s" % (key + ":", value))
+
+    for filename in filenames:
+        with h5f.File(filename, 'r') as data:
+            images = DecodeImages(data["image"][()])
+            depth = DecodeDepthPng(data["depth_image"][0].tobytes())
+            assert len(images) == len(data["label"]) == args.steps
+            assert depth.shape == (args.height, args.width)
+    print("read back", len(filenames), "episodes from", root)
+    if args.data_root is None:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main(getArgs())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+'''
+Measure how many images per second ConvertImageListToNumpy decodes, one at a
+time as before versus in batches on a thread pool, with and without reduced
+size jpeg decoding.
+'''
+
+import argparse
+import io
+import timeit
+
+import numpy as np
+from PIL import Image
+
+from costar_models.datasets.image import GetJpeg, GetPng
+from costar_models.datasets.image import ConvertImageListToNumpy
+
+
+def getArgs():
+    parser = argparse.ArgumentParser(add_help=True)
+    parser.add_argument("--num_images", type=int, default=64)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--max_img_size", type=int, default=224)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def makeImages(args, encode):
+    # smooth images compress like real camera frames, unlike noise
+    y, x = np.mgrid[0:args.height, 0:args.width]
+    images = []
+    for i in range(args.num_images):
+        img = np.stack([(x + 3 * i) % 256, (y + 5 * i) % 256,
+                        (x + y) % 256], axis=-1)
+        images.append(encode(img.astype(np.uint8)))
+    return images
+
+
+def loop(data):
+    # the previous implementation
+    return np.array([np.asarray(Image.open(io.BytesIO(raw)), dtype=np.uint8)
+                     for raw in data], dtype=np.uint8)
+
+
+def rate(args, fn):
+    t = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+    return args.num_images / t
+
+
+def main(args):
+    for name, encode in [("jpeg", GetJpeg), ("png", GetPng)]:
+        data = makeImages(args, encode)
+        print("%s %dx%d, %d images" % (name, args.width, args.height,
+                                      args.num_images))
+        print("  loop: %.1f images/s" % rate(args, lambda: loop(data)))
+        for threads in args.threads:
+            print("  batch, %d threads: %.1f images/s" % (threads, rate(
+                args, lambda: ConvertImageListToNumpy(
+                    data, num_threads=threads))))
+        if name == "jpeg":
+            for threads in args.threads:
+                print("  batch, %d threads, max_img_size %d: %.1f images/s"
+                      % (threads, args.max_img_size, rate(
+                          args, lambda: ConvertImageListToNumpy(
+                              data, num_threads=threads,
+                              max_img_size=args.max_img_size))))
+
+if __name__ == '__main__':
+    main(getArgs())
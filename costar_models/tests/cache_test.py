@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import h5py as h5f
+import numpy as np
+
+from costar_models.datasets.cache import DatasetCache, CachedFile
+from costar_models.datasets.image import GetJpeg, ConvertImageListToNumpy
+from costar_models.parse import GetModelParser
+
+class TestDatasetCache(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.dir, "example.success.h5f")
+    np.random.seed(0)
+    images = np.random.randint(0, 255, (5, 64, 48, 3)).astype(np.uint8)
+    self.jpegs = np.array([GetJpeg(img) for img in images])
+    with h5f.File(self.filename, 'w') as f:
+      f.create_dataset("image", data=self.jpegs)
+      f.create_dataset("label", data=np.arange(5))
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_caching_is_opt_in(self):
+    args = GetModelParser().parse_args([])
+    self.assertEqual(args.cache_files, 0)
+    self.assertEqual(args.cache_frames, 0)
+    # and so is decoding jpegs at reduced size
+    self.assertFalse(args.draft_decode)
+
+  def test_decode_max_img_size(self):
+    for max_img_size in [None, 16]:
+      cache = DatasetCache(max_files=2, max_frame_bytes=2**20,
+                           max_img_size=max_img_size)
+      try:
+        frames = CachedFile(cache, self.filename, ["image"])["image"]
+        expected = ConvertImageListToNumpy(self.jpegs,
+                                           max_img_size=max_img_size)
+        # the same frames the model would decode itself, cached or not
+        for rows in [[3, 1], [1, 3, 4]]:
+          np.testing.assert_array_equal(frames[rows], expected[rows])
+        self.assertEqual(cache.frames.stats()["hits"], 2)
+        if max_img_size is not None:
+          self.assertTrue(expected.shape[1] < 64)
+      finally:
+        cache.close()
+
+if __name__ == '__main__':
+  unittest.main()
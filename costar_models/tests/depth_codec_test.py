@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+
+from costar_models.datasets.depth_codec import *
+from costar_models.datasets.depth_image_encoding import FloatArrayToRgbImage
+from costar_models.datasets.depth_image_encoding import ImageToFloatArray
+
+MAX_24 = 2**24 - 1
+
+def depth16():
+  '''
+  Random 16 bit depth with zero and the largest value in it.
+  '''
+  depth = np.random.randint(0, 2**16, (48, 64)).astype(np.uint16)
+  depth[0, :4] = [0, 2**16 - 1, 255, 256]
+  return depth
+
+def reference_rgb16(depth):
+  '''
+  The old per-pixel encoding: high byte in red, low byte in green.
+  '''
+  depth = depth.astype(np.int64)
+  return np.stack([depth // 256, depth % 256, np.zeros_like(depth)],
+                  axis=-1).astype(np.uint8)
+
+class TestDepthCodec(unittest.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+
+  def test_depth16_rgb(self):
+    depth = depth16()
+    for order in ["rgb", "bgr"]:
+      rgb = EncodeDepth16ToRgb(depth, order=order)
+      expected = reference_rgb16(depth)
+      if order == "bgr":
+        expected = expected[..., ::-1]
+      np.testing.assert_array_equal(rgb, expected)
+
+      out = np.zeros(depth.shape, dtype=np.uint16)
+      decoded = DecodeRgbToDepth16(rgb, out=out, order=order)
+      self.assertTrue(decoded is out)
+      self.assertEqual(decoded.dtype, np.uint16)
+      np.testing.assert_array_equal(decoded, depth)
+
+  def test_depth16_png(self):
+    depth = depth16()
+    for mode in [DEPTH_RGB, DEPTH_PNG16]:
+      for compression in [None, 0, 1, 9]:
+        raw = EncodeDepthPng(depth, mode=mode, compression=compression)
+        decoded = DecodeDepthPng(raw)
+        self.assertEqual(decoded.dtype, np.uint16)
+        np.testing.assert_array_equal(decoded, depth)
+
+  def test_float_rgb(self):
+    # depths on the 1/256 mm grid, including zero and the largest one
+    fixed = np.random.randint(0, MAX_24 + 1, (48, 64))
+    fixed[0, :3] = [0, MAX_24, 1]
+    depth = fixed / DEFAULT_RGB_SCALE_FACTOR
+
+    rgb = EncodeFloatToRgb(depth)
+    expected = np.array(FloatArrayToRgbImage(depth))
+    np.testing.assert_array_equal(rgb, expected)
+
+    decoded = DecodeRgbToFloat(rgb)
+    np.testing.assert_array_equal(decoded, depth)
+    np.testing.assert_array_equal(decoded, ImageToFloatArray(expected))
+    # and back to the same bytes
+    np.testing.assert_array_equal(EncodeFloatToRgb(decoded), rgb)
+
+  def test_float_rgb_clip_and_drop_blue(self):
+    depth = np.array([[0., -1.], [1e6, 1.2345678]])
+    rgb = EncodeFloatToRgb(depth)
+    decoded = DecodeRgbToFloat(rgb)
+    self.assertEqual(decoded[0, 1], 0.)
+    self.assertEqual(decoded[1, 0], MAX_24 / DEFAULT_RGB_SCALE_FACTOR)
+    self.assertTrue(abs(decoded[1, 1] - depth[1, 1]) <=
+                    0.5 / DEFAULT_RGB_SCALE_FACTOR)
+
+    rgb = EncodeFloatToRgb(depth, drop_blue=True)
+    self.assertTrue(np.all(rgb[..., 2] == 0))
+    np.testing.assert_array_equal(
+        rgb, np.array(FloatArrayToRgbImage(depth, drop_blue=True)))
+
+  def test_preallocated_outputs(self):
+    depth = np.random.rand(16, 16) * 10.
+    out = np.empty((16, 16, 3), dtype=np.uint8)
+    work = np.empty((16, 16))
+    int_work = np.empty((16, 16), dtype=np.uint32)
+    rgb = EncodeFloatToRgb(depth, out=out, work=work, int_work=int_work)
+    self.assertTrue(rgb is out)
+    np.testing.assert_array_equal(rgb, EncodeFloatToRgb(depth))
+    with self.assertRaises(ValueError):
+      DecodeRgbToDepth16(rgb, out=np.empty((16, 16), np.uint16).T[::2])
+
+if __name__ == '__main__':
+  unittest.main()
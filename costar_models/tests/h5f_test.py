@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from costar_models.datasets.h5f import H5fDataset
+from costar_models.datasets.h5f_generator import H5fGeneratorDataset
+from costar_models.datasets.image import GetJpeg, ConvertImageListToNumpy
+
+IMAGE_TYPES = [("image", "jpeg")]
+
+def make_episode(length):
+  '''
+  One value per time step for every key, plus data that is not per step.
+  '''
+  images = np.random.randint(0, 255, (length, 8, 8, 3)).astype(np.uint8)
+  steps = {"image": [GetJpeg(img) for img in images],
+           "pose": np.random.randn(length, 7),
+           "label": np.random.randint(0, 5, (length,)),
+           "reward": np.random.rand(length).astype(np.float32),
+           "done": np.arange(length) == length - 1}
+  extra = {"value": [3.5] * length,
+           "success": [1.] * length}
+  return steps, extra
+
+class TestH5fEpisode(unittest.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def write_both(self, length, filename, chunk_rows=4):
+    '''
+    Write an episode as a whole with write(), and a time step at a time with
+    an H5fEpisode, to two datasets.
+    '''
+    steps, extra = make_episode(length)
+    whole = H5fDataset(os.path.join(self.dir, "whole"))
+    data = dict(extra)
+    data.update(steps)
+    data["image"] = np.array(steps["image"])
+    whole.write(data, filename, image_types=IMAGE_TYPES)
+
+    streamed = H5fDataset(os.path.join(self.dir, "streamed"))
+    episode = streamed.open_episode(image_types=IMAGE_TYPES,
+                                    chunk_rows=chunk_rows)
+    for i in range(length):
+      episode.append(dict((key, values[i])
+                          for key, values in steps.items()))
+    self.assertEqual(len(episode), length)
+    path = episode.close(extra, filename)
+    self.assertEqual(path, os.path.join(streamed.name, filename))
+
+  def load(self, name, success_only=False):
+    dataset = H5fGeneratorDataset(os.path.join(self.dir, name, "*.h5f"),
+                                  split=0.5)
+    dataset.load(success_only=success_only)
+    return dataset
+
+  def names(self, dataset):
+    return sorted(os.path.basename(f) for f in dataset.train + dataset.test)
+
+  def read(self, name, filename):
+    dataset = H5fGeneratorDataset(os.path.join(self.dir, name, "*.h5f"))
+    with dataset._load(os.path.join(self.dir, name, filename)) as f:
+      return dict((key, f[key][()]) for key in f.keys())
+
+  def test_same_as_whole_write(self):
+    # lengths below, at and above a chunk, and growing the columns twice
+    files = []
+    for i, length in enumerate([1, 4, 9, 30]):
+      files.append("example%06d.success.h5f" % i)
+      self.write_both(length, files[-1])
+
+    whole, streamed = self.load("whole"), self.load("streamed")
+    self.assertEqual(self.names(whole), files)
+    self.assertEqual(self.names(streamed), files)
+    self.assertEqual(streamed.load_jpeg, ["image"])
+    for filename in files:
+      expected = self.read("whole", filename)
+      actual = self.read("streamed", filename)
+      self.assertEqual(sorted(actual.keys()), sorted(expected.keys()))
+      for key in expected:
+        self.assertEqual(len(actual[key]), len(expected[key]))
+        if key == "image":
+          # bytes in the whole file, variable length uint8 when streamed
+          np.testing.assert_array_equal(
+              ConvertImageListToNumpy(actual[key]),
+              ConvertImageListToNumpy(expected[key]))
+        else:
+          self.assertEqual(actual[key].dtype, expected[key].dtype)
+          np.testing.assert_array_equal(actual[key], expected[key])
+
+  def test_discard_and_failure(self):
+    dataset = H5fDataset(os.path.join(self.dir, "streamed"))
+    steps, extra = make_episode(5)
+    for status in ["success", "failure"]:
+      episode = dataset.open_episode(image_types=IMAGE_TYPES)
+      for i in range(5):
+        episode.append(dict((key, values[i])
+                            for key, values in steps.items()))
+      episode.close(extra, "example%06d.%s.h5f" % (0, status))
+
+    episode = dataset.open_episode(image_types=IMAGE_TYPES)
+    episode.append(dict((key, values[0]) for key, values in steps.items()))
+    episode.discard()
+
+    # nothing left of the discarded episode, not even its temporary file
+    self.assertEqual(sorted(os.listdir(dataset.name)),
+                     ["example000000.failure.h5f",
+                      "example000000.success.h5f"])
+    self.assertEqual(len(self.names(self.load("streamed"))), 2)
+    self.assertEqual(self.names(self.load("streamed", success_only=True)),
+                     ["example000000.success.h5f"])
+
+  def test_bad_steps(self):
+    dataset = H5fDataset(os.path.join(self.dir, "streamed"))
+    steps, _ = make_episode(2)
+    episode = dataset.open_episode(image_types=IMAGE_TYPES)
+    episode.append(dict((key, values[0]) for key, values in steps.items()))
+    with self.assertRaises(ValueError):
+      episode.append({"pose": steps["pose"][1]})
+    bad = dict((key, values[1]) for key, values in steps.items())
+    bad["pose"] = np.zeros(6)
+    with self.assertRaises(ValueError):
+      episode.append(bad)
+    episode.discard()
+    self.assertEqual(glob.glob(os.path.join(dataset.name, "*")), [])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+import io
+import time
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from costar_models.datasets import FramePipeline
+from costar_models.datasets.depth_codec import DEPTH_RGB, DEPTH_PNG16
+from costar_models.datasets.depth_codec import DecodeDepthPng
+from costar_models.datasets.pipeline import DepthPngEncoder, EncodeJpeg
+
+class MemorySink(object):
+  '''
+  Keeps the rows of one episode, and remembers how it ended.
+  '''
+
+  def __init__(self, sinks):
+    self.rows = []
+    self.closed = None
+    self.discarded = False
+    sinks.append(self)
+
+  def append(self, row):
+    self.rows.append(row)
+
+  def close(self, data, filename):
+    self.closed = (data, filename)
+    return filename
+
+  def discard(self):
+    self.discarded = True
+
+def slow_bytes(frame):
+  # encode out of order: later frames are often done first
+  time.sleep(np.random.rand() * 0.005)
+  return frame.tobytes()
+
+def frames(num):
+  rgb = [np.full((12, 16, 3), 10 * i, dtype=np.uint8) for i in range(num)]
+  depth = [np.random.randint(0, 2**16, (12, 16)).astype(np.uint16)
+           for i in range(num)]
+  depth[0][0, :2] = [0, 2**16 - 1]
+  return rgb, depth
+
+class TestFramePipeline(unittest.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.sinks = []
+
+  def make(self, encoders, **kwargs):
+    return FramePipeline(encoders, lambda: MemorySink(self.sinks), **kwargs)
+
+  def test_order(self):
+    pipeline = self.make({"image": slow_bytes, "depth_image": slow_bytes},
+                         num_workers=4, max_pending=4)
+    rgb, depth = frames(30)
+    for i in range(30):
+      pipeline.append({"image": rgb[i], "depth_image": depth[i]})
+    self.assertEqual(pipeline.finish({"label": 1}, "a.h5f"), "a.h5f")
+
+    sink, = self.sinks
+    self.assertEqual(sink.closed, ({"label": 1}, "a.h5f"))
+    self.assertEqual(len(sink.rows), 30)
+    for i, row in enumerate(sink.rows):
+      self.assertEqual(row["image"], rgb[i].tobytes())
+      self.assertEqual(row["depth_image"], depth[i].tobytes())
+    self.assertEqual(pipeline.stats()["written"], 30)
+    self.assertEqual(pipeline.stats()["pending"], 0)
+
+  def test_encoded_frames(self):
+    for mode in [DEPTH_RGB, DEPTH_PNG16]:
+      self.sinks = []
+      pipeline = self.make({"image": EncodeJpeg,
+                            "depth_image": DepthPngEncoder(mode, 1)})
+      rgb, depth = frames(8)
+      for i in range(8):
+        pipeline.append({"image": rgb[i], "depth_image": depth[i]})
+      pipeline.finish({}, "b.h5f")
+
+      for i, row in enumerate(self.sinks[0].rows):
+        # depth is lossless, byte for byte
+        decoded = DecodeDepthPng(row["depth_image"])
+        self.assertEqual(decoded.dtype, np.uint16)
+        self.assertEqual(decoded.tobytes(), depth[i].tobytes())
+        # jpeg is not, but every frame keeps its place
+        image = np.asarray(Image.open(io.BytesIO(row["image"])))
+        self.assertTrue(np.abs(image.astype(int) - 10 * i).max() <= 2)
+
+  def test_latest_and_keep(self):
+    pipeline = self.make({"image": slow_bytes, "depth_image": slow_bytes},
+                         keep_every=3)
+    self.assertEqual(pipeline.latest(), {"image": None, "depth_image": None})
+    rgb, depth = frames(9)
+    for seq in range(9):
+      if pipeline.keep(seq):
+        pipeline.put("image", rgb[seq])
+        pipeline.append(pipeline.latest())
+    pipeline.finish({}, "c.h5f")
+    rows = self.sinks[0].rows
+    self.assertEqual([row["image"] for row in rows],
+                     [rgb[i].tobytes() for i in [0, 3, 6]])
+    # nothing was received on the depth stream
+    self.assertEqual([row["depth_image"] for row in rows], [b''] * 3)
+    stats = pipeline.stats()
+    self.assertEqual((stats["received"], stats["skipped"]), (9, 6))
+
+  def test_discard(self):
+    pipeline = self.make({"image": slow_bytes})
+    rgb, _ = frames(10)
+    for i in range(5):
+      pipeline.append({"image": rgb[i]})
+    pipeline.discard()
+    self.assertTrue(self.sinks[0].discarded)
+    self.assertEqual(self.sinks[0].closed, None)
+
+    # the next episode starts from an empty sink
+    for i in range(5, 10):
+      pipeline.append({"image": rgb[i]})
+    pipeline.finish({}, "d.h5f")
+    self.assertEqual(len(self.sinks), 2)
+    self.assertEqual([row["image"] for row in self.sinks[1].rows],
+                     [rgb[i].tobytes() for i in range(5, 10)])
+
+  def test_worker_exception(self):
+    def fail_on_frame_3(frame):
+      if frame[0, 0, 0] == 30:
+        raise ValueError('bad frame')
+      return frame.tobytes()
+
+    pipeline = self.make({"image": fail_on_frame_3})
+    rgb, _ = frames(6)
+    for i in range(6):
+      pipeline.append({"image": rgb[i]})
+    with self.assertRaises(RuntimeError) as context:
+      pipeline.finish({}, "e.h5f")
+    self.assertTrue('ValueError: bad frame' in str(context.exception))
+    self.assertTrue(self.sinks[0].discarded)
+    self.assertEqual(len(self.sinks[0].rows), 3)
+
+    # the error does not carry over to the next episode
+    pipeline.append({"image": rgb[0]})
+    pipeline.finish({}, "f.h5f")
+    self.assertEqual(self.sinks[-1].closed, ({}, "f.h5f"))
+    self.assertEqual(len(self.sinks[-1].rows), 1)
+
+if __name__ == '__main__':
+  unittest.main()
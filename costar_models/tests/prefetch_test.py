@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+import multiprocessing
+import time
+import unittest
+
+from costar_models.datasets import PrefetchGenerator
+from costar_models.datasets.image import ConvertImageListToNumpy
+from costar_models.datasets.image import GetJpeg
+
+import numpy as np
+
+SEED = 1234
+
+def sample_batch():
+  features = [np.random.randint(0, 255, (4, 8, 8, 3)).astype(np.uint8),
+              np.random.randn(4, 6)]
+  targets = [np.random.randint(0, 10, (4,))]
+  return features, targets
+
+def unprefetched(num_batches):
+  '''
+  The batches PrefetchGenerator should produce, built one after another in
+  this process.
+  '''
+  batches = []
+  for k in range(num_batches):
+    np.random.seed([SEED, k])
+    batches.append(sample_batch())
+  return batches
+
+def first_draw(k):
+  np.random.seed([SEED, k])
+  return np.random.rand()
+
+def fail_on_third_batch():
+  # batch k is built right after seeding with (SEED, k)
+  if np.random.rand() == FAIL_DRAW:
+    raise ValueError('bad file')
+  return sample_batch()
+
+FAIL_DRAW = first_draw(2)
+
+JPEGS = [GetJpeg(np.random.RandomState(i).randint(0, 255, (24, 32, 3)))
+         for i in range(10)]
+
+def jpeg_batch():
+  # decoded on the thread pool, which the first batch creates in this process
+  images = ConvertImageListToNumpy([JPEGS[i] for i in
+                                    np.random.randint(0, len(JPEGS), 6)],
+                                   num_threads=4)
+  return [images], [np.random.randn(6)]
+
+# batches built so far, by any process
+BUILT = multiprocessing.Value('i', 0)
+
+def counted_batch():
+  with BUILT.get_lock():
+    BUILT.value += 1
+  return sample_batch()
+
+class TestPrefetchGenerator(unittest.TestCase):
+
+  def assertBatchesEqual(self, expected, actual):
+    self.assertEqual(len(expected), len(actual))
+    for (ef, et), (af, at) in zip(expected, actual):
+      self.assertEqual(len(ef), len(af))
+      self.assertEqual(len(et), len(at))
+      for e, a in zip(ef + et, af + at):
+        self.assertEqual(e.dtype, a.dtype)
+        np.testing.assert_array_equal(e, a)
+
+  def take(self, generator, num_batches):
+    try:
+      return [next(generator) for _ in range(num_batches)]
+    finally:
+      generator.close()
+
+  def test_matches_unprefetched(self):
+    expected = unprefetched(10)
+    for num_workers in [1, 3]:
+      generator = PrefetchGenerator(sample_batch, num_workers=num_workers,
+                                    prefetch=2, seed=SEED)
+      self.assertBatchesEqual(expected, self.take(generator, 10))
+      self.assertEqual(generator.stats()["batches"], 10)
+      self.assertEqual(generator.stats()["spilled"], 0)
+
+  def test_deterministic(self):
+    first = self.take(PrefetchGenerator(sample_batch, num_workers=2,
+                                        seed=SEED), 6)
+    second = self.take(PrefetchGenerator(sample_batch, num_workers=4,
+                                         seed=SEED), 6)
+    self.assertBatchesEqual(first, second)
+
+  def test_spill_to_pickle(self):
+    # slots too small for a batch: everything goes through pickle instead
+    generator = PrefetchGenerator(sample_batch, num_workers=2, seed=SEED,
+                                  slot_bytes=64)
+    self.assertBatchesEqual(unprefetched(5), self.take(generator, 5))
+    self.assertEqual(generator.stats()["spilled"], 5)
+
+  def test_spill_is_bounded(self):
+    # pickled batches hold on to their slot until they are taken, so the
+    # worker can not run ahead by more than its slots
+    BUILT.value = 0
+    generator = PrefetchGenerator(counted_batch, num_workers=1, prefetch=2,
+                                  seed=SEED, slot_bytes=64)
+    try:
+      next(generator)
+      time.sleep(1.)
+      self.assertEqual(BUILT.value, 3)
+      self.assertBatchesEqual(unprefetched(4)[1:],
+                              [next(generator) for _ in range(3)])
+    finally:
+      generator.close()
+
+  def test_decode_jpegs(self):
+    expected = []
+    for k in range(6):
+      np.random.seed([SEED, k])
+      expected.append(jpeg_batch())
+    generator = PrefetchGenerator(jpeg_batch, num_workers=2, prefetch=2,
+                                  seed=SEED)
+    self.assertBatchesEqual(expected, self.take(generator, 6))
+
+  def test_worker_exception(self):
+    generator = PrefetchGenerator(fail_on_third_batch, num_workers=2,
+                                  seed=SEED)
+    try:
+      next(generator)
+      next(generator)
+      with self.assertRaises(RuntimeError) as context:
+        next(generator)
+      self.assertTrue('ValueError: bad file' in str(context.exception))
+    finally:
+      generator.close()
+
+if __name__ == '__main__':
+  unittest.main()
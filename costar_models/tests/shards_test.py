@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import h5py as h5f
+import numpy as np
+from six import StringIO
+
+from costar_models.datasets.image import GetJpeg
+from costar_models.datasets.shards import ConvertToShards, ShardFilename
+from costar_models.datasets.shards import ShardGeneratorDataset
+
+LENGTHS = [4, 7, 1, 6, 3, 9, 5, 2]
+
+def make_episode(length, constant=False):
+  images = np.random.randint(0, 255, (length, 8, 8, 3)).astype(np.uint8)
+  if constant:
+    # jpegs that all have the same length
+    images[:] = images[0]
+  return {"image": np.array([GetJpeg(img) for img in images]),
+          "pose": np.random.randn(length, 7),
+          "label": np.random.randint(0, 10, (length,)),
+          "image_type": "jpeg"}
+
+class TestShards(unittest.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.dir = tempfile.mkdtemp()
+    self.episodes = {}
+    for i, length in enumerate(LENGTHS):
+      name = "example%06d.%s.h5f" % (i, "success" if i % 3 else "failure")
+      example = make_episode(length, constant=(i == 3))
+      with h5f.File(os.path.join(self.dir, name), 'w') as f:
+        for key, value in example.items():
+          f.create_dataset(key, data=value)
+      self.episodes[name] = example
+    self.shards = os.path.join(self.dir, "shards")
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_round_trip(self):
+    # small shards, so that episodes are spread over several of them
+    num = ConvertToShards(os.path.join(self.dir, "*.h5f"), self.shards,
+                          shard_rows=10, chunk_rows=4)
+    self.assertEqual(num, len(LENGTHS))
+    self.assertTrue(len(glob.glob(os.path.join(self.shards, "*.h5"))) > 2)
+
+    dataset = ShardGeneratorDataset(self.shards, split=0.25)
+    sample = dataset.load()
+    self.assertEqual(sorted(sample.keys()), ["image", "label", "pose"])
+    names = dataset.train + dataset.test
+    self.assertEqual(sorted(names), sorted(self.episodes.keys()))
+    self.assertEqual(len(set(dataset.train) & set(dataset.test)), 0)
+
+    for name in names:
+      expected = self.episodes[name]
+      with dataset._load(name) as episode:
+        self.assertEqual(sorted(episode.keys()), ["image", "label", "pose"])
+        for key in episode.keys():
+          self.assertEqual(len(episode[key]), len(expected[key]))
+          np.testing.assert_array_equal(episode[key], expected[key])
+          self.assertEqual(episode[key].dtype, expected[key].dtype)
+
+  def test_shard_boundaries(self):
+    ConvertToShards(os.path.join(self.dir, "*.h5f"), self.shards,
+                    shard_rows=10, chunk_rows=4)
+    dataset = ShardGeneratorDataset(self.shards)
+    dataset.load()
+
+    # the episodes of every shard cover its rows exactly once, in order
+    for shard in np.unique(dataset.shards):
+      mine = dataset.shards == shard
+      starts = np.sort(dataset.starts[mine])
+      lengths = dataset.lengths[mine][np.argsort(dataset.starts[mine])]
+      ends = starts + lengths
+      self.assertEqual(starts[0], 0)
+      np.testing.assert_array_equal(starts[1:], ends[:-1])
+      with h5f.File(os.path.join(self.shards, ShardFilename(shard)),
+                    'r') as f:
+        for key in f.keys():
+          self.assertEqual(len(f[key]), ends[-1])
+    self.assertEqual(np.sum(dataset.lengths), np.sum(LENGTHS))
+
+  def test_success_only(self):
+    ConvertToShards(os.path.join(self.dir, "*.h5f"), self.shards,
+                    shard_rows=10)
+    dataset = ShardGeneratorDataset(self.shards)
+    dataset.load(success_only=True)
+    expected = [name for name in self.episodes if "success" in name]
+    self.assertEqual(sorted(dataset.train + dataset.test), sorted(expected))
+
+  def test_malformed_key(self):
+    name = sorted(self.episodes.keys())[0]
+    with h5f.File(os.path.join(self.dir, name), 'a') as f:
+      f.create_dataset("gripper", data=np.zeros(LENGTHS[0] + 1))
+      f.create_dataset("type_image", data=["jpeg"])
+    stdout = sys.stdout
+    sys.stdout = output = StringIO()
+    try:
+      ConvertToShards(os.path.join(self.dir, "*.h5f"), self.shards)
+    finally:
+      sys.stdout = stdout
+    # the extra key is dropped, but not silently
+    self.assertTrue("dropping gripper from %s" % name in output.getvalue())
+    self.assertFalse("type_image" in output.getvalue())
+    dataset = ShardGeneratorDataset(self.shards)
+    self.assertEqual(sorted(dataset.load().keys()), ["image", "label", "pose"])
+
+if __name__ == '__main__':
+  unittest.main()
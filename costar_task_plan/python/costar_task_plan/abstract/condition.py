@@ -12,6 +12,11 @@ violated. Each is associated with a weight.
 
 class AbstractCondition(object):
 
+  # Fields of the actor's state that this condition depends on, e.g. ("x",
+  # "y"). When used as a predicate, it is only re-evaluated when one of these
+  # changes. Leave as None if it depends on anything else.
+  inputs = None
+
   def __init__(self):
     self.idx = 0
 
@@ -21,6 +26,14 @@ class AbstractCondition(object):
   def __call__(self, world, state, actor=None, prev_state=None):
     return self._check(world, state, actor, prev_state)
 
+  def batch(self, world, actors):
+    '''
+    Evaluate for several actors at once, using each one's current and last
+    state. Override this with a vectorized version where possible.
+    '''
+    return [self(world, actor.state, actor, actor.last_state)
+            for actor in actors]
+
   def _check(self, world, state, actor=None, prev_state=None):
     raise Exception('condition.check() not yet implemented!')
 
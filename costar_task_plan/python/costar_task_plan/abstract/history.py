@@ -0,0 +1,78 @@
+
+class History(object):
+  '''
+  Stand-in for the deque that worlds use to store their recent history, with
+  one difference: copying it is O(1). Entries are kept in a linked list of
+  immutable cells, so a copy just shares the cells with the original, and new
+  entries appended to either one never affect the other.
+
+  Supports the subset of the deque interface worlds use: len(), indexing,
+  iteration, append(), popleft() and clear().
+  '''
+
+  def __init__(self, items=[]):
+    self.clear()
+    for item in items:
+      self.append(item)
+
+  def clear(self):
+    # most recent cell; each cell is (item, previous cell)
+    self._head = None
+    # number of entries that are visible
+    self._len = 0
+    # number of cells reachable from the head, visible or not
+    self._depth = 0
+
+  def copy(self):
+    history = History.__new__(History)
+    history._head = self._head
+    history._len = self._len
+    history._depth = self._depth
+    return history
+
+  __copy__ = copy
+
+  def __len__(self):
+    return self._len
+
+  def append(self, item):
+    self._head = (item, self._head)
+    self._len += 1
+    self._depth += 1
+    # Entries dropped by popleft() are still referenced by the cells. Every
+    # so often, rebuild the list so that we do not hold on to them forever.
+    if self._depth > 2 * max(self._len, 8):
+      self._compact()
+
+  def popleft(self):
+    if self._len == 0:
+      raise IndexError('pop from an empty history')
+    item = self[0]
+    self._len -= 1
+    return item
+
+  def __getitem__(self, idx):
+    if idx < 0:
+      idx += self._len
+    if idx < 0 or idx >= self._len:
+      raise IndexError('history index out of range')
+    cell = self._head
+    for _ in xrange(self._len - 1 - idx):
+      cell = cell[1]
+    return cell[0]
+
+  def __iter__(self):
+    items = [None] * self._len
+    cell = self._head
+    for i in xrange(self._len - 1, -1, -1):
+      items[i] = cell[0]
+      cell = cell[1]
+    return iter(items)
+
+  def _compact(self):
+    items = list(self)
+    self.clear()
+    for item in items:
+      self._head = (item, self._head)
+    self._len = len(items)
+    self._depth = len(items)
@@ -0,0 +1,157 @@
+import timeit
+
+import numpy as np
+
+'''
+Evaluation of predicates and conditions.
+
+After every tick, each predicate is computed for each actor, and then each
+condition is checked for the learner. For large worlds and trees this adds up,
+so the engine here:
+  - lets predicates declare which fields of the actor's state they depend on
+    (their "inputs"); if none of these changed since the previous state, the
+    previous value is reused instead of calling the check again;
+  - calls the check once for all actors that still need it, so that checks
+    can be vectorized across actors by overriding batch();
+  - keeps timing counters for every predicate and condition, see stats().
+
+Predicates that depend on anything other than the actor's own state (other
+actors, world time...) should leave inputs as None; they are always checked.
+'''
+
+
+class PredicateStats(object):
+  '''
+  Counters for one predicate or condition.
+  '''
+
+  def __init__(self):
+    self.calls = 0
+    self.evaluated = 0
+    self.cached = 0
+    self.time = 0.
+
+  def summary(self):
+    return {"calls": self.calls,
+            "evaluated": self.evaluated,
+            "cached": self.cached,
+            "time": self.time}
+
+
+class PredicateEngine(object):
+  '''
+  Evaluates the predicates and conditions of a world. Forked worlds share the
+  engine of the world they came from, so its counters cover a whole search.
+  '''
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    self.predicate_stats = {}
+    self.condition_stats = {}
+
+  def predicates(self, world, updated=None):
+    '''
+    Compute the predicates of every actor in the world.
+
+    Parameters:
+    -----------
+    world: the world; predicates are read from world.predicates
+    updated: for each actor, whether it was updated this tick. Actors that
+             were not still have the state their predicates were computed
+             for, so those can be reused.
+
+    Returns a list with the list of predicate values of each actor.
+    '''
+    actors = world.actors
+    num_predicates = len(world.predicates)
+    if updated is None:
+      updated = [True] * len(actors)
+
+    # the state we can take cached values from, for each actor
+    cached = []
+    for actor, was_updated in zip(actors, updated):
+      prev = actor.last_state if was_updated else actor.state
+      if prev is not None and len(prev.predicates) != num_predicates:
+        prev = None
+      cached.append(prev)
+
+    values = [[None] * num_predicates for _ in actors]
+    for i, (name, check) in enumerate(world.predicates):
+      start = timeit.default_timer()
+      inputs = getattr(check, "inputs", None)
+      todo = []
+      for j, actor in enumerate(actors):
+        prev = cached[j]
+        if inputs is not None and prev is not None and \
+            _unchanged(actor.state, prev, inputs):
+          values[j][i] = prev.predicates[i]
+        else:
+          todo.append(j)
+      if len(todo) > 0:
+        results = check.batch(world, [actors[j] for j in todo])
+        for j, result in zip(todo, results):
+          values[j][i] = result
+
+      stats = self._stats(self.predicate_stats, name)
+      stats.calls += 1
+      stats.evaluated += len(todo)
+      stats.cached += len(actors) - len(todo)
+      stats.time += timeit.default_timer() - start
+
+    return values
+
+  def conditions(self, world):
+    '''
+    Check each of the world's conditions for the learner. Returns a list of
+    booleans in the same order as world.conditions.
+    '''
+    actor = world.actors[0]
+    state = actor.state
+    prev_state = actor.last_state
+    results = []
+    for (condition, weight, name) in world.conditions:
+      start = timeit.default_timer()
+      results.append(condition(world, state, actor, prev_state))
+      stats = self._stats(self.condition_stats, name)
+      stats.calls += 1
+      stats.evaluated += 1
+      stats.time += timeit.default_timer() - start
+    return results
+
+  def stats(self):
+    '''
+    Timing counters for every predicate and condition: how often each was
+    called, for how many actors it was evaluated or reused, and the total
+    time spent on it in seconds.
+    '''
+    return {"predicates": dict((name, s.summary())
+                               for name, s in self.predicate_stats.items()),
+            "conditions": dict((name, s.summary())
+                               for name, s in self.condition_stats.items())}
+
+  def _stats(self, table, name):
+    stats = table.get(name, None)
+    if stats is None:
+      stats = table[name] = PredicateStats()
+    return stats
+
+
+def _unchanged(state, prev, inputs):
+  '''
+  True if none of the given fields differ between two states.
+  '''
+  if state is prev:
+    return True
+  for field in inputs:
+    a = getattr(state, field)
+    b = getattr(prev, field)
+    if a is b:
+      continue
+    elif isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+      if not np.array_equal(a, b):
+        return False
+    elif a != b:
+      return False
+  return True
@@ -12,6 +12,8 @@ class TimeCondition(AbstractCondition):
     '''
     TimeCondition: true until some amount of time has elapsed.
     '''
+    inputs = ("t",)
+
     def __init__(self,time):
         super(TimeCondition,self).__init__()
         self.time = time
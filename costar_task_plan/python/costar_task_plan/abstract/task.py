@@ -7,7 +7,10 @@ from __future__ import print_function
 from option import AbstractOption, NullOption
 from world import AbstractWorld
 
+import collections
 import copy
+import inspect
+import operator
 import numpy as np
 
 ROOT_NAME = "ROOT"
@@ -49,9 +52,10 @@ class Task(object):
         self.subtask_parents = subtask_parents
 
         self.compiled = False
-        self.nodes = {}
+        self.nodes = OptionDict()
         self.children = {}
         self.weights = {}
+        self._resetGraph()
 
         # Dictionary from the action string names to the
         # unique integer id (label) of each action
@@ -85,6 +89,11 @@ class Task(object):
           def check_blocks(block1, block2, **kwargs):
             ...
 
+        Checks are run while the possible arg sets are being generated, as
+        soon as all of their named arguments have a value, so that invalid
+        combinations are never expanded. Checks that take **kwargs, or no
+        named arguments, are run on complete arg sets with every argument.
+
         Parameters:
         -----------
         check: functor to add before adding any particular branch/node to the
@@ -115,22 +124,15 @@ class Task(object):
             if parent in self.option_templates:
                 self.option_templates[parent].connect(child, frequency)
 
-        for iname, option in task.nodes.items():
+        # copy the nodes without creating options that have not been needed
+        # yet, then add the connections between them
+        for iname in task._node_names:
             name = task.generic_names[iname]
-            if iname in self.nodes:
-                if name not in inodes:
-                    inodes[name] = []
-                if iname not in inodes[name]:
-                    inodes[name].append(iname)
-                for child in task.children[iname]:
-                    self.children[iname].add(child)
-                for wt in task.weights[iname]:
-                    self.weights[iname].append(wt)
-            else:
-                inodes[name] = [iname]
-                self.nodes[iname] = option
-                self.children[iname] = task.children[iname]
-                self.weights[iname] = task.weights[iname]
+            self._addInstantiatedNode(name, iname, task.nodes.raw(iname),
+                                      inodes)
+        for iname in task._node_names:
+            for child, wt in zip(task.children[iname], task.weights[iname]):
+                self._connect(iname, child, wt)
 
         return inodes
 
@@ -172,6 +174,24 @@ class Task(object):
         else:
             return [], []
 
+    def nodeId(self, node):
+        '''
+        Integer id of a node in the compiled graph. Ids number the nodes in
+        the order they were created, and index the child arrays below.
+        '''
+        return self._node_ids[node]
+
+    def nodeName(self, node_id):
+        return self._node_names[node_id]
+
+    def getChildIds(self, node_id):
+        '''
+        Children of a node as arrays of integer ids and weights. These are
+        views into the compiled graph and should not be modified.
+        '''
+        start, end = self.child_indptr[node_id], self.child_indptr[node_id + 1]
+        return self.child_ids[start:end], self.child_weights[start:end]
+
     def getOption(self, node):
         if node in self.nodes:
             return self.nodes[node]
@@ -186,6 +206,13 @@ class Task(object):
          - loop over all options
          - for each option: loop over all args
          - create option with those args
+
+        Options are only created the first time they are looked up in
+        self.nodes. The graph itself is stored with integer node ids: the
+        children of node i are child_ids[child_indptr[i]:child_indptr[i+1]],
+        with matching child_weights.
+
+        Returns the list of valid arg sets.
         '''
 
         assert not self.compiled
@@ -193,15 +220,41 @@ class Task(object):
         if isinstance(arg_dict, AbstractWorld):
             arg_dict = arg_dict.getObjects()
 
-        # Make list of args
-        arg_sets = get_arg_sets(arg_dict)
-
         # First: connect templates (parent -> child)
         for parent, child, frequency in self.template_connections:
             if parent in self.option_templates:
                 self.option_templates[parent].connect(child, frequency)
 
-        # Possible assignments to arguments. Add children here, not outside.
+        # Possible assignments to arguments. Invalid assignments are pruned by
+        # the checks while they are being generated.
+        arg_sets = list(iter_arg_sets(arg_dict, self.option_checks))
+
+        subtasks = [template for template in self.option_templates.values()
+                    if template.task is not None]
+        if len(subtasks) > 0:
+            self._compileScoped(arg_sets)
+        else:
+            self._compileFlat(arg_dict, arg_sets)
+
+        self._finalizeGraph()
+
+        if self.subtask_name == None:
+            for i, (node, children) in enumerate(self.children.items()):
+                self.indices[node] = i
+                self.names[i] = node
+
+        self.compiled = True
+        return arg_sets
+
+    def _compileScoped(self, arg_sets):
+        '''
+        Create and connect nodes one arg set at a time. Subtasks can create any
+        number of nodes for an arg set, so tasks that have them need this.
+        '''
+        missing = set()
+        # node names created by each template, by the values of the args the
+        # template actually uses
+        filled = {}
         for arg_set in arg_sets:
             # List of instantiated options and subtasks, used for connecting children
             # to parents.
@@ -211,26 +264,17 @@ class Task(object):
             # structures.
             inodes = {}
 
-            ok = True
-            for check in self.option_checks:
-                if not check(**arg_set):
-                    ok = False
-                    break
-            if not ok:
-                print("Skipping invalid args:", arg_set)
-                continue
-
             # create the nodes
             for name, template in self.option_templates.items():
-                iname, option = template.instantiate(name, arg_set)
-                if option is None:
-                    continue
-                elif isinstance(option, Task):
+                if template.task is not None:
                     # this was a subtask, and must be merged into the full version of
                     # the task model.
+                    iname, option = template.instantiate(name, arg_set)
                     inodes = self.mergeTask(option, name, inodes)
-                else:
-                    self._addInstantiatedNode(name, iname, option, inodes)
+                    continue
+                iname, option = self._instantiateLazy(
+                    name, template, arg_set, filled.setdefault(name, {}))
+                self._addInstantiatedNode(name, iname, option, inodes)
 
             # Connect nodes and their children, plus update the list of weights
             # associated with each parent-child pair.
@@ -243,12 +287,12 @@ class Task(object):
                     # This activity was never created -- we have no examples of
                     # this action or of the necessary objects to create this
                     # action in the real world.
-                    print ("Skipping missing option:", name)
+                    if name not in missing:
+                        print ("Skipping missing option:", name)
+                        missing.add(name)
                     continue
                 for iname in inodes[name]:
                     self.generic_names[iname] = name
-                    if iname not in self.weights:
-                        self.weights[iname] = []
                     # loop over all templated (abstract) actions
                     for child, frequency in zip(template.children, template.frequencies):
                         # If this child is in the set of instantiated nodes...
@@ -259,26 +303,121 @@ class Task(object):
                             for ichild in inodes[child]:
                                 # For every instantiated child in this high-level option set,
                                 # add it to the children of this node. Then update weights.
-                                self.children[iname].add(ichild)
-                                self.weights[iname].append(
-                                    float(frequency) / num_ichildren)
-                    #self.weights[iname] = (np.array(self.weights[iname]) / 
-                    #                       np.sum(self.weights[iname]))
+                                self._connect(iname, ichild,
+                                              float(frequency) / num_ichildren)
 
-        if self.subtask_name == None:
-                # WARNING: this is kind of terrible and might be sort of inefficient.
-                # Convert to a list
-            for i, (node, children) in enumerate(self.children.items()):
-                children = [child for child in children]
-                self.children[node] = children
-                self.indices[node] = i
-                self.names[i] = node
 
-        self.compiled = True
-        return arg_sets
+    def _compileFlat(self, arg_dict, arg_sets):
+        '''
+        Without subtasks, every template creates exactly one node per arg set,
+        and connects it to the nodes its child templates create for the same
+        arg set. So instead of looping over all templates for every arg set,
+        work out for each template which node it creates for each arg set,
+        then find the distinct parent-child pairs with numpy.
+
+        Nodes and children end up in the same order as when going through the
+        arg sets one at a time.
+        '''
+        num_sets = len(arg_sets)
+        templates = self.option_templates.items()
+
+        # For each template: which of its distinct nodes each arg set creates,
+        # and the first arg set that creates each of them.
+        which = []
+        created = []
+        for pos, (name, template) in enumerate(templates):
+            distinct = {}
+            first = []
+            idx = np.zeros(num_sets, dtype=np.int64)
+            try:
+                for i, key in enumerate(template.keys(arg_dict, arg_sets)):
+                    j = distinct.get(key, None)
+                    if j is None:
+                        j = distinct[key] = len(first)
+                        first.append(i)
+                    idx[i] = j
+            except TypeError:
+                # unhashable argument values: name every arg set separately
+                first = range(num_sets)
+                idx = np.arange(num_sets, dtype=np.int64)
+            which.append(idx)
+            for j, i in enumerate(first):
+                iname, filled_args = template.fill(name, arg_sets[i])
+                created.append((i, pos, j, iname, filled_args))
+
+        # create the nodes in the order they first show up
+        created.sort(key=lambda c: (c[0], c[1]))
+        lookup = [np.zeros(int(np.max(idx)) + 1 if num_sets > 0 else 0,
+                           dtype=np.int64) for idx in which]
+        for i, pos, j, iname, filled_args in created:
+            name, template = templates[pos]
+            if iname not in self._node_ids:
+                self._addInstantiatedNode(name, iname,
+                                          LazyOption(template, filled_args),
+                                          {})
+                self.generic_names[iname] = name
+            lookup[pos][j] = self._node_ids[iname]
+        ids = dict((name, lookup[pos][which[pos]])
+                   for pos, (name, template) in enumerate(templates))
+
+        # Connect nodes and their children: every distinct (parent, child)
+        # pair, ordered by the first arg set that connects them.
+        num_nodes = len(self._node_names)
+        edges = []
+        for name, template in templates:
+            for cpos, (child, frequency) in enumerate(
+                    zip(template.children, template.frequencies)):
+                if child not in ids:
+                    continue
+                pairs = ids[name] * num_nodes + ids[child]
+                pairs, first = np.unique(pairs, return_index=True)
+                for pair, i in zip(pairs, first):
+                    parent, ichild = divmod(int(pair), num_nodes)
+                    edges.append((i, cpos, parent, ichild, float(frequency)))
+        edges.sort()
+        for i, cpos, parent, child, weight in edges:
+            self._connect(self._node_names[parent],
+                          self._node_names[child],
+                          weight)
+
+    def _instantiateLazy(self, name, template, arg_set, cache):
+        '''
+        Get the name of the node a template creates for an arg set, plus a
+        LazyOption if the node does not exist yet. Most templates only use a
+        few of the arguments, so names are cached by the values of those.
+        '''
+        try:
+            key = template.key(arg_set)
+            iname = cache.get(key, None)
+        except TypeError:
+            # unhashable argument values
+            key, iname = None, None
+        if iname is not None and iname in self._node_ids:
+            return iname, None
+
+        iname, filled_args = template.fill(name, arg_set)
+        if key is not None:
+            cache[key] = iname
+        if iname in self._node_ids:
+            return iname, None
+        return iname, LazyOption(template, filled_args)
+
+    def _resetGraph(self):
+        # name <-> integer id of each instantiated node
+        self._node_ids = {}
+        self._node_names = []
+        # children and weights of each node (by id) while compiling; each
+        # parent-child pair is only connected once
+        self._child_lists = []
+        self._weight_lists = []
+        self._edges = set()
+        # compressed (CSR) version, built at the end of compile()
+        self.child_indptr = np.zeros(1, dtype=np.int64)
+        self.child_ids = np.zeros(0, dtype=np.int64)
+        self.child_weights = np.zeros(0)
 
     def _addInstantiatedNode(self, name, iname, option, inodes):
-        if iname in self.nodes:  # and iname is ROOT_TAG:
+        if iname in self._node_ids:
             if name not in inodes:
                 inodes[name] = []
             if iname not in inodes[name]:
@@ -288,18 +427,51 @@ class Task(object):
                 inodes[name].append(iname)
             else:
                 inodes[name] = [iname]
+            self._node_ids[iname] = len(self._node_names)
+            self._node_names.append(iname)
+            self._child_lists.append([])
+            self._weight_lists.append([])
             self.nodes[iname] = option
-            self.children[iname] = set()
-            self.weights[iname] = []
+
+    def _connect(self, iname, ichild, weight):
+        parent = self._node_ids[iname]
+        child = self._node_ids[ichild]
+        if (parent, child) not in self._edges:
+            self._edges.add((parent, child))
+            self._child_lists[parent].append(child)
+            self._weight_lists[parent].append(weight)
+
+    def _finalizeGraph(self):
+        '''
+        Pack the children of every node into flat arrays, and fill in the
+        dictionaries from node names to lists of children and weights.
+        '''
+        counts = [len(children) for children in self._child_lists]
+        self.child_indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        self.child_indptr[1:] = np.cumsum(counts)
+        self.child_ids = np.array([c for children in self._child_lists
+                                   for c in children], dtype=np.int64)
+        self.child_weights = np.array([w for weights in self._weight_lists
+                                       for w in weights], dtype=float)
+
+        names = self._node_names
+        for i, iname in enumerate(names):
+            self.children[iname] = [names[c] for c in self._child_lists[i]]
+            self.weights[iname] = self._weight_lists[i]
+
+        self._child_lists = []
+        self._weight_lists = []
+        self._edges = set()
 
     def clear(self):
-        self.nodes = {}
+        self.nodes = OptionDict()
         self.children = {}
         self.weights = {}
         self.indices = {}
         self.names = {}
         self.compiled = False
         self.generic_names = {}
+        self._resetGraph()
 
     def makeTree(self, world, max_depth=10):
         '''
@@ -340,7 +512,7 @@ class Task(object):
             raise RuntimeError(
                 'Cannot print nodes from Task before compile() has been called!')
         summary = ''
-        for name, node in self.nodes.items():
+        for name in self.nodes:
             summary += "%s --> %s\n" % (name, str(self.children[name]))
         return summary
 
@@ -400,6 +572,23 @@ class OptionTemplate(object):
         arg_dict: set of options that can fill out the parameters of the action
         '''
 
+        iname, filled_args = self.fill(name, arg_dict)
+        if self.task is None:
+            option = self.create(filled_args)
+        else:
+            option = Task(subtask_name=self.task.name)
+            for args in self.task.options:
+                option.add(*args)
+            option.compile(arg_dict)
+
+        return iname, option
+
+    def fill(self, name, arg_dict):
+        '''
+        Work out the name of the instantiated node and the arguments for its
+        constructor, without creating anything yet.
+        '''
+
         filled_args = {}
         name_args = {}
 
@@ -431,25 +620,41 @@ class OptionTemplate(object):
 
         if self.task is None:
             iname = self.name_template % (name, make_str(name_args))
-            #try:
-            option = self.constructor(**filled_args)
-            for pc in self.postconditions:
-                option.addPostCondition(pc)
-            #except Exception as e:
-            #    print("Warning: failed to create option %s (instance of %s)" % (iname, name))
-            #    print("args =", arg_dict)
-            #    print("name_args =", name_args)
-            #    print(e)
-            #    option = None
         else:
-            option = Task(subtask_name=self.task.name)
-            for args in self.task.options:
-                option.add(*args)
-            option.compile(arg_dict)
             iname = self.name_template % (name,
                                           make_str(filled_args))
 
-        return iname, option
+        return iname, filled_args
+
+    def keys(self, arg_dict, arg_sets):
+        '''
+        Compute key() for a whole list of arg sets that all assign the
+        arguments in arg_dict.
+        '''
+        args = [arg for arg in self.args if arg in arg_dict] + \
+            list(self.semantic_args)
+        if len(args) == 0:
+            return [()] * len(arg_sets)
+        # keys only need to tell arg sets apart, so any consistent
+        # function of the argument values will do
+        return map(operator.itemgetter(*args), arg_sets)
+
+    def key(self, arg_dict):
+        '''
+        Values of the arguments this template uses; two arg sets with the
+        same key instantiate the same node.
+        '''
+        return tuple([arg_dict.get(arg, None) for arg in self.args] +
+                     [arg_dict[arg] for arg in self.semantic_args])
+
+    def create(self, filled_args):
+        '''
+        Create the option from the arguments computed by fill().
+        '''
+        option = self.constructor(**filled_args)
+        for pc in self.postconditions:
+            option.addPostCondition(pc)
+        return option
 
     def connect(self, child, count=0):
         '''
@@ -472,6 +677,68 @@ class NullOptionTemplate(OptionTemplate):
             args={})
 
 
+class LazyOption(object):
+    '''
+    Internal class: everything needed to create an option the first time it is
+    actually used.
+    '''
+
+    __slots__ = ["template", "filled_args"]
+
+    def __init__(self, template, filled_args):
+        self.template = template
+        self.filled_args = filled_args
+
+    def create(self):
+        return self.template.create(self.filled_args)
+
+
+class OptionDict(collections.MutableMapping):
+    '''
+    Dictionary from node names to options. Options are stored as LazyOptions
+    until they are first looked up, so compiling a large task graph does not
+    create thousands of options that a search might never use. Every way of
+    reading an entry creates its option; only raw() returns a LazyOption.
+    '''
+
+    def __init__(self):
+        self._options = {}
+
+    def __getitem__(self, key):
+        option = self._options[key]
+        if isinstance(option, LazyOption):
+            option = option.create()
+            self._options[key] = option
+        return option
+
+    def __setitem__(self, key, option):
+        self._options[key] = option
+
+    def __delitem__(self, key):
+        del self._options[key]
+
+    def __contains__(self, key):
+        return key in self._options
+
+    def __iter__(self):
+        return iter(self._options)
+
+    def __len__(self):
+        return len(self._options)
+
+    def raw(self, key):
+        '''
+        Get the entry for a node without creating its option.
+        '''
+        return self._options[key]
+
+    def copy(self):
+        '''
+        A plain dict of every node and its option.
+        '''
+        return dict(self.items())
+
+
 class TaskNode(object):
     '''
     Internal class that represents branches in our task search.
@@ -482,34 +749,100 @@ class TaskNode(object):
         self.children = children
 
 
-def get_arg_sets(arg_dict):
+def get_arg_sets(arg_dict, checks=[]):
+    '''
+    List every possible assignment of values to the arguments in arg_dict that
+    passes all checks. The first argument changes fastest.
+    '''
+    return list(iter_arg_sets(arg_dict, checks))
 
-    # empty set of arguments
-    arg_sets = [{}]
 
-    # loop over all arguments
-    for arg, vals in arg_dict.items():
-        prev_arg_sets = arg_sets
-        arg_sets = []
+def iter_arg_sets(arg_dict, checks=[]):
+    '''
+    Generate the possible assignments depth first. Each check runs as soon as
+    all of its named arguments are assigned, so whole branches of the product
+    are skipped instead of being created and thrown away.
+    '''
+
+    # loop over all arguments; the last one is the outermost loop
+    args = list(arg_dict.keys())
+    args.reverse()
+    vals = []
+    for arg in args:
+        if isinstance(arg_dict[arg], list):
+            vals.append(arg_dict[arg])
+        else:
+            vals.append([arg_dict[arg]])
+
+    # run each check after the last of its arguments has been assigned
+    level_checks = [[] for _ in args]
+    final_checks = []
+    for check in checks:
+        names = _check_arg_names(check)
+        if names is None or len(names) == 0 or \
+                any([name not in arg_dict for name in names]):
+            # **kwargs checks can read any argument, so they wait for all
+            final_checks.append(check)
+        else:
+            level = max([args.index(name) for name in names])
+            # remember the result for each combination of its arguments
+            level_checks[level].append((check, names, {}))
+
+    arg_set = {}
+
+    def run(check, names, cache):
+        key = tuple(arg_set[name] for name in names)
+        try:
+            return cache[key]
+        except KeyError:
+            ok = check(**dict(zip(names, key)))
+            cache[key] = ok
+            return ok
+        except TypeError:
+            # values cannot be hashed, so just run the check again
+            return check(**dict(zip(names, key)))
+
+    def expand(level):
+        if level == len(args):
+            for check in final_checks:
+                if not check(**arg_set):
+                    return
+            # return the set of populated assignments
+            yield copy.copy(arg_set)
+            return
+        arg = args[level]
+        for val in vals[level]:
+            arg_set[arg] = val
+            ok = True
+            for check, names, cache in level_checks[level]:
+                if not run(check, names, cache):
+                    ok = False
+                    break
+            if ok:
+                for assignment in expand(level + 1):
+                    yield assignment
+        arg_set.pop(arg, None)
+
+    return expand(0)
 
-        if isinstance(vals, list):
-            # loop over possible argument assignments
-            for val in vals:
 
-                # add a version where arg=val
-                for prev_arg_set in prev_arg_sets:
-                    arg_set = copy.copy(prev_arg_set)
-                    arg_set[arg] = val
-                    arg_sets.append(arg_set)
+def _check_arg_names(check):
+    '''
+    Names of the arguments a check function takes, or None if we cannot tell
+    or if it also takes **kwargs.
+    '''
+    try:
+        if inspect.isfunction(check):
+            spec, skip = inspect.getargspec(check), 0
+        elif inspect.ismethod(check):
+            spec, skip = inspect.getargspec(check), 1
         else:
-            val = vals
-            for prev_arg_set in prev_arg_sets:
-                arg_set = copy.copy(prev_arg_set)
-                arg_set[arg] = val
-                arg_sets.append(arg_set)
-
-    # return the set of populated assignments
-    return arg_sets
+            spec, skip = inspect.getargspec(check.__call__), 1
+    except (TypeError, AttributeError):
+        return None
+    if spec.keywords is not None:
+        return None
+    return spec.args[skip:]
 
 
 def make_str(filled_args, subtask=None):
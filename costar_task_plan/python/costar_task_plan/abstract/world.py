@@ -4,6 +4,8 @@ import numpy as np
 from collections import deque
 
 from action import AbstractAction
+from history import History
+from predicates import PredicateEngine
 from state import AbstractState
 
 class AbstractWorld(object):
@@ -24,6 +26,8 @@ class AbstractWorld(object):
     self.reward = reward
     self.verbose = verbose
     self.actors = []
+    # which actors this world may modify in place; see ownActor()
+    self.owned = []
     self.conditions = []
     self.features = None
     self.initial_features = None
@@ -31,6 +35,7 @@ class AbstractWorld(object):
     self.done = False
     self.predicates = []
     self.predicate_idx = {}
+    self.predicate_engine = PredicateEngine()
     self.num_actors = 0
     self.task = None
     self.dt = 0.1
@@ -40,7 +45,7 @@ class AbstractWorld(object):
 
     # history stores features;
     self.history_length = history_length
-    self.history = deque()
+    self.history = History()
 
     # We only update this when we would FORK the world. it helps us make our
     # higher level decisions.
@@ -132,6 +137,8 @@ class AbstractWorld(object):
     actor.setId(actor_id)
     actor.state.updatePredicates(self, actor)
     self.actors.append(actor)
+    del self.owned[actor_id:]
+    self.owned.append(True)
     self.num_actors = len(self.actors)
     return actor_id
 
@@ -171,14 +178,7 @@ class AbstractWorld(object):
     Create a copy of the world and tick() with the appropriate new action. If
     we have policies, actors will be reset appropriately to use new policies.
     '''
-    new_world = copy.copy(self)
-    # NOTE: this is where the inefficiency lies.
-    #new_world.actors = copy.deepcopy(self.actors)
-    new_world.actors = [copy.copy(actor) for actor in self.actors]
-    new_world.updateTraceID()
-
-    # Make sure new world has a separate history with the same few entries
-    new_world.history = copy.copy(self.history)
+    new_world = self.duplicate()
 
     # If the action is not valid, take a zero action and update the world
     # appropriately.
@@ -190,10 +190,55 @@ class AbstractWorld(object):
 
   def duplicate(self):
     '''
+    Copy the world without advancing it. This is copy-on-write: the new world
+    shares its actors and history with this one, and an actor is only copied
+    by whichever world modifies it first. This makes forking cost about as
+    much as the state that actually changes.
     '''
-    new_world = copy.copy(self)
-    new_world.actors = [copy.copy(actor) for actor in self.actors]
+    new_world = _copyObject(self)
+    new_world.actors = list(self.actors)
+    new_world.history = self.history.copy()
+    self.owned = [False] * len(self.actors)
+    new_world.owned = [False] * len(self.actors)
     new_world.updateTraceID()
+    return new_world
+
+  def snapshot(self):
+    '''
+    Save the current state of the world so that it can be brought back later
+    with restore(). Snapshots share everything with the world, so they are
+    cheap to take and to keep around.
+    '''
+    return WorldSnapshot(self)
+
+  def restore(self, snapshot):
+    '''
+    Return the world to a state saved with snapshot().
+    '''
+    self.__dict__.update(snapshot.attrs)
+    self.actors = list(snapshot.actors)
+    self.history = snapshot.history.copy()
+    self.owned = [False] * len(self.actors)
+
+  def ownActor(self, i):
+    '''
+    Get actor i so that it can be modified in place. Actors may be shared with
+    other worlds after duplicate() or snapshot(); call this before changing
+    any of an actor's fields.
+    '''
+    if len(self.owned) < len(self.actors):
+      # actors added without addActor(); assume they are shared
+      self.owned += [False] * (len(self.actors) - len(self.owned))
+    if not self.owned[i]:
+      self.actors[i] = _copyObject(self.actors[i])
+      self.owned[i] = True
+    return self.actors[i]
+
+  def ownActors(self):
+    '''
+    Get a list of all actors, so that they can be modified in place.
+    '''
+    return [self.ownActor(i) for i in xrange(len(self.actors))]
 
   def tick(self, A0):
     '''
@@ -214,29 +259,30 @@ class AbstractWorld(object):
       else:
         actions[i] = actor.evaluate(self)
 
-    # update all actors in a separate loop
-    for actor, action in zip(self.actors, actions):
-      s = actor.update(action, self.dt)
+    # update all actors in a separate loop; actors with no dynamics never
+    # change, so we do not need our own copies of them
+    updated = [False] * len(self.actors)
+    for i, action in enumerate(actions):
+      if self.actors[i].dynamics is not None:
+        s = self.ownActor(i).update(action, self.dt)
+        updated[i] = True
 
     self._update_environment() # run update _update_environment for this environment
 
     S1 = self.actors[0].state
 
-    # set up vectors of predicates properly
-    for actor in self.actors:
-        actor.state.predicates = [0] * len(self.predicates)
-
     # update all actors
-    #self.predicates = [check(world, self, actor, actor.last_state)
-    #for actor in self.actors:
-    #  actor.state.updatePredicates(self, actor)
-    for i, (name, check) in enumerate(self.predicates):
-      for actor in self.actors:
-        actor.state.predicates[i] = check(
-            self,
-            actor.state,
-            actor,
-            actor.last_state)
+    all_predicates = self.predicate_engine.predicates(self, updated)
+    for j, actor in enumerate(self.actors):
+      predicates = all_predicates[j]
+      if not updated[j]:
+        # this actor did not move, so its state may be shared with other
+        # worlds: only copy it if something changed
+        if predicates == actor.state.predicates:
+          continue
+        actor = self.ownActor(j)
+        actor.state = _copyObject(actor.state)
+      actor.state.predicates = predicates
 
     (res, F1, r, rt) = self._process() # get the final set of variables
 
@@ -269,11 +315,9 @@ class AbstractWorld(object):
 
     # determine if we should terminate
     res = True
-    actor = self.actors[0]
-    state = actor.state
-    prev_state = actor.last_state
-    for (condition, weight, name) in self.conditions:
-      if not condition(self, state, actor, prev_state):
+    results = self.predicate_engine.conditions(self)
+    for ok, (condition, weight, name) in zip(results, self.conditions):
+      if not ok:
         if self.verbose:
           print "Constraint violated: %s, score modifier: %f"%(name,weight)
         res = False
@@ -296,6 +340,7 @@ class AbstractWorld(object):
     '''
     self.done = False
     self.ticks = 0
+    self.ownActors()
     self._reset()
     self.updateFeatures()
     self.history.clear()
@@ -359,3 +404,27 @@ class AbstractWorld(object):
       raise NotImplementedError('if your world wants to support adding '
                                 'objects, then you must implement the '
                                 '_createObjectActor function.')
+
+
+class WorldSnapshot(object):
+  '''
+  Saved state of a world; see AbstractWorld.snapshot().
+  '''
+
+  def __init__(self, world):
+    self.attrs = dict(world.__dict__)
+    self.actors = tuple(world.actors)
+    self.history = world.history.copy()
+    # the world no longer has the only reference to its actors
+    world.owned = [False] * len(world.actors)
+
+
+def _copyObject(obj):
+  '''
+  Fast shallow copy of an ordinary object.
+  '''
+  if not hasattr(obj, '__dict__') or hasattr(obj, '__slots__'):
+    return copy.copy(obj)
+  new_obj = obj.__class__.__new__(obj.__class__)
+  new_obj.__dict__.update(obj.__dict__)
+  return new_obj
@@ -8,6 +8,7 @@ See License for more details.
 from __future__ import print_function
 
 import tensorflow as tf
+import collections
 import numpy as np
 import os
 import signal
@@ -95,13 +96,16 @@ class AbstractAgent(object):
         self.verbose = verbose
         self.save = save
         self.load = load
-        self.current_example = {}
+        self._resetCurrentExample()
         self.last_example = None
         self.tfrecord_lambda_dict = None
         self.data_type = data_type
         self.seed = seed
         self.success_only = success_only
         self.random_downsample = random_downsample
+        # rows are dropped while the episode runs, so draw from a separate
+        # generator to leave the global one to the environment
+        self.downsample_random = np.random.RandomState(seed)
         self.collect_trajectories = collect_trajectories
         self.collection_mode = collection_mode
         self.trajectory_length = trajectory_length
@@ -205,12 +209,35 @@ class AbstractAgent(object):
             # tuple, we handle them one way...
             data = world.vectorize(control, features, reward, done, example,
                     action_label)
-            self._updateCurrentExample(data)
+            self._updateCurrentExample(data, world, max_label)
             if done:
                 self._finishCurrentExample(world, example, reward, max_label,
                         seed)
 
-    def _updateCurrentExample(self, data):
+    def _resetCurrentExample(self):
+        '''
+        Start a new example. Time steps are written out as soon as everything
+        they need is known, so current_example only holds the ones that are
+        still waiting: those in the current action (for goal features) and a
+        few more to look ahead.
+        '''
+        self.current_example = {}
+        # type and shape of the values of each key
+        self.current_types = {}
+        # index in the example of the first step in current_example
+        self.current_start = 0
+        # number of steps added to the example
+        self.current_length = 0
+        # next step to write out
+        self.current_next = 0
+        # steps where the label changed, and that were not written out yet
+        self.current_switches = collections.deque()
+        self.current_reward = 0.
+        self.current_prev_label = None
+        # the steps written out so far: an H5fEpisode or an _ExampleBuffer
+        self.current_rows = None
+
+    def _updateCurrentExample(self, data, world=None, max_label=-1):
         '''
         Add to the current trial, so we can compute things over the whole
         experiment.
@@ -219,30 +246,48 @@ class AbstractAgent(object):
         ----------
         data: vectorized list of saveable information: control, features,
               reward, done,  example, and (int) action label.
+        world: the world the data came from; if given, the steps that are
+               complete are written out.
+        max_label: label used as prev_label for the first step.
         '''
         for key,value in data:
-            if not key in self.current_example:
-                self.current_example[key] = [value]
+            if not key in self.current_types:
+                self.current_types[key] = (type(value),
+                                           getattr(value, "shape", None))
+                self.current_example[key] = []
             else:
+                first_type, shape = self.current_types[key]
                 if isinstance(value, np.ndarray):
-                    assert value.shape == self.current_example[key][0].shape
-                if not type(self.current_example[key][0]) == type(value):
-                    print(key, type(self.current_example[key][0]), type(value))
+                    assert value.shape == shape
+                if not first_type == type(value):
+                    print(key, first_type, type(value))
                     raise RuntimeError('Types do not match when' + \
                                        ' constructing data set.')
-                self.current_example[key].append(value)
-
-    def _finishCurrentExample(self, world, example, reward, max_label,
-            seed=None):
+            values = self.current_example[key]
+            if key == "reward":
+                self.current_reward += value
+            elif key == "label" and len(values) > 0 and \
+                    not value == values[-1]:
+                self.current_switches.append(self.current_length)
+            values.append(value)
+        self.current_length += 1
+
+        if world is not None:
+            self._writeCurrentExample(world, max_label, final=False)
+
+    def _writeCurrentExample(self, world, max_label, final):
         '''
-        Preprocess this particular example:
+        Preprocess the steps of this example that are ready, and write them
+        out:
         - split it up into different time windows of various sizes
-        - compute task result
         - compute transition points
         - compute option-level (mid-level) labels
-        '''
-        print("Finishing example no.",example,"with seed =",seed)
 
+        A step is ready when the step after the next one (or the 10th one, for
+        trajectories) has been added, and when the action it belongs to is
+        over if goal features are saved. When final is set, the example is
+        over and all remaining steps are written.
+        '''
         # ============================================================
         # Split into chunks and preprocess the data.
         # This may require setting up window_length, etc.
@@ -261,126 +306,121 @@ class AbstractAgent(object):
         else:
             next_list = []
             goal_list = []
+        lookahead = 10 if self.collect_trajectories else 2
 
-        # -- NOTE: you can add other features here in the future, but for now
-        # we do not need these. Label gets some unique handling.
-        prev_list  = []
-        first_list = []
-        length = len(self.current_example['example'])
-
-        # Create an empty dict to hold all the data from this last trial.
-        data = {}
-        data["prev_label"] = []
-
-        # Compute the points where the data changes from one label to the next
-        # and save these points as "goals".
-        switches = []
-        count = 1
-        label = self.current_example['label']
-        for i in xrange(length):
-            if i+1 == length:
-                switches += [i] * count
-                count = 1
-            elif not label[i+1] == label[i]:
-                switches += [i+1] * count
-                count = 1
-            else:
-                count += 1
-
-        assert(len(switches) == len(self.current_example['example']))
+        if self.current_prev_label is None:
+            self.current_prev_label = max_label
+        if self.current_rows is None:
+            self.current_rows = self._openRows()
 
         # ============================================
-        # Set up total reward
-        total_reward = np.sum(self.current_example["reward"])
-        data["value"] = [total_reward] * len(self.current_example["example"])
+        # Loop over the entries that are ready. For important items, take the
+        # next frame and the goal frame: the first frame of the next action,
+        # or the last frame.
+        length = self.current_length
+        switches = self.current_switches
+        while self.current_next < length:
+            i = self.current_next
+            while len(switches) > 0 and switches[0] <= i:
+                switches.popleft()
+            if not final:
+                if i + lookahead >= length:
+                    break
+                if len(goal_list) > 0 and len(switches) == 0:
+                    # the action is still running, so the goal is unknown
+                    break
+            goal = switches[0] if len(switches) > 0 else length - 1
 
-        if self.collect_trajectories:
-            feature_shapes = {}
-            for f in world.features.description:
-                shape = self.current_example[f][0].shape
-                feature_shapes[f] = (self.trajectory_length,) + shape
+            if self.collect_trajectories and i + 10 >= length:
+                # not enough steps left for a whole trajectory
+                self.current_next = length
+                break
 
-        # ============================================
-        # Loop over all entries. For important items, take the previous frame
-        # and the next frame -- and possibly even the final frame.
-        prev_label = max_label
-        for i in range(length):
             i0 = max(i-1,0)
             i1 = min(i+1,length-1)
-            ifirst = 0
+            # positions in current_example
+            start = self.current_start
+            j, j0, j1, jgoal = i - start, i0 - start, i1 - start, goal - start
 
             if self.collect_trajectories:
                 # collect a trajectory from this point going forward, out to
                 # whatever length trajectories are (determined by command line
                 # options)
-                if i + 10 >= length:
-                    break
-
                 # Take the next N examples and save them as a single entry.
                 # This is how we set up prediction for a sequence of images to
                 # come.
                 features = {}
-                for f, shape in feature_shapes.items():
-                    features[f] = np.zeros(shape)
-                    for j in range(self.trajectory_length):
-                        features[f][j] = self.current_example[f][i+j]
-
+                for f in world.features.description:
+                    values = self.current_example[f]
+                    features[f] = np.zeros(
+                            (self.trajectory_length,) + values[j].shape)
+                    for k in range(self.trajectory_length):
+                        features[f][k] = values[j+k]
+
+            self.current_next = i + 1
+            label = self.current_example["label"]
             # We will always include frames where the label changed. We may or
             # may not include frames where the 
-            if (self.current_example["label"][i0] == self.current_example["label"][i1] 
-                    and not i0 == 0 
-                    and not i1 == length - 1 
-                    and self.random_downsample 
-                    and not np.random.randint(2) == 0):
+            if (label[j0] == label[j1]
+                    and not i0 == 0
+                    and not i1 == length - 1
+                    and self.random_downsample
+                    and not self.downsample_random.randint(2) == 0):
                         continue
 
             # ==========================================
             # Finally, add the example to the dataset
+            row = {}
             for key, values in self.current_example.items():
-                if not key in data:
-                    data[key] = []
-                    if key in next_list:
-                        data["next_%s"%key] = []
-                    if key in prev_list:
-                        data["prev_%s"%key] = []
-                    if key in first_list:
-                        data["first_%s"%key] = []
-                    if key in goal_list:
-                        data["goal_%s"%key] = []
-                    if self.collect_trajectories and key in features:
-                        data["traj_%s"%key] = []
-
-                # Check data consistency
-                if len(data[key]) > 0:
-                    if isinstance(values[0], np.ndarray):
-                        assert values[0].shape == data[key][0].shape
-                    if not type(data[key][0]) == type(values[0]):
-                        print(key, type(data[key][0]), type(values[0]))
-                        raise RuntimeError('Types do not match when' + \
-                                           ' constructing data set.')
-
-                # Append list of features to the whole dataset
-                data[key].append(values[i])
+                row[key] = values[j]
                 if self.collect_trajectories and key in features:
-                    data["traj_%s"%key].append(features[key])
+                    row["traj_%s"%key] = features[key]
                 if key == "label":
-                    data["prev_%s"%key].append(prev_label)
-                    prev_label = values[i]
-                if key in prev_list:
-                    data["prev_%s"%key].append(values[i0])
+                    row["prev_%s"%key] = self.current_prev_label
+                    self.current_prev_label = values[j]
                 if key in next_list:
-                    data["next_%s"%key].append(values[i1])
-                if key in first_list:
-                    data["first_%s"%key].append(values[ifirst])
+                    row["next_%s"%key] = values[j1]
                 if key in goal_list:
-                    data["goal_%s"%key].append(values[switches[i]])
+                    row["goal_%s"%key] = values[jgoal]
+            self.current_rows.append(row)
+
+        # Only keep the steps that are still needed, including the one before
+        # the next step to write out
+        drop = max(0, self.current_next - 1 - self.current_start)
+        if drop > 0:
+            for values in self.current_example.values():
+                del values[:drop]
+            self.current_start += drop
+
+    def _openRows(self):
+        if self.data_type == self.H5F:
+            # streamed to disk as they come
+            return self.npz_writer.open_episode()
+        return _ExampleBuffer()
+
+    def _finishCurrentExample(self, world, example, reward, max_label,
+            seed=None):
+        '''
+        Write out the rest of this example and save it:
+        - compute task result
+        - add the value and success flags to every step
+        '''
+        print("Finishing example no.",example,"with seed =",seed)
+        self._writeCurrentExample(world, max_label, final=True)
+        rows = self.current_rows
+        length = len(rows)
+
+        # ============================================
+        # Set up total reward
+        data = {}
+        data["value"] = [self.current_reward] * length
 
         # ===================================================================
         # Add a failure flag to all examples.
         if reward <= 0.:
-            success = [0.] * len(data["example"])
+            success = [0.] * length
         else:
-            success = [1.0] * len(data["example"])
+            success = [1.0] * length
         data["success"] = success
 
         # ===================================================================
@@ -394,9 +434,9 @@ class AbstractAgent(object):
             # ================================================
             # Handle TF Records. We save here instead of at the end.
             if self.data_type == self.TFRECORD:
+                data.update(rows.data)
 
                 # Write all entries in data set to the TF record.
-                length = len(data.values()[0])
                 for i in xrange(length):
                     sample = []
                     for key, values in data.items():
@@ -406,14 +446,38 @@ class AbstractAgent(object):
                     if self.tf_writer.ready_to_write() is False:
                         self.tf_writer.prepare_to_write(sample)
                     self.tf_writer.write_example(sample)
+            elif self.data_type == self.H5F:
+                status = "success" if reward > 0. else "failure"
+                rows.close(data, "example%06d.%s.h5f" % (seed, status))
             else:
+                data.update(rows.data)
                 self.npz_writer.write(data, seed, reward)
         else:
             print("-- skipping bad example %d"%seed)
+            if self.data_type == self.H5F:
+                rows.discard()
     
         # ================================================
         # Reset the current example.
-        del self.current_example
-        self.current_example = {}
+        self._resetCurrentExample()
+
+
+class _ExampleBuffer(object):
+    '''
+    The steps of an example, kept in memory as one list per key until the
+    whole example is written.
+    '''
+
+    def __init__(self):
+        self.data = {}
+        self.length = 0
 
+    def __len__(self):
+        return self.length
 
+    def append(self, row):
+        for key, value in row.items():
+            if not key in self.data:
+                self.data[key] = []
+            self.data[key].append(value)
+        self.length += 1
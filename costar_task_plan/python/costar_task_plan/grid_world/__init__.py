@@ -18,3 +18,4 @@ from testing import Evaluate
 from experience import Experience
 from rl import *
 from crossworld_rl import *
+from road_world import RoadWorld
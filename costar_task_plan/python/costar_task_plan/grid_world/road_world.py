@@ -0,0 +1,278 @@
+"""
+(c) 2017 Chris Paxton
+"""
+
+from costar_task_plan.abstract import *
+from costar_task_plan.abstract import AbstractCondition, AbstractReward
+from costar_task_plan.abstract import AbstractFeatures
+
+import numpy as np
+
+'''
+RoadWorld
+A version of the grid world road that implements the AbstractWorld API, so
+that it can be forked and searched with the MCTS tools. The learner drives
+east along a multi-lane road and has to get past slower cars without hitting
+them.
+
+This is mostly useful as a small, self-contained planning problem for testing
+and benchmarking the tree search code.
+'''
+
+
+class RoadState(AbstractState):
+
+    def __init__(self, x, y, t=0., v=1.):
+        super(RoadState, self).__init__()
+        self.x = x
+        self.y = y
+        self.t = t
+        self.v = v
+
+    def toArray(self):
+        return np.array([self.x, self.y, self.t, self.v])
+
+    def toParams(self, action):
+        return action.toArray()
+
+
+class RoadAction(AbstractAction):
+
+    '''
+    Accelerate by dv and move dy lanes sideways.
+    '''
+
+    def __init__(self, dv=0., dy=0):
+        super(RoadAction, self).__init__()
+        self.dv = dv
+        self.dy = dy
+        self.code = (dv, dy)
+
+    def toArray(self):
+        return np.array([self.dv, self.dy])
+
+
+class RoadDynamics(AbstractDynamics):
+
+    '''
+    Integrates the car forward along the road. The number of substeps controls
+    how much work a single tick takes, so that we can mimic a more expensive
+    simulation when benchmarking.
+    '''
+
+    def __init__(self, world, substeps=1):
+        super(RoadDynamics, self).__init__(world)
+        self.substeps = substeps
+
+    def apply(self, state, action, dt):
+        v = min(max(state.v + action.dv, 0.), self.world.max_v)
+        y = min(max(state.y + action.dy, 0), self.world.lanes - 1)
+        x = state.x
+        step = dt / self.substeps
+        for _ in xrange(self.substeps):
+            x += v * step
+        return RoadState(x, y, state.t + dt, v)
+
+
+class RoadActor(AbstractActor):
+    pass
+
+
+class ConstantSpeedPolicy(AbstractPolicy):
+
+    '''
+    Drive straight at the current speed.
+    '''
+
+    def evaluate(self, world, state, actor):
+        return RoadAction(0., 0)
+
+
+class LanePolicy(AbstractPolicy):
+
+    '''
+    Move towards a particular lane and approach a particular speed.
+    '''
+
+    def __init__(self, lane, speed, accel=0.5):
+        super(LanePolicy, self).__init__()
+        self.lane = lane
+        self.speed = speed
+        self.accel = accel
+
+    def evaluate(self, world, state, actor):
+        dy = int(np.sign(self.lane - state.y))
+        dv = np.clip(self.speed - state.v, -self.accel, self.accel)
+        return RoadAction(dv, dy)
+
+
+class ProgressReward(AbstractReward):
+
+    '''
+    Reward the learner for moving down the road.
+    '''
+
+    def __init__(self, scale=0.1):
+        self.scale = scale
+
+    def __call__(self, world):
+        actor = world.actors[0]
+        if actor.last_state is None:
+            return 0., 0.
+        return self.scale * (actor.state.x - actor.last_state.x), 0.
+
+
+class NoCollisionCondition(AbstractCondition):
+
+    '''
+    True as long as the learner does not share a cell with any other car.
+    '''
+
+    def __call__(self, world, state, actor=None, prev_state=None):
+        for other in world.actors[1:]:
+            if other.state.y == state.y and \
+                    abs(other.state.x - state.x) < world.car_length:
+                return False
+        return True
+
+
+class LanePredicate(AbstractCondition):
+
+    '''
+    True if the car is in a particular lane.
+    '''
+
+    inputs = ("y",)
+
+    def __init__(self, lane):
+        super(LanePredicate, self).__init__()
+        self.lane = lane
+
+    def __call__(self, world, state, actor=None, prev_state=None):
+        return state.y == self.lane
+
+    def batch(self, world, actors):
+        y = np.array([actor.state.y for actor in actors])
+        return (y == self.lane).tolist()
+
+
+class BlockedPredicate(AbstractCondition):
+
+    '''
+    True if there is another car less than some distance ahead in the same
+    lane. This depends on the other cars, so it does not declare any inputs.
+    '''
+
+    def __init__(self, distance=3.):
+        super(BlockedPredicate, self).__init__()
+        self.distance = distance
+
+    def __call__(self, world, state, actor=None, prev_state=None):
+        for other in world.actors:
+            dx = other.state.x - state.x
+            if other.state.y == state.y and dx > 0 and dx < self.distance:
+                return True
+        return False
+
+    def batch(self, world, actors):
+        x = np.array([other.state.x for other in world.actors])
+        y = np.array([other.state.y for other in world.actors])
+        qx = np.array([actor.state.x for actor in actors])
+        qy = np.array([actor.state.y for actor in actors])
+        dx = x[None, :] - qx[:, None]
+        blocked = (y[None, :] == qy[:, None]) & (dx > 0) & \
+            (dx < self.distance)
+        return np.any(blocked, axis=1).tolist()
+
+
+class RoadFeatures(AbstractFeatures):
+
+    '''
+    Learner lane and speed, plus distance to the next car ahead in each lane.
+    '''
+
+    def compute(self, world, state):
+        ahead = np.ones(world.lanes) * world.length
+        for other in world.actors[1:]:
+            dx = other.state.x - state.x
+            if dx >= 0 and dx < ahead[other.state.y]:
+                ahead[other.state.y] = dx
+        return np.concatenate([[state.y, state.v], ahead])
+
+    def updateBounds(self, world):
+        pass
+
+    def getBounds(self):
+        return None
+
+
+class RoadWorld(AbstractWorld):
+
+    '''
+    Create a road with a number of lanes and a number of slow cars placed at
+    random ahead of the learner.
+
+    Parameters:
+    -----------
+    lanes: number of lanes on the road
+    length: length of the road
+    num_cars: number of other cars
+    num_obstacles: number of parked cars; these never move
+    substeps: integration steps per tick
+    max_time: episode length in seconds
+    seed: seed used to place the other cars
+    '''
+
+    def __init__(self, lanes=3, length=100., num_cars=10, num_obstacles=0,
+                 substeps=1, max_time=10., seed=None, *args, **kwargs):
+        super(RoadWorld, self).__init__(ProgressReward(), *args, **kwargs)
+        self.lanes = lanes
+        self.length = length
+        self.num_cars = num_cars
+        self.num_obstacles = num_obstacles
+        self.max_v = 5.
+        self.car_length = 1.
+        self.max_ticks = int(max_time / self.dt)
+        self.dynamics = RoadDynamics(self, substeps)
+        self.rng = np.random.RandomState(seed)
+
+        self.addCondition(NoCollisionCondition(), -100., "no_collision")
+        self.addCondition(TimeCondition(max_time), 0., "time")
+        for lane in xrange(lanes):
+            self.addPredicate("in_lane(%d)" % lane, LanePredicate(lane))
+        self.addPredicate("blocked", BlockedPredicate())
+        self.setFeatures(RoadFeatures())
+        self.reset()
+
+    def zeroAction(self, actor_id=0):
+        return RoadAction(0., 0)
+
+    def _update_environment(self):
+        pass
+
+    def _reset(self):
+        self.actors = []
+        self.addActor(RoadActor(state=RoadState(0., self.lanes / 2, v=2.),
+                                dynamics=self.dynamics))
+        for i in xrange(self.num_cars):
+            state = RoadState(self.rng.uniform(5., self.length),
+                              self.rng.randint(self.lanes),
+                              v=self.rng.uniform(0.5, 1.5))
+            self.addActor(RoadActor(state=state,
+                                    policy=ConstantSpeedPolicy(),
+                                    dynamics=self.dynamics))
+        for i in xrange(self.num_obstacles):
+            state = RoadState(self.rng.uniform(5., self.length),
+                              self.rng.randint(self.lanes),
+                              v=0.)
+            self.addActor(RoadActor(state=state,
+                                    policy=ConstantSpeedPolicy()))
+
+    def getLanePolicies(self, speeds=(1., 3.)):
+        '''
+        Get a discrete set of policies for the learner: one for each
+        combination of lane and target speed.
+        '''
+        return [LanePolicy(lane, speed)
+                for lane in xrange(self.lanes)
+                for speed in speeds]
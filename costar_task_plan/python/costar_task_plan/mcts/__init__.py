@@ -4,18 +4,21 @@ __all__ = [
     "AbstractSample", "AbstractRollout", "AbstractScore", "AbstractExtract",
     "AbstractInitialize", "AbstractWiden",
     # The Basics
-    "Node", "MctsAction",
+    "Node", "MctsAction", "ContinuousMctsAction",
     # ===========================================================================
     # Default policies
     "DefaultTaskMctsPolicies", "DefaultMctsPolicies",
     "ContinuousSamplerTaskPolicies",
+    "ContinuousMctsPolicies", "KernelRegressionMctsPolicies",
     # ===========================================================================
     # Rollout functions: estimate value of a leaf
     "SimulationRollout", "ActionValueRollout",
     # ===========================================================================
     # Sample functions: add via progressive widening
     "SinglePolicySample", "NullSample", "LearnedOrderPolicySample",
-    "ContinuousTaskSample",
+    "ContinuousTaskSample", "BatchSample",
+    "ParameterizedPolicySample", "GaussianParameterDistribution",
+    "ModelParameterDistribution",
     # ===========================================================================
     # Initialize functions: create initial set of children
     "NullInitialize", "PolicyInitialize",
@@ -29,12 +32,20 @@ __all__ = [
     # ===========================================================================
     # Score functions:
     "Ucb1Score", "PriorProbabilityScore",
+    "ContinuousRaveScore", "KernelRegressionScore",
+    # ===========================================================================
+    # Nearest-neighbor index over continuous actions
+    "ActionIndex",
+    # ===========================================================================
+    # Transposition table: share work between equivalent nodes
+    "TranspositionTable", "WorldStateKey", "LearnerStateKey",
     # ===========================================================================
     # Validator: print out graphs showing what happened
     "Validator",
     # ===========================================================================
     # Tree search functions
     "MonteCarloTreeSearch", "DepthFirstSearch",
+    "ParallelMonteCarloTreeSearch",
     "RandomSearch", "RandomSearchNoExecution",
     # ===========================================================================
     # Generic tree search result execution (closed-loop)
@@ -49,6 +60,7 @@ from action import *
 
 # Search algorithms
 from search import *
+from parallel_search import *
 
 # Execute plan results
 from execution import *
@@ -60,10 +72,15 @@ from continuous_policies import *
 # MCTS functions
 from rollout import *
 from sample import *
+from continuous_sampler import *
 from initialize import *
 from extract import *
 from widen import *
 from score import *
+from crave import *
+from kernel_regression import *
+from action_index import *
+from transposition import *
 
 # Validation/graphing utils
 from validation import *
@@ -26,6 +26,19 @@ next point where a decision needs to be made.
 '''
 
 
+class _NullLock(object):
+
+    '''
+    Stands in for a lock when only one thread is searching the tree.
+    '''
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
 class AbstractMctsPolicies(object):
 
     def __init__(self,
@@ -37,7 +50,8 @@ class AbstractMctsPolicies(object):
                  rollout=None,
                  max_depth=10,
                  verbose=0,
-                 dfs=False):
+                 dfs=False,
+                 transpositions=None):
         self.max_depth = max_depth
         self._rollout = rollout
         self._initialize = initialize
@@ -47,6 +61,7 @@ class AbstractMctsPolicies(object):
         self._extract = extract
         self._dfs = dfs
         self.verbose = verbose
+        self.transpositions = transpositions
 
         if self.verbose > 0:
             print "=========================================="
@@ -57,11 +72,13 @@ class AbstractMctsPolicies(object):
             print "SAMPLE:", sample
             print "SCORE:", score
             print "WIDEN:", widen
+            print "TRANSPOSITIONS:", transpositions
             print "=========================================="
 
         self._can_widen = self.sample is not None and self._widen is not None
 
-    def select(self, node, max_depth=10, can_widen=True):
+    def select(self, node, max_depth=10, can_widen=True, lock=None,
+               virtual_loss=0.):
         '''
         Choose a possible future to expand. Grow the tree if it is appropriate.
 
@@ -70,8 +87,19 @@ class AbstractMctsPolicies(object):
         - _score(): rank children in the order you want to explore them
         - _rollout(): called by rollout(). simulate play forward in time, or
                     otherwise predict the expected future value of a state.
+
+        If several threads are searching the same tree, pass in a shared lock.
+        All reads and writes of tree statistics happen while holding it; the
+        expensive part -- forking and simulating a new child -- does not. The
+        virtual loss is subtracted from each node on the way down and added
+        back during the update, so that concurrent searches spread out over
+        different branches instead of all expanding the same leaf.
         '''
 
+        shared = lock is not None
+        if not shared:
+            lock = _NullLock()
+
         visited = []
 
         done = False
@@ -84,59 +112,79 @@ class AbstractMctsPolicies(object):
         while steps < max_depth:
             assert node.initialized
 
-            steps += 1
-            node.n_visits += 1
-
-            length = len(node.children)
-            final_reward = node.reward
-
-            # Add this node's reward to the vector of visited states.
-            visited.append((node, final_reward))
-
-            # optionally expand internal nodes
-            if node.terminal:
-                break
-            elif self._can_widen and \
-                    (can_widen or (length == 0 and self._dfs)) \
-                    and self._widen(node):
-                # sample an action from this node that we haven't explored yet
-                action = self.sample(node)
-                if action:
-                    # add this action as a new child
-                    node.children.append(Node(action=action))
-                    can_widen = False
-                    length += 1
-
-            if length is 0:
-                break
-
-            # This is a visited node, which means that it has children we can
-            # consider. We want to score these children using our provided scoring
-            # function and select the next one to expand upon.
-            # -----------------------------------------------------------------------
-            # Compute  scores
-            score = [0] * length
-            for i, child in enumerate(node.children):
-                score[i] = self._score(node, child)
-
-            # choose the child with the best score
-            max_idx, max_score = max(
-                enumerate(score), key=operator.itemgetter(1))
+            with lock:
+                steps += 1
+                node.n_visits += 1
+                if virtual_loss:
+                    node.total_reward -= virtual_loss
+                    node.avg_reward = node.total_reward / node.n_visits
+
+                length = len(node.children)
+                final_reward = node.reward
+
+                # Add this node's reward to the vector of visited states.
+                visited.append((node, final_reward))
+
+                # optionally expand internal nodes
+                if node.terminal:
+                    break
+                elif self._can_widen and \
+                        (can_widen or (length == 0 and self._dfs)) \
+                        and self._widen(node):
+                    # sample an action from this node that we haven't explored
+                    # yet
+                    action = self.sample(node)
+                    if action:
+                        # add this action as a new child
+                        node.children.append(Node(action=action))
+                        can_widen = False
+                        length += 1
+
+                if length is 0:
+                    break
+
+                # This is a visited node, which means that it has children we
+                # can consider. We want to score these children using our
+                # provided scoring function and select the next one to expand
+                # upon.
+                child = node.children[self._choose(node, shared)]
+                if child.expanding:
+                    # other threads are already simulating every child
+                    break
+                expand = not child.initialized
+                if expand:
+                    child.expanding = True
 
             # instantiate child and select it
-            child = node.children[max_idx]
-            if not child.initialized:
+            if expand:
                 # fork the world and apply the correct action
-                node.instantiate(child)
+                node.instantiate(child, self.transpositions)
                 if self._initialize:
                     self._initialize(child)
+                child.expanding = False
 
             node = child
 
-        acc_reward = 0
-        for node, reward in reversed(visited):
-            acc_reward += reward
-            node.update(acc_reward, final_reward, steps)
+        with lock:
+            acc_reward = 0
+            for node, reward in reversed(visited):
+                acc_reward += reward
+                node.total_reward += virtual_loss
+                node.update(acc_reward, final_reward, steps)
+
+    def _choose(self, node, skip_expanding=False):
+        '''
+        Score all children of a node and return the index of the best one.
+        Children that another thread is currently expanding can be skipped.
+        '''
+        score = self._score.batch(node)
+        if skip_expanding:
+            for i, child in enumerate(node.children):
+                if child.expanding:
+                    score[i] = -float('inf')
+
+        # choose the child with the best score
+        return int(np.argmax(score))
 
     '''
   Instantiate the specified child by forking from the current parent.
@@ -145,7 +193,7 @@ class AbstractMctsPolicies(object):
     def instantiate(self, parent, child):
         if not child.initialized:
             # fork the world and apply the correct action
-            parent.instantiate(child)
+            parent.instantiate(child, self.transpositions)
             if self._initialize:
                 self._initialize(child)
 
@@ -154,6 +202,12 @@ class AbstractMctsPolicies(object):
   '''
 
     def initialize(self, node):
+        '''
+        Called at the start of every search with its root. Scores that cache
+        data about the tree start over, so nothing from earlier searches is
+        kept alive.
+        '''
+        self._score.clear()
         if self._initialize:
             self._initialize(node)
 
@@ -188,13 +242,7 @@ class AbstractMctsPolicies(object):
         elif len(node.children) == 0:
             return node
         else:
-            length = len(node.children)
-            score = [0] * length
-            for i, child in zip(xrange(length), node.children):
-                score[i] = self._score(node, child)
-            max_idx, max_score = max(
-                enumerate(score), key=operator.itemgetter(1))
-            return self.getNext(node.children[max_idx])
+            return self.getNext(node.children[self._choose(node)])
 
     '''
   Explore the tree down from the root.
@@ -251,6 +299,14 @@ class AbstractSample(object):
     def _sample(self, node):
         raise NotImplementedError('sampler._sample() not implemented!')
 
+    def sampleBatch(self, node, n):
+        '''
+        Draw n actions from a node at once. Samplers that call a learned model
+        or draw random parameters should override this, so that the work is
+        done in one vectorized call instead of n separate ones.
+        '''
+        return [self._sample(node) for _ in xrange(n)]
+
     def update(self, action, r):
         '''
         This function is provided as a way of updating an expected value function
@@ -340,6 +396,21 @@ class AbstractScore(object):
     def __call__(self, parent, child):
         raise NotImplementedError('score.__call__() not implemented!')
 
+    def clear(self):
+        '''
+        Forget anything cached about the tree. Called at the start of every
+        search.
+        '''
+        pass
+
+    def batch(self, parent):
+        '''
+        Score all children of the parent at once and return an array. Override
+        this with a vectorized version where possible.
+        '''
+        return np.array([self(parent, child) for child in parent.children],
+                        dtype=float)
+
 '''
 Widen the tree by adding a new entity.
 This function says if we can widen: it returns a boolean.
@@ -1,6 +1,8 @@
 from abstract import *
 from costar_task_plan.abstract import *
 
+import numpy as np
+
 # This connects two different decision points.
 
 
@@ -51,7 +53,13 @@ class MctsAction(AbstractMctsAction):
   '''
 
     def update(self, node):
-        if not node.terminal:
+        if not node.terminal and self.condition is None:
+            # no condition: just follow the policy for a fixed number of ticks
+            for i in xrange(self.ticks_after_fork):
+                (res, S0, A0, S1, F1, r) = node.tick(self.getAction(node))
+                if not res:
+                    break
+        elif not node.terminal:
             while self.condition(node.world,
                                  node.state,
                                  node.world.actors[0],
@@ -60,3 +68,19 @@ class MctsAction(AbstractMctsAction):
                 if not res:
                     break
         return node
+
+
+class ContinuousMctsAction(MctsAction):
+
+    '''
+    An MCTS action whose policy was created from a vector of continuous
+    parameters. The parameters are kept around so that the continuous scores
+    can compare actions with each other.
+    '''
+
+    def __init__(self, params, *args, **kwargs):
+        super(ContinuousMctsAction, self).__init__(*args, **kwargs)
+        self.params = np.asarray(params, dtype=float)
+
+    def toArray(self):
+        return self.params
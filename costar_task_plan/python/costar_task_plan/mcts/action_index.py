@@ -0,0 +1,125 @@
+# By Chris Paxton
+# (c) 2017 The Johns Hopkins University
+# See License for more details
+
+import numpy as np
+
+from scipy.spatial import cKDTree
+
+'''
+Nearest-neighbor index over points in a continuous space, e.g. the parameters
+of the actions explored from a node or the states that an option was tried
+from. The continuous MCTS scores use it to share value estimates between
+nearby actions without comparing every pair of them.
+
+KD-trees cannot be extended once built, so points are kept in a series of
+trees whose sizes are powers of two (the "logarithmic method"): adding a point
+merges it with all the trees smaller than it, like incrementing a binary
+counter. Inserts take O(log^2 n) amortized time and queries look at O(log n)
+trees of O(log n) depth each.
+'''
+
+
+class ActionIndex(object):
+
+    '''
+    Parameters:
+    -----------
+    dim: dimensionality of the points
+    leaf_size: points are kept in a flat buffer until there are this many,
+               since tiny trees are slower than just checking every point
+    '''
+
+    def __init__(self, dim, leaf_size=16):
+        self.dim = dim
+        self.leaf_size = leaf_size
+        self.points = np.zeros((0, dim))
+        self.items = []
+        self._size = 0
+        # list of (tree, ids of the points in the tree)
+        self._trees = []
+        # ids of the points that are not in any tree yet
+        self._buffer = []
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, point, item=None):
+        '''
+        Add a point along with whatever object it belongs to. Returns the id
+        of the new point.
+        '''
+        point = np.asarray(point, dtype=float).reshape(self.dim)
+        if self._size == len(self.points):
+            points = np.zeros((max(2 * self._size, 16), self.dim))
+            points[:self._size] = self.points[:self._size]
+            self.points = points
+        idx = self._size
+        self.points[idx] = point
+        self.items.append(item)
+        self._size += 1
+
+        self._buffer.append(idx)
+        if len(self._buffer) >= self.leaf_size:
+            self._merge()
+        return idx
+
+    def _merge(self):
+        ids = self._buffer
+        self._buffer = []
+        while len(self._trees) > 0 and len(self._trees[-1][1]) <= len(ids):
+            tree, tree_ids = self._trees.pop()
+            ids = np.concatenate([tree_ids, ids])
+        ids = np.asarray(ids, dtype=np.int64)
+        self._trees.append((cKDTree(self.points[ids]), ids))
+
+    def radius(self, point, r):
+        '''
+        Ids of all points within distance r of a point.
+        '''
+        point = np.asarray(point, dtype=float).reshape(self.dim)
+        found = []
+        for tree, ids in self._trees:
+            hits = tree.query_ball_point(point, r)
+            if len(hits) > 0:
+                found.append(ids[hits])
+        if len(self._buffer) > 0:
+            buf = np.asarray(self._buffer, dtype=np.int64)
+            d = np.linalg.norm(self.points[buf] - point, axis=1)
+            found.append(buf[d <= r])
+        if len(found) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(found)
+
+    def kernel(self, point, bandwidth, cutoff=3.):
+        '''
+        Gaussian kernel weights of all points within cutoff bandwidths of a
+        point; points further away contribute (almost) nothing. Returns ids
+        and weights.
+        '''
+        ids = self.radius(point, cutoff * bandwidth)
+        d = np.linalg.norm(self.points[ids] - point, axis=1)
+        return ids, np.exp(-0.5 * (d / bandwidth) ** 2)
+
+    def nearest(self, point, k=1):
+        '''
+        Ids and distances of the k closest points, closest first.
+        '''
+        point = np.asarray(point, dtype=float).reshape(self.dim)
+        ids = []
+        dists = []
+        for tree, tree_ids in self._trees:
+            kk = min(k, len(tree_ids))
+            d, hits = tree.query(point, kk)
+            ids.append(tree_ids[np.atleast_1d(hits)])
+            dists.append(np.atleast_1d(d))
+        if len(self._buffer) > 0:
+            buf = np.asarray(self._buffer, dtype=np.int64)
+            ids.append(buf)
+            dists.append(np.linalg.norm(self.points[buf] - point, axis=1))
+        if len(ids) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        ids = np.concatenate(ids)
+        dists = np.concatenate(dists)
+        order = np.argsort(dists)[:k]
+        return ids[order], dists[order]
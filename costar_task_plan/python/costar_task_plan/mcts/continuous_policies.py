@@ -1,6 +1,8 @@
 from abstract import AbstractMctsPolicies
+from crave import ContinuousRaveScore
 from extract import *
-from sample import ContinuousTaskSample
+from kernel_regression import KernelRegressionScore
+from sample import BatchSample, ContinuousTaskSample
 from score import *
 from widen import *
 
@@ -9,6 +11,19 @@ class ContinuousMctsPolicies(AbstractMctsPolicies):
 
     '''
     Version of MCTS policies that uses continuous RAVE based metrics.
+
+    Actions are drawn from the sampler in batches and added to the tree with
+    progressive widening; children share value estimates with nearby actions
+    tried elsewhere in the tree.
+
+    Parameters:
+    -----------
+    sample: sampler for continuous actions, e.g. ParameterizedPolicySample
+    score_c: exploration constant
+    pw_C, pw_alpha: progressive widening parameters
+    rave_k: RAVE equivalence parameter
+    bandwidth: kernel width for sharing between nearby states and actions
+    batch_size: number of actions to draw from the sampler at once
     '''
 
     def __init__(self,
@@ -17,16 +32,51 @@ class ContinuousMctsPolicies(AbstractMctsPolicies):
                  score_c=1.0,
                  pw_C=1.0,
                  pw_alpha=0.25,
+                 rave_k=10.,
+                 bandwidth=1.0,
+                 batch_size=8,
                  *args, **kwargs):
 
+        if sample is not None and batch_size > 1:
+            sample = BatchSample(sample, batch_size)
+
         super(ContinuousMctsPolicies, self).__init__(
-            score=ContinuousRaveScore(score_c),
+            score=ContinuousRaveScore(score_c, rave_k, bandwidth),
+            widen=ProgressiveWiden(pw_C, pw_alpha),
+            extract=MostVisitedExtract(),
+            sample=sample,
+            initialize=initialize,
+            *args, **kwargs)
+
+
+class KernelRegressionMctsPolicies(AbstractMctsPolicies):
+
+    '''
+    Continuous MCTS with kernel regression (KR-UCT) scores: children of a node
+    share value estimates with their siblings that have similar parameters.
+    Takes the same parameters as ContinuousMctsPolicies, except for rave_k.
+    '''
+
+    def __init__(self,
+                 sample=None,
+                 initialize=None,
+                 score_c=1.0,
+                 pw_C=1.0,
+                 pw_alpha=0.25,
+                 bandwidth=1.0,
+                 batch_size=8,
+                 *args, **kwargs):
+
+        if sample is not None and batch_size > 1:
+            sample = BatchSample(sample, batch_size)
+
+        super(KernelRegressionMctsPolicies, self).__init__(
+            score=KernelRegressionScore(score_c, bandwidth),
             widen=ProgressiveWiden(pw_C, pw_alpha),
             extract=MostVisitedExtract(),
             sample=sample,
             initialize=initialize,
             *args, **kwargs)
-        raise NotImplementedError('this does not yet exist')
 
 
 class ContinuousSamplerTaskPolicies(AbstractMctsPolicies):
@@ -3,25 +3,82 @@ from abstract import *
 from action import *
 
 import numpy as np
-import operator
 
+'''
+Samplers for continuous action spaces. Each MCTS action wraps a policy built
+from a vector of parameters (a goal position, a target speed, DMP weights...)
+and the parameters are drawn from a distribution, in batches.
+'''
 
-class GpPolicySample(AbstractSample):
 
-    def __init__(self, distributions={}, data={}):
-        self.Z = distributions
-        self.data = data
+class GaussianParameterDistribution(object):
+
+    '''
+    Fixed multivariate Gaussian over the action parameters, e.g. fit to expert
+    data.
+    '''
+
+    def __init__(self, mean, cov):
+        self.mean = np.asarray(mean, dtype=float)
+        self.cov = np.asarray(cov, dtype=float)
+
+    def __call__(self, node, n):
+        return np.random.multivariate_normal(self.mean, self.cov, n)
+
+
+class ModelParameterDistribution(object):
+
+    '''
+    Gaussian centered on the parameters a learned model predicts from the
+    features of a node. The model only needs a predict() function, e.g. a
+    Keras model; it is called once per batch.
+    '''
+
+    def __init__(self, model, cov):
+        self.model = model
+        self.cov = np.asarray(cov, dtype=float)
+
+    def __call__(self, node, n):
+        mean = self.model.predict(np.array([node.features()]))[0]
+        return np.random.multivariate_normal(mean, self.cov, n)
+
+
+class ParameterizedPolicySample(AbstractSample):
+
+    '''
+    Sample continuous actions for a single parameterized policy.
+
+    Parameters:
+    -----------
+    make_policy: function creating a policy from a parameter vector
+    distribution: function (node, n) -> n x d array of parameters
+    ticks: number of ticks to follow each policy for
+    condition: optional condition to follow each policy until
+    '''
+
+    def __init__(self, make_policy, distribution, ticks=10, condition=None,
+                 tag=None):
+        self.make_policy = make_policy
+        self.distribution = distribution
+        self.ticks = ticks
+        self.condition = condition
+        self.tag = tag
 
     def numOptions(self):
         return 1
 
-    def getOption(self, node, idx):
-        return MctsAction(policy=self.policy, id=0, ticks=self.ticks)
-
     def _sample(self, node):
-        return MctsAction(policy=self.policy, id=0, ticks=self.ticks)
+        return self.sampleBatch(node, 1)[0]
 
-    def getPolicies(self, node):
-        return [self.policy]
+    def sampleBatch(self, node, n):
+        params = self.distribution(node, n)
+        return [ContinuousMctsAction(params=p,
+                                     policy=self.make_policy(p),
+                                     condition=self.condition,
+                                     ticks=self.ticks,
+                                     tag=self.tag,
+                                     id=0)
+                for p in params]
 
     def getName(self):
+        return "parameterized"
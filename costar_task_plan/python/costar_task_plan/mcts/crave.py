@@ -1,62 +1,99 @@
-
 from abstract import AbstractScore
+from action_index import ActionIndex
+
+import numpy as np
 
 '''
 Implement select based on continuous rave.
 
-This is a more complicated score:
-  - we need to maintain a list of all the different things that are part of
-  our tree.
-  - whenever the tree is updated, we have to be able to call this function.
-  - luckily we can change things in the main class too...
+RAVE shares value estimates between all the places in the tree where an option
+was tried. Continuous RAVE only shares between places that are close to each
+other: the estimate for trying option k (with parameters p) from state s is a
+kernel-weighted average over every other node in the tree that tried k from a
+state near s (with parameters near p).
+
+Every child in the tree is stored in one nearest-neighbor index per option,
+keyed by its parent's state and its own action parameters, so each estimate
+only looks at the neighborhood instead of at every other node. The indices
+are rebuilt for every search: the policies call clear() when a search starts,
+and nodes of a reused tree are indexed again the first time they are scored.
 '''
 
 
-def ContinuousRaveScore(AbstractScore):
-
-    def __init__(self, ucb1_c, alpha):
-        self.ucb1_c = ucb1_c
-        self.alpha = alpha
-        self.next_state_idx = 0
-
-        # store distance metrics used between the different actions
-        self.state_keys = {}
-
-        self.state_dists = []
-        self.all_nodes = []
+class ContinuousRaveScore(AbstractScore):
 
     '''
-  Call is going to update everything in our internal memory.
-  Procedure:
-  - compute distance between child states
-  - count up all states with child.action.id
-  '''
-
-    def __call__(self, parent, child):
-        # add the child's value to the current list.
-        child_state = child.world.actors[0].state.toArray()
-
-        # UPDATE PROCEDURE
-        if not child_state in self.state_keys:
-            self.state_dists.append([])
-            for i, (key, val) in enumerate(self.state_keys.items()):
-                d = np.linalg.norm(child_state - key)
-                self.state_dists[-1].append(d)
-                self.state_dists[i].append(d)
-
-            self.state_keys[child_state] = self.next_state_idx
-            self.next_state_idx += 1
-
-        # COMPUTE VALUE FOR ACTIONS
-        action_crave = [node.avg_reward
-                        for node in self.all_nodes
-                        if node.action.id == child.action.id]
+    Parameters:
+    -----------
+    c: exploration constant
+    k: RAVE equivalence parameter; the shared estimate and the child's own
+       average are weighted equally after roughly k/3 visits to the child
+    bandwidth: width of the Gaussian kernel in state (and parameter) space
+    '''
 
-        pass
+    def __init__(self, c=1.0, k=10., bandwidth=1.0):
+        self.c = c
+        self.k = k
+        self.bandwidth = bandwidth
+        self.clear()
 
-    '''
-  Update everything in the tree
-  '''
+    def clear(self):
+        # option -> index of (parent state, parameters) for all its children
+        self.indices = {}
+        # id of parent -> (parent, number of its children already indexed);
+        # the parent is kept so that its id is not reused during this search
+        self.indexed = {}
 
-    def _update_environment(self, root):
-        pass
+    def __call__(self, parent, child):
+        return self.batch(parent)[parent.children.index(child)]
+
+    def batch(self, parent):
+        self._update(parent)
+        visits, avg_reward, prior = parent.childStats()
+        visits = visits.astype(float)
+
+        num_children = len(parent.children)
+        rave_value = np.zeros(num_children)
+        rave_visits = np.zeros(num_children)
+        for i, child in enumerate(parent.children):
+            index = self.indices[self._key(child)]
+            ids, w = index.kernel(self._point(parent, child), self.bandwidth)
+            nodes = [index.items[j] for j in ids]
+            w = w * np.array([node.n_visits for node in nodes])
+            rave_visits[i] = np.sum(w)
+            if rave_visits[i] > 0:
+                rave_value[i] = np.dot(
+                    w, [node.avg_reward for node in nodes]) / rave_visits[i]
+
+        beta = np.sqrt(self.k / (3 * visits + self.k))
+        value = (1 - beta) * avg_reward + beta * rave_value
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = value + self.c * \
+                np.sqrt(np.log(parent.n_visits) / np.maximum(visits, 1))
+        score[(visits == 0) & (rave_visits <= 0)] = float('inf')
+        return score
+
+    def _update(self, parent):
+        '''
+        Add any children of the parent that we have not seen yet.
+        '''
+        _, num_indexed = self.indexed.get(id(parent), (parent, 0))
+        for child in parent.children[num_indexed:]:
+            point = self._point(parent, child)
+            key = self._key(child)
+            if key not in self.indices:
+                self.indices[key] = ActionIndex(len(point))
+            self.indices[key].insert(point, child)
+        self.indexed[id(parent)] = (parent, len(parent.children))
+
+    def _key(self, child):
+        if child.action.tag is not None:
+            return child.action.tag
+        return child.action.id
+
+    def _point(self, parent, child):
+        state = np.asarray(parent.state.toArray(), dtype=float)
+        params = getattr(child.action, 'params', None)
+        if params is None:
+            return state
+        return np.concatenate([state, params])
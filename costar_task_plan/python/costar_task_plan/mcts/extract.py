@@ -6,7 +6,7 @@ All rights reserved. See license for details.
 
 from abstract import AbstractExtract
 
-import operator
+import numpy as np
 
 '''
 Return the most visited nodes all the way down the tree.
@@ -18,11 +18,8 @@ class MostVisitedExtract(AbstractExtract):
     def __call__(self, node):
         nodes = [node]
         while not node.terminal and len(node.children) > 0:
-            visits = [(i, child.n_visits)
-                      for (i, child) in enumerate(node.children)]
-            max_idx, max_num_visits = max(visits, key=operator.itemgetter(1))
-
-            node = node.children[max_idx]
+            visits, avg_reward, prior = node.childStats()
+            node = node.children[np.argmax(visits)]
             nodes.append(node)
         return nodes
 
@@ -39,15 +36,10 @@ class MostVisitedPositiveExtract(AbstractExtract):
     def __call__(self, node):
         nodes = [node]
         while not node.terminal and len(node.children) > 0:
-            if max([child.avg_reward for child in node.children]) > 0:
-                allowed = lambda child: child.avg_reward > 0
-            else:
-                allowed = lambda child: True
-            visits = [(i, child.n_visits)
-                      for (i, child) in enumerate(node.children) if allowed(child)]
-            max_idx, max_num_visits = max(visits, key=operator.itemgetter(1))
-
-            node = node.children[max_idx]
+            visits, avg_reward, prior = node.childStats()
+            if np.max(avg_reward) > 0:
+                visits = np.where(avg_reward > 0, visits, -1)
+            node = node.children[np.argmax(visits)]
             nodes.append(node)
         return nodes
 
@@ -61,14 +53,7 @@ class HighestAverageRewardExtract(AbstractExtract):
     def __call__(self, node):
         nodes = [node]
         while not node.terminal and len(node.children) > 0:
-            reward = [(i, child.avg_reward)
-                      for (i, child) in enumerate(node.children)]
-
-            if len(reward) == 0:
-                break
-
-            max_idx, max_rewar = max(reward, key=operator.itemgetter(1))
-
-            node = node.children[max_idx]
+            visits, avg_reward, prior = node.childStats()
+            node = node.children[np.argmax(avg_reward)]
             nodes.append(node)
         return nodes
@@ -1,7 +1,69 @@
+
+from abstract import AbstractScore
+from action_index import ActionIndex
+
+import numpy as np
+
 '''
 Kernel regression MCTS
+
+Score for nodes with continuous actions (KR-UCT): the value of each child is
+estimated from all of its siblings, weighted by how close their action
+parameters are. An action that has barely been tried but sits next to a good
+one looks good too, and the exploration bonus shrinks with the visits of the
+whole neighborhood rather than with the child's own visits.
+
+Children are kept in a nearest-neighbor index on their parent, so scoring n
+children costs O(n log n) plus the size of the neighborhoods instead of O(n^2).
 '''
 
 
-def KernelRegressionSelect(AbstractSelect):
-    pass
+class KernelRegressionScore(AbstractScore):
+
+    '''
+    Parameters:
+    -----------
+    c: exploration constant
+    bandwidth: width of the Gaussian kernel; either a scalar or one value per
+               action parameter
+    '''
+
+    def __init__(self, c=1.0, bandwidth=1.0):
+        self.c = c
+        self.bandwidth = np.asarray(bandwidth, dtype=float)
+
+    def __call__(self, parent, child):
+        return self.batch(parent)[parent.children.index(child)]
+
+    def batch(self, parent):
+        index = self._index(parent)
+        visits, avg_reward, prior = parent.childStats()
+
+        num_children = len(parent.children)
+        value = np.zeros(num_children)
+        weight = np.zeros(num_children)
+        for i in xrange(num_children):
+            ids, w = index.kernel(index.points[i], 1.)
+            w = w * visits[ids]
+            weight[i] = np.sum(w)
+            if weight[i] > 0:
+                value[i] = np.dot(w, avg_reward[ids]) / weight[i]
+
+        total = np.sum(weight)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = value + self.c * np.sqrt(np.log(total) / weight)
+        score[weight <= 0] = float('inf')
+        return score
+
+    def _index(self, parent):
+        '''
+        Add any new children of the parent to its index. Parameters are
+        divided by the bandwidth, so that the kernel has unit width.
+        '''
+        if parent.action_index is None:
+            dim = len(parent.children[0].action.toArray())
+            parent.action_index = ActionIndex(dim)
+        index = parent.action_index
+        for child in parent.children[len(index):]:
+            index.insert(child.action.toArray() / self.bandwidth, child)
+        return index
@@ -1,5 +1,7 @@
 from costar_task_plan.abstract import *
 
+import numpy as np
+
 '''
 An MCTS node is a TYPE of state, but contains a different type of state.
 Why? So that we can do interesting learning over MCTS states.
@@ -28,6 +30,21 @@ class Node(AbstractState):
         if world is None and action is None:
             raise RuntimeError('must provide either a world or an action!')
 
+        # Visit count, average reward and prior are stored in arrays. Until
+        # this node is attached to a parent it has arrays of its own; after
+        # that it uses its slot in the arrays of its parent, so that all
+        # children of a node can be scored at once.
+        self._visits = np.zeros(1, dtype=np.int64)
+        self._avg_reward = np.zeros(1)
+        self._prior = np.zeros(1)
+        self._slot = 0
+
+        # Arrays holding the statistics of this node's children
+        self._child_visits = np.zeros(0, dtype=np.int64)
+        self._child_avg_reward = np.zeros(0)
+        self._child_prior = np.zeros(0)
+        self._num_attached = 0
+
         self.parent = None
         self.n_visits = 0
         self.n_rollouts = 0
@@ -41,6 +58,15 @@ class Node(AbstractState):
         self.max_final_reward = -float('inf')
         self.prior = prior
         self.initialized = self.world is not None
+        self.expanding = False
+        # shared statistics and canonical key, when using a transposition
+        # table
+        self.transposition = None
+        self.world_key = None
+        # actions sampled ahead of time but not added as children yet, and
+        # nearest-neighbor index over the children's continuous parameters
+        self.candidates = []
+        self.action_index = None
         self.terminal = self.world is not None and self.world.done
         if self.action is not None and self.action.tag is not None:
             self.tag = self.action.tag
@@ -59,6 +85,111 @@ class Node(AbstractState):
         self.rewards = []
         self.reward = 0
 
+    @property
+    def n_visits(self):
+        return self._visits.item(self._slot)
+
+    @n_visits.setter
+    def n_visits(self, value):
+        self._visits[self._slot] = value
+
+    @property
+    def avg_reward(self):
+        return self._avg_reward.item(self._slot)
+
+    @avg_reward.setter
+    def avg_reward(self, value):
+        self._avg_reward[self._slot] = value
+
+    @property
+    def prior(self):
+        return self._prior.item(self._slot)
+
+    @prior.setter
+    def prior(self, value):
+        self._prior[self._slot] = value
+
+    def childStats(self):
+        '''
+        Get the statistics of all children of this node as arrays of visit
+        counts, average rewards, and priors. These are views: they are only
+        valid until the next child gets added.
+        '''
+        num_children = len(self.children)
+        if self._num_attached != num_children:
+            self._attachChildren(num_children)
+        return (self._child_visits[:num_children],
+                self._child_avg_reward[:num_children],
+                self._child_prior[:num_children])
+
+    def _attachChildren(self, num_children):
+        '''
+        Move the statistics of newly added children into our arrays. Children
+        get appended to the list directly, so we catch up lazily.
+        '''
+        if num_children > len(self._child_visits):
+            size = max(num_children, 2 * len(self._child_visits), 4)
+            visits = np.zeros(size, dtype=np.int64)
+            avg_reward = np.zeros(size)
+            prior = np.zeros(size)
+            visits[:self._num_attached] = \
+                self._child_visits[:self._num_attached]
+            avg_reward[:self._num_attached] = \
+                self._child_avg_reward[:self._num_attached]
+            prior[:self._num_attached] = \
+                self._child_prior[:self._num_attached]
+            self._child_visits = visits
+            self._child_avg_reward = avg_reward
+            self._child_prior = prior
+            for child in self.children[:self._num_attached]:
+                child._setArrays(self)
+
+        for i in xrange(self._num_attached, num_children):
+            child = self.children[i]
+            self._child_visits[i] = child.n_visits
+            self._child_avg_reward[i] = child.avg_reward
+            self._child_prior[i] = child.prior
+            child._slot = i
+            child._setArrays(self)
+        self._num_attached = num_children
+
+    def _setArrays(self, parent):
+        self._visits = parent._child_visits
+        self._avg_reward = parent._child_avg_reward
+        self._prior = parent._child_prior
+
+    def makeRoot(self):
+        '''
+        Detach this node from its parent so that it can be the root of a new
+        search. Statistics of this node and its subtree are kept.
+        '''
+        if not self.initialized:
+            raise RuntimeError('cannot make a root out of an empty node')
+        n_visits, avg_reward, prior = self.n_visits, self.avg_reward, \
+            self.prior
+        self._visits = np.zeros(1, dtype=np.int64)
+        self._avg_reward = np.zeros(1)
+        self._prior = np.zeros(1)
+        self._slot = 0
+        self.n_visits = n_visits
+        self.avg_reward = avg_reward
+        self.prior = prior
+        self.parent = None
+        self.prev_reward = 0
+        self.reward = 0
+
+    def size(self):
+        '''
+        Number of nodes in the subtree below and including this one.
+        '''
+        count = 0
+        stack = [self]
+        while len(stack) > 0:
+            node = stack.pop()
+            count += 1
+            stack.extend(node.children)
+        return count
+
     '''
     MCTS update step
     '''
@@ -68,6 +199,9 @@ class Node(AbstractState):
         self.max_reward = max(reward, self.max_reward)
         self.max_final_reward = max(reward, self.max_final_reward)
         self.avg_reward = self.total_reward / self.n_visits
+        if self.transposition is not None:
+            # use the value estimate shared with all equivalent nodes
+            self.avg_reward = self.transposition.update(reward)
         self.reward = 0  # reset counter for this trace
 
     '''
@@ -93,7 +227,7 @@ class Node(AbstractState):
     - if all of our children have been created ahead of time, we may want to
     '''
 
-    def instantiate(self, child):
+    def instantiate(self, child, transpositions=None):
 
         if child.parent is None:
             child.parent = self
@@ -109,6 +243,23 @@ class Node(AbstractState):
                 raise RuntimeError(
                     'Cannot instantiate a node with an empty action!')
 
+            if transpositions is not None:
+                transition, entry = transpositions.lookup(self, child)
+                if entry is not None:
+                    # we have simulated this option from an equivalent state
+                    # before, so reuse the result instead of forking
+                    child.world = entry.world
+                    child.state = entry.state
+                    child.initialized = True
+                    child.terminal = entry.terminal
+                    child.rewards = list(entry.rewards)
+                    child.reward = entry.reward
+                    child.prev_reward = self.prev_reward + self.reward
+                    child.traj = list(entry.traj)
+                    child.world_key = entry.world_key
+                    child.transposition = entry
+                    return
+
             action = child.action.getAction(self)
             if action is None:
                 failed = True
@@ -126,6 +277,8 @@ class Node(AbstractState):
             child.prev_reward = self.prev_reward + self.reward
             child.traj.append((self.world.actors[0].state, action))
             child.action.update(child)
+            if transpositions is not None:
+                child.transposition = transpositions.insert(transition, child)
         else:
             raise RuntimeError(
                 'Cannot instantiate a node that already has been instantiated!')
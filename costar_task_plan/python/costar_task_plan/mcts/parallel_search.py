@@ -0,0 +1,227 @@
+# By Chris Paxton
+# (c) 2017 The Johns Hopkins University
+# See License for more details
+
+import multiprocessing
+import random
+import threading
+import timeit
+
+import numpy as np
+
+from multiprocessing.pool import ThreadPool
+
+from abstract import AbstractSearch
+from node import Node
+
+'''
+Parallel versions of the tree search.
+
+Two different ways of using more than one core are supported:
+  - "root" parallelism: every worker process grows its own tree from a copy of
+    the root for its share of the iterations. Statistics for the children of
+    the root (and further down along the best path) are then merged, and we
+    extract a plan from the merged tree.
+  - "leaf" parallelism: several threads search a single shared tree. Tree
+    statistics are protected by a lock and a virtual loss keeps the threads
+    from all expanding the same leaf; forking and simulating new children
+    happen concurrently. This only helps for worlds whose tick() releases the
+    GIL, e.g. ones backed by a physics simulator.
+'''
+
+# Set right before the worker pool is created, so that forked workers get the
+# root and policies without having to pickle them.
+_root_parallel_job = None
+
+
+def _summarize(node, depth, key=None):
+    '''
+    Collect the statistics of a (sub)tree into nested tuples that are cheap to
+    send back from a worker process:
+        (key, n_visits, total_reward, max_reward, max_final_reward, children)
+    '''
+    children = []
+    if depth > 0:
+        for child_key, child in zip(_keys(node.children), node.children):
+            if child.n_visits > 0:
+                children.append(_summarize(child, depth - 1, child_key))
+    return (key,
+            node.n_visits,
+            node.total_reward,
+            node.max_reward,
+            node.max_final_reward,
+            children)
+
+
+def _keys(children):
+    '''
+    Two nodes from different trees are considered the same if they were
+    created from the same option with the same id. Repeated options (e.g. from
+    a sampler that always returns the same policy) are told apart by the order
+    they were added in.
+    '''
+    counts = {}
+    keys = []
+    for child in children:
+        key = (child.tag, getattr(child.action, 'id', None))
+        count = counts.get(key, 0)
+        counts[key] = count + 1
+        keys.append(key + (count,))
+    return keys
+
+
+def _root_parallel_worker(args):
+    seed, iterations = args
+    policies, root, depth = _root_parallel_job
+    np.random.seed(seed)
+    random.seed(seed)
+    for i in xrange(iterations):
+        policies.explore(root)
+    return _summarize(root, depth)
+
+
+class ParallelMonteCarloTreeSearch(AbstractSearch):
+
+    '''
+    Run MCTS with more than one core. Takes the same arguments as
+    MonteCarloTreeSearch, plus:
+
+    Parameters:
+    -----------
+    policies: MCTS policies object
+    num_workers: number of processes or threads; defaults to the CPU count
+    mode: "root" for root parallelism, "leaf" for the shared-tree version
+    virtual_loss: penalty applied to nodes that are being searched by another
+                  thread in "leaf" mode
+    merge_depth: how far down the tree to merge statistics in "root" mode
+    '''
+
+    def __init__(self, policies, num_workers=None, mode="root",
+                 virtual_loss=1., merge_depth=None):
+        if mode not in ["root", "leaf"]:
+            raise RuntimeError('unknown parallel search mode: %s' % mode)
+        self.policies = policies
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        self.num_workers = num_workers
+        self.mode = mode
+        self.virtual_loss = virtual_loss
+        if merge_depth is None:
+            merge_depth = policies.max_depth
+        self.merge_depth = merge_depth
+
+    def __call__(self, root, iter=100, *args, **kwargs):
+        self.policies.initialize(root)
+        start_time = timeit.default_timer()
+        if self.num_workers <= 1:
+            for i in xrange(iter):
+                self.policies.explore(root)
+            path = self.policies.extract(root)
+        elif self.mode == "root":
+            path = self._rootParallel(root, iter)
+        else:
+            path = self._leafParallel(root, iter)
+
+        elapsed = timeit.default_timer() - start_time
+        return elapsed, path
+
+    def _leafParallel(self, root, iterations):
+        lock = threading.Lock()
+        max_depth = self.policies.max_depth
+        pool = ThreadPool(self.num_workers)
+        try:
+            pool.map(lambda i: self.policies.select(root,
+                                                    max_depth,
+                                                    True,
+                                                    lock,
+                                                    self.virtual_loss),
+                     xrange(iterations))
+        finally:
+            pool.close()
+            pool.join()
+        return self.policies.extract(root)
+
+    def _rootParallel(self, root, iterations):
+        global _root_parallel_job
+
+        # split iterations as evenly as possible among the workers
+        base, extra = divmod(iterations, self.num_workers)
+        seeds = np.random.randint(2**31 - 1, size=self.num_workers)
+        jobs = [(seed, base + (1 if i < extra else 0))
+                for i, seed in enumerate(seeds)]
+
+        _root_parallel_job = (self.policies, root, self.merge_depth)
+        pool = multiprocessing.Pool(self.num_workers)
+        try:
+            summaries = pool.map(_root_parallel_worker, jobs)
+        finally:
+            pool.close()
+            pool.join()
+            _root_parallel_job = None
+
+        for summary in summaries:
+            self._addStats(root, summary)
+
+        # Follow the merged tree down. Only nodes along the path we actually
+        # return are instantiated here; everything else stays as statistics.
+        path = [root]
+        node = root
+        pending = self._mergeChildren(root, summaries)
+        while not node.terminal and len(node.children) > 0:
+            best = self.policies.extract(node)
+            if len(best) < 2 or best[1].n_visits == 0:
+                break
+            child = best[1]
+            self.policies.instantiate(node, child)
+            path.append(child)
+            node = child
+            pending = self._mergeChildren(child, pending.get(child, []))
+
+        return path
+
+    def _addStats(self, node, summary):
+        key, n_visits, total, max_reward, max_final, children = summary
+        node.n_visits += n_visits
+        node.total_reward += total
+        node.max_reward = max(node.max_reward, max_reward)
+        node.max_final_reward = max(node.max_final_reward, max_final)
+        if node.n_visits > 0:
+            node.avg_reward = node.total_reward / node.n_visits
+
+    def _mergeChildren(self, node, summaries):
+        '''
+        Add statistics from the worker trees to the children of a node in our
+        tree. Children that only the workers created (e.g. via progressive
+        widening) are recreated here with the sampler's getOption().
+
+        Returns a dictionary from each child to the summaries of its own
+        subtrees, so that we can continue merging further down.
+        '''
+        children = dict(zip(_keys(node.children), node.children))
+
+        pending = {}
+        for summary in summaries:
+            for child_summary in summary[5]:
+                key = child_summary[0]
+                if key not in children:
+                    child = self._createChild(node, key)
+                    if child is None:
+                        continue
+                    node.children.append(child)
+                    children[key] = child
+                child = children[key]
+                self._addStats(child, child_summary)
+                pending.setdefault(child, []).append(child_summary)
+        return pending
+
+    def _createChild(self, node, key):
+        tag, idx, count = key
+        if self.policies.sample is None or idx is None:
+            return None
+        try:
+            action = self.policies.sample.getOption(node, idx)
+        except NotImplementedError:
+            return None
+        if action is None:
+            return None
+        return Node(action=action)
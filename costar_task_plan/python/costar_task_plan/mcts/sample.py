@@ -137,6 +137,48 @@ class ContinuousTaskSample(AbstractSample):
         return "single"
 
 
+class BatchSample(AbstractSample):
+
+    '''
+    Draw actions from another sampler in batches and hand them out one at a
+    time as progressive widening adds children. Unused actions are kept with
+    the node until it widens again.
+
+    Parameters:
+    -----------
+    sampler: sampler to draw from; should implement sampleBatch()
+    batch_size: number of actions to draw at once
+    '''
+
+    def __init__(self, sampler, batch_size=8):
+        self.sampler = sampler
+        self.batch_size = batch_size
+
+    def _sample(self, node):
+        if len(node.candidates) == 0:
+            batch = self.sampler.sampleBatch(node, self.batch_size)
+            node.candidates = [action for action in reversed(batch)
+                               if action is not None]
+            if len(node.candidates) == 0:
+                return None
+        return node.candidates.pop()
+
+    def sampleBatch(self, node, n):
+        return self.sampler.sampleBatch(node, n)
+
+    def getOption(self, node, idx):
+        return self.sampler.getOption(node, idx)
+
+    def numOptions(self):
+        return self.sampler.numOptions()
+
+    def getPolicies(self, node):
+        return self.sampler.getPolicies(node)
+
+    def getName(self):
+        return "batch" + self.sampler.getName()
+
+
 class ActionSample(AbstractSample):
 
     '''
@@ -1,4 +1,3 @@
-
 from abstract import *
 
 '''
@@ -17,6 +16,14 @@ class Ucb1Score(AbstractScore):
         else:
             return child.avg_reward + self.c * np.sqrt(np.log(parent.n_visits) / child.n_visits)
 
+    def batch(self, parent):
+        visits, avg_reward, prior = parent.childStats()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = avg_reward + self.c * \
+                np.sqrt(np.log(parent.n_visits) / visits)
+        score[visits == 0] = float('inf')
+        return score
+
 '''
 This is the "AlphaGo" score.
 '''
@@ -29,3 +36,7 @@ class PriorProbabilityScore(AbstractScore):
 
     def __call__(self, parent, child):
         return child.avg_reward + self.c * child.prior / (1 + child.n_visits)
+
+    def batch(self, parent):
+        visits, avg_reward, prior = parent.childStats()
+        return avg_reward + self.c * prior / (1 + visits)
@@ -62,21 +62,62 @@ class MonteCarloTreeSearch(AbstractSearch):
     '''
     The "default" method for performing a search. Runs a certain number of
     iterations according to the full set of policies provided.
+
+    The search can also be run as an anytime algorithm: given a time budget
+    (in seconds) it keeps exploring until the deadline, and then returns the
+    best path found so far. Pass iter=None to only stop at the deadline.
+
+    When replanning after executing part of a plan, use advance() to keep the
+    subtree below the executed action instead of starting from scratch.
     '''
 
-    def __init__(self, policies):
+    def __init__(self, policies, time_budget=None):
         self.policies = policies
+        self.time_budget = time_budget
+        # iterations run during the last call
+        self.iterations = 0
+
+    def __call__(self, root, iter=100, time_budget=None, *args, **kwargs):
+        if time_budget is None:
+            time_budget = self.time_budget
+        if iter is None and time_budget is None:
+            raise RuntimeError('need a number of iterations or a time budget')
 
-    def __call__(self, root, iter=100, *args, **kwargs):
         self.policies.initialize(root)
         start_time = timeit.default_timer()
-        for i in xrange(iter):
+        if time_budget is not None:
+            deadline = start_time + time_budget
+        else:
+            deadline = float('inf')
+
+        self.iterations = 0
+        while iter is None or self.iterations < iter:
+            if self.iterations > 0 and timeit.default_timer() >= deadline:
+                break
             self.policies.explore(root)
+            self.iterations += 1
         path = self.policies.extract(root)
 
         elapsed = timeit.default_timer() - start_time
         return elapsed, path
 
+    def advance(self, root, child):
+        '''
+        Make a child of the root (e.g. path[1] of the plan we just executed)
+        the root of the next search. Everything below it is kept, so the next
+        call starts with all the statistics gathered for that subtree.
+
+        Returns the new root and a count of the visits and nodes that were
+        kept.
+        '''
+        if child not in root.children:
+            raise RuntimeError('can only advance to a child of the root')
+        if not child.initialized:
+            self.policies.instantiate(root, child)
+        saved = {"visits": child.n_visits, "nodes": child.size()}
+        child.makeRoot()
+        return child, saved
+
 
 class RandomSearch(AbstractSearch):
 
@@ -0,0 +1,191 @@
+# By Chris Paxton
+# (c) 2017 The Johns Hopkins University
+# See License for more details
+
+import threading
+
+import numpy as np
+
+from collections import OrderedDict
+
+'''
+Transposition table for MCTS.
+
+Many different orderings of the same options end up in the same world state:
+for example, grasping block A and then block B versus grasping B and then A.
+The table lets the search notice this:
+  - transitions (world state, option) are cached, so applying an option we
+    have already simulated from an equivalent state does not fork and tick
+    the world again;
+  - nodes with the same tag and world state share their value estimate.
+
+World states are compared through a canonical key. By default this is the
+state vector (rounded) and predicates of every actor, so two worlds only match
+if all actors are in the same state. LearnerStateKey only looks at the
+learner and is cheaper; use it for worlds with a single actor.
+'''
+
+
+def _ActorStateKey(state, decimals):
+    arr = np.round(np.asarray(state.toArray(), dtype=float), decimals)
+    return (arr.tostring(), tuple(state.predicates))
+
+
+def WorldStateKey(world, decimals=6):
+    '''
+    Default canonical key for a world: the state of every actor, rounded to a
+    fixed number of decimals, plus each actor's predicates.
+    '''
+    return tuple(_ActorStateKey(actor.state, decimals)
+                 for actor in world.actors)
+
+
+def LearnerStateKey(world, decimals=6):
+    '''
+    Canonical key for a world with a single actor: the learner's state,
+    rounded to a fixed number of decimals, plus the learner's predicates.
+    Other actors are ignored, so do not use this if they can move.
+    '''
+    return _ActorStateKey(world.actors[0].state, decimals)
+
+
+class TranspositionEntry(object):
+
+    '''
+    Everything needed to instantiate a node without simulating it, plus the
+    value statistics shared by all nodes that reach this state.
+    '''
+
+    def __init__(self, node):
+        self.world = node.world
+        self.state = node.state
+        self.terminal = node.terminal
+        self.rewards = list(node.rewards)
+        self.reward = node.reward
+        self.traj = list(node.traj)
+        self.world_key = node.world_key
+        self.n_visits = 0
+        self.total_reward = 0.
+
+    def update(self, reward):
+        self.n_visits += 1
+        self.total_reward += reward
+        return self.total_reward / self.n_visits
+
+
+class TranspositionTable(object):
+
+    '''
+    Opt in by passing one of these to the MCTS policies:
+
+        policies = DefaultTaskMctsPolicies(task,
+            transpositions=TranspositionTable(max_entries=100000))
+
+    Parameters:
+    -----------
+    max_entries: memory cap; the least recently used states are evicted
+                 once there are more than this many
+    key_fn: function computing a hashable canonical key from a world; the
+            default WorldStateKey compares every actor's state
+    '''
+
+    def __init__(self, max_entries=100000, key_fn=WorldStateKey):
+        self.max_entries = max_entries
+        self.key_fn = key_fn
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        # (world key, option) -> node key
+        self.transitions = OrderedDict()
+        # (tag, world key) -> TranspositionEntry
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def worldKey(self, node):
+        '''
+        Canonical key of a node's world. Worlds do not change once a node is
+        instantiated, so we only compute it once.
+        '''
+        if node.world_key is None:
+            node.world_key = self.key_fn(node.world)
+        return node.world_key
+
+    def actionKey(self, child):
+        '''
+        Options from a task model are identified by their tag; otherwise we
+        fall back to the policy object itself.
+        '''
+        if child.action.tag is not None:
+            return child.action.tag
+        return child.action.policy
+
+    def lookup(self, parent, child):
+        '''
+        Find the result of applying the child's option from the parent's
+        state. Returns None if we have not simulated it yet.
+        '''
+        transition = (self.worldKey(parent), self.actionKey(child))
+        with self.lock:
+            node_key = self.transitions.get(transition, None)
+            entry = None
+            if node_key is not None:
+                entry = self.entries.get(node_key, None)
+            if entry is None:
+                self.misses += 1
+                return transition, None
+            self.hits += 1
+            self._touch(self.transitions, transition)
+            self._touch(self.entries, node_key)
+            return transition, entry
+
+    def insert(self, transition, node):
+        '''
+        Store a freshly simulated node. If an equivalent node exists already,
+        return its entry so that the two share statistics.
+        '''
+        node_key = (node.tag, self.worldKey(node))
+        with self.lock:
+            entry = self.entries.get(node_key, None)
+            if entry is None:
+                entry = TranspositionEntry(node)
+                self.entries[node_key] = entry
+            else:
+                self.shared += 1
+                self._touch(self.entries, node_key)
+            self.transitions[transition] = node_key
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            while len(self.transitions) > self.max_entries:
+                self.transitions.popitem(last=False)
+        return entry
+
+    def _touch(self, table, key):
+        table[key] = table.pop(key)
+
+    def hitRate(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.
+        return float(self.hits) / total
+
+    def stats(self):
+        '''
+        Summary of how much simulation the table saved: hits are forks and
+        ticks we skipped, shared counts nodes that were merged with an
+        equivalent node after being simulated.
+        '''
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hitRate(),
+                "shared": self.shared,
+                "evictions": self.evictions,
+                "entries": len(self.entries)}
@@ -1,9 +1,11 @@
 from demo import *
 from environment import *
+from geometry import *
 from nm_file import *
 from utils import *
 
 # TTS API
 from world import *
 from dynamics import *
+from rollout import *
 from actor import *
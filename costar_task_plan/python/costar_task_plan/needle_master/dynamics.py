@@ -1,5 +1,6 @@
 from costar_task_plan.abstract import AbstractDynamics
 from actor import *
+from rollout import RolloutPrimitives
 
 class NeedleMasterDynamics(AbstractDynamics):
     
@@ -30,3 +31,10 @@ class NeedleDynamics(AbstractTrajectoryDynamics):
     next_state = super(NeedleDynamics,self).apply(state, action)
 
     return NeedleTrajectory(next_state.traj)
+
+  '''
+  Roll out many NeedleAction parameter vectors from the end of a trajectory
+  at once, as (batch, T, 3) states and the number of steps of each action.
+  '''
+  def applyBatch(self, state, params, primitives=3):
+    return RolloutPrimitives(state.end().vec, params, primitives)
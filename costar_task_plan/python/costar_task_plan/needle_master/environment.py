@@ -8,13 +8,7 @@ Created on Thu Oct 08 11:30:52 2015
 import numpy as np
 from matplotlib.collections import PatchCollection
 from matplotlib.patches import Polygon
-try:
-  import sympy
-except ImportError, e:
-  print "NeedleMaster requires sympy."
-  print "Try to install it with:"
-  print "\tpip install sympy"
-  raise e
+from geometry import NumericPolygon
 
 
 def SafeLoadLine(name, handle):
@@ -54,10 +48,24 @@ class Environment:
         for gate in self.gates:
             gate.Draw()
 
+    '''
+    Which points of a demonstration are inside each gate, as an array of
+    shape (number of gates, number of points).
+    '''
+
     def InGate(self, demo):
-        for gate in self.gates:
-            print gate.Contains(demo)
-        return False
+        return np.array([gate.ContainsPoints(demo.s) for gate in self.gates],
+                        dtype=bool).reshape(len(self.gates), len(demo.s))
+
+    '''
+    Which segments of a demonstration touch each surface, as an array of
+    shape (number of surfaces, number of points - 1).
+    '''
+
+    def OnSurface(self, demo):
+        return np.array([surface.IntersectsPath(demo.s)
+                         for surface in self.surfaces],
+                        dtype=bool).reshape(len(self.surfaces), len(demo.s) - 1)
 
     '''
     Load an environment file.
@@ -110,13 +118,23 @@ class Gate:
         self.env_width = env_width
         self.env_height = env_height
 
-    def Contains(self, demo):
-        # print demo.s.shape
-        # print [x for x in demo.s]
-        return [self.box.encloses_point(sympy.Point(x[:2])) for x in demo.s]  # , self.box.distance(sympy.Point(x[:2]))] for x in demo.s]
+    '''
+    Whether each state of a trajectory, e.g. demo.s, is inside the gate.
+    '''
+
+    def ContainsPoints(self, s):
+        return self.box.ContainsPoints(s)
 
     def Contains(self, state):
-        return self.box.encloses_point(state.vec[:2])
+        return self.box.Contains(state.vec[:2])
+
+    '''
+    Whether each segment of a trajectory touches the top or bottom of the
+    gate.
+    '''
+
+    def HitsEdges(self, s):
+        return self.top_box.IntersectsPath(s) | self.bottom_box.IntersectsPath(s)
 
     def Features(self, demo):
         return False
@@ -187,12 +205,9 @@ class Gate:
         # compute gate height and width
 
         # compute other things like polygon
-        p1, p2, p3, p4 = [x[:2] for x in self.corners]
-        self.box = sympy.Polygon(p1, p2, p3, p4)
-        p1, p2, p3, p4 = [x[:2] for x in self.top]
-        self.top_box = sympy.Polygon(p1, p2, p3, p4)
-        p1, p2, p3, p4 = [x[:2] for x in self.bottom]
-        self.bottom_box = sympy.Polygon(p1, p2, p3, p4)
+        self.box = NumericPolygon(self.corners)
+        self.top_box = NumericPolygon(self.top)
+        self.bottom_box = NumericPolygon(self.bottom)
 
 
 class Surface:
@@ -230,4 +245,18 @@ class Surface:
         else:
             self.color = [207. / 255, 69. / 255, 32. / 255]
 
-        self.poly = sympy.Polygon(*[x[:2] for x in self.corners])
+        self.poly = NumericPolygon(self.corners)
+
+    '''
+    Whether each state of a trajectory is inside the surface.
+    '''
+
+    def ContainsPoints(self, s):
+        return self.poly.ContainsPoints(s)
+
+    '''
+    Whether each segment of a trajectory touches the surface.
+    '''
+
+    def IntersectsPath(self, s):
+        return self.poly.IntersectsPath(s)
@@ -0,0 +1,128 @@
+'''
+Numeric 2D geometry for Needle Master gates and surfaces.
+
+Polygons are stored as arrays of edges, so testing every point or segment of
+a trajectory against a polygon is a handful of numpy operations instead of
+one sympy call per point. Points exactly on an edge do not count as inside,
+the same as sympy's Polygon.encloses_point.
+'''
+
+import numpy as np
+
+
+def Cross(o, a, b):
+    '''
+    z component of (a - o) x (b - o), broadcasting over leading dimensions.
+    '''
+    return ((a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1])
+            - (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0]))
+
+
+def OnSegment(p, a, b, tol=1e-9):
+    '''
+    Whether points p lie on the segments from a to b.
+    '''
+    scale = np.maximum(np.abs(b - a).max(axis=-1), 1.)
+    collinear = np.abs(Cross(a, b, p)) <= tol * scale * scale
+    inside = ((p[..., 0] >= np.minimum(a[..., 0], b[..., 0]) - tol * scale)
+              & (p[..., 0] <= np.maximum(a[..., 0], b[..., 0]) + tol * scale)
+              & (p[..., 1] >= np.minimum(a[..., 1], b[..., 1]) - tol * scale)
+              & (p[..., 1] <= np.maximum(a[..., 1], b[..., 1]) + tol * scale))
+    return collinear & inside
+
+
+def SegmentsIntersect(p1, p2, q1, q2, tol=1e-9):
+    '''
+    Whether segments p1-p2 and q1-q2 touch or cross, broadcasting over
+    leading dimensions.
+    '''
+    d1 = Cross(q1, q2, p1)
+    d2 = Cross(q1, q2, p2)
+    d3 = Cross(p1, p2, q1)
+    d4 = Cross(p1, p2, q2)
+    proper = (((d1 > 0) & (d2 < 0)) | ((d1 < 0) & (d2 > 0))) \
+        & (((d3 > 0) & (d4 < 0)) | ((d3 < 0) & (d4 > 0)))
+    return (proper
+            | OnSegment(p1, q1, q2, tol) | OnSegment(p2, q1, q2, tol)
+            | OnSegment(q1, p1, p2, tol) | OnSegment(q2, p1, p2, tol))
+
+
+class NumericPolygon:
+    '''
+    A polygon as arrays of its edges, with tests for many points or segments
+    at once.
+    '''
+
+    def __init__(self, corners):
+        self.corners = np.array(corners, dtype=float)[:, :2]
+        self.starts = self.corners
+        self.ends = np.roll(self.corners, -1, axis=0)
+        self.min = np.min(self.corners, axis=0)
+        self.max = np.max(self.corners, axis=0)
+
+    '''
+    Whether a single (x, y) point is inside the polygon.
+    '''
+
+    def Contains(self, point):
+        return bool(self.ContainsPoints(np.asarray(point)[None, :2])[0])
+
+    '''
+    Whether each row of an (N, 2) array of points is inside the polygon,
+    using the even-odd rule. Extra columns (e.g. the angle of a state) are
+    ignored.
+    '''
+
+    def ContainsPoints(self, points):
+        points = np.asarray(points, dtype=float)[:, :2]
+        inside = np.zeros(points.shape[0], dtype=bool)
+        idx = np.nonzero(np.all((points >= self.min) & (points <= self.max),
+                                axis=1))[0]
+        if len(idx) == 0:
+            return inside
+
+        p = points[idx, None, :]
+        a = self.starts[None]
+        b = self.ends[None]
+        # edges that straddle the horizontal line through each point
+        straddle = (a[..., 1] > p[..., 1]) != (b[..., 1] > p[..., 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # x where each edge meets that line; nan for horizontal edges,
+            # which never straddle it
+            x = a[..., 0] + (p[..., 1] - a[..., 1]) \
+                * (b[..., 0] - a[..., 0]) / (b[..., 1] - a[..., 1])
+            crossings = np.sum(straddle & (p[..., 0] < x), axis=1)
+        on_edge = np.any(OnSegment(p, a, b), axis=1)
+        inside[idx] = (crossings % 2 == 1) & ~on_edge
+        return inside
+
+    '''
+    Whether each segment between consecutive rows of an (N, 2) array of
+    points touches the polygon: it crosses an edge or lies inside. Returns
+    N-1 values.
+    '''
+
+    def IntersectsPath(self, points):
+        points = np.asarray(points, dtype=float)[:, :2]
+        return self.IntersectsSegments(points[:-1], points[1:])
+
+    '''
+    Whether each segment from a row of p1 to the same row of p2, both
+    (N, 2) arrays, touches the polygon.
+    '''
+
+    def IntersectsSegments(self, p1, p2):
+        p1 = np.asarray(p1, dtype=float)[:, :2]
+        p2 = np.asarray(p2, dtype=float)[:, :2]
+        hits = np.zeros(p1.shape[0], dtype=bool)
+        # skip segments whose bounding box misses the polygon's
+        idx = np.nonzero(np.all(np.minimum(p1, p2) <= self.max, axis=1)
+                         & np.all(np.maximum(p1, p2) >= self.min, axis=1))[0]
+        if len(idx) == 0:
+            return hits
+
+        crosses = np.any(SegmentsIntersect(
+            p1[idx, None], p2[idx, None], self.starts[None], self.ends[None]),
+            axis=1)
+        hits[idx] = crosses | self.ContainsPoints(p1[idx])
+        return hits
@@ -0,0 +1,119 @@
+'''
+Batched needle rollouts.
+
+NeedleDynamics steps one NeedleControl at a time and builds a NeedleState
+for every point. These functions integrate many NeedleAction parameter
+vectors at once: each one is expanded into a (T, 2) array of (v, dw)
+controls, padded with zero controls to the longest action, and the needle
+states follow from cumulative sums over the whole (batch, T) array. Zero
+controls leave the needle where it is, so the padded tail of a shorter
+rollout repeats its last state and does not change any gate or surface
+check.
+'''
+
+import collections
+
+import numpy as np
+
+'''
+Conditions of a batch of rollouts:
+- in_gate: (batch, number of gates), some state of the rollout is in the gate
+- hit_gate_edge: (batch, number of gates), the needle touched the top or
+  bottom of the gate
+- on_surface: (batch, number of surfaces), the needle touched the surface
+'''
+RolloutConditions = collections.namedtuple(
+    'RolloutConditions', 'in_gate hit_gate_edge on_surface')
+
+
+def PrimitivesToControls(params, primitives=3):
+    '''
+    Expand NeedleAction parameters into controls.
+
+    params: (batch, 3 * primitives) array; every primitive is (v, dw, t) and
+            runs for int(t) steps, as in NeedleAction._finalize
+
+    Returns (controls, lengths): (batch, T, 2) array of (v, dw), zero after
+    the end of each action, and the number of steps of each action.
+    '''
+    params = np.atleast_2d(np.asarray(params, dtype=float))
+    params = params[:, :3 * primitives].reshape(-1, primitives, 3)
+    steps = np.maximum(params[:, :, 2].astype(int), 0)
+    ends = np.cumsum(steps, axis=1)
+    lengths = ends[:, -1]
+
+    t = np.arange(np.max(lengths) if len(lengths) else 0)
+    # primitive that each step belongs to
+    primitive = np.sum(ends[:, :, None] <= t[None, None, :], axis=1)
+    active = t[None, :] < lengths[:, None]
+    primitive = np.minimum(primitive, primitives - 1)
+
+    rows = np.arange(params.shape[0])[:, None]
+    controls = params[rows, primitive, :2] * active[:, :, None]
+    return controls, lengths
+
+
+def RolloutControls(start, controls):
+    '''
+    Apply (batch, T, 2) controls to the needle from a start state (x, y, w),
+    the same as NeedleControlDynamics one step at a time.
+
+    Returns a (batch, T, 3) array of the states after each control.
+    '''
+    start = np.asarray(start, dtype=float)
+    batch = controls.shape[0]
+    v = controls[:, :, 0]
+    dw = controls[:, :, 1]
+
+    def Integrate(x0, dx):
+        # start the sum at x0 so every step rounds like x = x + dx
+        first = np.full((batch, 1), x0)
+        return np.cumsum(np.concatenate([first, dx], axis=1), axis=1)[:, 1:]
+
+    w = Integrate(start[2], dw)
+    x = Integrate(start[0], v * np.cos(w))
+    y = Integrate(start[1], v * np.sin(w))
+    return np.stack([x, y, w], axis=-1)
+
+
+def RolloutPrimitives(start, params, primitives=3):
+    '''
+    Roll out many NeedleAction parameter vectors from one start state.
+
+    Returns (states, lengths): the (batch, T, 3) states and the number of
+    steps of each action.
+    '''
+    controls, lengths = PrimitivesToControls(params, primitives)
+    return RolloutControls(start, controls), lengths
+
+
+def EvaluateRollouts(env, start, states):
+    '''
+    Check the gates and surfaces of an Environment against a batch of
+    rollouts from RolloutPrimitives, all at once.
+
+    Returns RolloutConditions.
+    '''
+    batch, steps = states.shape[:2]
+    start = np.asarray(start, dtype=float)[:3]
+    points = states.reshape(-1, 3)
+    # segments from the start to the first state, and between states
+    path = np.concatenate([np.tile(start, (batch, 1, 1)), states], axis=1)
+    p1 = path[:, :-1].reshape(-1, 3)
+    p2 = path[:, 1:].reshape(-1, 3)
+
+    def PerRollout(hits):
+        return np.any(hits.reshape(batch, steps), axis=1)
+
+    in_gate = [PerRollout(gate.ContainsPoints(points)) for gate in env.gates]
+    hit_gate_edge = [PerRollout(gate.top_box.IntersectsSegments(p1, p2)
+                                | gate.bottom_box.IntersectsSegments(p1, p2))
+                     for gate in env.gates]
+    on_surface = [PerRollout(surface.poly.IntersectsSegments(p1, p2))
+                  for surface in env.surfaces]
+
+    def Stack(values):
+        return np.array(values, dtype=bool).reshape(-1, batch).T
+
+    return RolloutConditions(Stack(in_gate), Stack(hit_gate_edge),
+                             Stack(on_surface))
@@ -294,7 +294,7 @@ class CostarWorld(AbstractWorld):
                 self.observation[obj] = None
 
         # Update 
-        for actor in self.actors:
+        for actor in self.ownActors():
             actor.state = actor.getState()
             actor.state.t = rospy.Time.now().to_sec()
 
@@ -14,6 +14,10 @@ from dmp_utils import LoadDataDMP
 from dmp_utils import ParamFromDMP
 from dmp_utils import ParamToDMP
 from dmp_utils import SearchDMP
+from dmp_rollout import RolloutDMPs
+from dmp_rollout import DMPRollout
+from dmp_rollout import DMPRolloutPool
+from dmp_rollout import CrossEntropySearch
 
 " File loading utilities "
 from file_utils import LoadData
@@ -35,6 +39,9 @@ from skill import RobotSkill
 
 " gmm tools "
 from gmm import GMM
+from gmm_score import MixtureFactors
+from gmm_score import MixtureLogLikelihood
+from gmm_score import MixtureLogLikelihoods
 
 # =============================================================================
 # Skill models used in updated version of the planning system
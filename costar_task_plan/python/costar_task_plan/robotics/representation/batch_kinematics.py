@@ -0,0 +1,265 @@
+# By Chris Paxton
+# (c) 2017 The Johns Hopkins University
+# See License for more details
+
+'''
+Batched forward kinematics and relative pose features.
+
+RobotFeatures used to run forward kinematics and compute object-relative
+features one waypoint at a time, going through PyKDL frames for every
+object. The functions here work on whole trajectories at once: poses are
+(N, 4, 4) homogeneous transforms, and a serial KDL chain is turned into
+arrays of joint axes and fixed transforms so that the pose of every
+waypoint comes out of a handful of numpy operations per segment.
+'''
+
+import numpy as np
+
+REVOLUTE = 'revolute'
+PRISMATIC = 'prismatic'
+FIXED = 'fixed'
+
+
+def KdlFrameToMatrix(frame):
+    '''
+    Convert a PyKDL frame to a 4x4 homogeneous transform.
+    '''
+    mat = np.eye(4)
+    for i in range(3):
+        for j in range(3):
+            mat[i, j] = frame.M[i, j]
+        mat[i, 3] = frame.p[i]
+    return mat
+
+
+def FramesToArray(frames):
+    '''
+    Convert a PyKDL frame, a list of frames, or an array of transforms to an
+    array of 4x4 transforms: (4, 4) for a single frame, (N, 4, 4) otherwise.
+    '''
+    if isinstance(frames, np.ndarray):
+        return frames
+    if isinstance(frames, (list, tuple)):
+        if len(frames) == 0:
+            return np.zeros((0, 4, 4))
+        return np.array([FramesToArray(frame) for frame in frames])
+    return KdlFrameToMatrix(frames)
+
+
+def InvertTransforms(mats):
+    '''
+    Invert rigid transforms of shape (..., 4, 4).
+    '''
+    inv = np.zeros(mats.shape)
+    rot_t = np.swapaxes(mats[..., :3, :3], -1, -2)
+    inv[..., :3, :3] = rot_t
+    inv[..., :3, 3] = -np.einsum('...ij,...j->...i', rot_t, mats[..., :3, 3])
+    inv[..., 3, 3] = 1.
+    return inv
+
+
+def QuaternionsFromRotations(rot):
+    '''
+    Quaternions (x, y, z, w) of (N, 3, 3) rotation matrices, using the same
+    branches as PyKDL Rotation.GetQuaternion.
+    '''
+    n = rot.shape[0]
+    quat = np.empty((n, 4))
+    trace = rot[:, 0, 0] + rot[:, 1, 1] + rot[:, 2, 2]
+
+    # the usual case, well away from a half turn
+    idx = trace > 1e-12
+    if np.any(idx):
+        r = rot[idx]
+        s = 0.5 / np.sqrt(trace[idx] + 1.0)
+        quat[idx, 3] = 0.25 / s
+        quat[idx, 0] = (r[:, 2, 1] - r[:, 1, 2]) * s
+        quat[idx, 1] = (r[:, 0, 2] - r[:, 2, 0]) * s
+        quat[idx, 2] = (r[:, 1, 0] - r[:, 0, 1]) * s
+
+    # otherwise start from the largest diagonal element
+    rest = ~idx
+    d0 = rot[:, 0, 0]
+    d1 = rot[:, 1, 1]
+    d2 = rot[:, 2, 2]
+    for axis, sel in enumerate([
+            rest & (d0 > d1) & (d0 > d2),
+            rest & ~((d0 > d1) & (d0 > d2)) & (d1 > d2),
+            rest & ~((d0 > d1) & (d0 > d2)) & ~(d1 > d2)]):
+        if not np.any(sel):
+            continue
+        r = rot[sel]
+        i, j, k = [(0, 1, 2), (1, 2, 0), (2, 0, 1)][axis]
+        s = 2.0 * np.sqrt(1.0 + r[:, i, i] - r[:, j, j] - r[:, k, k])
+        quat[sel, 3] = (r[:, k, j] - r[:, j, k]) / s
+        quat[sel, i] = 0.25 * s
+        quat[sel, j] = (r[:, i, j] + r[:, j, i]) / s
+        quat[sel, k] = (r[:, i, k] + r[:, k, i]) / s
+    return quat
+
+
+def RelativePoseFeatures(ee, obj):
+    '''
+    Features of end effector poses relative to an object, the same values
+    RobotFeatures.GetFeatures computes from obj.Inverse() * ee:
+    position (3), distance (1) and quaternion x, y, z, w (4).
+
+    Parameters:
+    -----------
+    ee: (..., N, 4, 4) end effector poses
+    obj: (4, 4) object pose, or (N, 4, 4) with one pose per end effector pose
+
+    Returns:
+    --------
+    (..., N, 8) array of features
+    '''
+    if obj.ndim == 2:
+        offset = PreMultiply(InvertTransforms(obj), ee)
+    else:
+        offset = np.matmul(InvertTransforms(obj), ee)
+    pos = offset[..., :3, 3]
+    dist = np.sqrt(np.sum(pos * pos, axis=-1))
+    quat = QuaternionsFromRotations(offset[..., :3, :3].reshape(-1, 3, 3))
+    quat = quat.reshape(pos.shape[:-1] + (4,))
+    return np.concatenate([pos, dist[..., None], quat], axis=-1)
+
+
+class ChainKinematics(object):
+    '''
+    Forward kinematics of a serial chain for many joint positions at once.
+
+    Each segment is a tuple (joint type, axis, origin, tip): revolute joints
+    rotate around the axis through the origin, prismatic joints translate
+    along the axis, and tip is the 4x4 pose of the segment's end when its
+    joint is at zero.
+    '''
+
+    def __init__(self, segments):
+        self.segments = []
+        self.dof = 0
+        for joint_type, axis, origin, tip in segments:
+            if joint_type != FIXED:
+                axis = np.asarray(axis, dtype=float)
+                axis = axis / np.linalg.norm(axis)
+                self.dof += 1
+            self.segments.append(
+                (joint_type, axis, np.asarray(origin, dtype=float), np.asarray(tip, dtype=float)))
+
+    @staticmethod
+    def FromKdlChain(chain):
+        '''
+        Read the segments of a PyKDL chain, like the one KDLKinematics builds
+        from the URDF. Joints are assumed to have unit scale and no offset.
+        '''
+        segments = []
+        for i in range(chain.getNrOfSegments()):
+            segment = chain.getSegment(i)
+            joint = segment.getJoint()
+            name = joint.getTypeName()
+            if name.startswith('Rot'):
+                joint_type = REVOLUTE
+            elif name.startswith('Trans'):
+                joint_type = PRISMATIC
+            else:
+                joint_type = FIXED
+            axis = [joint.JointAxis()[k] for k in range(3)]
+            origin = [joint.JointOrigin()[k] for k in range(3)]
+            segments.append((joint_type, axis, origin,
+                             KdlFrameToMatrix(segment.pose(0.))))
+        return ChainKinematics(segments)
+
+    def forward(self, q):
+        '''
+        Poses of the end of the chain for an (N, dof) array of joint
+        positions, as (N, 4, 4).
+        '''
+        q = np.atleast_2d(np.asarray(q, dtype=float))
+        n = q.shape[0]
+        # rotation and position of the pose so far, kept apart so that every
+        # product with a fixed transform is a single matrix product
+        rot = np.tile(np.eye(3), (n, 1, 1))
+        pos = np.zeros((n, 3))
+        joint = 0
+        for joint_type, axis, origin, tip in self.segments:
+            offset = tip[:3, 3]
+            if joint_type == REVOLUTE:
+                # rotate around the axis through the origin:
+                # R(q) = cos(q) I + sin(q) [axis]x + (1 - cos(q)) axis axis^T
+                ct = np.cos(q[:, joint])[:, None, None]
+                st = np.sin(q[:, joint])[:, None, None]
+                pos = pos + _Rotate(rot, origin)
+                rot_axis = _Rotate(rot, axis)
+                rot = (ct * rot + st * _Compose(rot, _Skew(axis))
+                       + (1. - ct) * rot_axis[:, :, None] * axis)
+                offset = offset - origin
+                joint += 1
+            elif joint_type == PRISMATIC:
+                pos = pos + q[:, joint, None] * _Rotate(rot, axis)
+                joint += 1
+            pos = pos + _Rotate(rot, offset)
+            rot = _Compose(rot, tip[:3, :3])
+
+        pose = np.zeros((n, 4, 4))
+        pose[:, :3, :3] = rot
+        pose[:, :3, 3] = pos
+        pose[:, 3, 3] = 1.
+        return pose
+
+
+def _Skew(v):
+    return np.array([[0., -v[2], v[1]], [v[2], 0., -v[0]], [-v[1], v[0], 0.]])
+
+
+def _Rotate(rot, v):
+    '''
+    (N, 3, 3) rotations applied to one vector, as (N, 3).
+    '''
+    return np.dot(rot.reshape(-1, 3), v).reshape(rot.shape[:-1])
+
+
+def _Compose(rot, mat):
+    '''
+    (N, 3, 3) rotations each multiplied on the right by one 3x3 matrix.
+    '''
+    return np.dot(rot.reshape(-1, 3), mat).reshape(rot.shape)
+
+
+def PostMultiply(mats, mat):
+    '''
+    (..., 4, 4) transforms each multiplied on the right by one 4x4 transform.
+    '''
+    return np.dot(mats.reshape(-1, 4), mat).reshape(mats.shape)
+
+
+def PreMultiply(mat, mats):
+    '''
+    One 4x4 transform multiplied on the right by each of (..., 4, 4)
+    transforms.
+    '''
+    out = np.dot(np.swapaxes(mats, -1, -2).reshape(-1, 4), mat.T)
+    return np.swapaxes(out.reshape(mats.shape), -1, -2).copy()
+
+
+class LoopKinematics(object):
+    '''
+    Batched interface for any kinematics object with a forward(q) method that
+    returns a 4x4 transform; computes one pose at a time.
+    '''
+
+    def __init__(self, kinematics):
+        self.kinematics = kinematics
+
+    def forward(self, q):
+        return np.array([np.asarray(self.kinematics.forward(qi))
+                         for qi in np.atleast_2d(q)]).reshape(-1, 4, 4)
+
+
+def GetBatchKinematics(kinematics):
+    '''
+    Batched forward kinematics for a KDLKinematics object, falling back to
+    one call per pose for kinematics that do not expose a KDL chain.
+    '''
+    chain = getattr(kinematics, 'chain', None)
+    if chain is not None and hasattr(chain, 'getNrOfSegments'):
+        return ChainKinematics.FromKdlChain(chain)
+    return LoopKinematics(kinematics)
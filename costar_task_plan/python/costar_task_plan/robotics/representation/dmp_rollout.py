@@ -0,0 +1,297 @@
+# By Chris Paxton
+# (c) 2017 The Johns Hopkins University
+# See License for more details
+
+'''
+In-process batched DMP rollouts.
+
+SearchDMP used to send every sampled parameter vector to the dmp package's
+set_active_dmp and get_dmp_plan services, one round trip per candidate. The
+functions here follow the same equations as the dmp package (Fourier basis
+forcing term, phase with 99% convergence at t=tau) but integrate a whole
+batch of parameter vectors at once as (M, dims) arrays, and need no ROS
+master.
+
+DMPRolloutPool rolls out and scores batches across worker processes, and
+CrossEntropySearch refines the parameter distribution over a few rounds of
+sampling and refitting to the best candidates.
+'''
+
+import multiprocessing
+
+import numpy as np
+
+from batch_kinematics import FramesToArray
+
+# same constants as the dmp package
+PHASE_ALPHA = -np.log(0.01)
+MAX_PLAN_LENGTH = 1000
+
+
+def CalcPhase(t, tau):
+    '''
+    Phase of the canonical system at time t.
+    '''
+    return np.exp(-(PHASE_ALPHA / tau) * t)
+
+
+def FourierBasis(x, num_weights):
+    '''
+    Fourier features cos(pi * i * x) for i = 0..num_weights-1 of a scalar x.
+    '''
+    return np.cos(np.pi * x * np.arange(num_weights))
+
+
+def ParamsToArrays(params, dims=7, num_weights=6):
+    '''
+    Split parameter vectors laid out like ParamFromDMP (goal, then the
+    weights of each dimension) into goals (M, dims) and weights
+    (M, dims, num_weights).
+    '''
+    params = np.atleast_2d(np.asarray(params, dtype=float))
+    goals = params[:, :dims]
+    weights = params[:, dims:dims + dims * num_weights].reshape(
+        -1, dims, num_weights)
+    return goals, weights
+
+
+def RolloutDMPs(goals, weights, k_gains, d_gains, x0, xdot0, t0, goal_thresh,
+                seg_length, tau, dt, integrate_iter):
+    '''
+    Integrate M DMPs that share gains and a start state, like PlanDMP does
+    for one of them.
+
+    Parameters:
+    -----------
+    goals: (M, dims) goals
+    weights: (M, dims, num_weights) forcing term weights
+    k_gains, d_gains: (dims,) spring and damping gains
+    the rest: as for PlanDMP
+
+    Returns:
+    --------
+    (positions, lengths): positions is (M, T, dims), and each DMP's plan is
+    its first lengths[i] points, where PlanDMP would have stopped
+    '''
+    goals = np.atleast_2d(np.asarray(goals, dtype=float))
+    weights = np.asarray(weights, dtype=float)
+    m, dims = goals.shape
+    num_weights = weights.shape[-1]
+    k_gains = np.asarray(k_gains, dtype=float)
+    d_gains = np.asarray(d_gains, dtype=float)
+    x0 = np.asarray(x0, dtype=float)
+    goal_thresh = np.asarray(goal_thresh, dtype=float)
+    check = goal_thresh > 0
+    sub_dt = dt / integrate_iter
+
+    x = np.tile(x0, (m, 1))
+    v = np.tile(np.asarray(xdot0, dtype=float), (m, 1))
+    positions = []
+    lengths = np.zeros(m, dtype=int)
+    active = np.ones(m, dtype=bool)
+    at_goal = np.zeros(m, dtype=bool)
+    t = 0.
+    while np.any(active):
+        s = CalcPhase(t + t0, tau)
+        log_s = (t + t0) / tau
+        if log_s >= 1.0:
+            f_eval = 0.
+        else:
+            f_eval = np.dot(weights.reshape(-1, num_weights),
+                            FourierBasis(log_s, num_weights)).reshape(m, dims) * s
+
+        # the terms of the spring that stay fixed during this step
+        attractor = goals - (goals - x0) * s + f_eval
+        for _ in range(integrate_iter):
+            v_dot = (k_gains * (attractor - x) - d_gains * v) / tau
+            x = x + v * (sub_dt / tau)
+            v = v + v_dot * sub_dt
+
+        positions.append(x)
+        t += dt
+        lengths[active] += 1
+
+        # plan for at least tau seconds, then until the goal threshold is met
+        if t + t0 >= tau:
+            at_goal = np.all(~check | (np.abs(x - goals) <= goal_thresh), axis=1)
+        active &= ((t + t0) < tau) | (~at_goal & (t < seg_length))
+        if t >= MAX_PLAN_LENGTH or (seg_length > 0 and t > seg_length):
+            break
+
+    return np.stack(positions, axis=1), lengths
+
+
+class DMPRollout(object):
+    '''
+    Everything needed to turn parameter vectors into joint trajectories:
+    the gains of the DMP and the arguments PlanDMP would be called with.
+    Plain numpy data, so it can be sent to worker processes.
+    '''
+
+    def __init__(self, k_gains, d_gains, x0, xdot0, t0, goal_thresh,
+                 seg_length, tau, dt, integrate_iter, num_weights=6):
+        self.k_gains = np.asarray(k_gains, dtype=float)
+        self.d_gains = np.asarray(d_gains, dtype=float)
+        self.dims = len(self.k_gains)
+        self.num_weights = num_weights
+        self.x0 = np.asarray(x0, dtype=float)
+        self.xdot0 = np.asarray(xdot0, dtype=float)
+        self.t0 = t0
+        self.goal_thresh = np.asarray(goal_thresh, dtype=float)
+        self.seg_length = seg_length
+        self.tau = tau
+        self.dt = dt
+        self.integrate_iter = integrate_iter
+
+    @staticmethod
+    def FromDMP(dmp, x0, xdot0, t0, goal_thresh, seg_length, tau, dt,
+                integrate_iter, num_weights=6):
+        '''
+        Use the gains of a list of DMPData messages, like the dmp_list of a
+        RequestDMP response.
+        '''
+        return DMPRollout([d.k_gain for d in dmp], [d.d_gain for d in dmp],
+                          x0, xdot0, t0, goal_thresh, seg_length, tau, dt,
+                          integrate_iter, num_weights)
+
+    def trajectories(self, params):
+        '''
+        Joint trajectories for an (M, num_params) array of parameter vectors,
+        as a list of M (N_i, dims) arrays.
+        '''
+        goals, weights = ParamsToArrays(params, self.dims, self.num_weights)
+        if goals.shape[0] == 0:
+            return []
+        positions, lengths = RolloutDMPs(
+            goals, weights, self.k_gains, self.d_gains, self.x0, self.xdot0,
+            self.t0, self.goal_thresh, self.seg_length, self.tau, self.dt,
+            self.integrate_iter)
+        return [traj[:length] for traj, length in zip(positions, lengths)]
+
+
+def ScoreRollouts(robot, rollout, params, world, objs=['link']):
+    '''
+    Roll out parameter vectors and score the trajectories with
+    RobotFeatures.GetTrajectoryLikelihoods.
+
+    Returns:
+    --------
+    (lls, trajs): (M,) log likelihoods and the list of M trajectories
+    '''
+    trajs = rollout.trajectories(params)
+    if len(trajs) == 0:
+        return np.zeros(0), trajs
+    lls = np.array(robot.GetTrajectoryLikelihoods(trajs, world, objs))
+    return lls, trajs
+
+
+# robot features of a pool worker, set when the worker starts
+_worker_robot = None
+
+
+def _InitWorker(robot):
+    global _worker_robot
+    _worker_robot = robot
+
+
+def _ScoreChunk(args):
+    rollout, params, world, objs = args
+    return ScoreRollouts(_worker_robot, rollout, params, world, objs)
+
+
+class DMPRolloutPool(object):
+    '''
+    Rolls out and scores batches of parameter vectors across worker
+    processes. The workers are forked with their own copy of the robot
+    features, so only parameters, object poses and trajectories are sent
+    between processes. With processes=1 everything runs in this process.
+    '''
+
+    def __init__(self, robot, processes=None):
+        self.robot = robot
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+        if processes > 1:
+            self.pool = multiprocessing.Pool(
+                processes, initializer=_InitWorker, initargs=(robot,))
+        else:
+            self.pool = None
+
+    def score(self, rollout, params, world, objs=['link']):
+        '''
+        Roll out and score an (M, num_params) array of parameter vectors.
+
+        Parameters:
+        -----------
+        rollout: DMPRollout
+        world: dictionary of object poses, as PyKDL frames or arrays
+
+        Returns:
+        --------
+        (lls, trajs) as for ScoreRollouts
+        '''
+        params = np.atleast_2d(np.asarray(params, dtype=float))
+        if self.pool is None or params.shape[0] < 2 * self.processes:
+            return ScoreRollouts(self.robot, rollout, params, world, objs)
+
+        # PyKDL frames cannot be sent to the workers, arrays can
+        world = dict((obj, FramesToArray(frame)) for obj, frame in world.items())
+        chunks = np.array_split(params, self.processes)
+        results = self.pool.map(
+            _ScoreChunk, [(rollout, chunk, world, objs) for chunk in chunks])
+        lls = np.concatenate([chunk_lls for chunk_lls, _ in results])
+        trajs = [traj for _, chunk_trajs in results for traj in chunk_trajs]
+        return lls, trajs
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+def CrossEntropySearch(pool, rollout, world, initial_params,
+                       objs=['link'],
+                       iterations=5,
+                       num_samples=1000,
+                       elite_fraction=0.1,
+                       min_variance=1e-6):
+    '''
+    Cross-entropy search over DMP parameters: score a batch of samples, fit
+    a Gaussian to the best elite_fraction of them, sample the next batch
+    from it, and repeat.
+
+    Parameters:
+    -----------
+    pool: DMPRolloutPool used to score each batch
+    rollout: DMPRollout
+    iterations: number of batches to score, at least one
+    initial_params: (M, num_params) first batch, e.g. samples from the
+                    skill's parameter distribution
+    min_variance: added to the diagonal of each refit covariance so the
+                  search does not collapse onto a single sample
+
+    Returns:
+    --------
+    (lls, elite_lls, elite_trajs, elite_params, trajs) of the last batch,
+    the same values SearchDMP returns
+    '''
+    if iterations < 1:
+        raise RuntimeError('cross-entropy search needs at least one '
+                           'iteration, got %d' % iterations)
+    params = np.atleast_2d(np.asarray(initial_params, dtype=float))
+    for i in range(iterations):
+        lls, trajs = pool.score(rollout, params, world, objs)
+        num_elite = max(2, int(np.ceil(elite_fraction * len(lls))))
+        elite = np.argsort(-lls)[:num_elite]
+        if i == iterations - 1:
+            break
+
+        mu = np.mean(params[elite], axis=0)
+        sigma = np.cov(params[elite], rowvar=False)
+        sigma += min_variance * np.eye(len(mu))
+        params = np.random.multivariate_normal(mu, sigma, num_samples)
+
+    return (lls, lls[elite], [trajs[j] for j in elite],
+            params[elite], trajs)
@@ -1,5 +1,6 @@
 " grid "
 from features import LoadRobotFeatures
+from dmp_rollout import DMPRollout, DMPRolloutPool
 
 " ros utils "
 import rospy
@@ -142,54 +143,37 @@ def ParamToDMP(param,dmp,dims=7,num_weights=6):
 
 '''
 SearchDMP
+Sample parameters from Z, roll out every sample in-process and keep the ones
+above the ll_percentile of the trajectory log likelihoods. Pass a
+DMPRolloutPool to score the samples across worker processes.
 '''
 def SearchDMP(Z,robot,world,
         x0,xdot0,t0,threshold,seg_length,tau,dt,int_iter,dmp,
         ll_percentile=90,
         num_weights=6,
-        num_samples=100):
+        num_samples=100,
+        pool=None):
 
     #print "Search iteration:"
-    dmps = Z.sample(100)
+    dmps = Z.sample(num_samples)
 
     assert(len(world.keys())==1)
 
-    #search = MarkerArray()
-    gen_trajs = []
-    gen_params = []
-    lls = []
-    count = 1
-    for i in range(100):
-        dmp2 = copy.deepcopy(dmp)
-        (goal,dmp2) = ParamToDMP(dmps[i],dmp,num_weights=num_weights)
-
-        RequestActiveDMP(dmp2)
-        plan = PlanDMP(x0,xdot0,t0,goal,threshold,seg_length,tau,dt,int_iter)
-
-        #ll = robot.GetTrajectoryLikelihood(plan.plan.points,world)
-        #print ll
-
-        traj = [pt.positions[:7] for pt in plan.plan.points]
-        ll = robot.GetTrajectoryLikelihood(traj,world,objs=['link'])
-        #ll = robot.GetTrajectoryLikelihood(traj,world,(10,17))
-        #ll = robot.GetTrajectoryLikelihood(traj,world,(3,3+(7*len(world.keys()))))
-
-        lls.append(ll)
-
-        gen_trajs.append(traj)
-        gen_params.append(ParamFromDMP(goal,dmp2))
+    rollout = DMPRollout.FromDMP(dmp,x0,xdot0,t0,threshold,seg_length,tau,dt,
+            int_iter,num_weights=num_weights)
+    if pool is None:
+        pool = DMPRolloutPool(robot,processes=1)
+    lls,gen_trajs = pool.score(rollout,dmps,world,objs=['link'])
+    gen_params = np.atleast_2d(dmps)
 
     search_lls = []
     search_trajs = []
     search_params = []
 
-    #print "... done with DMPs."
-
-    search_params = []
-    ll_threshold = np.percentile(lls,90)
+    ll_threshold = np.percentile(lls,ll_percentile)
     for (ll,param,traj) in zip(lls,gen_params,gen_trajs):
         if ll > ll_threshold:
-            search_params.append(param)
+            search_params.append(list(param))
             search_trajs.append(traj)
             search_lls.append(ll)
 
@@ -198,4 +182,3 @@ def SearchDMP(Z,robot,world,
     print "    Found %d with p>%f."%(len(search_params),ll_threshold)
 
     return lls,search_lls,search_trajs,search_params,gen_trajs
-
@@ -27,7 +27,15 @@ import tf
 import tf_conversions.posemath as pm
 
 # for fast feature computation
-from numba import jit
+from batch_kinematics import FramesToArray
+from batch_kinematics import GetBatchKinematics
+from batch_kinematics import KdlFrameToMatrix
+from batch_kinematics import PostMultiply
+from batch_kinematics import PreMultiply
+from batch_kinematics import RelativePoseFeatures
+from gmm_score import LogSumExp
+from gmm_score import MixtureFactors
+from gmm_score import MixtureLogLikelihood
 
 # input message types 
 import sensor_msgs
@@ -49,22 +57,19 @@ NUM_GRIPPER_VARS = 1
 NUM_GRIPPER_DIFF_VARS = 0
 NUM_TIME_VARS = 1
 
-@jit
 def P_Gauss(x,mu,inv,det,wts):
     '''
     P_Gauss
-    Compute the Gaussian probability of something
+    Compute the log probability of each row of x under a Gaussian mixture,
+    given the inverse and determinant of every component's covariance
     '''
 
     nvar = mu.shape[1]
-    p = np.zeros(x.shape[0])
+    diff = x[None,:,:] - mu[:,None,:]
+    res = -0.5 * np.einsum('kni,kij,knj->kn',diff,np.asarray(inv),diff)
+    norm = np.log(wts) - 0.5*np.log((2*np.pi)**nvar * np.abs(np.asarray(det)))
 
-    for i in range(wts.shape[0]):
-        res = (x - mu).dot(inv[0]) * (x - mu)
-        res = -0.5 * np.sum(res,axis=1)
-        p += wts[i] * np.exp(res) / (np.sqrt((2*np.pi)**nvar * np.abs(det[i])))
-
-    return np.log(p)
+    return LogSumExp(res + norm[:,None],axis=0)
 
 class RobotFeatures:
     '''
@@ -102,6 +107,8 @@ class RobotFeatures:
           self.kinematics = KDLKinematics(robot, base_link, end_link)
         else:
           self.kinematics = kinematics
+        # forward kinematics for whole trajectories, created when first used
+        self.batch_kinematics = None
           
         self.objects = objects
         self.world = {}
@@ -125,12 +132,9 @@ class RobotFeatures:
         self.manip_obj = None
         self.manip_frame = None
 
-        self.action_inv = []
-        self.goal_inv = []
-        self.action_det = []
-        self.goal_det = []
-        self.action_pdf = []
-        self.goal_pdf = []
+        # gmm_score factors of the action and goal models
+        self.action_factors = None
+        self.goal_factors = None
         self.action_mean = None
         self.action_std = None
         self.goal_mean = None
@@ -167,39 +171,24 @@ class RobotFeatures:
             self.gripper_cmds = data['gripper_cmds']
 
     def ConfigureSkill(self,action,goal):
+        '''
+        Set the action and goal models (GMMs with full covariances) and
+        precompute the factors used to score features under them.
+        '''
 
-        self.action_inv = np.zeros(action.covars_.shape)
-
-        self.action_def = []
-        self.goal_det = []
-
-        #self.action_pdf = mvn(mean=action.means_[0],cov=action.covars_[0])
-        #self.goal_pdf = mvn(mean=goal.means_[0],cov=goal.covars_[0])
-
-        for i in range(action.n_components):
-            self.action_inv[i,:,:] = np.linalg.inv(action.covars_[i,:,:])
-            self.action_det.append(np.linalg.det(action.covars_[i,:,:]))
-
+        self.action_factors = MixtureFactors(action.means_,action.covars_,action.weights_)
+        self.goal_factors = None
         if not goal is None:
-            self.goal_inv = np.zeros(goal.covars_.shape)
-            for i in range(goal.n_components):
-                self.goal_inv[i,:,:] = np.linalg.inv(goal.covars_[i,:,:])
-                self.goal_det.append(np.linalg.det(goal.covars_[i,:,:]))
+            self.goal_factors = MixtureFactors(goal.means_,goal.covars_,goal.weights_)
 
         self.traj_model = action;
         self.goal_model = goal;
 
     def P_Action(self,X):
-        if self.traj_model.n_components == 1:
-            return P_Gauss(X,self.traj_model.means_,self.action_inv,self.action_det,self.traj_model.weights_)
-        else:
-            return self.traj_model.score(X)
+        return MixtureLogLikelihood(X,*self.action_factors)
 
     def P_Goal(self,X):
-        if self.goal_model.n_components == 1:
-            return P_Gauss(X,self.goal_model.means_,self.goal_inv,self.goal_det,self.goal_model.weights_)
-        else:
-            return self.goal_model.score(X)
+        return MixtureLogLikelihood(X,*self.goal_factors)
 
     '''
     Start recording on the specified topics.
@@ -364,6 +353,26 @@ class RobotFeatures:
 
         return f
 
+    def GetForwardBatch(self,traj):
+        '''
+        Poses of the end effector in the world frame for every point of a
+        joint trajectory, as an (N, 4, 4) array: the same as
+        base_tform * GetForward(q[:dof]) for each q, with forward kinematics
+        computed for all points at once.
+        '''
+        if self.batch_kinematics is None:
+            self.batch_kinematics = GetBatchKinematics(self.kinematics)
+
+        if isinstance(traj, np.ndarray):
+            q = traj[:,:self.dof]
+        else:
+            q = np.array([q[:self.dof] for q in traj], dtype=float)
+        ee = self.batch_kinematics.forward(q)
+        if not self.manip_frame is None:
+            ee = PostMultiply(ee, KdlFrameToMatrix(self.manip_frame))
+
+        return PreMultiply(KdlFrameToMatrix(self.base_tform), ee)
+
     '''
     SetWorld
     Sets locations of different objects at the beginning of the action.
@@ -429,7 +438,7 @@ class RobotFeatures:
 
         weights = [0.0]*len(traj)
 
-        ee_frame = [self.base_tform * self.GetForward(q[:self.dof]) for q in traj]
+        ee_frame = self.GetForwardBatch(traj)
         features, goal_features = self.GetFeaturesForTrajectory(ee_frame,world,objs)
 
         features = self.NormalizeActionNG(features)
@@ -459,39 +468,93 @@ class RobotFeatures:
         Will then score them as per usual
         '''
 
-        ee_frame = [self.base_tform * self.GetForward(q[:self.dof]) for q in traj]
-        features,goal_features = self.GetFeaturesForTrajectory(ee_frame,world,objs)
-        isum = np.sum(range(len(features)))
-        scores = self.traj_model.score(features)
+        return self.GetTrajectoryLikelihoods([traj],world,objs)[0]
 
-        # average score
-        avg = np.mean(scores)
+    def GetTrajectoryLikelihoods(self,trajs,world,objs):
+        '''
+        GetTrajectoryLikelihoods
+        GetTrajectoryLikelihood for a list of trajectories, e.g. the DMP
+        candidates of SearchDMP: forward kinematics runs once over the points
+        of every trajectory, and the features of all trajectories with the
+        same length are computed and scored together.
+        '''
+        lengths = np.array([len(traj) for traj in trajs])
+        starts = np.concatenate([[0],np.cumsum(lengths)[:-1]])
+        if all(isinstance(traj, np.ndarray) for traj in trajs):
+            ee_frames = self.GetForwardBatch(np.concatenate(trajs))
+        else:
+            ee_frames = self.GetForwardBatch(
+                    [q for traj in trajs for q in traj])
+
+        lls = np.zeros(len(trajs))
+        for length in np.unique(lengths):
+            idx = np.nonzero(lengths == length)[0]
+            # (M, length, 4, 4) poses of the M trajectories of this length
+            ee = ee_frames[starts[idx][:,None] + np.arange(length)]
+            f,g = self.GetFeaturesForTrajectory(ee,world,objs)
 
-        return self.goal_model.score(goal_features) + avg
+            # average score
+            npts = f.shape[1]
+            action = MixtureLogLikelihood(
+                    f.reshape(-1,f.shape[-1]),*self.action_factors)
+            avg = np.sum(action.reshape(len(idx),npts),axis=1) / max(npts,1)
+            lls[idx] = self.P_Goal(g) + avg
+
+        return list(lls)
 
     def GetFeaturesForTrajectory(self,ee_frame,world,objs,gripper=None):
         '''
         GetFeaturesForTrajectory
+        Computes GetFeatures for every point but the last, and the goal
+        features for the last point, for all points at once.
+
+        ee_frame: end effector poses, as a list of PyKDL frames or an
+                  (N, 4, 4) array like GetForwardBatch returns, or
+                  (M, N, 4, 4) for M trajectories of the same length
+        world: object poses, each a PyKDL frame or (4, 4) array, or a list of
+               frames or (N, 4, 4) array with one pose per point
+
+        Returns (N-1, F) features and (1, G) goal features, or (M, N-1, F)
+        and (M, G) for M trajectories.
         '''
 
-        #features = [[]]*(len(traj)-1)
-        npts = len(ee_frame)-1
-        features = [[]]*(npts)
+        ee_frame = FramesToArray(ee_frame)
+        batch = ee_frame.shape[:-3]
+        npts = ee_frame.shape[-3]-1
+        # index of the last point; the goal uses the world at this point
+        i = npts-1
 
         #diffs = self.GetDiffFeatures(ee_frame,world,objs)
 
-        if not gripper is None:
-            for i in range(npts):
-                t = float(i+1) / npts
-                features[i] = self.GetFeatures(ee_frame[i],t,world,objs,i,gripper[i]) #+ diffs[i]
-            goal_features = self.GetFeatures(ee_frame[-1],0.0,world,objs,i,gripper[i-1])
-        else:
-            for i in range(npts):
-                t = float(i+1) / npts
-                features[i] = self.GetFeatures(ee_frame[i],t,world,objs,i)
-            goal_features = self.GetFeatures(ee_frame[-1],0.0,world,objs,i)
+        features = []
+        goal_features = []
+        for obj in objs:
+            if obj == TIME:
+                t = np.arange(1, npts+1, dtype=float) / npts
+                features.append(np.broadcast_to(t[:,None],batch+(npts,1)))
+                goal_features.append(np.zeros(batch+(1,)))
+            elif obj == GRIPPER:
+                if gripper is None:
+                    features.append(np.zeros(batch+(npts,NUM_GRIPPER_VARS)))
+                    goal_features.append(np.zeros(batch+(NUM_GRIPPER_VARS,)))
+                else:
+                    g = np.array(gripper[:npts],dtype=float)
+                    features.append(np.broadcast_to(g,batch+g.shape))
+                    g = np.array(gripper[i-1],dtype=float)
+                    goal_features.append(np.broadcast_to(g,batch+g.shape))
+            else:
+                obj_frame = FramesToArray(world[obj])
+                if obj_frame.ndim == 3:
+                    goal_frame = obj_frame[i]
+                    obj_frame = obj_frame[:npts]
+                else:
+                    goal_frame = obj_frame
+                features.append(RelativePoseFeatures(ee_frame[...,:npts,:,:],obj_frame))
+                goal_features.append(RelativePoseFeatures(ee_frame[...,-1,:,:],goal_frame))
 
-        return np.array(features), np.array([goal_features])
+        features = np.concatenate(features,axis=-1)
+        goal_features = np.concatenate(goal_features,axis=-1)
+        return features, goal_features.reshape(-1,goal_features.shape[-1])
 
     def GetFeatures(self,ee_frame,t,world,objs,idx,gripper=[0]*NUM_GRIPPER_VARS):
         '''
@@ -589,7 +652,7 @@ class RobotFeatures:
             manip_frame = (self.base_tform * self.GetForward(traj[0])).Inverse() * self.world_states[0][self.manip_obj]
             ee_frame = [x[self.manip_obj] for x in self.world_states]
         else:
-            ee_frame = [self.base_tform * self.GetForward(q[:self.dof]) for q in traj]
+            ee_frame = self.GetForwardBatch(traj)
 
         return self.GetFeaturesForTrajectory(ee_frame,self.world_states[0],objs,gripper)
 
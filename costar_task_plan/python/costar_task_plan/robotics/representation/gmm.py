@@ -2,6 +2,9 @@ from __future__ import print_function
 
 import numpy as np
 from pypr.clustering import gmm
+from gmm_score import MixtureFactors
+from gmm_score import MixtureLogLikelihood
+from gmm_score import MixtureLogLikelihoods
 import yaml
 try:
     from yaml import CLoader as Loader, CDumper as Dumper
@@ -12,6 +15,9 @@ class GMM(yaml.YAMLObject):
     '''
     Wraps some PyPr functions for easy grouping of different GMMs.
     Uses a couple different functions.
+
+    Scoring uses the Cholesky factors of the covariances, which are computed
+    whenever the covariances change and saved with the model.
     '''
 
     yaml_tag = u'!GMM'
@@ -29,17 +35,19 @@ class GMM(yaml.YAMLObject):
             elif not config == None:
                 self.mu = config['mu']
                 self.sigma = config['sigma']
-                self.updateInvSigma()
                 self.pi = config['pi']
                 self.k = config['k']
+                self.updateInvSigma()
             else:
                 raise RuntimeError('Must provide either data array or config')
 
     def addNoise(self, noise):
         for i in range(len(self.sigma)):
             self.sigma[i] += noise * np.eye(self.sigma[i].shape[0])
+        self.updateInvSigma()
 
     def updateInvSigma(self):
+        self.invsigma = [None] * self.k
         for i in range(self.k):
             self.invsigma[i] = np.linalg.inv(self.sigma[i])
             #try:
@@ -48,7 +56,23 @@ class GMM(yaml.YAMLObject):
             #    #print("ERROR: Inverse failed for cluster %d!" % i)
             #    #print(self.sigma[i])
             #    raise e
+        self.updateCholesky()
 
+    def updateCholesky(self):
+        '''
+        Compute the factors used for scoring from mu, sigma and pi.
+        '''
+        _, self.chol_inv, self.log_norm = MixtureFactors(
+            self.mu, self.sigma, self.pi)
+
+    def factors(self):
+        '''
+        The scoring factors; models saved before they were cached get them
+        computed on first use.
+        '''
+        if getattr(self, 'chol_inv', None) is None:
+            self.updateCholesky()
+        return np.atleast_2d(self.mu), self.chol_inv, self.log_norm
 
     def fit(self, data):
         '''
@@ -69,16 +93,30 @@ class GMM(yaml.YAMLObject):
 
     def score(self, data):
         '''
-        return log likelihoods
+        return the total log likelihood of the rows of data
         '''
-        return gmm.gm_log_likelihood(data, self.mu, self.sigma, self.pi)
+        return np.sum(self.loglikelihood(data))
 
     def loglikelihood(self, data):
-        # for i in range(k):
-        i = 0
-        ex1 = np.dot(self.invsigma[i], (data.T - self.mu[i]).T)
-        ex = -0.5 * np.dot((data.T - self.mu[i]).T, ex1)
-        return ex  # self.mu[0].transpose() * self.invsigma[0] * self.mu[0]
+        '''
+        return the log likelihood of each row of data under the mixture
+        '''
+        return MixtureLogLikelihood(data, *self.factors())
+
+    def scoreMany(self, trajs, average=False):
+        '''
+        Score many trajectories (e.g. candidates being ranked) at once.
+
+        Parameters:
+        -----------
+        trajs: list of (N_i, D) feature arrays, or an (M, N, D) array
+        average: mean log likelihood of the points instead of the total
+
+        Returns:
+        --------
+        (M,) array with score() of each trajectory
+        '''
+        return MixtureLogLikelihoods(trajs, *self.factors(), average=average)
 
 
     def sample(self, nsamples=1):
@@ -0,0 +1,101 @@
+'''
+Batched log likelihoods under Gaussian mixture models.
+
+A mixture with K components in D dimensions is scored through its factors:
+the means (K, D), the inverses of the Cholesky factors of the covariances
+(K, D, D) and the log of each component's weight and normalizing constant
+(K,). Computing the factors once per fit turns scoring N points into one
+matrix product for all the components and a log-sum-exp, and scoring many
+trajectories into one call on all of their points.
+'''
+
+import numpy as np
+
+
+def LogSumExp(x, axis=0):
+    '''
+    log(sum(exp(x))) along an axis without overflow or underflow.
+    '''
+    xmax = np.max(x, axis=axis, keepdims=True)
+    xmax[~np.isfinite(xmax)] = 0.
+    out = np.log(np.sum(np.exp(x - xmax), axis=axis, keepdims=True)) + xmax
+    return np.squeeze(out, axis=axis)
+
+
+def MixtureFactors(mu, sigma, pi):
+    '''
+    Precompute the factors used to score points under a Gaussian mixture.
+
+    Parameters:
+    -----------
+    mu: means of the components, (K, D)
+    sigma: full covariances of the components, (K, D, D)
+    pi: component weights, (K,)
+
+    Returns:
+    --------
+    (mu, chol_inv, log_norm): the means, the inverse Cholesky factors of the
+    covariances, and log(pi) plus the log normalizing constant of each
+    component. Raises np.linalg.LinAlgError if a covariance is not positive
+    definite.
+    '''
+    mu = np.atleast_2d(np.asarray(mu, dtype=float))
+    sigma = np.asarray(sigma, dtype=float).reshape(mu.shape[0], mu.shape[1], mu.shape[1])
+    pi = np.asarray(pi, dtype=float).reshape(-1)
+    chol = np.linalg.cholesky(sigma)
+    chol_inv = np.linalg.inv(chol)
+    log_det = 2. * np.sum(np.log(np.diagonal(chol, axis1=-2, axis2=-1)), axis=-1)
+    log_norm = np.log(pi) - 0.5 * (mu.shape[1] * np.log(2 * np.pi) + log_det)
+    return mu, chol_inv, log_norm
+
+
+def MixtureLogLikelihood(data, mu, chol_inv, log_norm):
+    '''
+    Log likelihood of each row of data under a mixture given by the factors
+    from MixtureFactors.
+
+    Parameters:
+    -----------
+    data: (N, D) points, or a single (D,) point
+
+    Returns:
+    --------
+    (N,) log likelihoods
+    '''
+    x = np.atleast_2d(data)
+    diff = x[None, :, :] - mu[:, None, :]
+    # whitened offsets of every point from every component: (K, N, D)
+    z = np.matmul(diff, np.swapaxes(chol_inv, -1, -2))
+    log_p = log_norm[:, None] - 0.5 * np.sum(z * z, axis=-1)
+    return LogSumExp(log_p, axis=0)
+
+
+def MixtureLogLikelihoods(trajs, mu, chol_inv, log_norm, average=False):
+    '''
+    Total (or average) log likelihood of each of many trajectories, scoring
+    the points of all of them at once.
+
+    Parameters:
+    -----------
+    trajs: list of (N_i, D) arrays, or an (M, N, D) array
+    average: return the mean log likelihood of each trajectory's points
+             instead of the sum
+
+    Returns:
+    --------
+    (M,) array
+    '''
+    lengths = np.array([len(traj) for traj in trajs])
+    if np.sum(lengths) == 0:
+        return np.zeros(len(lengths))
+    scores = MixtureLogLikelihood(np.concatenate(list(trajs), axis=0),
+                                  mu, chol_inv, log_norm)
+    starts = np.cumsum(lengths) - lengths
+    # reduceat would return the next sum for empty trajectories, so leave
+    # them out
+    scored = lengths > 0
+    totals = np.zeros(len(lengths))
+    totals[scored] = np.add.reduceat(scores, starts[scored])
+    if average:
+        return totals / np.maximum(lengths, 1)
+    return totals
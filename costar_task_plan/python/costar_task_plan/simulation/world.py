@@ -81,7 +81,7 @@ class SimulationWorld(AbstractWorld):
             pb.stepSimulation()
 
         # Update the states of all actors.
-        for actor in self.actors:
+        for actor in self.ownActors():
             actor.state = actor.getState()
             actor.state.t = self.ticks * self.dt
 
@@ -3,7 +3,7 @@ import numpy as np
 # TODO(cpaxton): remove pygame from this
 #import pygame as pg
 
-from costar_task_plan.mcts import Node
+from costar_task_plan.mcts import Node, MonteCarloTreeSearch
 
 '''
 loop over all MCTS scenarios
@@ -12,7 +12,23 @@ loop over all MCTS scenarios
 '''
 
 
-def mctsLoop(env, policies, seed, save, animate, **kwargs):
+def mctsLoop(env, policies, seed, save, animate, time_budget=None,
+             reuse=False, report_reuse=False, **kwargs):
+    '''
+    Plan, execute the first option of the plan, and replan until the episode
+    is over.
+
+    Parameters:
+    -----------
+    time_budget: seconds to plan for at every step; if not set, run a fixed
+                 number of iterations (the iter keyword argument)
+    reuse: start each replan from the subtree below the executed option
+           instead of from a fresh root; off by default
+    report_reuse: print how much search work was carried over each replan
+
+    Returns a list with the iterations, planning time, and reused visits and
+    nodes for every replan.
+    '''
 
     if seed is not None:
         world_id = int(seed)
@@ -22,7 +38,7 @@ def mctsLoop(env, policies, seed, save, animate, **kwargs):
 
     env.reset()
     world = env._world
-    current_root = Node(world=world)
+    current_root = Node(world=world, root=True)
     done = current_root.terminal
 
     if policies._rollout is None:
@@ -33,8 +49,8 @@ def mctsLoop(env, policies, seed, save, animate, **kwargs):
         dfs = "_dfs"
     else:
         dfs = ""
-    if policies._sample is not None:
-        sample = policies._sample.getName()
+    if policies.sample is not None:
+        sample = policies.sample.getName()
     else:
         sample = "none"
 
@@ -44,29 +60,57 @@ def mctsLoop(env, policies, seed, save, animate, **kwargs):
         window = world._getScreen()
         os.mkdir(dirname)
 
+    if time_budget is None:
+        iterations = kwargs.get('iter', 100)
+    else:
+        iterations = kwargs.get('iter', None)
+    search = MonteCarloTreeSearch(policies, time_budget=time_budget)
+
+    replans = []
     while not done:
 
-        # planning loop: determine the set of policies
-        for i in xrange(kwargs['iter']):
-            # do whatever you want here
-            policies.explore(current_root)
-        path = policies.extract(current_root)
+        # planning loop: search until we run out of iterations or time
+        elapsed, path = search(current_root, iter=iterations)
+        if len(path) < 2:
+            break
 
-        # execute loop: follow these policies for however long we are supposed
-        # to follow them according to their conditions
+        # execute loop: the child's world is the result of following the
+        # first option of the plan until its condition says to stop
+        child = path[1]
+        if reuse:
+            current_root, saved = search.advance(current_root, child)
+        else:
+            policies.instantiate(current_root, child)
+            if child.terminal:
+                # nothing left to plan; a root can not be terminal
+                current_root = child
+            else:
+                current_root = Node(world=child.world, root=True)
+            saved = {"visits": 0, "nodes": 0}
+        saved["iterations"] = search.iterations
+        saved["elapsed"] = elapsed
+        replans.append(saved)
 
-        while current_root.state.t < 1.0:
-            # compute the next action according to the current policy
-            # if a policy is finished, pop it off of the stack
+        if report_reuse:
+            print "replan %d: %d iterations in %.3fs, reused %d visits" \
+                " and %d nodes" % (len(replans),
+                                   saved["iterations"],
+                                   saved["elapsed"],
+                                   saved["visits"],
+                                   saved["nodes"])
+
+        done = current_root.terminal
+        if animate:
+            # show the current window
             pass
-            done = current_root.terminal
-            if animate:
-                # show the current window
-                pass
-            # if save:
-            #    # Save pygame image to disk
-            #    pg.image.save(window, "%s/iter%d.png"%(dirname,iter))
-            if done:
-                break
-
-        # update current root
+        # if save:
+        #    # Save pygame image to disk
+        #    pg.image.save(window, "%s/iter%d.png"%(dirname,iter))
+
+    if report_reuse and len(replans) > 0:
+        visits = sum([r["visits"] for r in replans])
+        total = sum([r["iterations"] for r in replans]) + visits
+        print "reused %d of %d visits (%.1f%%) over %d replans" % (
+            visits, total, 100. * visits / max(total, 1), len(replans))
+
+    return replans
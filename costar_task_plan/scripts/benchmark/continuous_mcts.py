@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+'''
+Time the pieces of continuous-action MCTS: kernel-weighted value estimates
+over n explored actions with the nearest-neighbor index versus checking every
+action, and drawing actions one at a time versus in batches.
+'''
+
+from costar_task_plan.grid_world import RoadWorld
+from costar_task_plan.grid_world.road_world import LanePolicy
+from costar_task_plan.mcts import ActionIndex, Node
+from costar_task_plan.mcts import GaussianParameterDistribution
+from costar_task_plan.mcts import ParameterizedPolicySample
+
+import argparse
+import numpy as np
+import timeit
+
+
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[100, 1000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=4)
+    parser.add_argument("--bandwidth", type=float, default=0.05)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch_size", type=int, default=32)
+    return parser.parse_args()
+
+
+def bruteForce(points, values, query, bandwidth):
+    d = np.linalg.norm(points - query, axis=1)
+    w = np.exp(-0.5 * (d / bandwidth) ** 2)
+    return np.dot(w, values) / np.sum(w)
+
+
+def indexed(index, values, query, bandwidth):
+    ids, w = index.kernel(query, bandwidth)
+    return np.dot(w, values[ids]) / np.sum(w)
+
+
+def main(args):
+    print "n\tbuild (ms)\tbrute (us)\tindex (us)"
+    for n in args.sizes:
+        points = np.random.rand(n, args.dim)
+        values = np.random.randn(n)
+        queries = points[np.random.randint(n, size=args.queries)]
+
+        index = ActionIndex(args.dim)
+        build = timeit.default_timer()
+        for point in points:
+            index.insert(point)
+        build = timeit.default_timer() - build
+
+        brute = timeit.timeit(
+            lambda: [bruteForce(points, values, q, args.bandwidth)
+                     for q in queries], number=1)
+        fast = timeit.timeit(
+            lambda: [indexed(index, values, q, args.bandwidth)
+                     for q in queries], number=1)
+        print "%d\t%.1f\t%.1f\t%.1f" % (n, 1e3 * build,
+                                        1e6 * brute / args.queries,
+                                        1e6 * fast / args.queries)
+
+    root = Node(world=RoadWorld(seed=0), root=True)
+    sample = ParameterizedPolicySample(
+        lambda p: LanePolicy(p[0], p[1]),
+        GaussianParameterDistribution([1., 2.], np.eye(2)))
+    num = 100 * args.batch_size
+    single = timeit.timeit(lambda: sample(root), number=num)
+    batch = timeit.timeit(lambda: sample.sampleBatch(root, args.batch_size),
+                          number=100)
+    print "sampling (us/action): single %.1f, batch of %d %.1f" % (
+        1e6 * single / num, args.batch_size, 1e6 * batch / num)
+
+if __name__ == '__main__':
+    main(getArgs())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+'''
+Compare replanning with and without subtree reuse in mctsLoop, on the grid
+world RoadWorld.
+'''
+
+from costar_task_plan.grid_world import RoadWorld
+from costar_task_plan.mcts import DefaultMctsPolicies, PolicyInitialize
+from costar_task_plan.tools import mctsLoop
+
+import argparse
+import numpy as np
+
+
+class RoadEnv(object):
+    '''
+    The reset() and _world that mctsLoop needs from an environment.
+    '''
+
+    def __init__(self, world):
+        self._world = world
+
+    def reset(self):
+        self._world.reset()
+
+
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iter", type=int, default=None,
+                        help="MCTS iterations per replan")
+    parser.add_argument("--time_budget", type=float, default=0.1,
+                        help="seconds to plan for at every replan")
+    parser.add_argument("--max_time", type=float, default=5.,
+                        help="length of an episode in simulated seconds")
+    parser.add_argument("--trials", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main(args):
+    kwargs = {}
+    if args.iter is not None:
+        kwargs["iter"] = args.iter
+    time_budget = args.time_budget if args.time_budget > 0 else None
+
+    print "reuse\treplans\titerations\treused visits"
+    for reuse in [False, True]:
+        replans, iterations, visits = 0, 0, 0
+        for trial in xrange(args.trials):
+            world = RoadWorld(seed=args.seed + trial, max_time=args.max_time)
+            policies = DefaultMctsPolicies(
+                initialize=PolicyInitialize(world.getLanePolicies()))
+            result = mctsLoop(RoadEnv(world), policies, args.seed + trial,
+                              False, False, time_budget=time_budget,
+                              reuse=reuse, **kwargs)
+            replans += len(result)
+            iterations += sum([r["iterations"] for r in result])
+            visits += sum([r["visits"] for r in result])
+        print "%s\t%d\t%d\t%d" % (reuse, replans, iterations, visits)
+
+if __name__ == '__main__':
+    main(getArgs())
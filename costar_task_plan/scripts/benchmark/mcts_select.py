@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+'''
+Time child selection for wide MCTS nodes, comparing the per-child score
+functions with the vectorized batch versions.
+'''
+
+from costar_task_plan.grid_world import RoadWorld
+from costar_task_plan.mcts import MctsAction, Node
+from costar_task_plan.mcts import PriorProbabilityScore, Ucb1Score
+
+import argparse
+import numpy as np
+import timeit
+
+
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--widths", type=int, nargs="+",
+                        default=[10, 100, 500, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    return parser.parse_args()
+
+
+def makeNode(world, width):
+    root = Node(world=world, root=True)
+    root.n_visits = 10 * width
+    for i in xrange(width):
+        child = Node(action=MctsAction(id=i), prior=np.random.rand())
+        child.n_visits = np.random.randint(10)
+        child.avg_reward = np.random.randn()
+        root.children.append(child)
+    root.childStats()
+    return root
+
+
+def main(args):
+    world = RoadWorld(seed=0)
+    print "score\twidth\tloop (us)\tbatch (us)"
+    for score in [Ucb1Score(), PriorProbabilityScore()]:
+        for width in args.widths:
+            root = makeNode(world, width)
+            loop = timeit.timeit(
+                lambda: np.argmax([score(root, c) for c in root.children]),
+                number=args.repeat)
+            batch = timeit.timeit(
+                lambda: np.argmax(score.batch(root)),
+                number=args.repeat)
+            print "%s\t%d\t%.1f\t%.1f" % (score.__class__.__name__,
+                                          width,
+                                          1e6 * loop / args.repeat,
+                                          1e6 * batch / args.repeat)
+
+if __name__ == '__main__':
+    main(getArgs())
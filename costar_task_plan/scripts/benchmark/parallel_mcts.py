@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+'''
+Compare planning time for a fixed number of MCTS iterations with a varying
+number of workers, on the grid world RoadWorld.
+
+The needle_master world is not part of this benchmark because it can not be
+searched with the MCTS tools yet:
+- NeedleMasterWorld does not call AbstractWorld.__init__, so it has no
+  actors, dt, reward, conditions or predicate engine for tick() and fork()
+- it does not implement zeroAction() or _update_environment()
+- _initActor() calls a sample_start() method that does not exist
+- its only reward, ExpertReward, raises in evaluate()
+Once those exist it can be added next to RoadWorld below.
+'''
+
+from costar_task_plan.grid_world import RoadWorld
+from costar_task_plan.mcts import DefaultMctsPolicies, PolicyInitialize
+from costar_task_plan.mcts import Node, ParallelMonteCarloTreeSearch
+
+import argparse
+import multiprocessing
+import numpy as np
+
+
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iter", type=int, default=400,
+                        help="MCTS iterations per planning call")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=[1, 2, 4, 8, multiprocessing.cpu_count()])
+    parser.add_argument("--mode", default="root", choices=["root", "leaf"])
+    parser.add_argument("--substeps", type=int, default=100,
+                        help="integration steps per tick; more is slower")
+    parser.add_argument("--trials", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main(args):
+    world = RoadWorld(seed=args.seed, substeps=args.substeps)
+    policies = DefaultMctsPolicies(
+        initialize=PolicyInitialize(world.getLanePolicies()))
+
+    baseline = None
+    print "workers\ttime (s)\tspeedup"
+    for num_workers in sorted(set(args.workers)):
+        search = ParallelMonteCarloTreeSearch(policies,
+                                              num_workers=num_workers,
+                                              mode=args.mode)
+        times = []
+        for trial in xrange(args.trials):
+            np.random.seed(args.seed + trial)
+            root = Node(world=world, root=True)
+            elapsed, path = search(root, iter=args.iter)
+            times.append(elapsed)
+        t = np.mean(times)
+        if baseline is None:
+            baseline = t
+        print "%d\t%f\t%.2fx" % (num_workers, t, baseline / t)
+
+if __name__ == '__main__':
+    main(getArgs())
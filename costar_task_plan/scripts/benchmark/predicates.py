@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+'''
+Time predicate evaluation during AbstractWorld.tick() on a crowded road, with
+the cached and batched PredicateEngine and with the old approach of calling
+every predicate for every actor. Prints the engine's per-predicate counters.
+'''
+
+from costar_task_plan.abstract.predicates import PredicateEngine
+from costar_task_plan.grid_world import RoadWorld
+from costar_task_plan.grid_world.road_world import RoadAction
+
+import argparse
+import timeit
+
+
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ticks", type=int, default=100)
+    parser.add_argument("--cars", type=int, default=50)
+    parser.add_argument("--obstacles", type=int, default=200)
+    parser.add_argument("--lanes", type=int, default=5)
+    return parser.parse_args()
+
+
+class LoopPredicateEngine(PredicateEngine):
+
+    '''
+    How AbstractWorld.tick() used to compute predicates.
+    '''
+
+    def predicates(self, world, updated=None):
+        return [[check(world, actor.state, actor, actor.last_state)
+                 for (name, check) in world.predicates]
+                for actor in world.actors]
+
+
+def run(args, engine):
+    world = RoadWorld(lanes=args.lanes,
+                      length=1000.,
+                      num_cars=args.cars,
+                      num_obstacles=args.obstacles,
+                      max_time=1e6,
+                      seed=0)
+    world.predicate_engine = engine
+    start = timeit.default_timer()
+    for i in xrange(args.ticks):
+        world.tick(RoadAction(0., 0))
+    return timeit.default_timer() - start
+
+
+def main(args):
+    loop = run(args, LoopPredicateEngine())
+    engine = PredicateEngine()
+    cached = run(args, engine)
+    print "ms per tick: loop %.2f, engine %.2f" % (1e3 * loop / args.ticks,
+                                                   1e3 * cached / args.ticks)
+    print "name\tcalls\tevaluated\tcached\ttime (ms)"
+    stats = engine.stats()
+    for kind in ["predicates", "conditions"]:
+        for name, s in sorted(stats[kind].items()):
+            print "%s\t%d\t%d\t%d\t%.2f" % (name, s["calls"], s["evaluated"],
+                                            s["cached"], 1e3 * s["time"])
+
+if __name__ == '__main__':
+    main(getArgs())
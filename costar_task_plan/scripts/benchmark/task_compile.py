@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+'''
+Time Task.compile() on a block stacking task with a growing number of blocks
+and target positions, and check how long it takes to look up children. Also
+counts how many options were created; they are only created once used.
+'''
+
+from costar_task_plan.abstract import Task, AbstractOption
+
+import argparse
+import numpy as np
+import timeit
+
+
+class BenchmarkOption(AbstractOption):
+
+    created = 0
+
+    def __init__(self, **kwargs):
+        self.args = kwargs
+        BenchmarkOption.created += 1
+
+
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blocks", type=int, nargs="+",
+                        default=[5, 10, 20, 40])
+    parser.add_argument("--positions", type=int, default=4)
+    return parser.parse_args()
+
+
+def different(block1, block2, **kwargs):
+    return block1 != block2
+
+
+def makeTask():
+    task = Task()
+    task.add("grasp", None, {"constructor": BenchmarkOption,
+                             "args": ["block1"]})
+    task.add("lift", "grasp", {"constructor": BenchmarkOption,
+                               "args": ["block1"]})
+    task.add("place", "lift", {"constructor": BenchmarkOption,
+                               "args": ["block1", "block2", "position"]})
+    task.add("release", "place", {"constructor": BenchmarkOption,
+                                  "args": []})
+    task.add("grasp", "release", None)
+    task.addCheck(different)
+    return task
+
+
+def main(args):
+    print "blocks\targ sets\tnodes\tedges\toptions\tcompile (s)\t" \
+        "getChildren (us)"
+    for num_blocks in args.blocks:
+        blocks = ["block%d" % i for i in xrange(num_blocks)]
+        task = makeTask()
+        BenchmarkOption.created = 0
+        start = timeit.default_timer()
+        arg_sets = task.compile({
+            "block1": blocks,
+            "block2": blocks,
+            "position": ["pos%d" % i for i in xrange(args.positions)]})
+        elapsed = timeit.default_timer() - start
+
+        names = list(task.nodes)
+        queries = [names[i] for i in np.random.randint(len(names), size=1000)]
+        lookup = timeit.timeit(lambda: [task.getChildren(q) for q in queries],
+                               number=1)
+        print "%d\t%d\t%d\t%d\t%d\t%.3f\t%.2f" % (num_blocks,
+                                                  len(arg_sets),
+                                                  len(task.nodes),
+                                                  len(task.child_ids),
+                                                  BenchmarkOption.created,
+                                                  elapsed,
+                                                  lookup * 1e3)
+
+if __name__ == '__main__':
+    main(getArgs())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+'''
+Measure fork throughput and peak memory use while growing a tree of worlds,
+the way MCTS does, with the copy-on-write AbstractWorld.fork() and with the
+old approach of copying the world and all of its actors on every fork.
+
+Each method runs in its own process so that peak RSS can be compared.
+'''
+
+from costar_task_plan.grid_world import RoadWorld
+from costar_task_plan.grid_world.road_world import RoadAction
+
+from collections import deque
+
+import argparse
+import copy
+import multiprocessing
+import numpy as np
+import resource
+import timeit
+
+
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--forks", type=int, default=20000)
+    parser.add_argument("--cars", type=int, default=10)
+    parser.add_argument("--obstacles", type=int, default=100)
+    parser.add_argument("--history", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def copyFork(world, action):
+    '''
+    How AbstractWorld.fork() used to work.
+    '''
+    new_world = copy.copy(world)
+    new_world.actors = [copy.copy(actor) for actor in world.actors]
+    new_world.owned = [True] * len(world.actors)
+    new_world.updateTraceID()
+    new_world.history = copy.copy(world.history)
+    new_world.tick(action)
+    return new_world
+
+
+def cowFork(world, action):
+    return world.fork(action)
+
+
+def run(method, args, queue):
+    world = RoadWorld(seed=args.seed,
+                      num_cars=args.cars,
+                      num_obstacles=args.obstacles,
+                      history_length=args.history,
+                      max_time=1e6)
+    if method is copyFork:
+        world.history = deque(world.history)
+    actions = [RoadAction(dv, dy) for dv in [-0.5, 0., 0.5] for dy in [-1, 0, 1]]
+    rng = np.random.RandomState(args.seed)
+    worlds = [world]
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = timeit.default_timer()
+    for i in xrange(args.forks):
+        parent = worlds[rng.randint(len(worlds))]
+        worlds.append(method(parent, actions[rng.randint(len(actions))]))
+    elapsed = timeit.default_timer() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+    queue.put((elapsed, rss))
+
+
+def main(args):
+    print "method\tforks/s\tpeak RSS increase (MB)"
+    for name, method in [("copy", copyFork), ("cow", cowFork)]:
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=run, args=(method, args, queue))
+        proc.start()
+        elapsed, rss = queue.get()
+        proc.join()
+        print "%s\t%.0f\t%.1f" % (name, args.forks / elapsed, rss / 1024.)
+
+if __name__ == '__main__':
+    main(getArgs())
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from costar_task_plan.agent.abstract import AbstractAgent, CM_GOAL, CM_NEXT
+from costar_models.datasets.h5f import H5fDataset
+from costar_models.datasets.h5f_generator import H5fGeneratorDataset
+
+import numpy as np
+
+class Features(object):
+  description = ["features", "pose"]
+
+class World(object):
+  features = Features()
+
+def make_steps(length, example):
+  '''
+  Vectorized time steps, like world.vectorize() returns them, with labels
+  that change every few steps.
+  '''
+  labels = np.repeat(np.random.randint(0, 6, length),
+                     np.random.randint(1, 5, length))[:length]
+  steps = []
+  for i in xrange(length):
+    steps.append([("features", np.random.randint(0, 255, (4, 4, 3))),
+                  ("pose", np.random.randn(7)),
+                  ("reward", np.array(np.random.rand())),
+                  ("done", np.array(1) if i == length - 1 else np.array(0)),
+                  ("example", np.array(example)),
+                  ("label", np.array(labels[i]))])
+  return steps
+
+def whole_example(steps, mode, reward, max_label):
+  '''
+  The previous preprocessing, which waited for the end of the example and
+  then computed every row at once.
+  '''
+  current = {}
+  for step in steps:
+    for key, value in step:
+      current.setdefault(key, []).append(value)
+  description = World.features.description
+  if mode == CM_NEXT:
+    next_list, goal_list = ["reward", "label"] + description, []
+  else:
+    next_list, goal_list = [], ["reward", "label"] + description
+
+  length = len(steps)
+  label = current["label"]
+  switches = []
+  count = 1
+  for i in xrange(length):
+    if i + 1 == length:
+      switches += [i] * count
+      count = 1
+    elif not label[i + 1] == label[i]:
+      switches += [i + 1] * count
+      count = 1
+    else:
+      count += 1
+
+  data = {"prev_label": [],
+          "value": [np.sum(current["reward"])] * length}
+  prev_label = max_label
+  for i in xrange(length):
+    i1 = min(i + 1, length - 1)
+    for key, values in current.items():
+      data.setdefault(key, []).append(values[i])
+      if key == "label":
+        data["prev_label"].append(prev_label)
+        prev_label = values[i]
+      if key in next_list:
+        data.setdefault("next_%s" % key, []).append(values[i1])
+      if key in goal_list:
+        data.setdefault("goal_%s" % key, []).append(values[switches[i]])
+  data["success"] = [1. if reward > 0. else 0.] * length
+  return data
+
+def read(directory, filename):
+  dataset = H5fGeneratorDataset(os.path.join(directory, "*.h5f"))
+  with dataset._load(os.path.join(directory, filename)) as f:
+    return dict((key, f[key][()]) for key in f.keys())
+
+class TestStreamedExamples(unittest.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.dir = tempfile.mkdtemp()
+    self.world = World()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def agent(self, mode, success_only=False, random_downsample=False):
+    return AbstractAgent(save=True, collection_mode=mode,
+                         success_only=success_only,
+                         random_downsample=random_downsample,
+                         data_file=os.path.join(self.dir, "streamed.h5f"))
+
+  def collect(self, agent, steps, example, reward, max_label=7):
+    for step in steps:
+      agent._updateCurrentExample(step, self.world, max_label)
+      if agent.collection_mode == CM_NEXT:
+        # only the previous, current and next steps are kept in memory
+        self.assertTrue(len(agent.current_example["label"]) <= 3)
+    agent._finishCurrentExample(self.world, example, reward, max_label,
+                                seed=example)
+
+  def test_same_as_whole_example(self):
+    reference = H5fDataset(os.path.join(self.dir, "whole"))
+    streamed = os.path.join(self.dir, "streamed")
+    for mode in [CM_GOAL, CM_NEXT]:
+      agent = self.agent(mode)
+      for example, length in enumerate([1, 2, 5, 17, 40]):
+        steps = make_steps(length, example)
+        filename = "example%06d.success.h5f" % example
+        self.collect(agent, steps, example, 1.)
+        reference.write(whole_example(steps, mode, 1., 7), filename)
+
+        expected = read(reference.name, filename)
+        actual = read(streamed, filename)
+        self.assertEqual(sorted(actual.keys()), sorted(expected.keys()))
+        for key in expected:
+          self.assertEqual(actual[key].dtype, expected[key].dtype)
+          self.assertEqual(actual[key].shape, expected[key].shape)
+          self.assertEqual(len(actual[key]), length)
+          if key == "value":
+            # summed in a different order
+            np.testing.assert_allclose(actual[key], expected[key])
+          else:
+            np.testing.assert_array_equal(actual[key], expected[key])
+
+  def test_failure(self):
+    steps = make_steps(6, 3)
+    self.collect(self.agent(CM_GOAL), steps, 3, 0.)
+    data = read(os.path.join(self.dir, "streamed"),
+                "example000003.failure.h5f")
+    np.testing.assert_array_equal(data["success"], np.zeros(6))
+
+    # failures are thrown away with success_only, leaving no files behind
+    shutil.rmtree(os.path.join(self.dir, "streamed"))
+    agent = self.agent(CM_GOAL, success_only=True)
+    self.collect(agent, steps, 3, 0.)
+    self.assertEqual(os.listdir(os.path.join(self.dir, "streamed")), [])
+    self.assertEqual(agent.current_length, 0)
+
+  def test_random_downsample(self):
+    steps = make_steps(60, 4)
+    labels = [dict(step)["label"] for step in steps]
+    state = np.random.get_state()
+    expected = np.random.rand(3)
+    np.random.set_state(state)
+    self.collect(self.agent(CM_NEXT, random_downsample=True), steps, 4, 1.)
+    # writing rows during the episode does not draw from the global random
+    # numbers, which the environment uses
+    np.testing.assert_array_equal(np.random.rand(3), expected)
+
+    data = read(os.path.join(self.dir, "streamed"),
+                "example000004.success.h5f")
+    self.assertTrue(len(data["label"]) < len(steps))
+    # steps next to a label change are always kept
+    kept = [labels[i] for i in xrange(1, len(steps) - 1)
+            if not labels[i - 1] == labels[i + 1]]
+    self.assertTrue(len(kept) > 0)
+    self.assertTrue(len(data["label"]) >= len(kept) + 2)
+
+    # the same seed drops the same steps
+    shutil.rmtree(os.path.join(self.dir, "streamed"))
+    self.collect(self.agent(CM_NEXT, random_downsample=True), steps, 4, 1.)
+    again = read(os.path.join(self.dir, "streamed"),
+                 "example000004.success.h5f")
+    np.testing.assert_array_equal(again["pose"], data["pose"])
+
+if __name__ == '__main__':
+  unittest.main()
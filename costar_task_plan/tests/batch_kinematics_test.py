@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+import PyKDL
+
+from costar_task_plan.robotics.representation import RobotFeatures
+from costar_task_plan.robotics.representation.batch_kinematics import ChainKinematics
+from costar_task_plan.robotics.representation.batch_kinematics import GetBatchKinematics
+from costar_task_plan.robotics.representation.batch_kinematics import KdlFrameToMatrix
+from costar_task_plan.robotics.representation.batch_kinematics import LoopKinematics
+from costar_task_plan.robotics.representation.batch_kinematics import QuaternionsFromRotations
+
+def random_rotation(rs):
+  x, y, z, w = rs.randn(4)
+  norm = np.sqrt(x * x + y * y + z * z + w * w)
+  return PyKDL.Rotation.Quaternion(x / norm, y / norm, z / norm, w / norm)
+
+def random_frame(rs):
+  return PyKDL.Frame(random_rotation(rs), PyKDL.Vector(*rs.randn(3)))
+
+def random_chain(rs):
+  '''
+  A chain with revolute joints around arbitrary axes and offsets, one
+  prismatic joint and one fixed segment.
+  '''
+  chain = PyKDL.Chain()
+  for k in xrange(9):
+    tip = random_frame(rs)
+    if k == 4:
+      # fixed
+      joint = PyKDL.Joint()
+    else:
+      joint_type = PyKDL.Joint.TransAxis if k == 6 else PyKDL.Joint.RotAxis
+      axis = tip.M * PyKDL.Vector(*rs.randn(3))
+      joint = PyKDL.Joint(tip.p, axis, joint_type)
+    chain.addSegment(PyKDL.Segment(joint, tip))
+  return chain
+
+class KdlKinematics(object):
+  '''
+  Forward kinematics one pose at a time with the KDL solver, like
+  KDLKinematics.forward.
+  '''
+
+  def __init__(self, chain):
+    self.chain = chain
+    self.solver = PyKDL.ChainFkSolverPos_recursive(chain)
+
+  def forward(self, q):
+    joints = PyKDL.JntArray(len(q))
+    for i, value in enumerate(q):
+      joints[i] = value
+    frame = PyKDL.Frame()
+    self.solver.JntToCart(joints, frame)
+    return KdlFrameToMatrix(frame)
+
+class NoChain(object):
+  '''
+  Kinematics without a KDL chain, for the loop fallback.
+  '''
+
+  def __init__(self, kinematics):
+    self.kinematics = kinematics
+
+  def forward(self, q):
+    return self.kinematics.forward(q)
+
+def per_frame_features(robot, ee_frame, world, objs, gripper=None):
+  '''
+  The previous GetFeaturesForTrajectory: one GetFeatures call per point.
+  '''
+  npts = len(ee_frame) - 1
+  features = []
+  for i in xrange(npts):
+    t = float(i + 1) / npts
+    if gripper is None:
+      features.append(robot.GetFeatures(ee_frame[i], t, world, objs, i))
+    else:
+      features.append(robot.GetFeatures(ee_frame[i], t, world, objs, i,
+                                        gripper[i]))
+  i = npts - 1
+  if gripper is None:
+    goal = robot.GetFeatures(ee_frame[-1], 0.0, world, objs, i)
+  else:
+    goal = robot.GetFeatures(ee_frame[-1], 0.0, world, objs, i,
+                             gripper[i - 1])
+  return np.array(features), np.array([goal])
+
+class TestBatchKinematics(unittest.TestCase):
+
+  def setUp(self):
+    self.rs = np.random.RandomState(0)
+    self.kinematics = KdlKinematics(random_chain(self.rs))
+    self.q = self.rs.randn(50, 8) * 2
+
+  def test_forward_matches_solver(self):
+    batch = GetBatchKinematics(self.kinematics)
+    self.assertTrue(isinstance(batch, ChainKinematics))
+    self.assertEqual(batch.dof, 8)
+    expected = np.array([self.kinematics.forward(q) for q in self.q])
+    self.assertTrue(np.allclose(batch.forward(self.q), expected, atol=1e-10))
+    # a single joint vector gives a batch of one
+    self.assertTrue(np.allclose(batch.forward(self.q[0]), expected[:1],
+                                atol=1e-10))
+
+  def test_loop_fallback(self):
+    batch = GetBatchKinematics(NoChain(self.kinematics))
+    self.assertTrue(isinstance(batch, LoopKinematics))
+    expected = GetBatchKinematics(self.kinematics).forward(self.q)
+    self.assertTrue(np.allclose(batch.forward(self.q), expected, atol=1e-10))
+
+  def test_quaternion_branches(self):
+    # half turns have a trace of -1 and use the diagonal branches
+    rotations = []
+    for axis in [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (0, 1, 1),
+                 (1, 0, 1), (1, 1, 1)]:
+      for angle in [np.pi, np.pi - 1e-13, 0.]:
+        rotations.append(PyKDL.Rotation.Rot(PyKDL.Vector(*axis), angle))
+    rotations += [random_rotation(self.rs) for _ in xrange(50)]
+    matrices = np.array([KdlFrameToMatrix(PyKDL.Frame(rot))[:3, :3]
+                         for rot in rotations])
+    expected = np.array([rot.GetQuaternion() for rot in rotations])
+    self.assertTrue(np.allclose(QuaternionsFromRotations(matrices), expected,
+                                atol=1e-12))
+
+class TestRobotFeatures(unittest.TestCase):
+
+  def setUp(self):
+    rs = np.random.RandomState(1)
+    config = {"dof": 8, "obj_frame": "world", "base_link": "base_link",
+              "end_link": "ee_link", "robot_description_param": "",
+              "joint_states_topic": "", "gripper_topic": ""}
+    self.robot = RobotFeatures(config, kinematics=KdlKinematics(random_chain(rs)))
+    self.robot.base_tform = random_frame(rs)
+    self.robot.manip_frame = random_frame(rs)
+    # an extra joint the arm does not use, like the gripper
+    self.traj = [list(rs.randn(8) * 2) + [9.] for _ in xrange(40)]
+    self.gripper = [[rs.rand()] for _ in xrange(40)]
+    self.world = {"link": random_frame(rs),
+                  "moving": [random_frame(rs) for _ in xrange(40)]}
+
+  def per_frame_forward(self):
+    return [self.robot.base_tform * self.robot.GetForward(q[:8])
+            for q in self.traj]
+
+  def test_forward_batch(self):
+    expected = [KdlFrameToMatrix(f) for f in self.per_frame_forward()]
+    self.assertTrue(np.allclose(self.robot.GetForwardBatch(self.traj),
+                                expected, atol=1e-10))
+    self.assertTrue(np.allclose(self.robot.GetForwardBatch(np.array(self.traj)),
+                                expected, atol=1e-10))
+
+  def test_features(self):
+    ee_frames = self.per_frame_forward()
+    ee = self.robot.GetForwardBatch(self.traj)
+    for objs, gripper in [(["time", "link", "gripper", "moving"], self.gripper),
+                          (["link", "time"], None)]:
+      expected, expected_goal = per_frame_features(
+          self.robot, ee_frames, self.world, objs, gripper)
+      # from the batch poses and from a list of PyKDL frames
+      for poses in [ee, ee_frames]:
+        features, goal = self.robot.GetFeaturesForTrajectory(
+            poses, self.world, objs, gripper)
+        self.assertEqual(features.shape, expected.shape)
+        self.assertTrue(np.allclose(features, expected, atol=1e-8))
+        self.assertTrue(np.allclose(goal, expected_goal, atol=1e-8))
+
+    # several trajectories of the same length at once
+    features, goal = self.robot.GetFeaturesForTrajectory(
+        np.array([ee, ee[::-1]]), self.world, ["link", "time"])
+    reverse, reverse_goal = per_frame_features(
+        self.robot, ee_frames[::-1], self.world, ["link", "time"])
+    self.assertTrue(np.allclose(features[1], reverse, atol=1e-8))
+    self.assertTrue(np.allclose(goal[1], reverse_goal[0], atol=1e-8))
+
+if __name__ == '__main__':
+  unittest.main()
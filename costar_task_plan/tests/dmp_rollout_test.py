@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+
+from costar_task_plan.robotics.representation import CrossEntropySearch
+from costar_task_plan.robotics.representation import DMPRollout
+from costar_task_plan.robotics.representation import DMPRolloutPool
+from costar_task_plan.robotics.representation.dmp_rollout import ScoreRollouts
+
+ALPHA = -np.log(0.01)
+
+def generate_plan(k_gains, d_gains, weights, x0, xdot0, t0, goal, goal_thresh,
+                  seg_length, tau, total_dt, integrate_iter):
+  '''
+  The plan get_dmp_plan returned, one dimension and one step at a time as in
+  generatePlan of the dmp package.
+  '''
+  dims = len(k_gains)
+  dt = total_dt / integrate_iter
+  xs = [[] for _ in xrange(dims)]
+  vs = [[] for _ in xrange(dims)]
+  t = 0.
+  n = 0
+  at_goal = False
+  while ((t + t0) < tau or (not at_goal and t < seg_length)) and t < 1000:
+    if seg_length > 0 and t > seg_length:
+      break
+    for i in xrange(dims):
+      if n == 0:
+        x = x0[i]
+        v = xdot0[i]
+      else:
+        x = xs[i][n - 1]
+        v = vs[i][n - 1] * tau
+      s = np.exp(-(ALPHA / tau) * (t + t0))
+      log_s = (t + t0) / tau
+      if log_s >= 1.0:
+        f = 0.
+      else:
+        f = s * sum(np.cos(np.pi * j * log_s) * weights[i][j]
+                    for j in xrange(len(weights[i])))
+      for _ in xrange(integrate_iter):
+        vdot = (k_gains[i] * ((goal[i] - x) - (goal[i] - x0[i]) * s + f)
+                - d_gains[i] * v) / tau
+        xdot = v / tau
+        v = v + vdot * dt
+        x = x + xdot * dt
+      xs[i].append(x)
+      vs[i].append(v / tau)
+    t += total_dt
+    n += 1
+    if (t + t0) >= tau:
+      at_goal = True
+      for i in xrange(dims):
+        if goal_thresh[i] > 0 and abs(xs[i][n - 1] - goal[i]) > goal_thresh[i]:
+          at_goal = False
+  return np.array(xs).T
+
+class EndpointRobot(object):
+  '''
+  Stands in for RobotFeatures: scores a trajectory by how close it ends to a
+  target, and slightly prefers shorter ones.
+  '''
+
+  def __init__(self, target):
+    self.target = target
+
+  def GetTrajectoryLikelihoods(self, trajs, world, objs):
+    return [-np.sum((traj[-1] - self.target) ** 2) - 0.01 * len(traj)
+            for traj in trajs]
+
+class TestDmpRollout(unittest.TestCase):
+
+  def setUp(self):
+    rs = np.random.RandomState(3)
+    self.dims = 7
+    self.num_weights = 6
+    self.k_gains = [100.] * self.dims
+    self.d_gains = [2. * np.sqrt(100.)] * self.dims
+    self.x0 = rs.randn(self.dims)
+    self.xdot0 = rs.randn(self.dims) * 0.1
+    self.tau = 3.9
+    goal = self.x0 + rs.randn(self.dims)
+    weights = rs.randn(self.dims * self.num_weights) * 5
+    self.params = np.concatenate(
+        [goal + rs.randn(30, self.dims) * 0.3,
+         weights + rs.randn(30, self.dims * self.num_weights) * 2], axis=1)
+    self.world = {"link": np.eye(4)}
+
+  def rollout(self, goal_thresh, seg_length, t0):
+    return DMPRollout(self.k_gains, self.d_gains, self.x0, self.xdot0, t0,
+                      goal_thresh, seg_length, self.tau, 0.1, 5,
+                      self.num_weights)
+
+  def reference(self, rollout, params):
+    return generate_plan(
+        self.k_gains, self.d_gains,
+        params[self.dims:].reshape(self.dims, self.num_weights),
+        self.x0, self.xdot0, rollout.t0, params[:self.dims],
+        rollout.goal_thresh, rollout.seg_length, self.tau, 0.1, 5)
+
+  def test_matches_generate_plan(self):
+    settings = [([0.01] * self.dims, -1, 0.),
+                ([1e-4] * self.dims, 10., 0.),
+                ([0.] * self.dims, -1, 1.2),
+                ([1e-3] * 4 + [0.] * 3, 2.5, 0.3)]
+    for goal_thresh, seg_length, t0 in settings:
+      rollout = self.rollout(goal_thresh, seg_length, t0)
+      trajs = rollout.trajectories(self.params)
+      self.assertEqual(len(trajs), len(self.params))
+      lengths = set()
+      for params, traj in zip(self.params, trajs):
+        expected = self.reference(rollout, params)
+        self.assertEqual(traj.shape, expected.shape)
+        self.assertTrue(np.allclose(traj, expected, atol=1e-9))
+        lengths.add(len(traj))
+      if seg_length == 10.:
+        # candidates stop at different times when they reach the goal
+        self.assertTrue(len(lengths) > 1)
+    self.assertEqual(rollout.trajectories(np.zeros((0, self.params.shape[1]))), [])
+
+  def test_ranking(self):
+    robot = EndpointRobot(self.x0 + 1.)
+    rollout = self.rollout([1e-4] * self.dims, 10., 0.)
+    expected = [robot.GetTrajectoryLikelihoods([self.reference(rollout, params)],
+                                               self.world, ["link"])[0]
+                for params in self.params]
+
+    lls, trajs = ScoreRollouts(robot, rollout, self.params, self.world)
+    self.assertTrue(np.allclose(lls, expected))
+    self.assertEqual(list(np.argsort(-lls)), list(np.argsort(-np.array(expected))))
+
+    # worker processes give the same scores, in the same order
+    pool = DMPRolloutPool(robot, processes=2)
+    try:
+      pool_lls, pool_trajs = pool.score(rollout, self.params, self.world)
+    finally:
+      pool.close()
+    self.assertTrue(np.allclose(pool_lls, lls))
+    for traj, pool_traj in zip(trajs, pool_trajs):
+      self.assertTrue(np.allclose(traj, pool_traj))
+
+  def test_cross_entropy_search(self):
+    robot = EndpointRobot(self.x0 + 1.)
+    rollout = self.rollout([0.01] * self.dims, -1, 0.)
+    np.random.seed(0)
+    lls, elite_lls, elite_trajs, elite_params, trajs = CrossEntropySearch(
+        DMPRolloutPool(robot, processes=1), rollout, self.world, self.params,
+        iterations=3, num_samples=50, elite_fraction=0.2)
+    self.assertEqual(len(lls), 50)
+    self.assertEqual(len(elite_lls), 10)
+    # the elite are the best of the last batch, best first
+    self.assertTrue(np.allclose(elite_lls, np.sort(lls)[::-1][:10]))
+    for ll, traj, params in zip(elite_lls, elite_trajs, elite_params):
+      self.assertTrue(np.allclose(traj, self.reference(rollout, params), atol=1e-9))
+      self.assertTrue(np.allclose(ll, robot.GetTrajectoryLikelihoods(
+          [traj], self.world, ["link"])[0]))
+    # refitting to the elite improves on the first batch
+    first, _ = ScoreRollouts(robot, rollout, self.params, self.world)
+    self.assertTrue(np.mean(lls) > np.mean(first))
+
+    # a single iteration only scores the initial batch
+    lls, elite_lls, elite_trajs, elite_params, trajs = CrossEntropySearch(
+        DMPRolloutPool(robot, processes=1), rollout, self.world, self.params,
+        iterations=1, elite_fraction=0.2)
+    self.assertTrue(np.allclose(lls, first))
+    self.assertTrue(np.allclose(elite_params, self.params[np.argsort(-first)[:6]]))
+    with self.assertRaises(RuntimeError):
+      CrossEntropySearch(DMPRolloutPool(robot, processes=1), rollout,
+                         self.world, self.params, iterations=0)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+
+from costar_task_plan.robotics.representation import GMM
+from costar_task_plan.robotics.representation import MixtureFactors
+from costar_task_plan.robotics.representation import MixtureLogLikelihood
+from costar_task_plan.robotics.representation import MixtureLogLikelihoods
+from costar_task_plan.robotics.representation import P_Gauss
+
+def per_sample(x, mu, sigma, pi):
+  '''
+  The previous scoring: one point and one component at a time, through the
+  inverse and determinant of each covariance.
+  '''
+  dims = mu.shape[1]
+  out = np.zeros(len(x))
+  for n in xrange(len(x)):
+    p = 0.
+    for k in xrange(len(pi)):
+      diff = x[n] - mu[k]
+      res = -0.5 * diff.dot(np.linalg.inv(sigma[k])).dot(diff)
+      p += pi[k] * np.exp(res) / np.sqrt((2 * np.pi) ** dims * np.linalg.det(sigma[k]))
+    out[n] = np.log(p)
+  return out
+
+def per_sample_log(x, mu, sigma, pi):
+  '''
+  Like per_sample, but summing the components in log space, for points
+  whose likelihood underflows.
+  '''
+  dims = mu.shape[1]
+  out = np.zeros(len(x))
+  for n in xrange(len(x)):
+    log_p = []
+    for k in xrange(len(pi)):
+      diff = x[n] - mu[k]
+      _, log_det = np.linalg.slogdet(sigma[k])
+      log_p.append(np.log(pi[k]) - 0.5 * diff.dot(np.linalg.solve(sigma[k], diff))
+                   - 0.5 * (dims * np.log(2 * np.pi) + log_det))
+    out[n] = np.logaddexp.reduce(log_p)
+  return out
+
+class TestGmmScore(unittest.TestCase):
+
+  def setUp(self):
+    rs = np.random.RandomState(0)
+    k, dims = 4, 6
+    self.mu = rs.randn(k, dims) * 2
+    a = rs.randn(k, dims, dims)
+    # the last component is nearly flat along one direction
+    a[-1, :, 0] = a[-1, :, 1]
+    self.sigma = np.matmul(a, np.swapaxes(a, 1, 2)) + 1e-8 * np.eye(dims)
+    self.sigma[:-1] += 0.5 * np.eye(dims)
+    self.pi = rs.rand(k)
+    self.pi /= np.sum(self.pi)
+    self.x = np.concatenate([rs.multivariate_normal(self.mu[i], self.sigma[i], 50)
+                             for i in xrange(k)])
+    self.factors = MixtureFactors(self.mu, self.sigma, self.pi)
+
+  def test_matches_per_sample(self):
+    self.assertTrue(np.linalg.cond(self.sigma[-1]) > 1e8)
+    expected = per_sample(self.x, self.mu, self.sigma, self.pi)
+    scores = MixtureLogLikelihood(self.x, *self.factors)
+    self.assertEqual(scores.shape, expected.shape)
+    self.assertTrue(np.allclose(scores, expected, rtol=1e-6, atol=1e-5))
+    # a single point
+    self.assertTrue(np.allclose(MixtureLogLikelihood(self.x[0], *self.factors),
+                                expected[:1], rtol=1e-6, atol=1e-5))
+
+  def test_p_gauss(self):
+    expected = per_sample(self.x, self.mu, self.sigma, self.pi)
+    scores = P_Gauss(self.x, self.mu, np.linalg.inv(self.sigma),
+                     np.linalg.det(self.sigma), self.pi)
+    self.assertTrue(np.allclose(scores, expected, rtol=1e-6, atol=1e-5))
+    # one component, which used to be the only case P_Gauss got right
+    scores = P_Gauss(self.x, self.mu[:1], np.linalg.inv(self.sigma[:1]),
+                     np.linalg.det(self.sigma[:1]), np.array([1.]))
+    expected = per_sample(self.x, self.mu[:1], self.sigma[:1], [1.])
+    self.assertTrue(np.allclose(scores, expected, rtol=1e-6, atol=1e-5))
+
+  def test_underflow(self):
+    # far off the flat direction of the last component every density is
+    # zero in floating point, but the log likelihood is not -inf
+    flat = np.linalg.svd(self.sigma[-1])[0][:, -1]
+    x = self.mu[-1] + np.array([1e-3, 1e-1, 1e3])[:, None] * flat
+    scores = MixtureLogLikelihood(x, *self.factors)
+    self.assertTrue(np.all(np.isfinite(scores)))
+    self.assertTrue(np.allclose(scores, per_sample_log(x, self.mu, self.sigma, self.pi),
+                                rtol=1e-6))
+    with np.errstate(divide='ignore'):
+      self.assertTrue(np.isneginf(per_sample(x[-1:], self.mu, self.sigma, self.pi)[0]))
+
+  def test_gmm_model(self):
+    gmm = GMM(config={"mu": list(self.mu), "sigma": list(self.sigma),
+                      "pi": self.pi, "k": len(self.pi)})
+    expected = per_sample(self.x, self.mu, self.sigma, self.pi)
+    self.assertTrue(np.allclose(gmm.loglikelihood(self.x), expected,
+                                rtol=1e-6, atol=1e-5))
+    self.assertTrue(np.allclose(gmm.score(self.x), np.sum(expected), rtol=1e-6))
+
+    trajs = [self.x[:30], self.x[30:30], self.x[30:120], self.x[120:]]
+    totals = gmm.scoreMany(trajs)
+    self.assertEqual(totals.shape, (4,))
+    self.assertEqual(totals[1], 0.)
+    for traj, total, average in zip(trajs, totals, gmm.scoreMany(trajs, average=True)):
+      if len(traj) == 0:
+        continue
+      self.assertTrue(np.allclose(total, gmm.score(traj)))
+      self.assertTrue(np.allclose(average, gmm.score(traj) / len(traj)))
+    self.assertTrue(np.allclose(
+        MixtureLogLikelihoods(np.array(trajs[2:3]), *self.factors), totals[2]))
+
+    # empty trajectories first, last, and next to each other
+    empty = self.x[:0]
+    for trajs in [[self.x[:30], empty], [empty, self.x[:30], empty, empty],
+                  [empty, self.x[30:31], self.x[:30], empty]]:
+      totals = MixtureLogLikelihoods(trajs, *self.factors)
+      self.assertEqual(totals.shape, (len(trajs),))
+      for traj, total in zip(trajs, totals):
+        self.assertTrue(np.allclose(total, np.sum(per_sample(
+            traj, self.mu, self.sigma, self.pi)), rtol=1e-6))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+
+import unittest
+
+from costar_task_plan.grid_world import RoadWorld
+from costar_task_plan.mcts import DefaultMctsPolicies, PolicyInitialize
+from costar_task_plan.mcts import Node, MonteCarloTreeSearch
+from costar_task_plan.mcts import ParallelMonteCarloTreeSearch
+from costar_task_plan.mcts import MctsAction, Ucb1Score, PriorProbabilityScore
+from costar_task_plan.mcts import TranspositionTable, WorldStateKey
+from costar_task_plan.mcts import LearnerStateKey
+from costar_task_plan.mcts import ActionIndex, ContinuousMctsPolicies
+from costar_task_plan.mcts import KernelRegressionMctsPolicies
+from costar_task_plan.mcts import ParameterizedPolicySample
+from costar_task_plan.mcts import GaussianParameterDistribution
+from costar_task_plan.grid_world.road_world import LanePolicy, RoadState
+from costar_task_plan.tools import mctsLoop
+
+import numpy as np
+
+def make_policies(world):
+  return DefaultMctsPolicies(
+      initialize=PolicyInitialize(world.getLanePolicies()))
+
+class TestParallelMcts(unittest.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.world = RoadWorld(seed=0, num_cars=5)
+    self.policies = make_policies(self.world)
+
+  def test_sequential(self):
+    root = Node(world=self.world, root=True)
+    elapsed, path = MonteCarloTreeSearch(self.policies)(root, iter=20)
+    self.assertEqual(root.n_visits, 20)
+    self.assertTrue(path[0] is root)
+    self.assertTrue(len(path) > 1)
+
+  def test_root_parallel(self):
+    root = Node(world=self.world, root=True)
+    search = ParallelMonteCarloTreeSearch(self.policies, num_workers=2)
+    elapsed, path = search(root, iter=21)
+
+    # every iteration from every worker shows up in the merged root
+    self.assertEqual(root.n_visits, 21)
+    self.assertEqual(sum([c.n_visits for c in root.children]), 21)
+    self.assertEqual(len(root.children), len(self.world.getLanePolicies()))
+
+    # the returned path is instantiated all the way down
+    self.assertTrue(path[0] is root)
+    self.assertTrue(len(path) > 1)
+    for parent, child in zip(path[:-1], path[1:]):
+      self.assertTrue(child.initialized)
+      self.assertTrue(child.parent is parent)
+
+  def test_leaf_parallel(self):
+    root = Node(world=self.world, root=True)
+    search = ParallelMonteCarloTreeSearch(self.policies,
+                                          num_workers=3,
+                                          mode="leaf")
+    elapsed, path = search(root, iter=30)
+    self.assertEqual(root.n_visits, 30)
+    self.assertTrue(path[0] is root)
+
+    # virtual loss is removed again once every search has finished
+    for child in root.children:
+      self.assertFalse(child.expanding)
+      if child.n_visits > 0:
+        self.assertAlmostEqual(child.avg_reward,
+                               child.total_reward / child.n_visits)
+
+class TestChildStats(unittest.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.root = Node(world=RoadWorld(seed=0, num_cars=5), root=True)
+    self.root.n_visits = 500
+    for i in xrange(300):
+      child = Node(action=MctsAction(id=i), prior=np.random.rand())
+      child.n_visits = np.random.randint(3)
+      child.avg_reward = np.random.randn()
+      self.root.children.append(child)
+      # grow the arrays while children are being added
+      if i % 50 == 0:
+        self.root.childStats()
+
+  def test_stats(self):
+    visits, avg_reward, prior = self.root.childStats()
+    self.assertEqual(len(visits), 300)
+    for i, child in enumerate(self.root.children):
+      self.assertEqual(visits[i], child.n_visits)
+      self.assertEqual(avg_reward[i], child.avg_reward)
+      self.assertEqual(prior[i], child.prior)
+
+    # writes to a child show up in the arrays of its parent
+    self.root.children[7].n_visits += 1
+    self.assertEqual(visits[7], self.root.children[7].n_visits)
+
+  def test_batch_scores(self):
+    for score in [Ucb1Score(1.4), PriorProbabilityScore(0.5)]:
+      expected = [score(self.root, child) for child in self.root.children]
+      np.testing.assert_array_equal(score.batch(self.root), expected)
+
+class TestTranspositionTable(unittest.TestCase):
+
+  def test_reuse(self):
+    np.random.seed(0)
+    world = RoadWorld(seed=0, num_cars=5)
+    table = TranspositionTable()
+    policies = DefaultMctsPolicies(
+        initialize=PolicyInitialize(world.getLanePolicies()),
+        transpositions=table)
+    search = MonteCarloTreeSearch(policies)
+
+    root = Node(world=world, root=True)
+    search(root, iter=20)
+    hits, misses = table.hits, table.misses
+    self.assertTrue(misses > 0)
+
+    # searching again from the same state reuses simulated children
+    np.random.seed(0)
+    root2 = Node(world=world, root=True)
+    search(root2, iter=20)
+    self.assertTrue(table.hits - hits >= len(root2.children))
+    self.assertTrue(table.misses - misses < misses)
+    for a, b in zip(root.children, root2.children):
+      if not (a.initialized and b.initialized):
+        continue
+      self.assertTrue(a.world is b.world)
+      self.assertTrue(a.transposition is b.transposition)
+      self.assertEqual(b.avg_reward, b.transposition.total_reward /
+                       b.transposition.n_visits)
+
+  def test_key_covers_all_actors(self):
+    world = RoadWorld(seed=0, num_cars=5)
+    other = world.duplicate()
+    car = other.ownActor(1)
+    car.state = RoadState(car.state.x + 1., car.state.y,
+                          car.state.t, car.state.v)
+    # same learner, different car: only the full key tells them apart
+    self.assertEqual(LearnerStateKey(world), LearnerStateKey(other))
+    self.assertNotEqual(WorldStateKey(world), WorldStateKey(other))
+    self.assertEqual(WorldStateKey(world), WorldStateKey(world.duplicate()))
+
+  def test_eviction(self):
+    world = RoadWorld(seed=0, num_cars=5)
+    table = TranspositionTable(max_entries=3)
+    policies = DefaultMctsPolicies(
+        initialize=PolicyInitialize(world.getLanePolicies()),
+        transpositions=table)
+    MonteCarloTreeSearch(policies)(Node(world=world, root=True), iter=20)
+    self.assertEqual(len(table), 3)
+    self.assertTrue(table.evictions > 0)
+
+class RoadEnv(object):
+
+  def __init__(self, world):
+    self._world = world
+
+  def reset(self):
+    self._world.reset()
+
+class TestAnytimeSearch(unittest.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.world = RoadWorld(seed=0, num_cars=5)
+    self.policies = make_policies(self.world)
+
+  def test_time_budget(self):
+    search = MonteCarloTreeSearch(self.policies, time_budget=0.05)
+    root = Node(world=self.world, root=True)
+    elapsed, path = search(root, iter=None)
+    self.assertTrue(search.iterations > 0)
+    self.assertEqual(root.n_visits, search.iterations)
+    self.assertTrue(elapsed < 0.5)
+    self.assertTrue(len(path) > 1)
+
+    # the iteration count still caps the search
+    elapsed, path = search(Node(world=self.world, root=True), iter=3)
+    self.assertEqual(search.iterations, 3)
+
+  def test_advance(self):
+    search = MonteCarloTreeSearch(self.policies)
+    root = Node(world=self.world, root=True)
+    elapsed, path = search(root, iter=30)
+    child = path[1]
+    visits = child.n_visits
+    new_root, saved = search.advance(root, child)
+    self.assertTrue(new_root is child)
+    self.assertTrue(new_root.parent is None)
+    self.assertEqual(saved["visits"], visits)
+    self.assertEqual(new_root.n_visits, visits)
+
+    # the next search keeps adding to the statistics of the subtree
+    search(new_root, iter=10)
+    self.assertEqual(new_root.n_visits, visits + 10)
+
+  def test_loop(self):
+    env = RoadEnv(RoadWorld(seed=0, num_cars=3, max_time=3.))
+    replans = mctsLoop(env, self.policies, 0, False, False, reuse=True,
+                       iter=10)
+    self.assertTrue(len(replans) > 1)
+    self.assertTrue(all([r["iterations"] == 10 for r in replans]))
+    self.assertTrue(sum([r["visits"] for r in replans]) > 0)
+
+  def test_loop_without_reuse(self):
+    roots = []
+    initialize = self.policies.initialize
+    def record(node):
+      roots.append(node)
+      initialize(node)
+    self.policies.initialize = record
+    env = RoadEnv(RoadWorld(seed=0, num_cars=3, max_time=3.))
+    replans = mctsLoop(env, self.policies, 0, False, False, iter=10)
+    self.assertTrue(len(replans) > 1)
+    self.assertEqual(sum([r["visits"] for r in replans]), 0)
+    # every replan starts from a fresh root
+    self.assertEqual(len(roots), len(replans))
+    for root in roots:
+      self.assertEqual(root.tag, 'ROOT()')
+      self.assertTrue(root.parent is None)
+
+class TestActionIndex(unittest.TestCase):
+
+  def test_queries(self):
+    np.random.seed(0)
+    index = ActionIndex(3, leaf_size=4)
+    points = np.random.rand(200, 3)
+    for i, point in enumerate(points):
+      self.assertEqual(index.insert(point, i), i)
+    self.assertEqual(len(index), 200)
+
+    query = np.array([0.5, 0.5, 0.5])
+    dists = np.linalg.norm(points - query, axis=1)
+    self.assertEqual(sorted(index.radius(query, 0.3)),
+                     list(np.where(dists <= 0.3)[0]))
+    ids, d = index.nearest(query, k=5)
+    self.assertEqual(list(ids), list(np.argsort(dists)[:5]))
+
+class TestContinuousMcts(unittest.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    self.world = RoadWorld(seed=0, num_cars=5)
+    self.sample = ParameterizedPolicySample(
+        lambda p: LanePolicy(p[0], p[1]),
+        GaussianParameterDistribution([1., 2.], np.eye(2)),
+        ticks=5)
+
+  def test_batch_sample(self):
+    root = Node(world=self.world, root=True)
+    actions = self.sample.sampleBatch(root, 10)
+    self.assertEqual(len(actions), 10)
+    self.assertEqual(actions[3].params.shape, (2,))
+    self.assertEqual(actions[3].policy.lane, actions[3].params[0])
+
+  def test_search(self):
+    for policies in [ContinuousMctsPolicies(self.sample, batch_size=4),
+                     KernelRegressionMctsPolicies(self.sample, pw_C=2.)]:
+      root = Node(world=self.world, root=True)
+      elapsed, path = MonteCarloTreeSearch(policies)(root, iter=30)
+      self.assertEqual(root.n_visits, 30)
+      self.assertTrue(len(root.children) > 1)
+      self.assertTrue(len(path) > 1)
+      # unused samples wait for the next time the node widens
+      self.assertTrue(len(root.candidates) < 8)
+
+  def test_rave_cleared_between_searches(self):
+    policies = ContinuousMctsPolicies(self.sample, batch_size=4)
+    search = MonteCarloTreeSearch(policies)
+    first = Node(world=self.world, root=True)
+    search(first, iter=20)
+    score = policies._score
+    self.assertTrue(id(first) in score.indexed)
+
+    # a new search must not keep the nodes of the last tree alive
+    second = Node(world=self.world, root=True)
+    search(second, iter=20)
+    self.assertFalse(id(first) in score.indexed)
+    self.assertTrue(id(second) in score.indexed)
+    nodes, stack = set(), [second]
+    while stack:
+      node = stack.pop()
+      nodes.add(id(node))
+      stack.extend(node.children)
+    for index in score.indices.values():
+      for node in index.items:
+        self.assertTrue(id(node) in nodes)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+import glob
+import os
+import unittest
+
+import numpy as np
+try:
+  import sympy
+except ImportError:
+  sympy = None
+
+from costar_task_plan.needle_master import Demo
+from costar_task_plan.needle_master import Environment
+from costar_task_plan.needle_master import NumericPolygon
+from costar_task_plan.needle_master import SegmentsIntersect
+
+TRIALS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      "..", "scripts", "needle_master", "trials")
+
+# a square and a concave polygon with a notch cut out of its top
+SQUARE = [[0., 0.], [4., 0.], [4., 4.], [0., 4.]]
+NOTCHED = [[0., 0.], [6., 0.], [6., 4.], [4., 4.], [3., 2.], [2., 4.], [0., 4.]]
+
+def load_environments():
+  '''
+  Every bundled trial environment with the first trial recorded in it.
+  '''
+  environments = []
+  for filename in sorted(glob.glob(os.path.join(TRIALS, "environment_*.txt"))):
+    env = Environment(filename)
+    number = os.path.basename(filename)[len("environment_"):-len(".txt")]
+    trials = sorted(glob.glob(os.path.join(TRIALS, "trial_%s_*.csv" % number)))
+    demo = Demo(env.height, env.width, trials[0])
+    environments.append((env, demo))
+  return environments
+
+class TestPolygon(unittest.TestCase):
+
+  def test_edges_and_vertices(self):
+    square = NumericPolygon(SQUARE)
+    inside = [[2., 2.], [0.001, 3.999], [3.999, 0.001]]
+    outside = [[-1., 2.], [5., 2.], [2., 4.001], [-0.001, -0.001], [8., 8.]]
+    edges = [[2., 0.], [4., 2.], [2., 4.], [0., 2.], [0., 0.], [4., 4.],
+             [4., 0.], [0., 4.]]
+    points = np.array(inside + outside + edges)
+    expected = [True] * len(inside) + [False] * (len(outside) + len(edges))
+    self.assertEqual(list(square.ContainsPoints(points)), expected)
+    for point, value in zip(points, expected):
+      self.assertEqual(square.Contains(point), value)
+
+  def test_concave(self):
+    notched = NumericPolygon(NOTCHED)
+    points = np.array([[1., 3.], [5., 3.], [3., 3.], [3., 1.],
+                       # the tip and sides of the notch
+                       [3., 2.], [2.5, 3.], [3.5, 3.],
+                       # level with vertices, which the crossing count
+                       # must not count twice
+                       [1., 2.], [5., 2.], [1., 4.], [5., 4.], [-1., 4.],
+                       [3., 4.]])
+    expected = [True, True, False, True,
+                False, False, False,
+                True, True, False, False, False, False]
+    self.assertEqual(list(notched.ContainsPoints(points)), expected)
+    # extra columns such as the needle angle are ignored
+    states = np.concatenate([points, np.ones((len(points), 1))], axis=1)
+    self.assertEqual(list(notched.ContainsPoints(states)), expected)
+
+  def test_segments(self):
+    p1 = np.array([[0., 0.], [0., 0.], [0., 0.], [0., 0.], [0., 0.],
+                   [0., 0.], [0., 0.], [0., 0.], [1., 1.]])
+    p2 = np.array([[2., 2.], [2., 0.], [2., 0.], [2., 0.], [2., 0.],
+                   [2., 0.], [2., 0.], [2., 0.], [1., 1.]])
+    q1 = np.array([[0., 2.], [1., 0.], [2., 0.], [3., 0.], [1., -1.],
+                   [1., 1.], [0., 1.], [-1., 0.], [0., 0.]])
+    q2 = np.array([[2., 0.], [3., 0.], [3., 0.], [4., 0.], [1., 1.],
+                   [1., 2.], [2., 1.], [-2., 0.], [2., 2.]])
+    expected = [True,   # crossing
+                True,   # collinear and overlapping
+                True,   # collinear, touching at an end
+                False,  # collinear and apart
+                True,   # one crosses the other's middle
+                False,  # T shape that stops short
+                False,  # parallel
+                False,  # collinear and apart, on the other side
+                True]   # a point lying on the other segment
+    hits = SegmentsIntersect(p1, p2, q1, q2)
+    self.assertEqual(list(hits), expected)
+    # the order of the segments and of their ends does not matter
+    self.assertEqual(list(SegmentsIntersect(q1, q2, p1, p2)), expected)
+    self.assertEqual(list(SegmentsIntersect(p2, p1, q2, q1)), expected)
+
+  def test_path(self):
+    square = NumericPolygon(SQUARE)
+    # the comments describe the segment starting at each point
+    path = np.array([[-2., 2.],  # into the square through an edge
+                     [2., 2.],   # inside
+                     [3., 3.],   # out through a corner
+                     [5., 5.],   # outside
+                     [4., 6.],   # in line with an edge, but past its end
+                     [4., 5.],   # ending on a corner
+                     [4., 4.],   # starting on a corner
+                     [6., 4.],   # outside
+                     [6., -2.]])
+    expected = [True, True, True, False, False, True, True, False]
+    self.assertEqual(list(square.IntersectsPath(path)), expected)
+    self.assertEqual(list(square.IntersectsSegments(path[:-1], path[1:])),
+                     expected)
+
+class TestTrialEnvironments(unittest.TestCase):
+
+  def setUp(self):
+    self.environments = load_environments()
+
+  @unittest.skipIf(sympy is None, "the old results need sympy")
+  def test_same_as_sympy(self):
+    '''
+    Gate and surface checks on the bundled trials give what the sympy
+    polygons used to. sympy takes tens of milliseconds per point, so only
+    states near each polygon are checked, with its corners and the middles
+    of its edges.
+    '''
+    results = []
+    for env, demo in self.environments:
+      in_gate = env.InGate(demo)
+      self.assertEqual(in_gate.shape, (len(env.gates), len(demo.s)))
+      polygons = [(gate.box, in_gate[i]) for i, gate in enumerate(env.gates)]
+      polygons += [(surface.poly, surface.ContainsPoints(demo.s))
+                   for surface in env.surfaces]
+      for polygon, inside in polygons:
+        corners = polygon.corners
+        near = np.nonzero(np.all((demo.s[:, :2] >= polygon.min - 10.)
+                                 & (demo.s[:, :2] <= polygon.max + 10.),
+                                 axis=1))[0]
+        near = near[np.linspace(0, len(near) - 1, min(len(near), 6)).astype(int)]
+        points = np.concatenate([demo.s[near, :2], corners[:2],
+                                 (corners[:2] + corners[1:3]) / 2])
+        got = list(inside[near]) + list(polygon.ContainsPoints(points[len(near):]))
+        old = sympy.Polygon(*[tuple(corner) for corner in corners])
+        expected = [bool(old.encloses_point(sympy.Point(*point)))
+                    for point in points]
+        self.assertEqual(got, expected)
+        results += expected
+    self.assertTrue(any(results))
+    self.assertFalse(all(results))
+
+  def test_gates_and_surfaces(self):
+    for env, demo in self.environments:
+      in_gate = env.InGate(demo)
+      on_surface = env.OnSurface(demo)
+      self.assertEqual(on_surface.shape, (len(env.surfaces), len(demo.s) - 1))
+      for i, gate in enumerate(env.gates):
+        for state, inside in zip(demo.s, in_gate[i]):
+          self.assertEqual(gate.box.Contains(state), inside)
+        hits = gate.HitsEdges(demo.s)
+        self.assertEqual(hits.shape, (len(demo.s) - 1,))
+      for j, surface in enumerate(env.surfaces):
+        # a path with a point inside a surface touches it
+        inside = surface.ContainsPoints(demo.s)
+        self.assertTrue(np.all(on_surface[j][inside[:-1]]))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+import glob
+import os
+import unittest
+
+import numpy as np
+
+from costar_task_plan.needle_master import Demo
+from costar_task_plan.needle_master import Environment
+from costar_task_plan.needle_master import EvaluateRollouts
+from costar_task_plan.needle_master import NeedleAction
+from costar_task_plan.needle_master import NeedleControlDynamics
+from costar_task_plan.needle_master import NeedleDynamics
+from costar_task_plan.needle_master import NeedleState
+from costar_task_plan.needle_master import NeedleTrajectory
+from costar_task_plan.needle_master import PrimitivesToControls
+from costar_task_plan.needle_master import RolloutPrimitives
+
+TRIALS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      "..", "scripts", "needle_master", "trials")
+
+class EmptyWorld(object):
+  '''
+  Just enough of a world for NeedleState.
+  '''
+
+  def gates(self):
+    return []
+
+class Path(object):
+  '''
+  A needle path, for the Environment checks that take a demo.
+  '''
+
+  def __init__(self, s):
+    self.s = s
+
+def stepped(world, start, params):
+  '''
+  The states of one action, applying NeedleControlDynamics one control at a
+  time as NeedleDynamics does.
+  '''
+  action = NeedleAction(params=list(params))
+  action.finalize(None)
+  dynamics = NeedleControlDynamics(world)
+  pt = NeedleState(world, np.array(start, dtype=float))
+  states = []
+  for control in action.traj:
+    pt = dynamics.apply(pt, control)
+    states.append(pt.vec)
+  return np.array(states).reshape(-1, 3)
+
+def random_params(rs, batch):
+  '''
+  (v, dw, t) for three primitives, some of which do not move at all.
+  '''
+  return np.concatenate([np.column_stack([rs.rand(batch) * 30,
+                                          rs.randn(batch) * 0.05,
+                                          rs.randint(-2, 30, batch)])
+                         for _ in xrange(3)], axis=1).astype(float)
+
+class TestNeedleRollout(unittest.TestCase):
+
+  def setUp(self):
+    self.world = EmptyWorld()
+    self.start = np.array([100., 200., 0.3])
+    params = [[10., 0.1, 5., -5., 0.02, 12., 3., -0.3, 1.],
+              # zero-length primitives, at the start, middle and end
+              [10., 0.1, 0., 8., -0.05, 7., 2., 0.2, 0.],
+              [4., 0.3, 9., 0., 0., 0., 6., -0.1, 3.],
+              # fractional and negative step counts
+              [5., 0.01, 2.7, 1., 1., -3., 7., 0.05, 4.2],
+              # no steps at all
+              [10., 0.1, 0., 8., -0.05, 0., 2., 0.2, 0.],
+              np.zeros(9)]
+    self.params = np.array(params)
+
+  def test_matches_needle_dynamics(self):
+    states, lengths = RolloutPrimitives(self.start, self.params)
+    controls, control_lengths = PrimitivesToControls(self.params)
+    self.assertEqual(list(lengths), [18, 7, 12, 6, 0, 0])
+    self.assertEqual(list(control_lengths), list(lengths))
+    self.assertEqual(states.shape, (len(self.params), 18, 3))
+    for params, rollout, control, length in zip(self.params, states, controls,
+                                                lengths):
+      expected = stepped(self.world, self.start, params)
+      self.assertEqual(len(expected), length)
+      self.assertTrue(np.allclose(rollout[:length], expected, atol=1e-9))
+      # past the end the needle stays where the action left it
+      last = expected[-1] if length else self.start
+      self.assertTrue(np.allclose(rollout[length:], last, atol=1e-9))
+      self.assertTrue(np.all(control[length:] == 0.))
+
+  def test_apply_batch(self):
+    end = stepped(self.world, self.start, self.params[0])
+    traj = NeedleTrajectory([NeedleState(self.world, vec) for vec in end])
+    states, lengths = NeedleDynamics(self.world).applyBatch(traj, self.params)
+    for params, rollout, length in zip(self.params, states, lengths):
+      expected = stepped(self.world, end[-1], params)
+      self.assertTrue(np.allclose(rollout[:length], expected, atol=1e-9))
+
+    # an empty batch
+    states, lengths = RolloutPrimitives(self.start, np.zeros((0, 9)))
+    self.assertEqual(states.shape, (0, 0, 3))
+    self.assertEqual(lengths.shape, (0,))
+
+class TestTrialRollouts(unittest.TestCase):
+
+  def setUp(self):
+    filename = os.path.join(TRIALS, "environment_12.txt")
+    self.env = Environment(filename)
+    trial = sorted(glob.glob(os.path.join(TRIALS, "trial_12_*.csv")))[0]
+    self.demo = Demo(self.env.height, self.env.width, trial)
+
+  def test_same_as_gates_and_surfaces(self):
+    '''
+    EvaluateRollouts gives what the Gate and Environment checks give for
+    each rollout on its own, from a point along a recorded trial.
+    '''
+    rs = np.random.RandomState(0)
+    world = EmptyWorld()
+    start = self.demo.s[len(self.demo.s) // 4]
+    params = np.concatenate([random_params(rs, 200), np.zeros((1, 9))])
+    states, lengths = RolloutPrimitives(start, params)
+    conditions = EvaluateRollouts(self.env, start, states)
+    gates, surfaces = len(self.env.gates), len(self.env.surfaces)
+    self.assertEqual(conditions.in_gate.shape, (len(params), gates))
+    self.assertEqual(conditions.hit_gate_edge.shape, (len(params), gates))
+    self.assertEqual(conditions.on_surface.shape, (len(params), surfaces))
+
+    for i in xrange(len(params)):
+      rollout = stepped(world, start, params[i])
+      self.assertEqual(len(rollout), lengths[i])
+      path = Path(np.concatenate([start[None], rollout]))
+      in_gate = [len(rollout) > 0 and np.any(gate.ContainsPoints(rollout))
+                 for gate in self.env.gates]
+      hit_gate_edge = [np.any(gate.HitsEdges(path.s)) for gate in self.env.gates]
+      on_surface = [np.any(hits) for hits in self.env.OnSurface(path)]
+      self.assertEqual(list(conditions.in_gate[i]), in_gate)
+      self.assertEqual(list(conditions.hit_gate_edge[i]), hit_gate_edge)
+      self.assertEqual(list(conditions.on_surface[i]), on_surface)
+
+    # the batch covers every outcome
+    for values in conditions:
+      self.assertTrue(np.any(values))
+      self.assertFalse(np.all(values))
+
+if __name__ == '__main__':
+  unittest.main()
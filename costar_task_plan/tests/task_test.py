@@ -4,12 +4,15 @@ import unittest
 
 from costar_task_plan.abstract import Task
 from costar_task_plan.abstract import AbstractOption
+from costar_task_plan.abstract.task import get_arg_sets, LazyOption
 
 import numpy as np
 
 class PickOption(AbstractOption):
+  created = 0
   def __init__(self, obj):
     self.obj = obj
+    PickOption.created += 1
 
 def pick_args():
   return {
@@ -150,5 +153,67 @@ class TestTask(unittest.TestCase):
     self.assertTrue(isinstance(seq[1], MoveOption))
     self.assertTrue(isinstance(seq[2], DropOption))
 
+  def test_checks(self):
+    calls = []
+    def different(obj, goal):
+      calls.append((obj, goal))
+      return obj != goal
+    args = {
+      'obj': ['a', 'b', 'c'],
+      'goal': ['a', 'b', 'c'],
+      'extra': [1, 2],
+    }
+    arg_sets = get_arg_sets(args, [different])
+    self.assertEqual(len(arg_sets), 12)
+    for arg_set in arg_sets:
+      self.assertTrue(arg_set['obj'] != arg_set['goal'])
+    # the check runs once per (obj, goal) pair, not once per full arg set
+    self.assertEqual(len(calls), 9)
+
+    # checks that take **kwargs see every argument, once per full arg set
+    seen = []
+    def with_kwargs(obj, goal, **kwargs):
+      seen.append(kwargs)
+      return kwargs['extra'] == 1
+    arg_sets = get_arg_sets(args, [different, with_kwargs])
+    self.assertEqual(len(arg_sets), 6)
+    self.assertEqual(len(seen), 12)
+    self.assertTrue(all([kwargs.keys() == ['extra'] for kwargs in seen]))
+
+    # same order as the full product
+    self.assertEqual(get_arg_sets({'obj': ['a', 'b'], 'goal': ['x']}),
+        [{'obj': 'a', 'goal': 'x'}, {'obj': 'b', 'goal': 'x'}])
+
+  def test_compiled_graph(self):
+    task = make_template()
+    PickOption.created = 0
+    task.compile({
+      'obj': ['apple', 'orange', 'pear'],
+      'goal': ['basket', 'box'],
+    })
+    # options are created when they are first used
+    self.assertEqual(PickOption.created, 0)
+    self.assertTrue(isinstance(task.nodes.raw("pick('obj=pear')"), LazyOption))
+    self.assertTrue(isinstance(task.getOption("pick('obj=pear')"), PickOption))
+    self.assertEqual(PickOption.created, 1)
+
+    # copies and views of the nodes never return a LazyOption
+    for options in [dict(task.nodes), task.nodes.copy()]:
+      self.assertEqual(sorted(options.keys()), sorted(task.nodes.keys()))
+      self.assertFalse(any([isinstance(option, LazyOption)
+                            for option in options.values()]))
+    self.assertFalse(any([isinstance(option, LazyOption)
+                          for option in task.nodes.values()]))
+    self.assertFalse(any([isinstance(option, LazyOption)
+                          for _, option in task.nodes.items()]))
+
+    for name in task.nodes:
+      children, weights = task.getChildren(name)
+      self.assertEqual(len(children), len(weights))
+      ids, wts = task.getChildIds(task.nodeId(name))
+      self.assertEqual([task.nodeName(i) for i in ids], children)
+      self.assertEqual(list(wts), weights)
+    self.assertEqual(len(task.getChildren("pick('obj=pear')")[0]), 3)
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import unittest
+
+from costar_task_plan.abstract.history import History
+from costar_task_plan.grid_world import RoadWorld
+from costar_task_plan.grid_world.road_world import RoadAction
+
+from collections import deque
+
+import numpy as np
+
+def actor_states(world):
+  return [(a.state.x, a.state.y, a.state.v) for a in world.actors]
+
+class TestHistory(unittest.TestCase):
+
+  def test_like_deque(self):
+    history, expected = History(), deque()
+    for i in xrange(100):
+      for h in [history, expected]:
+        if len(h) >= 10:
+          h.popleft()
+        h.append(i)
+      self.assertEqual(list(history), list(expected))
+      self.assertEqual(len(history), len(expected))
+      self.assertEqual(history[0], expected[0])
+      self.assertEqual(history[-1], expected[-1])
+
+  def test_copy(self):
+    history = History([1, 2, 3])
+    other = history.copy()
+    other.append(4)
+    history.popleft()
+    self.assertEqual(list(history), [2, 3])
+    self.assertEqual(list(other), [1, 2, 3, 4])
+
+class TestWorldFork(unittest.TestCase):
+
+  def setUp(self):
+    self.world = RoadWorld(seed=0, num_cars=5, num_obstacles=5)
+
+  def test_fork_leaves_parent_alone(self):
+    before = actor_states(self.world)
+    history = list(self.world.history)
+    child = self.world.fork(RoadAction(0.5, 1))
+    grandchild = child.fork(RoadAction(0.5, 1))
+    self.assertEqual(actor_states(self.world), before)
+    self.assertEqual(list(self.world.history), history)
+    self.assertEqual(len(child.history), len(history) + 1)
+    self.assertNotEqual(actor_states(child), before)
+    self.assertNotEqual(actor_states(grandchild), actor_states(child))
+
+    # parked cars are shared between all three worlds
+    for i in xrange(6, 11):
+      self.assertTrue(self.world.actors[i] is grandchild.actors[i])
+    self.assertFalse(self.world.actors[0] is child.actors[0])
+
+  def test_snapshot_restore(self):
+    snapshot = self.world.snapshot()
+    before = actor_states(self.world)
+    for i in xrange(5):
+      self.world.tick(RoadAction(0.5, 0))
+    self.assertEqual(self.world.ticks, 5)
+    self.world.restore(snapshot)
+    self.assertEqual(self.world.ticks, 0)
+    self.assertEqual(actor_states(self.world), before)
+
+    # the snapshot can be restored more than once
+    self.world.tick(RoadAction(0.5, 0))
+    self.world.restore(snapshot)
+    self.assertEqual(actor_states(self.world), before)
+
+class TestPredicates(unittest.TestCase):
+
+  def test_matches_direct_checks(self):
+    world = RoadWorld(seed=0, num_cars=10, num_obstacles=5)
+    for i in xrange(20):
+      world.tick(RoadAction(0.2, 1 if i % 5 == 0 else 0))
+      for actor in world.actors:
+        expected = [check(world, actor.state, actor, actor.last_state)
+                    for name, check in world.predicates]
+        self.assertEqual(actor.state.predicates, expected)
+
+  def test_stats(self):
+    world = RoadWorld(seed=0, num_cars=10, num_obstacles=5)
+    world.predicate_engine.reset()
+    for i in xrange(10):
+      world.tick(RoadAction(0., 0))
+    stats = world.predicate_engine.stats()
+
+    # nobody changes lanes, so lane predicates are never checked again
+    lane = stats["predicates"]["in_lane(0)"]
+    self.assertEqual(lane["calls"], 10)
+    self.assertEqual(lane["evaluated"], 0)
+    self.assertEqual(lane["cached"], 10 * len(world.actors))
+
+    # this one depends on the other cars and is always checked
+    blocked = stats["predicates"]["blocked"]
+    self.assertEqual(blocked["evaluated"], 10 * len(world.actors))
+    self.assertTrue(blocked["time"] > 0)
+    self.assertEqual(stats["conditions"]["time"]["calls"], 10)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -15,6 +15,12 @@ from costar_models.datasets.image import GetPng
 from costar_models.datasets.image import JpegToNumpy
 from costar_models.datasets.image import ConvertImageListToNumpy
 from costar_models.datasets.depth_image_encoding import FloatArrayToRgbImage
+from costar_models.datasets.depth_codec import DEPTH_RGB
+from costar_models.datasets.depth_codec import EncodeDepth16ToRgb
+from costar_models.datasets.pipeline import FramePipeline
+from costar_models.datasets.pipeline import WriterSink
+from costar_models.datasets.pipeline import EncodeJpeg
+from costar_models.datasets.pipeline import DepthPngEncoder
 
 from cv_bridge import CvBridge, CvBridgeError
 from sensor_msgs.msg import Image
@@ -68,7 +74,11 @@ class DataCollector(object):
             tf_listener=None,
             action_labels_to_always_log=None,
             verbose=0,
-            synchronize=False):
+            synchronize=False,
+            depth_encoding=DEPTH_RGB,
+            depth_compression=None,
+            keep_every=3,
+            encode_threads=2):
         """ Initialize a data collector object for writing ros topic information and data collection state to disk
 
         img_shape: currently ignored
@@ -78,6 +88,13 @@ class DataCollector(object):
         action_labels_to_always_log: 'move_to_home' is always logged by default, others can be added. This option may not work yet.
         verbose: print lots of extra info, useful for debuggging
         synchronize: will attempt to synchronize image data by timestamp. Not yet working as of 2018-05-05.
+        depth_encoding: how depth images are stored, see costar_models.datasets.depth_codec.
+            DEPTH_RGB (the default) is the 3 channel png readers expect, DEPTH_PNG16 a 16 bit png.
+        depth_compression: png compression level for depth images, 1 is fastest and still lossless.
+            None uses the opencv default.
+        keep_every: keep one in every keep_every camera frames, by header sequence number.
+            The default of 3 logs at most 10 hz from a 30 hz camera, 1 keeps every frame.
+        encode_threads: number of threads encoding images in the background.
         """
 
         self.js_topic = "joint_states"
@@ -136,6 +153,20 @@ class DataCollector(object):
         else:
             raise RuntimeError("data type %s not supported" % data_type)
 
+        # Callbacks only keep the latest raw images; they are encoded and
+        # written in the background, see costar_models.datasets.pipeline
+        image_types = [("image", "jpeg"), ("depth_image", "png")]
+        if self.data_type == "h5f":
+            sink = lambda: self.writer.open_episode(image_types=image_types)
+        else:
+            sink = lambda: WriterSink(self.writer, image_types)
+        self.pipeline = FramePipeline(
+                {"image": lambda image: EncodeJpeg(image, quality=99 if synchronize else None),
+                 "depth_image": DepthPngEncoder(depth_encoding, depth_compression)},
+                sink,
+                keep_every=keep_every,
+                num_workers=encode_threads)
+
         self.T_world_ee = None
         self.T_world_camera = None
         self.camera_frame = camera_frame
@@ -147,8 +178,6 @@ class DataCollector(object):
         self.pc = None
         self.camera_depth_info = None
         self.camera_rgb_info = None
-        self.depth_img = None
-        self.rgb_img = None
         self.gripper_msg = None
 
         self._bridge = CvBridge()
@@ -202,35 +231,19 @@ class DataCollector(object):
         if rgb_msg is None:
             rospy.logwarn("_rgbdCb: rgb_msg is None !!!!!!!!!")
         try:
-            # max out at 10 hz assuming 30hz data source
-            # TODO(ahundt) make mod value configurable
-            if rgb_msg.header.seq % 3 == 0:
+            # by default max out at 10 hz assuming 30hz data source
+            if self.pipeline.keep(rgb_msg.header.seq):
+                # the images are encoded later, in the background
                 cv_image = self._bridge.imgmsg_to_cv2(rgb_msg, "rgb8")
-
-                # decode the data, this will take some time
-
-                rospy.loginfo('rgb color cv_image shape: ' + str(cv_image.shape) + ' depth sequence number: ' + str(msg.header.seq))
-                # print('rgb color cv_image shape: ' + str(cv_image.shape))
-                cv_image = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
-                # encode the jpeg with high quality
-                encode_params = [cv2.IMWRITE_JPEG_QUALITY, 99]
-                rgb_img = cv2.imencode('.jpg', cv_image, encode_params)[1].tobytes()
-                # rgb_img = GetJpeg(np.asarray(cv_image))
-
                 cv_depth_image = self._bridge.imgmsg_to_cv2(depth_msg, desired_encoding="passthrough")
-                depth_encoded_as_rgb_numpy = encode_depth_numpy(cv_depth_image)
-                bytevalues = cv2.imencode('.png', depth_encoded_as_rgb_numpy)[1].tobytes()
+                if self.verbose > 3:
+                    rospy.loginfo('rgb color cv_image shape: ' + str(cv_image.shape) + ' depth sequence number: ' + str(depth_msg.header.seq))
 
                 with self.mutex:
-                    self.rgb_time = msg.header.stamp
-                    self.rgb_img = rgb_img
-                    # self.depth_info = depth_camera_info
-                    # self.rgb_info = rgb_camera_info
-                    self.depth_img_time = msg.header.stamp
-                    # self.depth_img = np_image
-                    # self.depth_img = img_str
-                    self.depth_img = bytevalues
-            #print(self.rgb_img)
+                    self.rgb_time = rgb_msg.header.stamp
+                    self.depth_img_time = depth_msg.header.stamp
+                    self.pipeline.put("image", cv_image)
+                    self.pipeline.put("depth_image", cv_depth_image)
         except CvBridgeError as e:
             rospy.logwarn(str(e))
 
@@ -238,21 +251,13 @@ class DataCollector(object):
         if msg is None:
             rospy.logwarn("_rgbCb: msg is None !!!!!!!!!")
         try:
-            # max out at 10 hz assuming 30hz data source
-            if msg.header.seq % 3 == 0:
+            # by default max out at 10 hz assuming 30hz data source
+            if self.pipeline.keep(msg.header.seq):
                 cv_image = self._bridge.imgmsg_to_cv2(msg, "rgb8")
-                # decode the data, this will take some time
-
-                # rospy.loginfo('rgb color cv_image shape: ' + str(cv_image.shape) + ' depth sequence number: ' + str(msg.header.seq))
-                # print('rgb color cv_image shape: ' + str(cv_image.shape))
-                cv_image = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
-                rgb_img = cv2.imencode('.jpg', cv_image)[1].tobytes()
-                # rgb_img = GetJpeg(np.asarray(cv_image))
 
                 with self.mutex:
                     self.rgb_time = msg.header.stamp
-                    self.rgb_img = rgb_img
-            #print(self.rgb_img)
+                    self.pipeline.put("image", cv_image)
         except CvBridgeError as e:
             rospy.logwarn(str(e))
 
@@ -278,75 +283,15 @@ class DataCollector(object):
 
     def _depthCb(self, msg):
         try:
-            if msg.header.seq % 3 == 0:
-                cv_image = self._bridge.imgmsg_to_cv2(msg, desired_encoding="passthrough")
-
-                # ref: https://stackoverflow.com/a/25592959
-                # also: https://stackoverflow.com/a/17970817
-                # kinda works, but only 8 bit image....
-
-                # img_str = cv2.imencode('.png', cv_image, cv2.CV_16U)[1].tobytes()
-                # img_str = np.frombuffer(cv2.imencode('.png', cv_image)[1].tobytes(), np.uint8)
-                # doesn't work
-                # img_str = np.string_(cv2.imencode('.png', cv_image)[1].tostring())
-                # img_str = io.BytesIO(img_str).getvalue()
-                # doesn't work
-                # img_str = io.BytesIO(cv2.imencode('.png', cv_image)[1].tobytes().getvalue())
-                # These values are in mm according to:
+            if self.pipeline.keep(msg.header.seq):
+                # These values are 16 bit integers in mm according to:
                 # https://github.com/ros-perception/depthimage_to_laserscan/blob/indigo-devel/include/depthimage_to_laserscan/depth_traits.h#L49
-                # np_image = np.asarray(cv_image, dtype=np.uint16)
-
-                # depth_image = PIL.Image.fromarray(np_image)
-
-                # if depth_image.mode == 'I;16':
-                #     # https://github.com/python-pillow/Pillow/issues/1099
-                #     # https://github.com/arve0/leicaexperiment/blob/master/leicaexperiment/experiment.py#L560
-                #     depth_image = depth_image.convert(mode='I')
-                # max_val = np.max(np_image)
-                # min_val = np.min(np_image)
-                # print('max val: ' + str(max_val) + ' min val: ' + str(min_val))
-                # decode the data, this will take some time
-                # output = io.BytesIO()
-                # depth_image.save(output, format="PNG")
-
-                # begin 32 bit float code (too slow)
-                # cv_image = self._bridge.imgmsg_to_cv2(msg, "32FC1")
-                # # These values are in mm according to:
-                # # https://github.com/ros-perception/depthimage_to_laserscan/blob/indigo-devel/include/depthimage_to_laserscan/depth_traits.h#L49
-                # np_image = np.asarray(cv_image, dtype=np.float32) * 1000.0
-                # # max_val = np.max(np_image)
-                # # min_val = np.min(np_image)
-                # # print('max val: ' + str(max_val) + ' min val: ' + str(min_val))
-                # # decode the data, this will take some time
-                # depth_image = FloatArrayToRgbImage(np_image)
-                # output = io.BytesIO()
-                # depth_image.save(output, format="PNG")
-                # end 32 bit float code (too slow)
-
-                # convert to meters from milimeters
-                # plt.imshow(cv_image, cmap='nipy_spectral')
-                # plt.pause(.01)
-                # plt.draw()
-                # print('np_image shape: ' + str(np_image.shape))
-
-                # split into three channels
-                # np_image = np.asarray(cv_image, dtype=np.uint32) * 1000
-                # r = np.array(np.divide(np_image, 256*256), dtype=np.uint8)
-                # g = np.array(np.mod(np.divide(np_image, 256), 256), dtype=np.uint8)
-                # b = np.array(np.mod(np_image, 256), dtype=np.uint8)
-
-                # split into two channels with a third zero channel
-
-                # bytevalues = uint16_depth_image_to_png_numpy(cv_image)
-                depth_encoded_as_rgb_numpy = encode_depth_numpy(cv_image)
-                bytevalues = cv2.imencode('.png', depth_encoded_as_rgb_numpy)[1].tobytes()
+                # they are encoded as png later, in the background
+                cv_image = self._bridge.imgmsg_to_cv2(msg, desired_encoding="passthrough")
 
                 with self.mutex:
                     self.depth_img_time = msg.header.stamp
-                    # self.depth_img = np_image
-                    # self.depth_img = img_str
-                    self.depth_img = bytevalues
-                # print (self.depth_img)
+                    self.pipeline.put("depth_image", cv_image)
         except CvBridgeError as e:
             rospy.logwarn(str(e))
 
@@ -354,6 +299,9 @@ class DataCollector(object):
         self.task = task
 
     def reset(self):
+        # throw away the images of an episode that was not saved
+        self.pipeline.discard()
+        # "image" and "depth_image" are streamed to disk by self.pipeline
         self.data = {}
         self.data["nsecs"] = []
         self.data["secs"] = []
@@ -361,8 +309,6 @@ class DataCollector(object):
         self.data["dq"] = []
         self.data["pose"] = []
         self.data["camera"] = []
-        self.data["image"] = []
-        self.data["depth_image"] = []
         self.data["goal_idx"] = []
         self.data["gripper"] = []
         self.data["label"] = []
@@ -439,12 +385,8 @@ class DataCollector(object):
             print("Labels and goals:")
             print(self.data["label"])
             print(self.data["goal_idx"])
+            print(self.pipeline.stats())
 
-        # TODO(ahundt) make nonspecific to hdf5
-        # dt = h5py.special_dtype(vlen=bytes)
-        # self.data['depth_image'] = np.asarray(self.data['depth_image'], dtype=dt)
-        self.data['depth_image'] = np.asarray(self.data['depth_image'])
-        self.data['image'] = np.asarray(self.data['image'])
         if log is None:
             # save an empty string in the log if nothing is specified
             log = ''
@@ -455,8 +397,9 @@ class DataCollector(object):
 
         filename = timeStamped("example%06d.%s.h5f" % (seed, result))
         rospy.loginfo('Saving dataset example with filename: ' + filename)
-        # for now all examples are considered a success
-        self.writer.write(self.data, filename, image_types=[("image", "jpeg"), ("depth_image", "png")])
+        # the images were written while the episode was running,
+        # this waits for the last ones and adds everything else
+        self.pipeline.finish(self.data, filename)
         self.reset()
 
     def set_home_pose(self, pose):
@@ -540,8 +483,7 @@ class DataCollector(object):
 
             self.t = t
             # make sure we keep the right rgb and depth
-            img_jpeg = self.rgb_img
-            depth_png = self.depth_img
+            frames = self.pipeline.latest()
 
         have_data = False
         # how many times have we tried to get the transforms
@@ -677,9 +619,8 @@ class DataCollector(object):
         #plt.figure()
         #plt.imshow(self.rgb_img)
         #plt.show()
-        # print("jpg size={}, png size={}".format(sys.getsizeof(img_jpeg), sys.getsizeof(depth_png)))
-        self.data["image"].append(img_jpeg) # encoded as JPEG
-        self.data["depth_image"].append(depth_png)
+        # encoded as JPEG and PNG in the background
+        self.pipeline.append(frames)
         self.data["gripper"].append(self.gripper_msg.gPO / 255.)
 
         # TODO(cpaxton): verify
@@ -734,17 +675,12 @@ def rgb_as_png_binary_bytes(rgb_np_image):
 
 def encode_depth_numpy(cv_image, order='bgr'):
     # split into two channels with a third zero channel
-    r = np.array(np.divide(cv_image, 256), dtype=np.uint8)
-    g = np.array(np.mod(cv_image, 256), dtype=np.uint8)
-    b = np.zeros(cv_image.shape, dtype=np.uint8)
     # If we are using opencv to encode we want to use bgr for
     # the encoding step to ensure the color order is correct
     # when it is decoded
-    if order == 'rgb':
-        rgb_np_image = np.stack([r, g, b], axis=-1)
-    elif order == 'bgr':
-        rgb_np_image = np.stack([b, g, r], axis=-1)
-    else:
+    try:
+        rgb_np_image = EncodeDepth16ToRgb(cv_image, order=order)
+    except ValueError:
         raise ValueError('encode_depth_numpy unsupported encoding' + str(order))
 
     # rospy.loginfo('rgb_np_image shape: ' + str(rgb_np_image.shape) + ' depth sequence number: ' + str(msg.header.seq))
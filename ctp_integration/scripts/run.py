@@ -94,6 +94,11 @@ def getArgs():
                         default=10,
                         type=int,
                         help="rate at which data will be collected in hertz")
+    parser.add_argument("--keep_every",
+                        default=3,
+                        type=int,
+                        help="keep one in every keep_every camera frames, "
+                             "3 takes 10 hz from a 30 hz camera")
     parser.add_argument("--one_nn_action",
                         action="store_true",
                         help="Go to one neural network proposed pose, close the gripper, then go home.")
@@ -165,6 +170,7 @@ def collect_data(args):
             task=stack_task,
             data_root="~/.costar/data",
             rate=args.rate,
+            keep_every=args.keep_every,
             data_type="h5f",
             robot_config=UR5_C_MODEL_CONFIG,
             camera_frame="camera_link",
@@ -51,8 +51,8 @@ except ImportError:
             return args[0]
         return kwargs.get('iterable', None)
 
-# from costar_models.datasets.image import JpegToNumpy
-# from costar_models.datasets.image import ConvertImageListToNumpy
+from costar_models.datasets.image import JpegToNumpy
+from costar_models.datasets.image import ConvertImageListToNumpy
 import pygame
 import io
 from PIL import Image
@@ -152,35 +152,6 @@ def GetPng(img):
     return output.getvalue()
 
 
-def JpegToNumpy(jpeg):
-    if tf is not None:
-        image = tf.image.decode_jpeg(jpeg)
-    else:
-        stream = io.BytesIO(jpeg)
-        image = Image.open(stream)
-    return np.asarray(image, dtype=np.uint8)
-
-
-def ConvertImageListToNumpy(data, format='numpy', data_format='NHWC', dtype=np.uint8):
-    """ Convert a list of binary jpeg or png files to numpy format.
-
-    # Arguments
-
-    data: a list of binary jpeg images to convert
-    format: default 'numpy' returns a 4d numpy array,
-        'list' returns a list of 3d numpy arrays
-    """
-    images = []
-    for raw in data:
-        img = JpegToNumpy(raw)
-        if data_format == 'NCHW':
-            img = np.transpose(img, [2, 0, 1])
-        images.append(img)
-    if format == 'numpy':
-        images = np.array(images, dtype=dtype)
-    return images
-
-
 def npy_to_video(npy, filename, fps=10, preview=True, convert='gif'):
     """Convert a numpy array into a gif file at the location specified by filename.
 
@@ -3,3 +3,11 @@
 python cem_test.py
 python sampler_test.py  
 python task_test.py
+python mcts_test.py
+python world_test.py
+python agent_test.py
+python batch_kinematics_test.py
+python gmm_score_test.py
+python dmp_rollout_test.py
+python needle_geometry_test.py
+python needle_rollout_test.py